@@ -108,6 +108,7 @@ std::string Profiler::EndProfiling() {
   }
   if (profile_with_logger_) {
     profile_with_logger_ = false;
+    enabled_ = false;  // the events were sent to the custom logger, and will not be collected any more.
     return std::string();
   }
 
@@ -0,0 +1,197 @@
+// Copyright (c) Microsoft Corporation. All rights reserved.
+// Licensed under the MIT License.
+
+#include "python/onnxruntime_pybind_exceptions.h"
+#include "python/onnxruntime_pybind_state_common.h"
+
+#include <algorithm>
+#include <limits>
+#include <string>
+#include <unordered_map>
+#include <vector>
+
+#include "core/common/logging/isink.h"
+#include "core/common/logging/logging.h"
+#include "core/common/profiler_common.h"
+#include "core/platform/ort_mutex.h"
+#include "core/session/inference_session.h"
+
+namespace onnxruntime {
+namespace python {
+
+namespace py = pybind11;
+
+namespace {
+
+// Histogram of durations in microseconds. The durations below 16us have a bucket each, and every power of two above
+// is split in 8 buckets, so that a percentile read from the buckets is within 12.5% of the duration.
+class DurationHistogram {
+ public:
+  void Add(long long duration) {
+    const uint64_t value = duration > 0 ? static_cast<uint64_t>(duration) : 0;
+    ++count_;
+    total_ += value;
+    min_ = std::min(min_, value);
+    max_ = std::max(max_, value);
+
+    int shift = 0;
+    while ((value >> shift) >= kNumExactBuckets) {
+      ++shift;
+    }
+    const size_t index = (static_cast<size_t>(shift) << kSubBucketBits) + static_cast<size_t>(value >> shift);
+    if (index >= buckets_.size()) {
+      buckets_.resize(index + 1);
+    }
+    ++buckets_[index];
+  }
+
+  // Returns (count, total, min, max, [(exclusive upper bound, count) of the buckets which are not empty]).
+  py::tuple ToTuple() const {
+    py::list buckets;
+    for (size_t index = 0; index < buckets_.size(); ++index) {
+      if (buckets_[index] == 0) {
+        continue;
+      }
+      const size_t shift = index < kNumExactBuckets ? 0 : (index >> kSubBucketBits) - 1;
+      const uint64_t upper_bound = (static_cast<uint64_t>(index - (shift << kSubBucketBits)) + 1) << shift;
+      buckets.append(py::make_tuple(upper_bound, buckets_[index]));
+    }
+    return py::make_tuple(count_, total_, count_ ? min_ : 0, max_, buckets);
+  }
+
+ private:
+  static constexpr int kSubBucketBits = 3;
+  static constexpr size_t kNumExactBuckets = size_t{2} << kSubBucketBits;
+
+  uint64_t count_{0};
+  uint64_t total_{0};
+  uint64_t min_{std::numeric_limits<uint64_t>::max()};
+  uint64_t max_{0};
+  std::vector<uint64_t> buckets_;
+};
+
+// Aggregates in memory the durations of the kernels of the nodes and of the runs of the sessions profiled with it,
+// instead of recording the events for the JSON profile file. The events are sent by the profiler of the sessions
+// to the sink of the logger of the aggregator, from the threads running the nodes.
+class ProfilingAggregator {
+ public:
+  ProfilingAggregator() {
+    logging_manager_ = std::make_unique<logging::LoggingManager>(
+        std::make_unique<Sink>(*this), logging::Severity::kWARNING, false,
+        logging::LoggingManager::InstanceType::Temporal);
+    logger_ = logging_manager_->CreateLogger("ProfilingAggregator");
+  }
+
+  void StartProfiling(InferenceSession& session) {
+    if (session.GetProfiling().IsEnabled()) {
+      throw std::runtime_error("Profiling is already enabled for this session.");
+    }
+    session.StartProfiling(logger_.get());
+  }
+
+  void AddEvent(const profiling::EventRecord& event) {
+    static const std::string kernel_time_suffix = "_kernel_time";
+    if (event.cat == profiling::SESSION_EVENT && event.name == "model_run") {
+      std::lock_guard<OrtMutex> lock(mutex_);
+      runs_.Add(event.dur);
+      return;
+    }
+    if (event.cat != profiling::NODE_EVENT || event.name.size() <= kernel_time_suffix.size() ||
+        event.name.compare(event.name.size() - kernel_time_suffix.size(), kernel_time_suffix.size(),
+                           kernel_time_suffix) != 0) {
+      return;
+    }
+
+    const auto op_name = event.args.find("op_name");
+    const std::string node_name = event.name.substr(0, event.name.size() - kernel_time_suffix.size());
+    std::lock_guard<OrtMutex> lock(mutex_);
+    nodes_[node_name].Add(event.dur);
+    if (op_name != event.args.end()) {
+      op_types_[op_name->second].Add(event.dur);
+    }
+  }
+
+  py::dict Snapshot(bool reset) {
+    std::unordered_map<std::string, DurationHistogram> op_types;
+    std::unordered_map<std::string, DurationHistogram> nodes;
+    DurationHistogram runs;
+    {
+      std::lock_guard<OrtMutex> lock(mutex_);
+      if (reset) {
+        op_types.swap(op_types_);
+        nodes.swap(nodes_);
+        std::swap(runs, runs_);
+      } else {
+        op_types = op_types_;
+        nodes = nodes_;
+        runs = runs_;
+      }
+    }
+
+    py::dict op_types_dict;
+    for (const auto& [name, histogram] : op_types) {
+      op_types_dict[py::str(name)] = histogram.ToTuple();
+    }
+    py::dict nodes_dict;
+    for (const auto& [name, histogram] : nodes) {
+      nodes_dict[py::str(name)] = histogram.ToTuple();
+    }
+    py::dict snapshot;
+    snapshot["op_types"] = op_types_dict;
+    snapshot["nodes"] = nodes_dict;
+    snapshot["runs"] = runs.ToTuple();
+    return snapshot;
+  }
+
+  void Reset() {
+    std::lock_guard<OrtMutex> lock(mutex_);
+    op_types_.clear();
+    nodes_.clear();
+    runs_ = DurationHistogram();
+  }
+
+ private:
+  class Sink : public logging::ISink {
+   public:
+    explicit Sink(ProfilingAggregator& aggregator) : aggregator_(aggregator) {}
+
+    void SendProfileEvent(profiling::EventRecord& event) const override {
+      aggregator_.AddEvent(event);
+    }
+
+   private:
+    // Only the profiling events are sent to the logger of the aggregator.
+    void SendImpl(const logging::Timestamp&, const std::string&, const logging::Capture&) override {}
+
+    ProfilingAggregator& aggregator_;
+  };
+
+  OrtMutex mutex_;
+  std::unordered_map<std::string, DurationHistogram> op_types_;
+  std::unordered_map<std::string, DurationHistogram> nodes_;
+  DurationHistogram runs_;
+  std::unique_ptr<logging::LoggingManager> logging_manager_;
+  std::unique_ptr<logging::Logger> logger_;
+};
+
+}  // namespace
+
+void addProfilingMethods(pybind11::module& m) {
+  py::class_<ProfilingAggregator>(m, "ProfilingAggregator", R"pbdoc(Aggregates the durations of the nodes and the runs
+of sessions in histograms in memory.)pbdoc")
+      .def(py::init<>())
+      // The aggregator is kept alive by the session, which sends it the events of its runs until it is destroyed.
+      .def(
+          "start_profiling", [](ProfilingAggregator* aggregator, PyInferenceSession* sess) -> void {
+            aggregator->StartProfiling(*sess->GetSessionHandle());
+          },
+          py::keep_alive<2, 1>(),
+          R"pbdoc(Starts the profiling of a session into the aggregator, until the session ends profiling.)pbdoc")
+      .def("snapshot", &ProfilingAggregator::Snapshot, py::arg("reset") = false,
+           R"pbdoc(Returns the histograms of the op types, of the nodes and of the runs. With reset, the histograms
+are cleared atomically with the snapshot.)pbdoc")
+      .def("reset", &ProfilingAggregator::Reset, R"pbdoc(Clears the histograms.)pbdoc");
+}
+
+}  // namespace python
+}  // namespace onnxruntime
@@ -53,6 +53,9 @@ void QuantizeMatMul4BitsBlockwise(
   py::buffer_info scale_buf = scale.request();
   py::buffer_info zp_buf = zero_points.request();
 
+  // Weights of a model may be quantized concurrently by several Python threads.
+  py::gil_scoped_release release;
+
   MlasQuantizeBlockwise<T, 4>(
       reinterpret_cast<uint8_t*>(dst_buf.ptr),
       reinterpret_cast<T*>(scale_buf.ptr),
@@ -83,6 +86,8 @@ void QuantizeMatMulBnb4Blockwise(
   py::buffer_info src_buf = src.request();
   py::buffer_info absmax_buf = absmax.request();
 
+  py::gil_scoped_release release;
+
   contrib::QuantizeBlockwiseBnb4<T>(
       static_cast<uint8_t*>(dst_buf.ptr),
       static_cast<const T*>(src_buf.ptr),
@@ -2,20 +2,17 @@
 
 import argparse
 import fnmatch
-import json
-import subprocess as sp
-from collections import defaultdict
+import os
+import sys
 
 import pandas as pd
 
-
-def _demangle(name, demangler="c++filt"):
-    try:
-        with sp.Popen([demangler, name], stdin=sp.PIPE, stdout=sp.PIPE) as proc:
-            out, _ = proc.communicate()
-            return out.decode("utf-8").strip()
-    except Exception:
-        return name
+if os.path.exists(os.path.join(os.path.dirname(__file__), "..", "profile_trace.py")):
+    # Allow running this script without installing onnxruntime package.
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+    from profile_trace import TraceColumns, demangle_names, iter_trace_events
+else:
+    from onnxruntime.tools.profile_trace import TraceColumns, demangle_names, iter_trace_events
 
 
 def _get_args():
@@ -90,15 +87,24 @@ def _shape_to_string(shape):
     return res
 
 
-def _json_to_df(data, filter_matcher):
-    cpu_entries = []
-    gpu_entries = []
+def _trace_to_columns(events, filter_matcher):
+    """
+    Reads the CPU and GPU kernel entries of the trace events into columns, and the number of entries of each before
+    every model_run event, which split the entries by model run.
+    """
+    cpu_entries = TraceColumns(["name", "input_type_shape", "output_type_shape"], ["duration"])
+    gpu_entries = TraceColumns(["name", "dimensions", "op_name", "input_type_shape"], ["duration"])
+    run_offsets = []
 
     most_recent_kernel_launch_event = None
     num_missing_kernel_launch_events = 0
     total_kernel_events = 0
 
-    for item in data:
+    for item in events:
+        name = item.get("name")
+        if name == "model_run":
+            run_offsets.append((len(cpu_entries), len(gpu_entries)))
+
         cat = item.get("cat")
         if cat is None:
             continue
@@ -110,8 +116,6 @@ def _json_to_df(data, filter_matcher):
             continue
         op_name = arg.get("op_name")
 
-        name = item["name"]
-
         if not filter_matcher(name) and op_name is not None and not filter_matcher(op_name):
             continue
 
@@ -128,30 +132,27 @@ def _json_to_df(data, filter_matcher):
         grid_z = arg.get("grid_z", -1)
 
         if cat == "Kernel":
+            input_type_shape = (
+                _shape_to_string(most_recent_kernel_launch_event["args"]["input_type_shape"])
+                if most_recent_kernel_launch_event is not None
+                else "unknown"
+            )
             gpu_entries.append(
-                {
-                    "name": name,
-                    "duration": dur,
-                    "dimensions": f"b{block_x}x{block_y}x{block_z},g{grid_x}x{grid_y}x{grid_z}",
-                    "op_name": op_name,
-                    "input_type_shape": (
-                        _shape_to_string(most_recent_kernel_launch_event["args"]["input_type_shape"])
-                        if most_recent_kernel_launch_event is not None
-                        else "unknown"
-                    ),
-                }
+                name=name,
+                duration=dur,
+                dimensions=f"b{block_x}x{block_y}x{block_z},g{grid_x}x{grid_y}x{grid_z}",
+                op_name=op_name,
+                input_type_shape=input_type_shape,
             )
             total_kernel_events += 1
-            if gpu_entries[-1]["input_type_shape"] == "unknown" and "hipMem" not in gpu_entries[-1]["name"]:
+            if input_type_shape == "unknown" and "hipMem" not in name:
                 num_missing_kernel_launch_events += 1
         else:
             cpu_entries.append(
-                {
-                    "name": item["args"]["op_name"],
-                    "duration": dur,
-                    "input_type_shape": _shape_to_string(item["args"]["input_type_shape"]),
-                    "output_type_shape": _shape_to_string(item["args"]["output_type_shape"]),
-                }
+                name=item["args"]["op_name"],
+                duration=dur,
+                input_type_shape=_shape_to_string(item["args"]["input_type_shape"]),
+                output_type_shape=_shape_to_string(item["args"]["output_type_shape"]),
             )
 
     if num_missing_kernel_launch_events > 0:
@@ -159,11 +160,13 @@ def _json_to_df(data, filter_matcher):
             f"WARNING: Could not resolve shapes for {num_missing_kernel_launch_events} of {total_kernel_events} kernels."
         )
 
-    cpu_df = pd.DataFrame(cpu_entries)
-    gpu_df = pd.DataFrame(gpu_entries)
-    cpu_df["count"] = 1
-    gpu_df["count"] = 1
-    return cpu_df, gpu_df
+    return cpu_entries, gpu_entries, run_offsets
+
+
+def _columns_to_df(columns):
+    df = columns.to_dataframe()
+    df["count"] = 1
+    return df
 
 
 def _print_top_hitters(frame, args, target="cpu"):
@@ -182,13 +185,14 @@ def _print_top_hitters(frame, args, target="cpu"):
     frame2 = frame[["duration", "count"]].sum()
     frame["pct"] = 100 * (frame["duration"] / frame2["duration"])
     fields = [*group_key, "duration", "pct", "count"]
-    frame1 = frame[fields].groupby(group_key).sum().reset_index()
+    frame1 = frame[fields].groupby(group_key, observed=True).sum().reset_index()
     frame1 = frame1.sort_values(by="duration", ascending=False)[:top]
     frame1["cumulative_pct"] = frame1["pct"].cumsum()
     frame1["cumulative_dur"] = frame1["duration"].cumsum()
 
     if target.lower() == "gpu":
-        frame1["name"] = frame1["name"].apply(lambda x: _demangle(x, args.demangler))
+        names = frame1["name"].astype(str)
+        frame1["name"] = names.map(demangle_names(names, args.demangler))
 
     print(f"\n------ Top {target.upper()} Kernel Times ------")
     print(frame1.round(2).to_string(index=False))
@@ -196,33 +200,20 @@ def _print_top_hitters(frame, args, target="cpu"):
         frame1.to_csv(f"{args.csv}_{target}_kernel_times.csv", index=False)
 
 
-def _print_op_kernel_mapping_info(cpu_df, gpu_df, num_runs, csv=None):
+def _print_op_kernel_mapping_info(cpu_entries, gpu_entries, num_runs, csv=None):
     # Count op occurrences in the selected runs
-    op_counts = defaultdict(int)
-    for op in cpu_df.T.to_dict().values():
-        identifiers = tuple([op["name"], op["input_type_shape"]])
-        op_counts[identifiers] += 1
-
-    # Collect kernel stats: count/duration
-    stat_dict = defaultdict(lambda: defaultdict(float))
-    for kernel in gpu_df.T.to_dict().values():
-        op_name = kernel["op_name"]
-        if op_name is None:  # Only interested in op related kernels
-            continue
-        input_type_shape = kernel["input_type_shape"]
-        kernel_name = kernel["name"]
-        dimensions = kernel["dimensions"]
-        identifiers = tuple([op_name, input_type_shape, kernel_name, dimensions])
-        stat_dict[identifiers]["count"] += 1
-        stat_dict[identifiers]["duration"] += kernel["duration"]
+    op_counts = cpu_entries.sum_by(["name", "input_type_shape"], "duration")
+
+    # Collect kernel stats: count/duration, of the op related kernels only
+    stat_dict = gpu_entries.sum_by(["op_name", "input_type_shape", "name", "dimensions"], "duration")
 
     # Create the DataFrame for kernel entries with op correlation info
     kernel_list = []
-    for identifiers, stat in stat_dict.items():
+    for identifiers, (duration, count) in stat_dict.items():
         op_name, input_type_shape, kernel_name, dimensions = identifiers
-        op_count = op_counts.get(tuple([op_name, input_type_shape]))
-        if op_count is None:
+        if (op_name, input_type_shape) not in op_counts:
             continue
+        _, op_count = op_counts[(op_name, input_type_shape)]
         kernel_list.append(
             {
                 "op_name": op_name,
@@ -230,9 +221,9 @@ def _print_op_kernel_mapping_info(cpu_df, gpu_df, num_runs, csv=None):
                 "op_count": op_count / num_runs,  # Average op count per run
                 "kernel_name": kernel_name,
                 "kernel_dimensions": dimensions,
-                "kernel_count": stat["count"] / num_runs,  # Average kernel count per run
-                "kernel_avg_dur (us)": stat["duration"] / stat["count"],
-                "kernel_total_dur (us)": stat["duration"] / num_runs,
+                "kernel_count": count / num_runs,  # Average kernel count per run
+                "kernel_avg_dur (us)": duration / count,
+                "kernel_total_dur (us)": duration / num_runs,
             }
         )
 
@@ -271,17 +262,16 @@ def _construct_filter_matcher(args):
     return _match_item
 
 
-def _split_data_across_runs(data, start=1, end=None):
+def _split_data_across_runs(cpu_entries, gpu_entries, run_offsets, start=1, end=None):
     """
-    Splits the traces according to model runs they belong to.
+    Splits the entries according to model runs they belong to.
     By default, we skip the first model run (run 0) and consider all subsequent runs.
     """
     # Here we assume that the traces are properly ordered, so we can simplify the splitting logic.
-    model_run_splits = [i for i, item in enumerate(data) if item.get("name") == "model_run"]
-    if not model_run_splits:
+    if not run_offsets:
         print('WARNING: Could not find "model_run" event in trace. Using entire traces.')
-        return data
-    total_num_runs = len(model_run_splits)
+        return cpu_entries, gpu_entries, 1
+    total_num_runs = len(run_offsets)
     print(f"Found {total_num_runs} model_run events in trace.")
 
     assert -total_num_runs <= start < total_num_runs, f"Invalid start index {start}."
@@ -297,32 +287,27 @@ def _split_data_across_runs(data, start=1, end=None):
     assert num_runs > 0, "No valid model runs are included in the split."
     print(f"Analyzing {num_runs} model run(s): {start}-{end - 1}.")
 
-    # Add index 0 in case user wants to include the first model run.
-    model_run_splits = [0, *model_run_splits]
-    return data[model_run_splits[start] : model_run_splits[end]], num_runs
-
-
-def _load_json(profile_path):
-    with open(profile_path, encoding="utf-8") as file_obj:
-        data = json.load(file_obj)
-    if isinstance(data, dict):
-        data = data["traceEvents"]
-    return data
+    # Add offset 0 in case user wants to include the first model run.
+    run_offsets = [(0, 0), *run_offsets]
+    (cpu_start, gpu_start), (cpu_end, gpu_end) = run_offsets[start], run_offsets[end]
+    return cpu_entries.slice(cpu_start, cpu_end), gpu_entries.slice(gpu_start, gpu_end), num_runs
 
 
 def main():
     args = _get_args()
     filter_matcher = _construct_filter_matcher(args)
 
-    data = _load_json(args.input)
-    data, num_runs = _split_data_across_runs(data, args.start, args.end)
-    cpu_df, gpu_df = _json_to_df(data, filter_matcher)
+    # The trace is streamed, and only the columns of the kernel entries are kept in memory.
+    cpu_entries, gpu_entries, run_offsets = _trace_to_columns(iter_trace_events(args.input), filter_matcher)
+    cpu_entries, gpu_entries, num_runs = _split_data_across_runs(
+        cpu_entries, gpu_entries, run_offsets, args.start, args.end
+    )
 
     pd.set_option("display.max_colwidth", 120)
-    _print_top_hitters(cpu_df, args, target="cpu")
-    _print_top_hitters(gpu_df, args, target="gpu")
+    _print_top_hitters(_columns_to_df(cpu_entries), args, target="cpu")
+    _print_top_hitters(_columns_to_df(gpu_entries), args, target="gpu")
     if args.mapping:
-        _print_op_kernel_mapping_info(cpu_df, gpu_df, num_runs, args.csv)
+        _print_op_kernel_mapping_info(cpu_entries, gpu_entries, num_runs, args.csv)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,212 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+# Streaming reader of the chrome trace files written by the profiler of onnxruntime, shared by the profiler of
+# transformers and the profile explorer. The events are decoded one by one from chunks of the file, so that traces of
+# several GB of long runs are processed without loading the whole file, and the values needed by a tool are kept in
+# compact numpy columns.
+
+import json
+import re
+import subprocess
+from array import array
+
+import numpy as np
+
+TRACE_CHUNK_SIZE = 1 << 20
+
+# Separators of the values of a JSON array or object.
+_SEPARATORS = re.compile(r"[\s,]*")
+
+# Demangled names of each demangler, cached across calls of demangle_names.
+_demangled_names = {}
+
+
+class _JsonStream:
+    """Decodes the values of a JSON document one by one from chunks of a text file."""
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skips the separators, and returns the next character or an empty string at the end of the file."""
+        while True:
+            self.pos = _SEPARATORS.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return ""
+
+    def skip(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos} of the trace")
+        self.pos += 1
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer might continue in the next chunk.
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read()
+
+
+def _iter_array(stream):
+    stream.skip("[")
+    while True:
+        char = stream.peek()
+        # The closing bracket is optional in the trace event format, for traces of processes which did not exit.
+        if char in ("]", ""):
+            return
+        yield stream.decode()
+
+
+def iter_trace_events(trace_path, chunk_size=TRACE_CHUNK_SIZE):
+    """
+    Yields the events of a chrome trace file one by one, reading the file in chunks of chunk_size characters. The
+    trace is either an array of events or an object with the events in traceEvents.
+    """
+    with open(trace_path, encoding="utf-8") as trace_file:
+        stream = _JsonStream(trace_file, chunk_size)
+        char = stream.peek()
+        if char == "[":
+            yield from _iter_array(stream)
+            return
+        if char != "{":
+            raise ValueError(f"{trace_path} is not a JSON trace")
+
+        stream.skip("{")
+        while stream.peek() not in ("}", ""):
+            key = stream.decode()
+            stream.skip(":")
+            if key == "traceEvents":
+                yield from _iter_array(stream)
+                return
+            stream.decode()
+        raise ValueError(f"{trace_path} has no traceEvents")
+
+
+def demangle_names(names, demangler="c++filt"):
+    """
+    Returns a dict from names to their demangled form. The names which are not in the cache of the demangler are
+    demangled by a single run of the demangler, which reads a name per line. The names are not changed when the
+    demangler cannot be run.
+    """
+    cache = _demangled_names.setdefault(demangler, {})
+    missing = [name for name in dict.fromkeys(names) if name not in cache]
+    if missing:
+        try:
+            demangled = subprocess.run(
+                [demangler], input="\n".join(missing) + "\n", capture_output=True, check=True, text=True
+            ).stdout.splitlines()
+        except (OSError, subprocess.CalledProcessError):
+            demangled = missing
+        # A name with a line break would shift all the names after it.
+        if len(demangled) != len(missing):
+            demangled = missing
+        cache.update(zip(missing, (name.strip() for name in demangled)))
+    return {name: cache[name] for name in names}
+
+
+class TraceColumns:
+    """
+    Columns of the values computed from the events of a trace, one row per event. A string column is stored as int32
+    codes into the list of its distinct values, with -1 for None, and a number column as int64, so that a row takes a
+    few bytes whatever the size of the event.
+    """
+
+    def __init__(self, string_columns, number_columns):
+        self.string_columns = list(string_columns)
+        self.number_columns = list(number_columns)
+        self._codes = {name: array("i") for name in self.string_columns}
+        self._values = {name: {} for name in self.string_columns}
+        self._numbers = {name: array("q") for name in self.number_columns}
+
+    def __len__(self):
+        columns = self._codes or self._numbers
+        return len(next(iter(columns.values()))) if columns else 0
+
+    def append(self, **row):
+        for name, codes in self._codes.items():
+            value = row.get(name)
+            if value is None:
+                codes.append(-1)
+            else:
+                values = self._values[name]
+                code = values.get(value)
+                if code is None:
+                    code = values[value] = len(values)
+                codes.append(code)
+        for name, numbers in self._numbers.items():
+            numbers.append(row.get(name, 0))
+
+    def strings(self, name):
+        """Returns the distinct values of a string column, in the order of their codes."""
+        return list(self._values[name])
+
+    def column(self, name):
+        """Returns the codes of a string column or the values of a number column in a numpy array."""
+        return np.array(self._codes[name] if name in self._codes else self._numbers[name])
+
+    def slice(self, start, stop):
+        """Returns the rows from start to stop in new columns, which share the distinct values of these columns."""
+        columns = TraceColumns([], [])
+        columns.string_columns = self.string_columns
+        columns.number_columns = self.number_columns
+        columns._codes = {name: codes[start:stop] for name, codes in self._codes.items()}
+        columns._values = self._values
+        columns._numbers = {name: numbers[start:stop] for name, numbers in self._numbers.items()}
+        return columns
+
+    def sum_by(self, keys, value):
+        """
+        Groups the rows by the values of the string columns keys, and returns a dict from the tuple of the values of
+        the keys to the sum of the number column value and the count of the rows of the group. The rows with a None
+        key are skipped.
+        """
+        codes = [self.column(key) for key in keys]
+        valid = np.ones(len(self), dtype=bool)
+        for key_codes in codes:
+            valid &= key_codes >= 0
+        sizes = [max(len(self._values[key]), 1) for key in keys]
+        groups = np.ravel_multi_index([key_codes[valid] for key_codes in codes], sizes)
+        unique_groups, inverse = np.unique(groups, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.column(value)[valid], minlength=len(unique_groups))
+        counts = np.bincount(inverse, minlength=len(unique_groups))
+
+        strings = [self.strings(key) for key in keys]
+        group_codes = zip(*(key_codes.tolist() for key_codes in np.unravel_index(unique_groups, sizes)))
+        return {
+            tuple(strings[i][code] for i, code in enumerate(group)): (int(total), int(count))
+            for group, total, count in zip(group_codes, totals.tolist(), counts.tolist())
+        }
+
+    def to_dataframe(self):
+        """Returns the columns in a pandas DataFrame, with categorical string columns."""
+        import pandas as pd
+
+        data = {name: pd.Categorical.from_codes(self.column(name), self.strings(name)) for name in self.string_columns}
+        data.update({name: self.column(name) for name in self.number_columns})
+        return pd.DataFrame(data)
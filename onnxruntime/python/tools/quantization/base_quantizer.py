@@ -22,7 +22,6 @@ from .quant_utils import (
     ONNX_TYPE_TO_NP_TYPE,
     TENSOR_NAME_QUANT_SUFFIX,
     QuantType,
-    find_by_name,
     model_has_infer_metadata,
     quantize_data,
     quantize_nparray,
@@ -133,14 +132,14 @@ class BaseQuantizer:
         raise NotImplementedError
 
     def is_input_a_initializer(self, input_name):
-        initializer = find_by_name(input_name, self.model.initializer())
+        initializer = self.model.get_initializer(input_name)
         return initializer is not None
 
     def is_per_channel(self):
         return self.per_channel
 
     def is_valid_quantize_weight(self, weight_name):
-        weight = find_by_name(weight_name, self.model.initializer())
+        weight = self.model.get_initializer(weight_name)
         if weight is not None:
             return weight.data_type in (onnx.TensorProto.FLOAT, onnx.TensorProto.FLOAT16)
         if (not self.enable_subgraph_quantization) or (self.parent is None):
@@ -204,7 +203,7 @@ class BaseQuantizer:
         """
 
         # get bias
-        bias_initializer = find_by_name(bias_name, self.model.initializer())
+        bias_initializer = self.model.get_initializer(bias_name)
         bias_data = tensor_proto_to_array(bias_initializer)
         quantized_bias_name = bias_name + TENSOR_NAME_QUANT_SUFFIX
 
@@ -353,7 +352,7 @@ class BaseQuantizer:
         reduce_range=True,
         keep_float_weight=False,
     ):
-        initializer = find_by_name(weight_name, self.model.initializer())
+        initializer = self.model.get_initializer(weight_name)
         if initializer is None:
             raise ValueError("{} is not an initializer", weight_name)
 
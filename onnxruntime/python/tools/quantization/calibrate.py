@@ -5,10 +5,15 @@
 # license information.
 # --------------------------------------------------------------------------
 import abc
+import collections
 import copy
+import functools
 import itertools
+import logging
+import multiprocessing
 import os
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 from pathlib import Path
 from typing import Dict, Optional, Sequence, Tuple, Union
@@ -19,7 +24,8 @@ from onnx import ModelProto, TensorProto, helper, numpy_helper
 
 import onnxruntime
 
-from .quant_utils import apply_plot, load_model_with_shape_infer, smooth_distribution
+from .calibration_cache import CalibrationCache, hash_inputs, hash_model
+from .quant_utils import apply_plot, load_model_with_shape_infer
 
 
 def rel_entr(pk: np.ndarray, qk: np.ndarray) -> np.ndarray:
@@ -156,6 +162,27 @@ class CalibrationDataReader(metaclass=abc.ABCMeta):
         return result
 
 
+# InferenceSession of a worker process created by CalibraterBase.set_parallel_sessions.
+_worker_infer_session = None
+
+
+def _create_worker_inference_session(augmented_model_path, execution_providers, intra_op_num_threads):
+    global _worker_infer_session  # noqa: PLW0603
+    sess_options = onnxruntime.SessionOptions()
+    sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+    if intra_op_num_threads:
+        sess_options.intra_op_num_threads = intra_op_num_threads
+    _worker_infer_session = onnxruntime.InferenceSession(
+        augmented_model_path,
+        sess_options=sess_options,
+        providers=execution_providers,
+    )
+
+
+def _run_worker_inference_session(inputs):
+    return _worker_infer_session.run(None, inputs)
+
+
 class CalibraterBase:
     def __init__(
         self,
@@ -187,6 +214,13 @@ class CalibraterBase:
         self.augment_model = None
         self.infer_session = None
         self.execution_providers = ["CPUExecutionProvider"]
+        self.num_sessions = 1
+        self.intra_op_num_threads = None
+        self.calibration_cache = None
+        self.cache_key = None
+        self.sample_hashes = []
+        self.num_collected_samples = 0
+        self.calibrate_outputs = True
 
     def set_execution_providers(self, execution_providers=["CPUExecutionProvider"]):  # noqa: B006
         """
@@ -207,9 +241,136 @@ class CalibraterBase:
             providers=self.execution_providers,
         )
 
+    def set_parallel_sessions(self, num_sessions, intra_op_num_threads=None):
+        """
+        run the augmented model with num_sessions InferenceSession, each one in its own worker process.
+        The data reader is still consumed in the current process and its inputs are dispatched to the workers.
+        The outputs are collected in the same order as with a single session so the result does not change.
+        :param num_sessions: number of worker processes, 1 runs the model in the current process.
+        :param intra_op_num_threads: number of threads of every worker session,
+            by default the cores are split between the workers.
+        """
+        if num_sessions < 1:
+            raise ValueError(f"num_sessions={num_sessions} must be >= 1.")
+        self.num_sessions = num_sessions
+        if intra_op_num_threads is None and num_sessions > 1:
+            intra_op_num_threads = max(1, (os.cpu_count() or 1) // num_sessions)
+        self.intra_op_num_threads = intra_op_num_threads
+
+    def set_calibration_cache(self, cache_dir, reader_fingerprint=None):
+        """
+        store the collected statistics in cache_dir, see :class:`CalibrationCache`. It must be called before
+        augment_graph. The first call to collect_data restores the statistics previously collected with
+        the same model, calibrated tensors, settings and calibration data, skips the samples they cover and
+        saves the statistics every time the intermediate outputs are merged.
+        :param cache_dir: directory of the cache.
+        :param reader_fingerprint: string identifying the calibration data. By default, it is a hash of the
+            first input of the data reader, so appending samples at the end of the data reader keeps it.
+            The hash of every sample is stored with the statistics, a data reader whose first samples are not
+            the ones of the cached statistics raises a ValueError instead of reusing them.
+        """
+        self.calibration_cache = CalibrationCache(cache_dir)
+        self.reader_fingerprint = reader_fingerprint
+        self.model_hash = hash_model(self.model)
+        self.cache_tensors, _ = self.select_tensors_to_calibrate(self.model)
+        self.cache_key = None
+
+    def get_cache_settings(self) -> dict:
+        """
+        return: the settings of the calibrater which change the collected statistics.
+        """
+        raise NotImplementedError
+
+    def get_cache_state(self) -> Dict[str, Tuple[np.ndarray, ...]]:
+        """
+        return: the statistics collected so far, {tensor name: tuple of arrays}.
+        """
+        raise NotImplementedError
+
+    def set_cache_state(self, state: Dict[str, Tuple[np.ndarray, ...]]):
+        """
+        restore the statistics returned by get_cache_state.
+        """
+        raise NotImplementedError
+
+    def save_calibration_cache(self):
+        """
+        save the statistics collected so far if a calibration cache is used. The intermediate outputs
+        must have been merged into the statistics.
+        """
+        if self.calibration_cache is not None and self.cache_key is not None:
+            self.calibration_cache.save(
+                self.cache_key, self.sample_hashes[: self.num_collected_samples], self.get_cache_state()
+            )
+
+    def iter_data_reader(self, data_reader: CalibrationDataReader):
+        """
+        Iterate on the inputs given by the data reader, skipping the ones restored from the calibration cache.
+        """
+        inputs = data_reader.get_next()
+        if self.calibration_cache is not None and self.cache_key is None:
+            reader_fingerprint = self.reader_fingerprint
+            if reader_fingerprint is None and inputs:
+                reader_fingerprint = hash_inputs(inputs)
+            if reader_fingerprint is not None:
+                self.cache_key = CalibrationCache.make_key(
+                    self.model_hash, self.cache_tensors, self.get_cache_settings(), reader_fingerprint
+                )
+                cached = self.calibration_cache.load(self.cache_key)
+                if cached is not None:
+                    sample_hashes, state = cached
+                    for index, sample_hash in enumerate(sample_hashes):
+                        if not inputs or hash_inputs(inputs) != sample_hash:
+                            raise ValueError(
+                                f"Sample {index} of the data reader is not the one of the statistics cached in "
+                                f"{self.calibration_cache.cache_dir}, set reader_fingerprint to a string "
+                                "identifying the calibration data."
+                            )
+                        inputs = data_reader.get_next()
+                    self.set_cache_state(state)
+                    self.sample_hashes = list(sample_hashes)
+                    self.num_collected_samples = len(sample_hashes)
+
+        while inputs:
+            if self.calibration_cache is not None:
+                self.sample_hashes.append(hash_inputs(inputs))
+            yield inputs
+            inputs = data_reader.get_next()
+
+    def run_data_reader(self, data_reader: CalibrationDataReader):
+        """
+        Run the augmented model on every input given by the data reader.
+        :return: generator of the outputs of the augmented model, in the order of the inputs.
+        """
+        if self.num_sessions <= 1:
+            for inputs in self.iter_data_reader(data_reader):
+                outputs = self.infer_session.run(None, inputs)
+                self.num_collected_samples += 1
+                yield outputs
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=self.num_sessions,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_create_worker_inference_session,
+            initargs=(str(self.augmented_model_path), self.execution_providers, self.intra_op_num_threads),
+        ) as executor:
+            # Only a few inputs per worker are in flight to keep the memory bounded.
+            pending = collections.deque()
+            for inputs in self.iter_data_reader(data_reader):
+                pending.append(executor.submit(_run_worker_inference_session, inputs))
+                if len(pending) >= 2 * self.num_sessions:
+                    outputs = pending.popleft().result()
+                    self.num_collected_samples += 1
+                    yield outputs
+            while pending:
+                outputs = pending.popleft().result()
+                self.num_collected_samples += 1
+                yield outputs
+
     def select_tensors_to_calibrate(self, model: ModelProto):
         """
-        select input/output tensors of candidate nodes to calibrate.
+        select input/output tensors of candidate nodes to calibrate, only the inputs if calibrate_outputs is False.
         returns:
             tensors (set): set of tensor name.
             value_infos (dict): tensor name to value info.
@@ -224,7 +385,7 @@ class CalibraterBase:
 
         for node in model.graph.node:
             if not self.op_types_to_calibrate or node.op_type in self.op_types_to_calibrate:
-                for tensor_name in itertools.chain(node.input, node.output):
+                for tensor_name in itertools.chain(node.input, node.output if self.calibrate_outputs else []):
                     if tensor_name in value_infos:
                         vi = value_infos[tensor_name]
                         if (
@@ -274,6 +435,9 @@ class MinMaxCalibrater(CalibraterBase):
         moving_average=False,
         averaging_constant=0.01,
         max_intermediate_outputs=None,
+        per_channel=False,
+        channel_axis=1,
+        calibrate_outputs=True,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -284,6 +448,11 @@ class MinMaxCalibrater(CalibraterBase):
         :param moving_average: compute the moving average of the minimum and maximum values instead of the global minimum and maximum.
         :param averaging_constant: constant smoothing factor to use when computing the moving average.
         :param max_intermediate_outputs: maximum number of intermediate outputs before an intermediate range is computed.
+        :param per_channel: compute the range of every channel of the tensors instead of one range per tensor.
+            The ranges are arrays with one value per channel, the number of channels of a tensor must be static.
+            A single range is computed for the tensors of unknown rank.
+        :param channel_axis: axis of the channels when per_channel is True, negative values count from the last axis.
+        :param calibrate_outputs: compute the range of the outputs of the nodes too, not only of their inputs.
         """
         super().__init__(
             model_path,
@@ -292,10 +461,21 @@ class MinMaxCalibrater(CalibraterBase):
             symmetric=symmetric,
             use_external_data_format=use_external_data_format,
         )
-        self.intermediate_outputs = []
         self.calibrate_tensors_range = None
         self.num_model_outputs = len(self.model.graph.output)
         self.model_original_outputs = {output.name for output in self.model.graph.output}
+        # Running (ReduceMin, ReduceMax) statistics of the calibrated tensors, the values of all the tensors
+        # are concatenated in the order of the augmented outputs. The two rows hold the running minimum and
+        # maximum or, with moving_average, the running sums of both values.
+        self.calibrate_tensor_names = None
+        self.calibrate_tensor_dtypes = None
+        self.calibrate_tensor_offsets = None
+        self.accumulated_range = None
+        self.accumulated_range_index = None
+        self.num_accumulated_outputs = 0
+        self.per_channel = per_channel
+        self.channel_axis = channel_axis
+        self.calibrate_outputs = calibrate_outputs
         self.moving_average = moving_average
         if moving_average and (averaging_constant < 0 or averaging_constant > 1):
             raise ValueError("Invalid averaging constant, which should not be < 0 or > 1.")
@@ -310,8 +490,28 @@ class MinMaxCalibrater(CalibraterBase):
         """
         tensors, _ = self.select_tensors_to_calibrate(self.model)
         reshape_shape_name = str(uuid.uuid4())
-        reshape_shape = numpy_helper.from_array(np.array([1], dtype=np.int64), reshape_shape_name)
+        reshape_shape = numpy_helper.from_array(
+            np.array([-1 if self.per_channel else 1], dtype=np.int64), reshape_shape_name
+        )
         self.model.graph.initializer.append(reshape_shape)
+        opset_version = next(
+            (opset.version for opset in self.model.opset_import if opset.domain in ("", "ai.onnx")), None
+        )
+
+        def get_reduced_axes(tensor_name):
+            """Returns the axes reduced to compute the range of every channel, None to compute a single range."""
+            if tensor_name not in value_infos or not value_infos[tensor_name].type.tensor_type.HasField("shape"):
+                logging.warning(
+                    f"Unable to compute the range of every channel of tensor {tensor_name!r} of unknown rank, "
+                    f"a single range is computed. Running shape inference before quantization may resolve this issue."
+                )
+                return None
+            dims = value_infos[tensor_name].type.tensor_type.shape.dim
+            if not dims:
+                # a scalar has a single channel
+                return []
+            channel_axis = self.channel_axis % len(dims)
+            return [axis for axis in range(len(dims)) if axis != channel_axis]
 
         def add_reduce_min_max(tensor_name, reduce_op_name):
             # When doing ReduceMax/ReduceMin, ORT can't reduce on dim with value of 0 if 'keepdims' is false.
@@ -324,6 +524,21 @@ class MinMaxCalibrater(CalibraterBase):
             reduce_node = onnx.helper.make_node(
                 reduce_op_name, [tensor_name], [intermediate_output], keepdims=keepdims, name=reduce_output
             )
+            reduced_axes = get_reduced_axes(tensor_name) if self.per_channel else None
+            if reduced_axes is not None:
+                if not reduced_axes:
+                    reduce_node = onnx.helper.make_node(
+                        "Identity", [tensor_name], [intermediate_output], name=reduce_output
+                    )
+                elif opset_version is not None and opset_version >= 18:
+                    # the axes of ReduceMin and ReduceMax are an input since opset 18
+                    axes_name = reduce_output + "_Axes"
+                    self.model.graph.initializer.append(
+                        numpy_helper.from_array(np.array(reduced_axes, dtype=np.int64), axes_name)
+                    )
+                    reduce_node.input.append(axes_name)
+                else:
+                    reduce_node.attribute.append(helper.make_attribute("axes", reduced_axes))
 
             reshape_node = onnx.helper.make_node(
                 "Reshape",
@@ -333,9 +548,6 @@ class MinMaxCalibrater(CalibraterBase):
             )
 
             self.model.graph.node.extend([reduce_node, reshape_node])
-            value_infos = {vi.name: vi for vi in self.model.graph.value_info}
-            value_infos.update({o.name: o for o in self.model.graph.output})
-            value_infos.update({i.name: i for i in self.model.graph.input})
             if tensor_name in value_infos:
                 onnx_type = value_infos[tensor_name].type.tensor_type.elem_type
             else:
@@ -343,8 +555,13 @@ class MinMaxCalibrater(CalibraterBase):
                     f"Unable to guess tensor type for tensor {tensor_name!r}, "
                     f"running shape inference before quantization may resolve this issue."
                 )
-            self.model.graph.output.append(helper.make_tensor_value_info(reduce_output, onnx_type, [1]))
+            self.model.graph.output.append(
+                helper.make_tensor_value_info(reduce_output, onnx_type, [None if self.per_channel else 1])
+            )
 
+        value_infos = {vi.name: vi for vi in self.model.graph.value_info}
+        value_infos.update({o.name: o for o in self.model.graph.output})
+        value_infos.update({i.name: i for i in self.model.graph.input})
         for tensor in tensors:
             add_reduce_min_max(tensor, "ReduceMin")
             add_reduce_min_max(tensor, "ReduceMax")
@@ -356,41 +573,101 @@ class MinMaxCalibrater(CalibraterBase):
         )
 
     def clear_collected_data(self):
-        self.intermediate_outputs = []
+        self.num_accumulated_outputs = 0
+
+    def accumulate_outputs(self, outputs: Sequence[np.ndarray]):
+        """
+        Folds the outputs of one inference into the running statistics of the calibrated tensors.
+        Only the ReduceMin and ReduceMax outputs added by augment_graph are read, the cost of one
+        inference is proportional to the number of calibrated tensors and nothing is kept from it.
+        """
+        added_outputs = outputs[self.num_model_outputs :]
+        if self.calibrate_tensor_names is None:
+            added_output_names = [output.name for output in self.model.graph.output[self.num_model_outputs :]]
+            self.calibrate_tensor_names = [name.rpartition("_")[0] for name in added_output_names[::2]]
+            self.calibrate_tensor_dtypes = [output.dtype for output in added_outputs[::2]]
+            # ReduceMin and ReduceMax outputs alternate, both hold one value per channel
+            sizes = np.array([output.size for output in added_outputs[::2]], dtype=np.int64)
+            self.calibrate_tensor_offsets = np.concatenate([[0], np.cumsum(sizes)])
+            if self.per_channel:
+                # position of the minimum and maximum of every channel in the concatenated outputs
+                min_index = np.arange(self.calibrate_tensor_offsets[-1]) + np.repeat(
+                    self.calibrate_tensor_offsets[:-1], sizes
+                )
+                self.accumulated_range_index = np.stack([min_index, min_index + np.repeat(sizes, sizes)])
+            else:
+                self.accumulated_range_index = None
+            self.accumulated_range = np.empty((2, self.calibrate_tensor_offsets[-1]), dtype=np.float64)
+
+        values = np.concatenate(added_outputs)
+        if values.size != 2 * self.calibrate_tensor_offsets[-1]:
+            raise ValueError("The number of channels of the calibrated tensors must not change between inputs.")
+        if self.accumulated_range_index is None:
+            # Every added output holds a single value.
+            values = values.reshape(-1, 2).T
+        else:
+            values = values[self.accumulated_range_index]
+        if self.num_accumulated_outputs == 0:
+            self.accumulated_range[:] = values
+        elif self.moving_average:
+            self.accumulated_range += values
+        else:
+            np.minimum(self.accumulated_range[0], values[0], out=self.accumulated_range[0])
+            np.maximum(self.accumulated_range[1], values[1], out=self.accumulated_range[1])
+        self.num_accumulated_outputs += 1
 
     def collect_data(self, data_reader: CalibrationDataReader):
-        while True:
-            inputs = data_reader.get_next()
-            if not inputs:
-                break
-            self.intermediate_outputs.append(self.infer_session.run(None, inputs))
+        for outputs in self.run_data_reader(data_reader):
+            self.accumulate_outputs(outputs)
             if (
                 self.max_intermediate_outputs is not None
-                and len(self.intermediate_outputs) == self.max_intermediate_outputs
+                and self.num_accumulated_outputs == self.max_intermediate_outputs
             ):
-                self.compute_range()
+                self.compute_data()
                 self.clear_collected_data()
+                self.save_calibration_cache()
 
-        if len(self.intermediate_outputs) == 0 and self.calibrate_tensors_range is None:
+        if self.num_accumulated_outputs == 0 and self.calibrate_tensors_range is None:
             raise ValueError("No data is collected.")
 
         t = self.compute_data()
         if not isinstance(t, TensorsData):
             raise TypeError(f"compute_data must return a TensorsData not {type(t)}.")
         self.clear_collected_data()
+        self.save_calibration_cache()
+
+    def get_cache_settings(self) -> dict:
+        return {
+            "calibrater": "MinMax",
+            "symmetric": self.symmetric,
+            "per_channel": self.per_channel,
+            "channel_axis": self.channel_axis,
+            "moving_average": self.moving_average,
+            "averaging_constant": self.averaging_constant,
+        }
+
+    def get_cache_state(self) -> Dict[str, Tuple[np.ndarray, ...]]:
+        if self.calibrate_tensors_range is None:
+            return {}
+        return {tensor: self.calibrate_tensors_range[tensor].range_value for tensor in self.calibrate_tensors_range}
+
+    def set_cache_state(self, state: Dict[str, Tuple[np.ndarray, ...]]):
+        self.calibrate_tensors_range = TensorsData(CalibrationMethod.MinMax, state) if state else None
 
     def merge_range(self, old_range, new_range):
         if not old_range:
             return new_range
 
-        for key, value in old_range.items():
+        for key, value in old_range.data.items():
+            old_min, old_max = value.range_value
+            new_min, new_max = new_range[key].range_value
             if self.moving_average:
-                min_value = value[0] + self.averaging_constant * (new_range[key][0] - value[0])
-                max_value = value[1] + self.averaging_constant * (new_range[key][1] - value[1])
+                min_value = old_min + self.averaging_constant * (new_min - old_min)
+                max_value = old_max + self.averaging_constant * (new_max - old_max)
             else:
-                min_value = min(value[0], new_range[key][0])
-                max_value = max(value[1], new_range[key][1])
-            new_range[key] = (min_value, max_value)
+                min_value = np.minimum(old_min, new_min)
+                max_value = np.maximum(old_max, new_max)
+            new_range[key] = TensorData(lowest=min_value, highest=max_value)
 
         return new_range
 
@@ -400,43 +677,27 @@ class MinMaxCalibrater(CalibraterBase):
         :return: dictionary mapping: {added node names: (ReduceMin, ReduceMax) pairs }
         """
 
-        if len(self.intermediate_outputs) == 0:
+        if self.num_accumulated_outputs == 0:
             return self.calibrate_tensors_range
 
-        output_names = [self.infer_session.get_outputs()[i].name for i in range(len(self.intermediate_outputs[0]))]
-        output_dicts_list = [
-            dict(zip(output_names, intermediate_output)) for intermediate_output in self.intermediate_outputs
+        if self.moving_average:
+            accumulated_range = self.accumulated_range / self.num_accumulated_outputs
+        else:
+            accumulated_range = self.accumulated_range
+        min_values, max_values = accumulated_range
+        if self.symmetric:
+            max_values = np.maximum(np.abs(min_values), np.abs(max_values))
+            min_values = -max_values
+
+        offsets = self.calibrate_tensor_offsets
+        pairs = [
+            (min_values[start:end].astype(dtype), max_values[start:end].astype(dtype))
+            for start, end, dtype in zip(offsets[:-1], offsets[1:], self.calibrate_tensor_dtypes)
         ]
 
-        merged_output_dict = {}
-        for d in output_dicts_list:
-            for k, v in d.items():
-                merged_output_dict.setdefault(k, []).append(v)
-        added_output_names = output_names[self.num_model_outputs :]
-        calibrate_tensor_names = [
-            added_output_names[i].rpartition("_")[0] for i in range(0, len(added_output_names), 2)
-        ]  # output names
-
-        merged_added_output_dict = {
-            i: merged_output_dict[i] for i in merged_output_dict if i not in self.model_original_outputs
-        }
-
-        pairs = []
-        for i in range(0, len(added_output_names), 2):
-            if self.moving_average:
-                min_value_array = np.mean(merged_added_output_dict[added_output_names[i]], axis=0)
-                max_value_array = np.mean(merged_added_output_dict[added_output_names[i + 1]], axis=0)
-            else:
-                min_value_array = np.min(merged_added_output_dict[added_output_names[i]], axis=0)
-                max_value_array = np.max(merged_added_output_dict[added_output_names[i + 1]], axis=0)
-
-            if self.symmetric:
-                max_absolute_value = max(np.abs(min_value_array), np.abs(max_value_array))
-                pairs.append(tuple([-max_absolute_value, max_absolute_value]))
-            else:
-                pairs.append(tuple([min_value_array, max_value_array]))
-
-        new_calibrate_tensors_range = TensorsData(CalibrationMethod.MinMax, dict(zip(calibrate_tensor_names, pairs)))
+        new_calibrate_tensors_range = TensorsData(
+            CalibrationMethod.MinMax, dict(zip(self.calibrate_tensor_names, pairs))
+        )
         if self.calibrate_tensors_range:
             self.calibrate_tensors_range = self.merge_range(self.calibrate_tensors_range, new_calibrate_tensors_range)
         else:
@@ -458,6 +719,8 @@ class HistogramCalibrater(CalibraterBase):
         num_quantized_bins=2048,
         percentile=99.999,
         scenario="same",
+        max_intermediate_outputs=None,
+        num_workers=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path.
@@ -470,6 +733,13 @@ class HistogramCalibrater(CalibraterBase):
         :param num_quantized_bins: number of quantized bins. Default 128.
         :param percentile: A float number between [0, 100]. Default 99.99.
         :param scenario: see :class:`DistributionCalibrater`
+        :param max_intermediate_outputs: maximum number of intermediate outputs kept in memory before they are
+            merged into the histograms. By default, all outputs are kept until the data reader is exhausted.
+            The counts already collected are spread over the new bins when the range of a tensor grows, so the
+            thresholds are close to, but not always equal to, the ones computed from all the outputs at once.
+            The entropy method is the most sensitive to this approximation.
+        :param num_workers: number of processes used to compute the thresholds of the tensors in parallel.
+            By default, the thresholds are computed in the current process.
         """
         super().__init__(
             model_path,
@@ -489,6 +759,8 @@ class HistogramCalibrater(CalibraterBase):
         self.percentile = percentile
         self.tensors_to_calibrate = None
         self.scenario = scenario
+        self.max_intermediate_outputs = max_intermediate_outputs
+        self.num_workers = num_workers
 
     def augment_graph(self):
         """
@@ -512,16 +784,64 @@ class HistogramCalibrater(CalibraterBase):
     def collect_data(self, data_reader: CalibrationDataReader):
         """
         Entropy Calibrator collects operators' tensors as well as generates tensor histogram for each operator.
+        If max_intermediate_outputs is set, the collected outputs are folded into the histograms every
+        max_intermediate_outputs runs so that memory does not grow with the number of calibration samples.
         """
-        while True:
-            inputs = data_reader.get_next()
-            if not inputs:
-                break
-            self.intermediate_outputs.append(self.infer_session.run(None, inputs))
+        for outputs in self.run_data_reader(data_reader):
+            self.intermediate_outputs.append(outputs)
+            if (
+                self.max_intermediate_outputs is not None
+                and len(self.intermediate_outputs) == self.max_intermediate_outputs
+            ):
+                self.collect_histogram()
+                self.clear_collected_data()
+                self.save_calibration_cache()
 
-        if len(self.intermediate_outputs) == 0:
+        if len(self.intermediate_outputs) == 0 and self.collector is None:
             raise ValueError("No data is collected.")
 
+        self.collect_histogram()
+        self.clear_collected_data()
+        self.save_calibration_cache()
+
+    def create_collector(self):
+        self.collector = HistogramCollector(
+            method=self.method,
+            symmetric=self.symmetric,
+            num_bins=self.num_bins,
+            num_quantized_bins=self.num_quantized_bins,
+            percentile=self.percentile,
+            scenario=self.scenario,
+            num_workers=self.num_workers,
+        )
+
+    def get_cache_settings(self) -> dict:
+        # Only the symmetric percentile method collects histograms of absolute values,
+        # the other methods can share the same histograms.
+        return {
+            "calibrater": "Histogram",
+            "absolute_value": self.method == "percentile" and self.symmetric,
+            "num_bins": self.num_bins,
+        }
+
+    def get_cache_state(self) -> Dict[str, Tuple[np.ndarray, ...]]:
+        if self.collector is None:
+            return {}
+        return self.collector.get_histogram_dict()
+
+    def set_cache_state(self, state: Dict[str, Tuple[np.ndarray, ...]]):
+        if not state:
+            return
+        self.create_collector()
+        self.collector.histogram_dict = dict(state)
+
+    def collect_histogram(self):
+        """
+        Merge the intermediate outputs collected so far into the histogram of every calibrated tensor.
+        """
+        if len(self.intermediate_outputs) == 0:
+            return
+
         output_names = [self.infer_session.get_outputs()[i].name for i in range(len(self.intermediate_outputs[0]))]
         output_dicts_list = [
             dict(zip(output_names, intermediate_output)) for intermediate_output in self.intermediate_outputs
@@ -535,18 +855,9 @@ class HistogramCalibrater(CalibraterBase):
         clean_merged_dict = {i: merged_dict[i] for i in merged_dict if i in self.tensors_to_calibrate}
 
         if not self.collector:
-            self.collector = HistogramCollector(
-                method=self.method,
-                symmetric=self.symmetric,
-                num_bins=self.num_bins,
-                num_quantized_bins=self.num_quantized_bins,
-                percentile=self.percentile,
-                scenario=self.scenario,
-            )
+            self.create_collector()
         self.collector.collect(clean_merged_dict)
 
-        self.clear_collected_data()
-
     def compute_data(self) -> TensorsData:
         """
         Compute the min-max range of tensor
@@ -577,6 +888,8 @@ class EntropyCalibrater(HistogramCalibrater):
         symmetric=False,
         num_bins=128,
         num_quantized_bins=128,
+        max_intermediate_outputs=None,
+        num_workers=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -587,6 +900,9 @@ class EntropyCalibrater(HistogramCalibrater):
         :param symmetric: make range of tensor symmetric (central point is 0).
         :param num_bins: number of bins to create a new histogram for collecting tensor values.
         :param num_quantized_bins: number of quantized bins. Default 128.
+        :param max_intermediate_outputs: maximum number of intermediate outputs kept in memory before they are
+            merged into the histograms.
+        :param num_workers: number of processes used to compute the thresholds of the tensors in parallel.
         """
         super().__init__(
             model_path,
@@ -597,6 +913,8 @@ class EntropyCalibrater(HistogramCalibrater):
             symmetric=symmetric,
             num_bins=num_bins,
             num_quantized_bins=num_quantized_bins,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
 
 
@@ -611,6 +929,8 @@ class PercentileCalibrater(HistogramCalibrater):
         symmetric=False,
         num_bins=2048,
         percentile=99.999,
+        max_intermediate_outputs=None,
+        num_workers=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -621,6 +941,9 @@ class PercentileCalibrater(HistogramCalibrater):
         :param symmetric: make range of tensor symmetric (central point is 0).
         :param num_quantized_bins: number of quantized bins. Default 128.
         :param percentile: A float number between [0, 100]. Default 99.99.
+        :param max_intermediate_outputs: maximum number of intermediate outputs kept in memory before they are
+            merged into the histograms.
+        :param num_workers: number of processes used to compute the thresholds of the tensors in parallel.
         """
         super().__init__(
             model_path,
@@ -631,6 +954,8 @@ class PercentileCalibrater(HistogramCalibrater):
             symmetric=symmetric,
             num_bins=num_bins,
             percentile=percentile,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
 
 
@@ -644,6 +969,8 @@ class DistributionCalibrater(HistogramCalibrater):
         method="distribution",
         num_bins=128,
         scenario="same",
+        max_intermediate_outputs=None,
+        num_workers=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -657,6 +984,9 @@ class DistributionCalibrater(HistogramCalibrater):
             the algorithm weights and float 8 follow the same distribution,
             if `scenario="p3"`, it assumes the weights follow
             a gaussian law and float 8 ~ X^3 where X is a gaussian law
+        :param max_intermediate_outputs: maximum number of intermediate outputs kept in memory before they are
+            merged into the histograms.
+        :param num_workers: number of processes used to compute the thresholds of the tensors in parallel.
         """
         super().__init__(
             model_path,
@@ -666,6 +996,8 @@ class DistributionCalibrater(HistogramCalibrater):
             method=method,
             num_bins=num_bins,
             scenario=scenario,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
 
 
@@ -700,7 +1032,7 @@ class HistogramCollector(CalibrationDataCollector):
                  pytorch_quantization/calib/histogram.html
     """
 
-    def __init__(self, method, symmetric, num_bins, num_quantized_bins, percentile, scenario):
+    def __init__(self, method, symmetric, num_bins, num_quantized_bins, percentile, scenario, num_workers=None):
         self.histogram_dict = {}
         self.method = method
         self.symmetric = symmetric
@@ -708,6 +1040,7 @@ class HistogramCollector(CalibrationDataCollector):
         self.num_quantized_bins = num_quantized_bins
         self.percentile = percentile
         self.scenario = scenario
+        self.num_workers = num_workers
 
     def get_histogram_dict(self):
         return self.histogram_dict
@@ -779,9 +1112,18 @@ class HistogramCollector(CalibrationDataCollector):
                     # NOTE: np.arange may create an extra bin after the one containing temp_amax
                     new_bin_edges = np.arange(old_hist_edges[-1] + width, temp_amax + width, width)
                     old_hist_edges = np.hstack((old_hist_edges, new_bin_edges))
+                # the first edge is the smallest absolute value of the first data, smaller values need new bins
+                num_lower_bins = 0
+                temp_amin = np.min(data_arr_np)
+                if temp_amin < old_hist_edges[0]:
+                    width = old_hist_edges[1] - old_hist_edges[0]
+                    # NOTE: one more bin than needed, so that the rounding of the edges does not leave temp_amin out
+                    num_lower_bins = int((old_hist_edges[0] - temp_amin) // width) + 2
+                    new_bin_edges = old_hist_edges[0] - width * np.arange(num_lower_bins, 0, -1)
+                    old_hist_edges = np.hstack((new_bin_edges, old_hist_edges))
                 hist, hist_edges = np.histogram(data_arr_np, bins=old_hist_edges)
                 hist_edges = hist_edges.astype(data_arr_np.dtype)
-                hist[: len(old_hist)] += old_hist
+                hist[num_lower_bins : num_lower_bins + len(old_hist)] += old_hist
                 assert (
                     data_arr_np.dtype != np.float64
                 ), "only float32 or float16 is supported, every constant must be explicetly typed"
@@ -836,13 +1178,12 @@ class HistogramCollector(CalibrationDataCollector):
                 hist, hist_edges = np.histogram(data_arr, len(old_hist), range=(-new_threshold, new_threshold))
                 hist += old_hist
             else:
-                old_num_bins = len(old_hist)
-                old_stride = 2 * old_threshold / old_num_bins
-                half_increased_bins = int((new_threshold - old_threshold) // old_stride + 1)
-                new_num_bins = old_num_bins + 2 * half_increased_bins
-                new_threshold = half_increased_bins * old_stride + old_threshold
-                hist, hist_edges = np.histogram(data_arr, new_num_bins, range=(-new_threshold, new_threshold))
-                hist[half_increased_bins : new_num_bins - half_increased_bins] += old_hist
+                # The old counts are spread over the bins of the new range, assuming they are uniform in their bins,
+                # so that the histogram keeps the same bins as if all the values had been collected at once.
+                hist, hist_edges = np.histogram(data_arr, len(old_hist), range=(-new_threshold, new_threshold))
+                old_cumsum = np.concatenate(([0], np.cumsum(old_hist))).astype(np.float64)
+                moved_cumsum = np.round(np.interp(hist_edges, old_hist_edges.astype(np.float64), old_cumsum))
+                hist += np.diff(moved_cumsum).astype(hist.dtype)
             return (
                 hist,
                 hist_edges,
@@ -865,6 +1206,26 @@ class HistogramCollector(CalibrationDataCollector):
         else:
             raise ValueError("Only 'entropy', 'percentile' or 'distribution' methods are supported")
 
+    def map_histograms(self, compute_threshold):
+        """
+        Apply `compute_threshold(self, histogram)` to the histogram of every tensor.
+        The tensors are independent, they are dispatched to a pool of processes if num_workers > 1.
+        :return: dictionary mapping: {tensor name: result}
+        """
+        tensors = list(self.histogram_dict)
+        histograms = [self.histogram_dict[tensor] for tensor in tensors]
+        if not self.num_workers or self.num_workers <= 1 or len(histograms) <= 1:
+            return {tensor: compute_threshold(self, histogram) for tensor, histogram in zip(tensors, histograms)}
+
+        # Only the settings of the collector are sent to the workers, not every histogram it holds.
+        settings = copy.copy(self)
+        settings.histogram_dict = {}
+        num_workers = min(self.num_workers, len(histograms))
+        chunksize = max(1, len(histograms) // (num_workers * 4))
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = executor.map(functools.partial(compute_threshold, settings), histograms, chunksize=chunksize)
+            return dict(zip(tensors, results))
+
     def compute_percentile(self):
         if self.percentile < 0 or self.percentile > 100:
             raise ValueError("Invalid percentile. Must be in range 0 <= percentile <= 100.")
@@ -872,66 +1233,68 @@ class HistogramCollector(CalibrationDataCollector):
         histogram_dict = self.histogram_dict
         percentile = self.percentile
 
-        thresholds_dict = {}  # per tensor thresholds
-
         print(f"Number of tensors : {len(histogram_dict)}")
         print(f"Number of histogram bins : {self.num_bins}")
         print(f"Percentile : ({100.0 - percentile},{percentile})")
 
-        for tensor, histogram in histogram_dict.items():
-            hist = histogram[0]
-            hist_edges = histogram[1]
-            total = hist.sum()
-            cdf = np.cumsum(hist / total)
-            if self.symmetric:
-                idx_right = np.searchsorted(cdf, percentile / 100.0)
+        thresholds_dict = self.map_histograms(HistogramCollector.get_percentile_threshold)  # per tensor thresholds
 
-                thresholds_dict[tensor] = (
-                    -np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
-                    np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
-                )
-            else:
-                percent_to_cut_one_side = (100.0 - percentile) / 200.0
-                idx_right = np.searchsorted(cdf, 1.0 - percent_to_cut_one_side)
-                idx_left = np.searchsorted(cdf, percent_to_cut_one_side)
-                thresholds_dict[tensor] = (
-                    np.array(hist_edges[idx_left], dtype=hist_edges.dtype),
-                    np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
-                )
-            min_value = histogram[2]
-            max_value = histogram[3]
-            if thresholds_dict[tensor][0] < min_value:
-                thresholds_dict[tensor] = (min_value, thresholds_dict[tensor][1])
-            if thresholds_dict[tensor][1] > max_value:
-                thresholds_dict[tensor] = (thresholds_dict[tensor][0], max_value)
-            thresholds_dict[tensor] = (*thresholds_dict[tensor], *hist[:2])
-            # Plot histogram for debug only
-            if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
-                apply_plot(hist, hist_edges)
+        # Plot histogram for debug only
+        if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
+            for histogram in histogram_dict.values():
+                apply_plot(histogram[0], histogram[1])
 
         return thresholds_dict
 
+    def get_percentile_threshold(self, histogram):
+        hist = histogram[0]
+        hist_edges = histogram[1]
+        percentile = self.percentile
+        total = hist.sum()
+        cdf = np.cumsum(hist / total)
+        if self.symmetric:
+            idx_right = np.searchsorted(cdf, percentile / 100.0)
+
+            threshold = (
+                -np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
+                np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
+            )
+        else:
+            percent_to_cut_one_side = (100.0 - percentile) / 200.0
+            idx_right = np.searchsorted(cdf, 1.0 - percent_to_cut_one_side)
+            idx_left = np.searchsorted(cdf, percent_to_cut_one_side)
+            threshold = (
+                np.array(hist_edges[idx_left], dtype=hist_edges.dtype),
+                np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
+            )
+        min_value = histogram[2]
+        max_value = histogram[3]
+        if threshold[0] < min_value:
+            threshold = (min_value, threshold[1])
+        if threshold[1] > max_value:
+            threshold = (threshold[0], max_value)
+        return (*threshold, *hist[:2])
+
     def compute_entropy(self):
         histogram_dict = self.histogram_dict
-        num_quantized_bins = self.num_quantized_bins
-
-        thresholds_dict = {}  # per tensor thresholds
 
         print(f"Number of tensors : {len(histogram_dict)}")
         print(f"Number of histogram bins : {self.num_bins} (The number may increase depends on the data it collects)")
         print(f"Number of quantized bins : {self.num_quantized_bins}")
 
-        for tensor, histogram in histogram_dict.items():
-            optimal_threshold = self.get_entropy_threshold(histogram, num_quantized_bins)
-            thresholds_dict[tensor] = optimal_threshold
-            thresholds_dict[tensor] = (*optimal_threshold, *histogram[:2])
+        thresholds_dict = self.map_histograms(HistogramCollector.get_optimal_entropy_threshold)  # per tensor thresholds
 
-            # Plot histogram for debug only
-            if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
+        # Plot histogram for debug only
+        if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
+            for histogram in histogram_dict.values():
                 apply_plot(histogram[0], histogram[1])
 
         return thresholds_dict
 
+    def get_optimal_entropy_threshold(self, histogram):
+        optimal_threshold = self.get_entropy_threshold(histogram, self.num_quantized_bins)
+        return (*optimal_threshold, *histogram[:2])
+
     @staticmethod
     def _avg_std(hist, hist_edges, power=1):
         if power <= 0:
@@ -959,41 +1322,135 @@ class HistogramCollector(CalibrationDataCollector):
             raise ValueError("Invalid num_bins. Must be in range 512 <= num_bins.")
 
         histogram_dict = self.histogram_dict
-        thresholds_dict = {}  # per tensor thresholds
 
         print(f"Number of tensors : {len(histogram_dict)}")
         print(f"Number of histogram bins : {self.num_bins}")
         print(f"Scenario : {self.scenario!r})")
 
-        for tensor, histogram in histogram_dict.items():
-            hist = histogram[0]
-            hist_edges = histogram[1]
+        thresholds_dict = self.map_histograms(HistogramCollector.get_distribution_threshold)  # per tensor thresholds
 
-            assert hist_edges.dtype != np.float64
-            if self.scenario == "same":
-                avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1)
-            elif self.scenario == "p3":
-                avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1.0 / 3.0)
-            else:
-                raise ValueError("Invalid scenario. Must be in {'same', 'p3'}.")
-            assert avg_coef.dtype != np.float64
-            assert std_coef.dtype != np.float64
-            assert hist_edges.dtype != np.float64
-            thresholds_dict[tensor] = TensorData(
-                avg=avg_coef,
-                std=std_coef,
-                hist=hist,
-                hist_edges=hist_edges,
-                lowest=hist_edges.min(),
-                highest=hist_edges.max(),
-            )
-
-            # Plot histogram for debug only
-            if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
-                apply_plot(hist, hist_edges)
+        # Plot histogram for debug only
+        if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
+            for histogram in histogram_dict.values():
+                apply_plot(histogram[0], histogram[1])
 
         return thresholds_dict
 
+    def get_distribution_threshold(self, histogram):
+        hist = histogram[0]
+        hist_edges = histogram[1]
+
+        assert hist_edges.dtype != np.float64
+        if self.scenario == "same":
+            avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1)
+        elif self.scenario == "p3":
+            avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1.0 / 3.0)
+        else:
+            raise ValueError("Invalid scenario. Must be in {'same', 'p3'}.")
+        assert avg_coef.dtype != np.float64
+        assert std_coef.dtype != np.float64
+        assert hist_edges.dtype != np.float64
+        return TensorData(
+            avg=avg_coef,
+            std=std_coef,
+            hist=hist,
+            hist_edges=hist_edges,
+            lowest=hist_edges.min(),
+            highest=hist_edges.max(),
+        )
+
+    # Maximum number of histogram values processed at once by _kl_divergences.
+    _entropy_chunk_elements = 2**20
+
+    @staticmethod
+    def _smooth_distributions(p, lengths, eps=0.0001):
+        """
+        Batched version of :func:`smooth_distribution` applied to every row of `p`,
+        only the first `lengths[k]` values of row `k` are considered and the others must be positive.
+        Returns the smoothed rows and a mask of the rows which are not only made of zeros.
+        """
+        is_zeros = p == 0
+        n_zeros = np.count_nonzero(is_zeros, axis=1)
+        n_nonzeros = lengths - n_zeros
+        non_empty = n_nonzeros > 0
+
+        eps1 = eps * n_zeros.astype(np.float64) / np.where(non_empty, n_nonzeros, 1)
+        eps1[~non_empty] = 0
+        assert (eps1 < 1.0).all(), f"eps1={eps1.max()}"
+
+        # Same values as `hist += eps * is_zeros + (-eps1) * is_nonzeros` in float32.
+        hist = p.astype(np.float32)
+        hist -= eps1.astype(np.float32)[:, np.newaxis]
+        hist[is_zeros] = np.float32(eps)
+        assert (hist > 0).all()
+        return hist, non_empty
+
+    @classmethod
+    def _kl_divergences(cls, hist, start_indices, end_indices, num_quantized_bins, dtype):
+        """
+        Computes the KL divergence between the reference distribution `p` and its quantized version `q`
+        for every candidate slice `hist[start_indices[k]:end_indices[k]]`. All candidates must merge
+        the same number of bins into every quantized bin.
+        The result is the same as evaluating every candidate with :func:`smooth_distribution` and :func:`entropy`.
+        """
+        num_candidates = start_indices.size
+        lengths = end_indices - start_indices
+        max_length = lengths.max()
+        num_merged_bins = lengths[0] // num_quantized_bins
+        merged_size = num_quantized_bins * num_merged_bins
+        assert (lengths // num_quantized_bins == num_merged_bins).all()
+        rows = np.arange(num_candidates)
+        valid = np.arange(max_length) < lengths[:, np.newaxis]
+
+        # The outliers of every candidate are read from prefix sums instead of being summed again for each one.
+        cumulative_hist = np.concatenate((np.zeros(1, dtype=hist.dtype), np.cumsum(hist)))
+        left_outliers_counts = cumulative_hist[start_indices]
+        right_outliers_counts = cumulative_hist[-1] - cumulative_hist[end_indices]
+
+        # sliced distributions, padded values are set to 1 and ignored
+        padded_hist = np.concatenate((hist, np.ones(max_length, dtype=hist.dtype)))
+        sliced_distribution = np.lib.stride_tricks.sliding_window_view(padded_hist, max_length)[start_indices]
+        sliced_distribution[~valid] = 1
+
+        # quantize p.size bins into quantized bins (default 128 bins), the remaining bins go to the last one
+        merged_shape = (num_candidates, num_quantized_bins, num_merged_bins)
+        quantized_bins = sliced_distribution[:, :merged_size].reshape(merged_shape).sum(axis=2).astype(np.int64)
+        quantized_bins[:, -1] += cumulative_hist[end_indices] - cumulative_hist[start_indices + merged_size]
+
+        # reference distribution p
+        p = sliced_distribution
+        p[:, 0] += left_outliers_counts
+        p[rows, lengths - 1] += right_outliers_counts
+
+        # in order to compare p and q, we need to make length of q equals to length of p
+        # expand quantized bins into p.size bins, the remaining bins of q stay at zero
+        norm = np.count_nonzero(p[:, :merged_size].reshape(merged_shape), axis=2)
+        expanded_bins = np.zeros(quantized_bins.shape, dtype=np.float64)
+        np.divide(quantized_bins, norm, out=expanded_bins, where=norm != 0)
+        q = np.zeros(p.shape, dtype=np.int64)
+        q[:, :merged_size] = np.repeat(expanded_bins, num_merged_bins, axis=1)
+        q[~valid] = 1
+
+        p, p_non_empty = cls._smooth_distributions(p, lengths)
+        q, q_non_empty = cls._smooth_distributions(q, lengths)
+        non_empty = p_non_empty & q_non_empty
+
+        # Sums are computed row by row on the valid values to get the same rounding as entropy().
+        kl_divergence = np.full(num_candidates, np.inf, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p_sums = np.ones((num_candidates, 1), dtype=np.float32)
+            q_sums = np.ones((num_candidates, 1), dtype=np.float32)
+            non_empty_rows = [(k, lengths[k]) for k in np.nonzero(non_empty)[0].tolist()]
+            for k, length in non_empty_rows:
+                p_sums[k] = p[k, :length].sum()
+                q_sums[k] = q[k, :length].sum()
+            p = 1.0 * p / p_sums
+            q = 1.0 * q / q_sums
+            vec = rel_entr(p, q)
+            for k, length in non_empty_rows:
+                kl_divergence[k] = np.array(vec[k, :length].sum(), dtype=dtype)
+        return kl_divergence
+
     def get_entropy_threshold(self, histogram, num_quantized_bins):
         """Given a dataset, find the optimal threshold for quantizing it.
         The reference distribution is `q`, and the candidate distribution is `p`.
@@ -1008,7 +1465,6 @@ class HistogramCollector(CalibrationDataCollector):
 
         dtype = histogram[1].dtype
         kl_divergence = np.zeros(zero_bin_index - num_half_quantized_bin + 1)
-        thresholds = [(np.array(0, dtype=dtype), np.array(0, dtype=dtype)) for i in range(kl_divergence.size)]
 
         # <------------ num bins ---------------->
         #        <--- quantized bins ---->
@@ -1024,56 +1480,32 @@ class HistogramCollector(CalibrationDataCollector):
         # |                                      |
         # start index                    end index       (end of iteration)
 
-        for i in range(num_half_quantized_bin, zero_bin_index + 1, 1):
-            start_index = zero_bin_index - i
-            end_index = zero_bin_index + i + 1 if (zero_bin_index + i + 1) <= num_bins else num_bins
-
-            thresholds[i - num_half_quantized_bin] = (hist_edges[start_index], hist_edges[end_index])
-
-            sliced_distribution = copy.deepcopy(hist[start_index:end_index])
-
-            # reference distribution p
-            p = sliced_distribution.copy()  # a copy of np array
-            left_outliers_count = sum(hist[:start_index])
-            right_outliers_count = sum(hist[end_index:])
-            p[0] += left_outliers_count
-            p[-1] += right_outliers_count
-
-            # nonzeros[i] incidates whether p[i] is non-zero
-            nonzeros = (p != 0).astype(np.int64)
-
-            # quantize p.size bins into quantized bins (default 128 bins)
-            quantized_bins = np.zeros(num_quantized_bins, dtype=np.int64)
-            num_merged_bins = sliced_distribution.size // num_quantized_bins
-
-            # merge bins into quantized bins
-            for index in range(num_quantized_bins):
-                start = index * num_merged_bins
-                end = start + num_merged_bins
-                quantized_bins[index] = sum(sliced_distribution[start:end])
-            quantized_bins[-1] += sum(sliced_distribution[num_quantized_bins * num_merged_bins :])
-
-            # in order to compare p and q, we need to make length of q equals to length of p
-            # expand quantized bins into p.size bins
-            q = np.zeros(p.size, dtype=np.int64)
-            for index in range(num_quantized_bins):
-                start = index * num_merged_bins
-                end = start + num_merged_bins
-
-                norm = sum(nonzeros[start:end])
-                if norm != 0:
-                    q[start:end] = quantized_bins[index] / norm
-
-            p = smooth_distribution(p)
-            q = smooth_distribution(q)
-            if p is None or q is None:
-                div = np.array(np.inf, dtype=dtype)
-            else:
-                div = np.array(entropy(p, q), dtype=dtype)
-            kl_divergence[i - num_half_quantized_bin] = div
+        half_widths = np.arange(num_half_quantized_bin, zero_bin_index + 1)
+        start_indices = zero_bin_index - half_widths
+        end_indices = np.minimum(zero_bin_index + half_widths + 1, num_bins)
+
+        # The candidates are evaluated by chunks of rows padded to the longest candidate of the chunk.
+        # A chunk only holds candidates merging the same number of bins into a quantized bin,
+        # consecutive candidates have close lengths so the padding stays small.
+        num_merged_bins = (end_indices - start_indices) // num_quantized_bins
+        chunk_size = max(1, self._entropy_chunk_elements // max(num_bins, 1))
+        chunk_start = 0
+        while chunk_start < kl_divergence.size:
+            chunk_end = min(
+                np.searchsorted(num_merged_bins, num_merged_bins[chunk_start], side="right"),
+                chunk_start + chunk_size,
+            )
+            chunk = slice(chunk_start, chunk_end)
+            kl_divergence[chunk] = self._kl_divergences(
+                hist, start_indices[chunk], end_indices[chunk], num_quantized_bins, dtype
+            )
+            chunk_start = chunk_end
 
         min_kl_divergence_idx = np.argmin(kl_divergence)
-        optimal_threshold = thresholds[min_kl_divergence_idx]
+        optimal_threshold = (
+            hist_edges[start_indices[min_kl_divergence_idx]],
+            hist_edges[end_indices[min_kl_divergence_idx]],
+        )
         min_value = histogram[2]
         max_value = histogram[3]
         if optimal_threshold[0] < min_value:
@@ -1100,6 +1532,9 @@ def create_calibrator(
         moving_average = extra_options.get("moving_average", False)
         averaging_constant = extra_options.get("averaging_constant", 0.01)
         max_intermediate_outputs = extra_options.get("max_intermediate_outputs", None)
+        per_channel = extra_options.get("per_channel", False)
+        channel_axis = extra_options.get("channel_axis", 1)
+        calibrate_outputs = extra_options.get("calibrate_outputs", True)
         calibrator = MinMaxCalibrater(
             model,
             op_types_to_calibrate,
@@ -1109,12 +1544,17 @@ def create_calibrator(
             moving_average=moving_average,
             averaging_constant=averaging_constant,
             max_intermediate_outputs=max_intermediate_outputs,
+            per_channel=per_channel,
+            channel_axis=channel_axis,
+            calibrate_outputs=calibrate_outputs,
         )
     elif calibrate_method == CalibrationMethod.Entropy:
         # default settings for entropy algorithm
         num_bins = extra_options.get("num_bins", 128)
         num_quantized_bins = extra_options.get("num_quantized_bins", 128)
         symmetric = extra_options.get("symmetric", False)
+        max_intermediate_outputs = extra_options.get("max_intermediate_outputs", None)
+        num_workers = extra_options.get("num_workers", None)
         calibrator = EntropyCalibrater(
             model,
             op_types_to_calibrate,
@@ -1123,12 +1563,16 @@ def create_calibrator(
             symmetric=symmetric,
             num_bins=num_bins,
             num_quantized_bins=num_quantized_bins,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
     elif calibrate_method == CalibrationMethod.Percentile:
         # default settings for percentile algorithm
         num_bins = extra_options.get("num_bins", 2048)
         percentile = extra_options.get("percentile", 99.999)
         symmetric = extra_options.get("symmetric", True)
+        max_intermediate_outputs = extra_options.get("max_intermediate_outputs", None)
+        num_workers = extra_options.get("num_workers", None)
         calibrator = PercentileCalibrater(
             model,
             op_types_to_calibrate,
@@ -1137,12 +1581,16 @@ def create_calibrator(
             symmetric=symmetric,
             num_bins=num_bins,
             percentile=percentile,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
 
     elif calibrate_method == CalibrationMethod.Distribution:
         # default settings for percentile algorithm
         num_bins = extra_options.get("num_bins", 2048)
         scenario = extra_options.get("scenario", "same")
+        max_intermediate_outputs = extra_options.get("max_intermediate_outputs", None)
+        num_workers = extra_options.get("num_workers", None)
 
         calibrator = DistributionCalibrater(
             model,
@@ -1151,11 +1599,19 @@ def create_calibrator(
             use_external_data_format=use_external_data_format,
             num_bins=num_bins,
             scenario=scenario,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
 
     if calibrator:
+        cache_dir = extra_options.get("cache_dir", None)
+        if cache_dir:
+            calibrator.set_calibration_cache(cache_dir, extra_options.get("reader_fingerprint", None))
         calibrator.augment_graph()
         calibrator.create_inference_session()
+        num_sessions = extra_options.get("num_sessions", 1)
+        if num_sessions > 1:
+            calibrator.set_parallel_sessions(num_sessions, extra_options.get("intra_op_num_threads", None))
         return calibrator
 
     raise ValueError(f"Unsupported calibration method {calibrate_method}")
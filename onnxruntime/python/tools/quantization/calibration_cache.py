@@ -0,0 +1,121 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from onnx import ModelProto
+
+_METADATA_KEY = "__metadata__"
+
+
+def hash_model(model: ModelProto) -> str:
+    """
+    Hash the graph of a model. Every element is serialized on its own so that models larger
+    than the protobuf limit of 2GB can be hashed.
+    """
+    digest = hashlib.sha256()
+    for opset in model.opset_import:
+        digest.update(opset.SerializeToString())
+    graph = model.graph
+    for field in (graph.input, graph.output, graph.initializer, graph.node):
+        digest.update(str(len(field)).encode())
+        for proto in field:
+            digest.update(proto.SerializeToString(deterministic=True))
+    return digest.hexdigest()
+
+
+def hash_inputs(inputs: dict[str, Any]) -> str:
+    """
+    Hash one input of a calibration data reader.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(inputs):
+        value = np.ascontiguousarray(inputs[name])
+        digest.update(name.encode())
+        digest.update(str(value.dtype).encode())
+        digest.update(str(value.shape).encode())
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+
+class CalibrationCache:
+    """
+    On-disk cache of the statistics collected by a calibrater.
+
+    Every entry is identified by a key built from the model, the calibrated tensors, the settings of the
+    calibrater which change the collected statistics and a fingerprint of the calibration data. An entry
+    stores the state of the calibrater, a dictionary {tensor name: tuple of numpy arrays}, and the hashes
+    of the samples of the data reader already folded into that state. A calibrater restoring an entry skips
+    those samples after checking their hashes, which allows to resume an interrupted calibration or to
+    append new samples at the end of the data reader without running the model again on the previous ones.
+    """
+
+    def __init__(self, cache_dir: str | Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(model_hash: str, tensors: set[str] | list[str], settings: dict[str, Any], reader_fingerprint: str):
+        content = json.dumps(
+            {
+                "model": model_hash,
+                "tensors": sorted(tensors),
+                "settings": settings,
+                "reader": reader_fingerprint,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir.joinpath(f"{key}.npz")
+
+    def load(self, key: str) -> tuple[list[str], dict[str, tuple[np.ndarray, ...]]] | None:
+        """
+        Returns the hashes of the samples and the state stored for this key or None if there is no entry.
+        """
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            metadata = json.loads(str(data[_METADATA_KEY]))
+            state = {}
+            for index, (tensor, length) in enumerate(zip(metadata["tensors"], metadata["lengths"])):
+                state[tensor] = tuple(data[f"{index}_{i}"] for i in range(length))
+        return metadata["sample_hashes"], state
+
+    def save(self, key: str, sample_hashes: list[str], state: dict[str, tuple[np.ndarray, ...]]):
+        """
+        Stores the state of a calibrater after the samples of hashes sample_hashes, see :func:`hash_inputs`.
+        The previous entry is replaced atomically so that an interruption never leaves a partially written entry.
+        """
+        arrays = {}
+        tensors = list(state)
+        for index, tensor in enumerate(tensors):
+            for i, value in enumerate(state[tensor]):
+                arrays[f"{index}_{i}"] = np.asarray(value)
+        metadata = {
+            "sample_hashes": list(sample_hashes),
+            "tensors": tensors,
+            "lengths": [len(state[tensor]) for tensor in tensors],
+        }
+        arrays[_METADATA_KEY] = np.array(json.dumps(metadata))
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".npz.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
@@ -7,22 +7,28 @@
 from __future__ import annotations
 
 import argparse
+import collections
 import copy
 import importlib
+import importlib.util
 import logging
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
 import onnx
+from onnx import external_data_helper
 from onnx.onnx_pb import GraphProto, ModelProto, NodeProto, TensorProto
 from packaging import version
 
 from onnxruntime.capi._pybind_state import quantize_matmul_4bits
 
-from .calibrate import CalibrationDataReader
+from .calibrate import CalibrationDataReader, CalibrationMethod, create_calibrator
 from .onnx_model import ONNXModel
-from .quant_utils import attribute_to_kwarg
+from .quant_utils import ExternalDataWriter, attribute_to_kwarg, load_external_tensor
 
 logging.basicConfig(format="%(asctime)s %(name)s [%(levelname)s] - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -105,6 +111,7 @@ class HQQWeightOnlyQuantConfig(WeightOnlyQuantConfig):
         block_size=128,
         bits=4,
         axis=1,
+        backend="auto",
     ):
         """
         This is a class for HQQ algorithm Weight Only Quant Configuration.
@@ -117,13 +124,19 @@ class HQQWeightOnlyQuantConfig(WeightOnlyQuantConfig):
                 how many bits to represent weight.
             axis (int, optional):
                 0 or 1. which axis to quantize. https://arxiv.org/pdf/2309.15531.pdf
+            backend (str, optional):
+                "torch", "numpy" or "auto". The torch implementation runs on GPU when CUDA is available,
+                the numpy implementation has no dependency. "auto" uses torch if it is installed.
         """
         super().__init__(
             algorithm="HQQ",
         )
+        if backend not in ("auto", "torch", "numpy"):
+            raise ValueError(f"Unsupported HQQ backend {backend!r}, it must be 'auto', 'torch' or 'numpy'.")
         self.block_size = block_size
         self.bits = bits
         self.axis = axis
+        self.backend = backend
 
 
 class DefaultWeightOnlyQuantConfig(WeightOnlyQuantConfig):
@@ -140,6 +153,45 @@ class DefaultWeightOnlyQuantConfig(WeightOnlyQuantConfig):
         self.accuracy_level = accuracy_level
 
 
+class AWQWeightOnlyQuantConfig(WeightOnlyQuantConfig):
+    def __init__(
+        self,
+        calibration_data_reader: CalibrationDataReader,
+        block_size: int = 128,
+        is_symmetric: bool = False,
+        accuracy_level: int | None = None,
+        n_grid: int = 20,
+    ):
+        """
+        This is a class for activation-aware weight quantization (AWQ) Weight Only Quant Configuration.
+        The per-channel magnitudes of the inputs of the MatMul nodes are collected with MinMaxCalibrater,
+        the rows of every weight are scaled by a power of the magnitudes of the matching input channels before
+        the weight is quantized with the default block quantizer and the input is scaled by the inverse scales.
+        https://arxiv.org/abs/2306.00978
+
+        Args:
+            calibration_data_reader:
+                a calibration data reader. It enumerates calibration data and generates inputs for the original model.
+            block_size (int, optional):
+                number of rows of the weight sharing a scale and a zero point.
+            is_symmetric (bool, optional):
+                whether the weight is quantized symmetrically.
+            accuracy_level (int, optional):
+                accuracy level of the MatMulNBits nodes.
+            n_grid (int, optional):
+                number of exponents in [0, 1) evaluated for every input of MatMul nodes, the exponent minimizing the
+                quantization error of the weights it multiplies, weighted by the squared magnitudes of its channels,
+                is kept.
+        """
+        super().__init__(algorithm="AWQ")
+        self.calibration_data_reader = calibration_data_reader
+        self.block_size = block_size
+        self.is_symmetric = is_symmetric
+        self.bits = 4
+        self.accuracy_level = accuracy_level
+        self.n_grid = n_grid
+
+
 def is_divisible(val1, val2):
     return int(val2 * np.ceil(val1 / val2)) == val1
 
@@ -221,6 +273,140 @@ class HQQWeightOnlyQuantizer:
         else:
             raise NotImplementedError("Only 2,4,8 bits are supported.")
 
+    # Proximal solver || weight - dequantize(quantize(weight))||_p^p, numpy implementation of optimize_weights
+    @staticmethod
+    def optimize_weights_numpy(
+        weight: np.ndarray,
+        scale: np.ndarray,
+        zero: np.ndarray,
+        min_max: list[int],
+        axis: int = 0,
+        opt_params: dict | None = None,
+        verbose=False,
+    ):
+        opt_params = {"lp_norm": 0.7, "beta": 1e1, "kappa": 1.01, "iters": 20} if opt_params is None else opt_params
+        lp_norm, beta, kappa, iters = (
+            opt_params["lp_norm"],
+            opt_params["beta"],
+            opt_params["kappa"],
+            opt_params["iters"],
+        )
+
+        w_f = weight.astype(np.float32, copy=False)
+        scale = scale.astype(np.float32, copy=False)
+        zero = zero.astype(np.float32, copy=False)
+
+        w_q = np.empty_like(w_f)
+        w_e = np.empty_like(w_f)
+        best_error = 1e4
+        for i in range(iters):
+            # w_q = round(w_f * scale + zero).clip(min_max)
+            np.multiply(w_f, scale, out=w_q)
+            w_q += zero
+            np.round(w_q, out=w_q)
+            np.clip(w_q, min_max[0], min_max[1], out=w_q)
+            # w_e = w_f - w_r with w_r = (w_q - zero) / scale
+            np.subtract(w_q, zero, out=w_e)
+            w_e /= scale
+            np.subtract(w_f, w_e, out=w_e)
+            current_error = float(np.abs(w_e).mean())
+
+            # shrink operator of the lp norm
+            abs_error = np.abs(w_e)
+            if lp_norm == 1:
+                abs_error -= 1.0 / beta
+            else:
+                abs_error -= (1.0 / beta) * np.power(abs_error + 1e-8, lp_norm - 1)
+            np.maximum(abs_error, 0, out=abs_error)
+            np.copysign(abs_error, w_e, out=w_e)
+            # zero = mean(w_q - (w_f - w_e) * scale)
+            np.subtract(w_f, w_e, out=w_e)
+            w_e *= scale
+            np.subtract(w_q, w_e, out=w_e)
+            zero = np.mean(w_e, axis=axis, keepdims=True)
+            beta *= kappa
+
+            if verbose:
+                print(i, np.round(current_error, 6))
+            if current_error < best_error:
+                best_error = current_error
+            else:
+                break
+
+        return scale, zero
+
+    @staticmethod
+    def pack_on_row_248bit_numpy(ori_int_array: np.ndarray, bits: int) -> np.ndarray:
+        """
+        Packs the rows of an array of integers in [0, 2^bits), the j-th value of every group of 8 / bits
+        consecutive values of a row is stored in the bits [bits * j, bits * (j + 1)) of a byte.
+        """
+        if bits not in [2, 4, 8]:
+            raise NotImplementedError("Only 2,4,8 bits are supported.")
+        compress_ratio = 8 // bits
+        rows, cols = ori_int_array.shape
+        grouped = ori_int_array.astype(np.uint8).reshape(rows, cols // compress_ratio, compress_ratio)
+        shifts = np.arange(0, 8, bits, dtype=np.uint8)
+        return np.bitwise_or.reduce(grouped << shifts, axis=-1)
+
+    # numpy implementation of quantize_internal
+    def quantize_internal_numpy(
+        self, weight_array, bits=4, channel_wise=True, group_size=64, optimize=True, round_zero=True, axis=1
+    ):
+        weight = weight_array.astype(np.float32)
+        ori_shape = weight.shape
+
+        pad_len = (group_size - ori_shape[axis] % group_size) % group_size
+        if axis == 1:
+            weight = np.pad(weight, ((0, 0), (0, pad_len)), "constant")
+        else:
+            weight = np.pad(weight, ((0, pad_len), (0, 0)), "constant")
+        shape = weight.shape
+
+        # Reshape for grouping
+        if (group_size is not None) and channel_wise:
+            weight = weight.reshape([-1, group_size]) if (axis == 1) else weight.reshape([group_size, -1])
+
+        # Get min/max values
+        if channel_wise is False:
+            _min, _max = weight.min(), weight.max()
+            optimize = False
+        else:
+            _min = weight.min(axis=axis, keepdims=True)
+            _max = weight.max(axis=axis, keepdims=True)
+
+        max_v = 2**bits - 1
+        min_v = 0
+        min_max = [min_v, max_v]
+
+        # Note: here we work with the inverse of the scale to avoid division and quantize instead via weight*scale + zero, the scale is inverted later on.
+        # clamp to avoid half-precision problems
+        min_max_axis = _max - _min
+        min_max_axis = np.where(min_max_axis == 0, np.float32(max_v), min_max_axis)
+        scale = np.minimum(max_v / min_max_axis, np.float32(2e4))
+        zero = -_min * scale
+
+        if round_zero:
+            zero = np.round(zero)
+
+        # Fine-tune weights
+        if optimize:
+            scale, zero = self.optimize_weights_numpy(weight, scale, zero, min_max=min_max, axis=axis)
+
+        # Quantize
+        w_q = np.clip(np.round(weight * scale + zero), min_max[0], min_max[1])
+        w_q = w_q.reshape(shape).astype(np.int32)
+
+        scale = 1.0 / scale
+        if axis == 1:
+            scale = scale.reshape(shape[0], -1)
+            zero = zero.reshape(shape[0], -1)
+        else:
+            scale = scale.reshape(-1, shape[-1])
+            zero = zero.reshape(-1, shape[-1])
+
+        return w_q, scale.astype(weight_array.dtype), zero.astype(weight_array.dtype)
+
     # from Official implementation of Half-Quadratic Quantization (HQQ)
     def quantize_internal(
         self, tensor, bits=4, channel_wise=True, group_size=64, optimize=True, round_zero=True, axis=1
@@ -287,23 +473,28 @@ class HQQWeightOnlyQuantizer:
 
         return w_q, scale.to(tensor.dtype), zero.to(tensor.dtype)
 
-    def quantize(self, node: NodeProto, graph_stack: list[GraphProto]):
-        """If the node is MatMul with fp32 const weight, quantize the weight with int4, and return the new node"""
-        if node.op_type != "MatMul":
-            return node  # only care about MatMul for now
-        import torch
+    def use_torch(self) -> bool:
+        if self.config.backend == "auto":
+            return importlib.util.find_spec("torch") is not None
+        return self.config.backend == "torch"
 
-        logger.info(f"start to quantize {node.name} ...")
-        inputB = node.input[1]  # noqa: N806
-        b_pb, bs_graph = get_initializer(inputB, graph_stack)
-        if b_pb is None:
-            logger.info("MatMul doesn't have const weight. Skip to quantize")
-            return node  # only care about constant weight
+    def quantize_weight(self, b_array: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Quantize a 2D weight, returns the packed weight, the scales and the zero points."""
+        if self.use_torch():
+            packed, scales, zero_points = self.quantize_weight_torch(b_array)
+        else:
+            quant_weight, scales, zero_points = self.quantize_internal_numpy(
+                b_array.T, bits=self.config.bits, group_size=self.config.block_size
+            )
+            packed = self.pack_on_row_248bit_numpy(quant_weight, self.config.bits)
+
+        # reshape to the shapes of the inputs of MatMulNBits: [N, k_blocks, blob_size], [N * k_blocks]
+        cols, k_blocks = scales.shape
+        return packed.reshape(cols, k_blocks, -1), scales.reshape(-1), zero_points.reshape(-1)
+
+    def quantize_weight_torch(self, b_array: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        import torch
 
-        b_array = onnx.numpy_helper.to_array(b_pb)
-        if len(b_array.shape) != 2:
-            logger.info("MatMul weight is not 2D. Skip to quantize")
-            return node  # can only process 2-D matrix
         b_array_torch = torch.from_numpy(b_array)
         if torch.cuda.is_available():
             b_array_torch = b_array_torch.cuda()
@@ -320,12 +511,22 @@ class HQQWeightOnlyQuantizer:
             device=quant_weight_torch.device,
         )
         self.pack_on_row_fast_248bit(packed_torch, quant_weight_torch, self.config.bits)
-        scales = scales_torch.cpu().numpy()
-        zero_points = zero_points_torch.cpu().numpy()
-        b_quant = onnx.numpy_helper.from_array(packed_torch.cpu().numpy())
+        return packed_torch.cpu().numpy(), scales_torch.cpu().numpy(), zero_points_torch.cpu().numpy()
+
+    def make_node(
+        self,
+        node: NodeProto,
+        b_pb: TensorProto,
+        bs_graph: GraphProto,
+        b_shape: tuple[int, ...],
+        quantized: tuple[np.ndarray, np.ndarray, np.ndarray],
+    ) -> NodeProto:
+        """Adds the quantized weight to the graph owning the weight and returns the MatMulNBits node."""
+        packed, scales, zero_points = quantized
+        b_quant = onnx.numpy_helper.from_array(packed)
         b_quant.name = b_pb.name + "_Q4"
         for input in bs_graph.input:
-            if input.name == inputB:
+            if input.name == node.input[1]:
                 bs_graph.input.remove(input)
                 break
 
@@ -340,7 +541,7 @@ class HQQWeightOnlyQuantizer:
         input_names.append(zp_tensor.name)
 
         kwargs = {}
-        rows, cols = b_array.shape
+        rows, cols = b_shape
         kwargs["K"] = rows
         kwargs["N"] = cols
         kwargs["bits"] = self.config.bits
@@ -359,6 +560,14 @@ class HQQWeightOnlyQuantizer:
 
         return matmul_q4_node
 
+    def quantize(self, node: NodeProto, graph_stack: list[GraphProto]):
+        """If the node is MatMul with fp32 const weight, quantize the weight with int4, and return the new node"""
+        weight = get_matmul_weight(node, graph_stack)
+        if weight is None:
+            return node
+        b_pb, bs_graph, b_array = weight
+        return self.make_node(node, b_pb, bs_graph, b_array.shape, self.quantize_weight(b_array))
+
 
 def get_initializer(name, graph_path: list[GraphProto]) -> tuple[TensorProto, GraphProto]:
     for gid in range(len(graph_path) - 1, -1, -1):
@@ -369,6 +578,32 @@ def get_initializer(name, graph_path: list[GraphProto]) -> tuple[TensorProto, Gr
     return None, None
 
 
+def get_matmul_weight(node: NodeProto, graph_stack: list[GraphProto], external_data_dir: str | None = None):
+    """
+    Returns the weight initializer of a MatMul node, the graph owning it and its value if the weight
+    can be quantized, None otherwise. If external_data_dir is specified, weights stored in external data
+    files are memory mapped instead of being loaded.
+    """
+    if node.op_type != "MatMul":
+        return None  # only care about MatMul for now
+
+    logger.info(f"start to quantize {node.name} ...")
+    b_pb, bs_graph = get_initializer(node.input[1], graph_stack)
+    if b_pb is None:
+        logger.info("MatMul doesn't have const weight. Skip to quantize")
+        return None  # only care about constant weight
+
+    if len(b_pb.dims) != 2:
+        logger.info("MatMul weight is not 2D. Skip to quantize")
+        return None  # can only process 2-D matrix
+
+    if external_data_dir is not None and external_data_helper.uses_external_data(b_pb):
+        b_array = load_external_tensor(b_pb, external_data_dir)
+    else:
+        b_array = onnx.numpy_helper.to_array(b_pb)
+    return b_pb, bs_graph, b_array
+
+
 class DefaultWeightOnlyQuantizer:
     def __init__(self, config: DefaultWeightOnlyQuantConfig):
         self.config = config
@@ -383,64 +618,80 @@ class DefaultWeightOnlyQuantizer:
         block_size = self.config.block_size
         blob_size = block_size // 2
         k_blocks = (rows + block_size - 1) // block_size
-        padded_rows = k_blocks * block_size
-        pad_len = padded_rows - rows
-        if pad_len > 0:
-            fp32weight = np.pad(fp32weight, ((0, pad_len), (0, 0)), "constant")
 
-        # block wise quantization, each block comes from a single column
+        # block wise quantization, each block comes from a single column. The last block of a column
+        # may be partial, the native kernel only reads the first rows of the weight so it is not padded.
         packed = np.zeros((cols, k_blocks, blob_size), dtype="uint8")
         scales = np.zeros((cols * k_blocks), dtype=fp32weight.dtype)
         zero_point = np.zeros(cols * ((k_blocks + 1) // 2), dtype="uint8")
-        quantize_matmul_4bits(packed, fp32weight, scales, zero_point, block_size, cols, rows, self.config.is_symmetric)
+        quantize_matmul_4bits(
+            packed,
+            np.ascontiguousarray(fp32weight),
+            scales,
+            zero_point,
+            block_size,
+            cols,
+            rows,
+            self.config.is_symmetric,
+        )
 
         return (packed, scales, zero_point)
 
-    def quantize(self, node: NodeProto, graph_stack: list[GraphProto]) -> NodeProto:
-        """If the node is MatMul with fp32 const weight, quantize the weight with int4, and return the new node"""
-
-        if node.op_type != "MatMul":
-            return node  # only care about MatMul for now
-
-        logger.info(f"start to quantize {node.name} ...")
-        inputB = node.input[1]  # noqa: N806
-        B, Bs_graph = get_initializer(inputB, graph_stack)  # noqa: N806
-        if B is None:
-            logger.info("MatMul doesn't have const weight. Skip to quantize")
-            return node  # only care about constant weight
+    def int4_block_dequant(
+        self, packed: np.ndarray, scales: np.ndarray, zero_points: np.ndarray, rows: int
+    ) -> np.ndarray:
+        """Returns the [rows, cols] float32 weight represented by the outputs of int4_block_quant"""
+        cols, k_blocks, blob_size = packed.shape
+        values = np.stack([packed & 0x0F, packed >> 4], axis=-1).reshape(cols, k_blocks, blob_size * 2)
+        if self.config.is_symmetric:
+            zero_points = np.float32(8)
+        else:
+            zero_points = zero_points.reshape(cols, -1)
+            zero_points = np.stack([zero_points & 0x0F, zero_points >> 4], axis=-1).reshape(cols, -1)
+            zero_points = zero_points[:, :k_blocks, np.newaxis].astype(np.float32)
+        weight = (values.astype(np.float32) - zero_points) * scales.reshape(cols, k_blocks, 1).astype(np.float32)
+        return weight.reshape(cols, -1)[:, :rows].T
 
-        B_array = onnx.numpy_helper.to_array(B)  # noqa: N806
-        if len(B_array.shape) != 2:
-            logger.info("MatMul weight is not 2D. Skip to quantize")
-            return node  # can only process 2-D matrix
+    def quantize_weight(self, b_array: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Quantize a 2D weight, returns the packed weight, the scales and the zero points."""
+        return self.int4_block_quant(b_array)
 
-        packed, scales, zero_points = self.int4_block_quant(B_array)
+    def make_node(
+        self,
+        node: NodeProto,
+        b_pb: TensorProto,
+        bs_graph: GraphProto,
+        b_shape: tuple[int, ...],
+        quantized: tuple[np.ndarray, np.ndarray, np.ndarray],
+    ) -> NodeProto:
+        """Adds the quantized weight to the graph owning the weight and returns the MatMulNBits node."""
+        packed, scales, zero_points = quantized
         B_quant = onnx.numpy_helper.from_array(packed)  # noqa: N806
-        B_quant.name = B.name + "_Q4"
-        for input in Bs_graph.input:
-            if input.name == inputB:
-                Bs_graph.input.remove(input)
+        B_quant.name = b_pb.name + "_Q4"
+        for input in bs_graph.input:
+            if input.name == node.input[1]:
+                bs_graph.input.remove(input)
                 break
 
         scales_tensor = onnx.numpy_helper.from_array(scales)
-        scales_tensor.name = B.name + "_scales"
-        Bs_graph.initializer.extend([B_quant, scales_tensor])
+        scales_tensor.name = b_pb.name + "_scales"
+        bs_graph.initializer.extend([B_quant, scales_tensor])
 
         input_names = [node.input[0], B_quant.name, scales_tensor.name]
         if not self.config.is_symmetric:
             zp_tensor = onnx.numpy_helper.from_array(zero_points)
-            zp_tensor.name = B.name + "_zero_points"
-            Bs_graph.initializer.extend([zp_tensor])
+            zp_tensor.name = b_pb.name + "_zero_points"
+            bs_graph.initializer.extend([zp_tensor])
             input_names.append(zp_tensor.name)
 
         kwargs = {}
-        rows, cols = B_array.shape
+        rows, cols = b_shape
         kwargs["K"] = rows
         kwargs["N"] = cols
         kwargs["bits"] = 4
         kwargs["block_size"] = self.config.block_size
         if self.config.accuracy_level is not None:
-            kwargs["accuracy_level"] = self.accuracy_level
+            kwargs["accuracy_level"] = self.config.accuracy_level
 
         matmul_q4_node = onnx.helper.make_node(
             "MatMulNBits",
@@ -455,6 +706,130 @@ class DefaultWeightOnlyQuantizer:
 
         return matmul_q4_node
 
+    def quantize(self, node: NodeProto, graph_stack: list[GraphProto]) -> NodeProto:
+        """If the node is MatMul with fp32 const weight, quantize the weight with int4, and return the new node"""
+        weight = get_matmul_weight(node, graph_stack)
+        if weight is None:
+            return node
+        b_pb, bs_graph, b_array = weight
+        return self.make_node(node, b_pb, bs_graph, b_array.shape, self.quantize_weight(b_array))
+
+
+class AWQWeightOnlyQuantizer(DefaultWeightOnlyQuantizer):
+    def __init__(self, config: AWQWeightOnlyQuantConfig, input_magnitudes: dict[str, np.ndarray] | None = None):
+        """
+        :param input_magnitudes: maximum absolute value of every channel of the inputs of the MatMul nodes,
+            {tensor name: array of K values}. Weights whose input has no magnitudes are quantized without scaling.
+        """
+        super().__init__(config)
+        self.input_magnitudes = {} if input_magnitudes is None else input_magnitudes
+        # scales of the inputs shared by all the weights they multiply, {tensor name: array of K values}
+        self.input_scales = {}
+        # Mul nodes scaling an input, shared by the nodes of a graph, {(id of the graph, tensor name):
+        # (graph, output of the Mul node, inverse scales)}
+        self.scaled_inputs = {}
+
+    def search_scales(self, weights: list[np.ndarray], input_name: str) -> np.ndarray | None:
+        """
+        Search the scales of the channels of the tensor input_name minimizing the quantization error of the 2D
+        weights it multiplies, returns None if the input has no magnitudes.
+        """
+        magnitudes = self.input_magnitudes.get(input_name)
+        if magnitudes is None or any(b_array.shape[:1] != magnitudes.shape for b_array in weights):
+            return None
+
+        # the columns of the weights are quantized independently, so they are evaluated together
+        weight = np.concatenate(weights, axis=1)
+        dtype = weight.dtype
+        weight = weight.astype(np.float32)
+        magnitudes = magnitudes.astype(np.float32)
+        # the error of the output is approximated by the error of every row of the weight weighted by the
+        # squared magnitude of the matching input channel
+        importance = np.square(magnitudes)[:, np.newaxis]
+        best_error = None
+        best = None
+        for i in range(self.config.n_grid):
+            ratio = i / self.config.n_grid
+            scales = np.maximum(np.power(magnitudes, ratio), 1e-4)
+            scales = scales / np.sqrt(scales.max() * scales.min())
+            quantized = self.int4_block_quant((weight * scales[:, np.newaxis]).astype(dtype))
+            dequantized = self.int4_block_dequant(*quantized, weight.shape[0]) / scales[:, np.newaxis]
+            error = np.sum(importance * np.square(dequantized - weight))
+            if best_error is None or error < best_error:
+                best_error = error
+                best = scales
+        return best
+
+    def quantize_weight(
+        self, b_array: np.ndarray, input_name: str | None = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray | None]:
+        """
+        Quantize a 2D weight multiplying the tensor input_name, returns the packed weight, the scales, the zero
+        points and the inverse scales the input is multiplied by, None if the weight is not scaled.
+        The scales of input_scales are used if any, otherwise they are searched for this weight alone.
+        """
+        if input_name in self.input_scales:
+            scales = self.input_scales[input_name]
+        else:
+            scales = self.search_scales([b_array], input_name)
+        if scales is None:
+            return (*self.int4_block_quant(b_array), None)
+
+        scaled = (b_array.astype(np.float32) * scales[:, np.newaxis]).astype(b_array.dtype)
+        return (*self.int4_block_quant(scaled), (1 / scales).astype(b_array.dtype))
+
+    def make_node(
+        self,
+        node: NodeProto,
+        b_pb: TensorProto,
+        bs_graph: GraphProto,
+        b_shape: tuple[int, ...],
+        quantized: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray | None],
+        graph: GraphProto | None = None,
+    ) -> list[NodeProto]:
+        """
+        Adds the quantized weight and the inverse scales to the graph owning the weight and returns
+        the Mul node scaling the input followed by the MatMulNBits node.
+        :param graph: graph of the node. The input is scaled by a single Mul node for all the nodes of this graph
+            multiplying it with the same inverse scales, only the first one returns the Mul node.
+        """
+        packed, scales, zero_points, inv_scales = quantized
+        if inv_scales is None:
+            return [super().make_node(node, b_pb, bs_graph, b_shape, (packed, scales, zero_points))]
+
+        scaled_node = NodeProto()
+        scaled_node.CopyFrom(node)
+        key = (id(graph), node.input[0])
+        scaled_input = self.scaled_inputs.get(key)
+        if graph is not None and scaled_input is not None and scaled_input[0] is graph:
+            if np.array_equal(scaled_input[2], inv_scales):
+                scaled_node.input[0] = scaled_input[1]
+                return [super().make_node(scaled_node, b_pb, bs_graph, b_shape, (packed, scales, zero_points))]
+
+        inv_scales_tensor = onnx.numpy_helper.from_array(inv_scales)
+        inv_scales_tensor.name = b_pb.name + "_awq_inv_scales"
+        bs_graph.initializer.extend([inv_scales_tensor])
+
+        scaled_node.input[0] = node.output[0] + "_awq_input"
+        mul_node = onnx.helper.make_node(
+            "Mul",
+            inputs=[node.input[0], inv_scales_tensor.name],
+            outputs=[scaled_node.input[0]],
+            name=node.name + "_awq_mul" if node.name else "",
+        )
+        if graph is not None and scaled_input is None:
+            self.scaled_inputs[key] = (graph, scaled_node.input[0], inv_scales)
+        return [mul_node, super().make_node(scaled_node, b_pb, bs_graph, b_shape, (packed, scales, zero_points))]
+
+    def quantize(self, node: NodeProto, graph_stack: list[GraphProto]) -> list[NodeProto]:
+        """If the node is MatMul with fp32 const weight, quantize the weight with int4, and return the new nodes"""
+        weight = get_matmul_weight(node, graph_stack)
+        if weight is None:
+            return [node]
+        b_pb, bs_graph, b_array = weight
+        quantized = self.quantize_weight(b_array, node.input[0])
+        return self.make_node(node, b_pb, bs_graph, b_array.shape, quantized, graph_stack[-1])
+
 
 class MatMul4BitsQuantizer:
     """Perform 4b quantization of constant MatMul weights"""
@@ -467,15 +842,36 @@ class MatMul4BitsQuantizer:
         accuracy_level: int | None = None,
         nodes_to_exclude=None,
         algo_config: WeightOnlyQuantConfig = None,
+        num_workers: int = 1,
+        load_external_data: bool = True,
     ):
+        """
+        :param model: model or path of the model to quantize.
+        :param num_workers: number of threads quantizing weights concurrently with the HQQ, DEFAULT and AWQ
+            algorithms. Weights are read and the graph is updated in the order of the nodes so the quantized model
+            does not depend on the number of workers. At most 2 * num_workers weights are loaded at the same time.
+        :param load_external_data: whether the external data of a model given by its path is loaded in memory with
+            the model, as with onnx.load. If False, self.model references the external data files until process()
+            loads them, and process_external_data() quantizes the model without loading its weights.
+        """
         if nodes_to_exclude is None:
             nodes_to_exclude = []
-        self.model = ONNXModel(onnx.load(model)) if isinstance(model, str) else ONNXModel(model)
+        if isinstance(model, str):
+            self.model = ONNXModel(onnx.load(model, load_external_data=load_external_data))
+        else:
+            self.model = ONNXModel(model)
         self.model_path = model if isinstance(model, str) else None
+        self.load_external_data = load_external_data
         self.block_size = block_size
         self.is_symmetric = is_symmetric
         self.accuracy_level = accuracy_level
         self.nodes_to_exclude = set(nodes_to_exclude)
+        self.num_workers = num_workers
+        self.executor = None
+        # nodes whose weight is being quantized by the executor, in the order of the nodes of all the graphs
+        self.pending_nodes = collections.deque()
+        self.external_data_dir = None
+        self.external_data_writer = None
         self.node_quantizer = None
         if algo_config is None:
             algo_config = DefaultWeightOnlyQuantConfig(
@@ -486,6 +882,31 @@ class MatMul4BitsQuantizer:
             self.node_quantizer = HQQWeightOnlyQuantizer(self.algo_config)
         elif algo_config.algorithm == "DEFAULT":
             self.node_quantizer = DefaultWeightOnlyQuantizer(self.algo_config)
+        elif algo_config.algorithm == "AWQ":
+            self.node_quantizer = AWQWeightOnlyQuantizer(self.algo_config)
+
+    def _make_node(self, node, graph, b_pb, bs_graph, b_shape, quantized) -> NodeProto | list[NodeProto]:
+        num_initializers = len(bs_graph.initializer)
+        # AWQ shares the Mul node scaling an input between the nodes of a graph
+        kwargs = {"graph": graph} if self.algo_config.algorithm == "AWQ" else {}
+        out_node = self.node_quantizer.make_node(node, b_pb, bs_graph, b_shape, quantized, **kwargs)
+        if self.external_data_writer is not None:
+            # the quantized weights were appended to the initializers of bs_graph, move them to the external data
+            for initializer in bs_graph.initializer[num_initializers:]:
+                self.external_data_writer.write(initializer)
+        return out_node
+
+    def _quantize_weight_args(self, node: NodeProto, b_array: np.ndarray) -> tuple:
+        # AWQ scales the weight according to the magnitudes of the input of the node
+        if self.algo_config.algorithm == "AWQ":
+            return (b_array, node.input[0])
+        return (b_array,)
+
+    def _complete_pending_node(self):
+        # the nodes are completed in the order they were submitted, across the subgraphs too, so that the
+        # quantized weights are added to the graphs in the same order as without executor
+        new_nodes, index, node, graph, b_pb, bs_graph, b_shape, future = self.pending_nodes.popleft()
+        new_nodes[index] = self._make_node(node, graph, b_pb, bs_graph, b_shape, future.result())
 
     def _process_subgraph(self, graph_stack: list[GraphProto]):
         new_nodes = []
@@ -517,18 +938,40 @@ class MatMul4BitsQuantizer:
                 node = onnx.helper.make_node(  # noqa: PLW2901
                     node.op_type, node.input, node.output, name=node.name, **kwargs
                 )
-            out_node = None
+            weight = None
             if node.name in self.nodes_to_exclude:
                 logger.info(f"exclude to quantize {node.name} as specified by nodes_to_exclude...")
-                out_node = node
-            elif self.algo_config is not None and self.algo_config.algorithm == "HQQ":
-                out_node = self.node_quantizer.quantize(node, graph_stack)
             else:
-                out_node = self.node_quantizer.quantize(node, graph_stack)
-            new_nodes.append(out_node)
+                weight = get_matmul_weight(node, graph_stack, self.external_data_dir)
+
+            if weight is None:
+                new_nodes.append(node)
+            elif self.executor is None:
+                b_pb, bs_graph, b_array = weight
+                quantized = self.node_quantizer.quantize_weight(*self._quantize_weight_args(node, b_array))
+                new_nodes.append(self._make_node(node, graph, b_pb, bs_graph, b_array.shape, quantized))
+            else:
+                b_pb, bs_graph, b_array = weight
+                future = self.executor.submit(
+                    self.node_quantizer.quantize_weight, *self._quantize_weight_args(node, b_array)
+                )
+                self.pending_nodes.append(
+                    (new_nodes, len(new_nodes), node, graph, b_pb, bs_graph, b_array.shape, future)
+                )
+                new_nodes.append(node)
+                if len(self.pending_nodes) >= 2 * self.num_workers:
+                    self._complete_pending_node()
+
+        # the nodes of the parent graphs submitted before this subgraph are completed first
+        while self.pending_nodes:
+            self._complete_pending_node()
 
         graph.ClearField("node")
-        graph.node.extend(new_nodes)
+        for new_node in new_nodes:
+            if isinstance(new_node, list):
+                graph.node.extend(new_node)
+            else:
+                graph.node.append(new_node)
         graph_stack.pop()
         return graph
 
@@ -593,20 +1036,136 @@ class MatMul4BitsQuantizer:
             )
         logger.info(f"complete quantization of model with {algorithm} algorithm.")
 
-    def process(self):
-        if self.algo_config.algorithm in ["HQQ", "DEFAULT"]:
-            # use a stack to keep track of sub-graphs
-            graph_stack = [self.model.graph()]
-            opset_import = self.model.opset_import()
-
-            has_ms_domain = False
-            for opset in opset_import:
-                if opset.domain == "com.microsoft":
-                    has_ms_domain = True
-            if not has_ms_domain:
-                opset_import.extend([onnx.helper.make_opsetid("com.microsoft", 1)])
+    def _process_model(self):
+        # use a stack to keep track of sub-graphs
+        graph_stack = [self.model.graph()]
+        opset_import = self.model.opset_import()
+
+        has_ms_domain = False
+        for opset in opset_import:
+            if opset.domain == "com.microsoft":
+                has_ms_domain = True
+        if not has_ms_domain:
+            opset_import.extend([onnx.helper.make_opsetid("com.microsoft", 1)])
+        if self.num_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                self.executor = executor
+                try:
+                    self._process_subgraph(graph_stack)
+                finally:
+                    self.executor = None
+                    self.pending_nodes.clear()
+        else:
             self._process_subgraph(graph_stack)
-            self.model.clean_initializers()
+        self.model.clean_initializers()
+
+    def process_external_data(self, output_model_path: str):
+        """
+        Quantizes a model given by its path and saves it to output_model_path with all its tensors in the
+        external data file output_model_path.data, without loading the model weights in memory.
+        MatMul weights are memory mapped and quantized one at a time, the quantized weights are appended to
+        the output external data file as soon as they are computed and the other tensors are copied by chunks.
+        The peak memory usage is about the size of the largest weights being quantized.
+        The quantizer must be created with load_external_data=False. Only the HQQ and DEFAULT algorithms are supported.
+        """
+        if self.model_path is None or self.load_external_data:
+            raise ValueError(
+                "process_external_data requires the model to be given by its path with load_external_data=False."
+            )
+        if self.algo_config.algorithm not in ["HQQ", "DEFAULT"]:
+            raise ValueError(f"process_external_data does not support the {self.algo_config.algorithm} algorithm.")
+
+        external_data_dir = os.path.dirname(os.path.abspath(self.model_path))
+        output_location = Path(output_model_path).name + ".data"
+        output_data_path = os.path.abspath(os.path.join(os.path.dirname(output_model_path), output_location))
+        for tensor in external_data_helper._get_all_tensors(self.model.model):
+            if external_data_helper.uses_external_data(tensor):
+                location = external_data_helper.ExternalDataInfo(tensor).location
+                if os.path.abspath(os.path.join(external_data_dir, location)) == output_data_path:
+                    raise ValueError(f"The output model cannot overwrite the external data file {output_data_path!r}.")
+
+        with ExternalDataWriter(output_model_path, output_location) as writer:
+            self.external_data_dir = external_data_dir
+            self.external_data_writer = writer
+            try:
+                self._process_model()
+                for tensor in external_data_helper._get_all_tensors(self.model.model):
+                    writer.write(tensor, external_data_dir)
+            finally:
+                self.external_data_dir = None
+                self.external_data_writer = None
+        self.model.save_model_to_file(output_model_path)
+
+    def _collect_input_magnitudes(self) -> dict[str, np.ndarray]:
+        """
+        Runs the calibration data reader of the AWQ config on the model and returns the maximum absolute value
+        of every channel of the inputs of the MatMul nodes.
+        """
+        with tempfile.TemporaryDirectory(prefix="ort.quant.") as quant_tmp_dir:
+            model_path = self.model_path
+            if model_path is None:
+                model_path = os.path.join(quant_tmp_dir, "model.onnx")
+                onnx.save_model(self.model.model, model_path, save_as_external_data=True)
+            calibrator = create_calibrator(
+                Path(model_path),
+                ["MatMul"],
+                augmented_model_path=os.path.join(quant_tmp_dir, "augmented_model.onnx"),
+                calibrate_method=CalibrationMethod.MinMax,
+                use_external_data_format=True,
+                # only the inputs of the MatMul nodes are scaled
+                extra_options={"per_channel": True, "channel_axis": -1, "calibrate_outputs": False},
+            )
+            calibrator.collect_data(self.algo_config.calibration_data_reader)
+            tensors_range = calibrator.compute_data()
+            del calibrator
+
+        magnitudes = {}
+        for name in tensors_range:
+            min_value, max_value = tensors_range[name].range_value
+            magnitudes[name] = np.maximum(np.abs(min_value), np.abs(max_value))
+        return magnitudes
+
+    def _search_input_scales(self):
+        """
+        Searches the AWQ scales of every input of the MatMul nodes once for all the weights it multiplies,
+        so that the nodes sharing an input share the Mul node scaling it.
+        """
+        consumers = {}
+
+        def collect_consumers(graph_stack: list[GraphProto]):
+            for node in graph_stack[-1].node:
+                for attr in node.attribute:
+                    if attr.type == onnx.AttributeProto.GRAPH:
+                        collect_consumers([*graph_stack, attr.g])
+                    elif attr.type == onnx.AttributeProto.GRAPHS:
+                        for subgraph in attr.graphs:
+                            collect_consumers([*graph_stack, subgraph])
+                if node.op_type == "MatMul" and node.name not in self.nodes_to_exclude:
+                    consumers.setdefault(node.input[0], []).append((node, graph_stack))
+
+        collect_consumers([self.model.graph()])
+        self.node_quantizer.input_scales = {}
+        self.node_quantizer.scaled_inputs = {}
+        for input_name, nodes in consumers.items():
+            weights = [get_matmul_weight(node, graph_stack) for node, graph_stack in nodes]
+            weights = [weight[2] for weight in weights if weight is not None]
+            if weights:
+                scales = self.node_quantizer.search_scales(weights, input_name)
+                if scales is not None:
+                    self.node_quantizer.input_scales[input_name] = scales
+
+    def process(self):
+        if self.algo_config.algorithm in ["HQQ", "DEFAULT", "AWQ"]:
+            if self.algo_config.algorithm == "AWQ":
+                logger.info("start to collect the magnitudes of the MatMul inputs...")
+                self.node_quantizer.input_magnitudes = self._collect_input_magnitudes()
+            if self.model_path is not None:
+                external_data_helper.load_external_data_for_model(
+                    self.model.model, os.path.dirname(os.path.abspath(self.model_path))
+                )
+            if self.algo_config.algorithm == "AWQ":
+                self._search_input_scales()
+            self._process_model()
         else:
             # use Intel® Neural Compressor for RTN or GPTQ weight-only quantize algorithm
             try:
@@ -669,6 +1228,20 @@ set of 4b integers with a scaling factor and an optional offset.
         "Refer to the MatMulNBits contrib op's 'accuracy_level' attribute for details "
         "(https://github.com/microsoft/onnxruntime/blob/main/docs/ContribOperators.md#commicrosoftmatmulnbits).",
     )
+    parser.add_argument(
+        "--num_workers",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of threads quantizing weights concurrently",
+    )
+    parser.add_argument(
+        "--stream_weights",
+        required=False,
+        action="store_true",
+        help="Quantize the weights one at a time without loading the weights of the input model in memory. "
+        "The output model is saved with external data.",
+    )
     parser.add_argument("-v", "--verbose", required=False, action="store_true")
     parser.set_defaults(verbose=False)
     parser.add_argument(
@@ -695,7 +1268,6 @@ if __name__ == "__main__":
         logger.error(f"file {output_model_path} already exists")
         raise Exception(f"file {output_model_path} already exists")
 
-    model = onnx.load(input_model_path)
     if args.quant_method == "hqq":
         quant_config = HQQWeightOnlyQuantConfig(block_size=args.block_size, bits=args.bits)
     elif args.quant_method == "default":
@@ -710,10 +1282,15 @@ if __name__ == "__main__":
         raise ValueError(f"Unsupported quantization method: {args.quant_method}")
 
     quant = MatMul4BitsQuantizer(
-        model=model,
+        model=input_model_path,
         accuracy_level=args.accuracy_level,
         nodes_to_exclude=args.nodes_to_exclude,
         algo_config=quant_config,
+        num_workers=args.num_workers,
+        load_external_data=not args.stream_weights,
     )
-    quant.process()
-    quant.model.save_model_to_file(output_model_path, True)
+    if args.stream_weights:
+        quant.process_external_data(output_model_path)
+    else:
+        quant.process()
+        quant.model.save_model_to_file(output_model_path, True)
@@ -89,6 +89,11 @@ def _clean_initializers_helper(graph, model):
 class ONNXModel:
     def __init__(self, model: ModelProto):
         self.model = model
+        # Indices {name: element} of the initializers, inputs, outputs and value infos of the main graph.
+        # They are built on demand, see _get_name_index.
+        self._name_indices = {}
+        # Incremented by notify_edit() to invalidate the indices.
+        self.generation = 0
 
     def nodes(self):
         return self.model.graph.node
@@ -99,11 +104,10 @@ class ONNXModel:
     def initializer_extend(self, inits):
         if len(inits) == 0:
             raise ValueError("Can add an empty list.")
-        for init in self.initializer():
-            self._check_init(init, "gain")
         for init in inits:
             self._check_init(init)
             self.model.graph.initializer.append(init)
+            self._update_name_index("initializer")
 
     def graph(self):
         return self.model.graph
@@ -137,34 +141,88 @@ class ONNXModel:
         for node in nodes_to_add:
             self.add_node(node)
 
+    def notify_edit(self):
+        """
+        Invalidates the indices of the names after elements of the main graph were renamed or replaced in place,
+        which the indices cannot detect.
+        """
+        self.generation += 1
+
+    def _get_name_index(self, field_name):
+        """
+        Returns a dictionary {name: first element with this name} of a repeated field of the main graph:
+        initializer, input, output or value_info.
+
+        The dictionary is rebuilt when notify_edit() was called or when the number of elements or the first or
+        last element of the field changed, so elements added to or removed from the graph directly are detected.
+        Elements renamed in place without calling notify_edit() are detected when they are looked up by their
+        previous name only.
+        """
+        field = getattr(self.model.graph, field_name)
+        entry = self._name_indices.get(field_name)
+        if entry is not None:
+            indexed_field, generation, count, first, last, index = entry
+            if (
+                indexed_field is field
+                and generation == self.generation
+                and len(field) == count
+                and (count == 0 or (field[0] is first and field[-1] is last))
+            ):
+                return index
+
+        index = {}
+        for element in field:
+            index.setdefault(element.name, element)
+        self._name_indices[field_name] = (
+            field,
+            self.generation,
+            len(field),
+            field[0] if len(field) else None,
+            field[-1] if len(field) else None,
+            index,
+        )
+        return index
+
+    def _update_name_index(self, field_name):
+        """Adds the last element of a field to its index after it is appended."""
+        entry = self._name_indices.get(field_name)
+        if entry is None:
+            return
+        field, generation, count, first, _, index = entry
+        if generation != self.generation or len(field) != count + 1 or (count > 0 and field[0] is not first):
+            del self._name_indices[field_name]
+            return
+        element = field[-1]
+        index.setdefault(element.name, element)
+        self._name_indices[field_name] = (field, generation, count + 1, field[0], element, index)
+
+    def _find_by_name(self, field_name, name):
+        element = self._get_name_index(field_name).get(name)
+        if element is not None and element.name != name:
+            # The element was renamed in place.
+            del self._name_indices[field_name]
+            element = self._get_name_index(field_name).get(name)
+        return element
+
     def add_initializer(self, tensor):
-        if find_by_name(tensor.name, self.model.graph.initializer) is None:
+        if self.get_initializer(tensor.name) is None:
             self._check_init(tensor)
             self.model.graph.initializer.extend([tensor])
+            self._update_name_index("initializer")
 
     def get_initializer(self, name):
-        for tensor in self.model.graph.initializer:
-            if tensor.name == name:
-                return tensor
-        return None
+        return self._find_by_name("initializer", name)
 
     def find_graph_input(self, input_name):
-        for input in self.model.graph.input:
-            if input.name == input_name:
-                return input
-        return None
+        return self._find_by_name("input", input_name)
 
     def find_graph_output(self, output_name):
-        for output in self.model.graph.output:
-            if output.name == output_name:
-                return output
-        return None
+        return self._find_by_name("output", output_name)
 
     def get_tensor_type(self, tensor_name: str):
-        tensor_type_map = {obj.name: obj.type for obj in self.model.graph.value_info}
-
-        if tensor_name in tensor_type_map:
-            return tensor_type_map[tensor_name].tensor_type
+        value_info = self._find_by_name("value_info", tensor_name)
+        if value_info is not None:
+            return value_info.type.tensor_type
 
         g_input = self.find_graph_input(tensor_name)
         if g_input:
@@ -195,16 +253,39 @@ class ONNXModel:
         return {initializer.name for initializer in self.model.graph.initializer}
 
     def remove_initializer(self, tensor):
-        if tensor in self.model.graph.initializer:
-            self.model.graph.initializer.remove(tensor)
-            for input in self.model.graph.input:
-                if input.name == tensor.name:
-                    self.model.graph.input.remove(input)
-                    break
+        self.remove_initializers([tensor])
 
     def remove_initializers(self, init_to_remove):
-        for initializer in init_to_remove:
-            self.remove_initializer(initializer)
+        # Only initializers with the same name are compared with a tensor to remove, and all tensors are deleted
+        # in one pass, since comparing every tensor with every initializer is quadratic in large models.
+        initializers = self.model.graph.initializer
+        name_to_positions = {}
+        for i, initializer in enumerate(initializers):
+            name_to_positions.setdefault(initializer.name, []).append(i)
+
+        positions_to_remove = set()
+        removed_names = []
+        for tensor in init_to_remove:
+            for i in name_to_positions.get(tensor.name, []):
+                if i not in positions_to_remove and initializers[i] == tensor:
+                    positions_to_remove.add(i)
+                    removed_names.append(tensor.name)
+                    break
+        for i in sorted(positions_to_remove, reverse=True):
+            del initializers[i]
+
+        # Remove the first graph input with the name of every removed initializer.
+        inputs = self.model.graph.input
+        names_to_remove = {}
+        for name in removed_names:
+            names_to_remove[name] = names_to_remove.get(name, 0) + 1
+        input_positions_to_remove = []
+        for i, input in enumerate(inputs):
+            if names_to_remove.get(input.name, 0) > 0:
+                names_to_remove[input.name] -= 1
+                input_positions_to_remove.append(i)
+        for i in reversed(input_positions_to_remove):
+            del inputs[i]
 
     def get_non_initializer_inputs(self):
         initializer_names = self.get_initializer_name_set()
@@ -438,12 +519,15 @@ class ONNXModel:
                 node.input[j] = new_input_name
 
     def replace_input_of_all_nodes(self, old_input_name, new_input_name):
+        assert isinstance(old_input_name, str) and isinstance(new_input_name, str)
         for node in self.model.graph.node:
-            ONNXModel.replace_node_input(node, old_input_name, new_input_name)
+            # Searching the inputs is much faster than calling replace_node_input for every node of large graphs.
+            if old_input_name in node.input:
+                ONNXModel.replace_node_input(node, old_input_name, new_input_name)
 
     def replace_input_of_nodes(self, old_input_name, new_input_name, node_names_set):
         for node in self.model.graph.node:
-            if node.name in node_names_set:
+            if node.name in node_names_set and old_input_name in node.input:
                 ONNXModel.replace_node_input(node, old_input_name, new_input_name)
 
     @staticmethod
@@ -454,12 +538,15 @@ class ONNXModel:
                 node.output[j] = new_output_name
 
     def replace_output_of_all_nodes(self, old_output_name, new_output_name):
+        assert isinstance(old_output_name, str) and isinstance(new_output_name, str)
         for node in self.model.graph.node:
-            ONNXModel.replace_node_output(node, old_output_name, new_output_name)
+            # Searching the outputs is much faster than calling replace_node_output for every node of large graphs.
+            if old_output_name in node.output:
+                ONNXModel.replace_node_output(node, old_output_name, new_output_name)
 
     def replace_output_of_nodes(self, old_output_name, new_output_name, node_names_set):
         for node in self.model.graph.node:
-            if node.name in node_names_set:
+            if node.name in node_names_set and old_output_name in node.output:
                 ONNXModel.replace_node_output(node, old_output_name, new_output_name)
 
     def remove_unused_constant(self):
@@ -482,18 +569,15 @@ class ONNXModel:
         for w in self.initializer():
             if w.name not in input_name_to_nodes and not self.is_graph_output(w.name):
                 ununsed_weights.append(w)
-                # Remove from graph.input
-                for graph_input in self.graph().input:
-                    if graph_input.name == w.name:
-                        self.graph().input.remove(graph_input)
 
+        # It also removes the graph inputs of the unused weights.
         self.remove_initializers(ununsed_weights)
 
     def is_graph_output(self, output_name):
-        return any(output.name == output_name for output in self.model.graph.output)
+        return self.find_graph_output(output_name) is not None
 
     def is_graph_input(self, tensor_name: str) -> bool:
-        return any(input.name == tensor_name for input in self.model.graph.input)
+        return self.find_graph_input(tensor_name) is not None
 
     # TODO:use OnnxModel.graph_topological_sort(self.model.graph) from transformers.onnx_model
     # Currently it breaks Openvino/Linux training gpu pipeline so hold off for 1.8 release
@@ -31,7 +31,7 @@ class ConvInteger(QuantOperatorBase):
         node = self.node
         model = self.quantizer.model
         # Add tensors for the shape to be reshaped to
-        weight = find_by_name(node.input[1], model.initializer())
+        weight = model.get_initializer(node.input[1])
         if weight is None:
             raise ValueError(f"Expected {node.input[1]} to be an initializer")
 
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import logging
 import os
 import tempfile
@@ -676,6 +678,98 @@ def model_has_external_data(model_path: Path):
     return False
 
 
+def load_external_tensor(tensor: TensorProto, base_dir: str) -> numpy.ndarray:
+    """
+    Returns the value of a tensor stored in an external data file as a read-only memory map.
+    The data is read from the file when the array is accessed and is never copied into the tensor.
+    """
+    info = external_data_helper.ExternalDataInfo(tensor)
+    dtype = onnx.helper.tensor_dtype_to_np_dtype(tensor.data_type)
+    shape = tuple(tensor.dims)
+    if numpy.prod(shape) == 0:
+        return numpy.empty(shape, dtype=dtype)
+    return numpy.memmap(
+        os.path.join(base_dir, info.location), dtype=dtype, mode="r", offset=info.offset or 0, shape=shape
+    )
+
+
+class ExternalDataWriter:
+    """
+    Appends the data of tensors to a single external data file as soon as they are produced, so that
+    a model larger than the memory can be written one tensor at a time.
+    """
+
+    def __init__(self, model_path: str | Path, location: str | None = None, size_threshold: int = 1024):
+        """
+        :param model_path: path of the model which references the external data file.
+        :param location: name of the external data file, relative to the model. Defaults to <model name>.data.
+        :param size_threshold: tensors stored in the model whose data is smaller than this size are kept in the model.
+        """
+        self.location = location if location is not None else Path(model_path).name + ".data"
+        self.path = os.path.abspath(os.path.join(os.path.dirname(model_path), self.location))
+        self.size_threshold = size_threshold
+        self.file = open(self.path, "wb")  # noqa: SIM115
+        # names of the tensors already moved to the external data file
+        self.written_tensors = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _set_external_data(self, tensor: TensorProto, offset: int, length: int):
+        del tensor.external_data[:]
+        for key, value in (("location", self.location), ("offset", offset), ("length", length)):
+            entry = tensor.external_data.add()
+            entry.key = key
+            entry.value = str(value)
+        tensor.data_location = TensorProto.EXTERNAL
+
+    def write(self, tensor: TensorProto, base_dir: str = ""):
+        """
+        Moves the data of a tensor to the external data file.
+        Data already stored in another external data file, relative to base_dir, is copied by chunks.
+
+        :param tensor: tensor to move, its external data fields are updated.
+        :param base_dir: directory of the model the tensor comes from.
+        """
+        offset = self.file.tell()
+        if external_data_helper.uses_external_data(tensor):
+            info = external_data_helper.ExternalDataInfo(tensor)
+            if tensor.name in self.written_tensors and info.location == self.location:
+                return
+            source_path = os.path.abspath(os.path.join(base_dir, info.location))
+            if source_path == self.path:
+                raise ValueError(
+                    f"External data of tensor {tensor.name!r} cannot be copied to the file it is read from."
+                )
+            with open(source_path, "rb") as source:
+                source.seek(info.offset or 0)
+                if info.length is not None:
+                    length = info.length
+                else:
+                    length = os.fstat(source.fileno()).st_size - source.tell()
+                remaining = length
+                while remaining > 0:
+                    chunk = source.read(min(remaining, 1 << 26))
+                    if not chunk:
+                        raise ValueError(f"External data of tensor {tensor.name!r} is truncated in {source_path!r}.")
+                    self.file.write(chunk)
+                    remaining -= len(chunk)
+        elif tensor.HasField("raw_data") and len(tensor.raw_data) >= self.size_threshold:
+            length = len(tensor.raw_data)
+            self.file.write(tensor.raw_data)
+            tensor.ClearField("raw_data")
+        else:
+            return
+        self._set_external_data(tensor, offset, length)
+        self.written_tensors.add(tensor.name)
+
+
 def optimize_model(model_path: Path, opt_model_path: Path):
     """
         Generate model that applies graph optimization (constant folding, etc.)
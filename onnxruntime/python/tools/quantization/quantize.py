@@ -382,6 +382,25 @@ def quantize_static(
                     Default is None. If set to an integer, during calculation of the min-max range of the tensors
                     it will load at max value number of outputs before computing and merging the range. This will
                     produce the same result as all computing with None, but is more memory efficient.
+                    For the Entropy, Percentile and Distribution methods, the outputs are merged into the
+                    histograms every max value runs, which bounds memory usage with large calibration sets.
+                CalibNumWorkers = Optional[int] :
+                    Default is None. If set to an integer greater than 1, the Entropy, Percentile and Distribution
+                    methods compute the threshold of each tensor in a pool of that many processes.
+                CalibNumSessions = int :
+                    Default is 1. If greater than 1, the calibration data is run through that many inference
+                    sessions of the augmented model, each one in its own worker process. The collected ranges
+                    are the same as with a single session.
+                CalibCacheDir = Optional[str] :
+                    Default is None. If set, the statistics collected by the calibration are stored in this
+                    directory. They are reused, without running the model again, by the next calibration of the
+                    same model and calibrated tensors with the same calibration settings and data. A calibration
+                    which was interrupted resumes from the last saved statistics, which are saved every
+                    CalibMaxIntermediateOutputs samples, and only the new samples appended at the end of the
+                    data reader are run.
+                CalibReaderFingerprint = Optional[str] :
+                    Default is None. String identifying the calibration data in the cache. By default, it is
+                    a hash of the first input of the data reader.
                 SmoothQuant = True/False :
                     Default is False. If enabled, SmoothQuant algorithm will be applied before quantization to do
                     fake input channel quantization.
@@ -450,6 +469,10 @@ def quantize_static(
         ("CalibMovingAverage", "moving_average"),
         ("CalibMovingAverageConstant", "averaging_constant"),
         ("CalibMaxIntermediateOutputs", "max_intermediate_outputs"),
+        ("CalibNumWorkers", "num_workers"),
+        ("CalibNumSessions", "num_sessions"),
+        ("CalibCacheDir", "cache_dir"),
+        ("CalibReaderFingerprint", "reader_fingerprint"),
     ]
     calib_extra_options = {
         key: extra_options.get(name) for (name, key) in calib_extra_options_keys if name in extra_options
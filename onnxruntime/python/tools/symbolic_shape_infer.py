@@ -3,12 +3,20 @@
 
 # -*- coding: UTF-8 -*-
 import argparse
+import functools
+import hashlib
+import heapq
+import json
 import logging
+import os
+import tempfile
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import onnx
 import sympy
-from onnx import helper, numpy_helper, shape_inference
+from onnx import external_data_helper, helper, numpy_helper, shape_inference
 from packaging import version
 
 assert version.parse(onnx.__version__) >= version.parse("1.8.0")
@@ -68,7 +76,7 @@ def make_named_value_info(name):
 
 
 def get_shape_from_sympy_shape(sympy_shape):
-    return [None if i is None else (int(i) if is_literal(i) else str(i)) for i in sympy_shape]
+    return [None if i is None else (int(i) if is_literal(i) else sympy_str(i)) for i in sympy_shape]
 
 
 def is_literal(dim):
@@ -122,6 +130,202 @@ def sympy_reduce_product(x):
     return value
 
 
+# identical layers of a model compute the same dim expressions, so the expensive simplification and construction of
+# expressions are memoized by their arguments, and only done once per model
+@functools.lru_cache(maxsize=4096, typed=True)
+def sympy_simplify(expr):
+    return sympy.simplify(expr)
+
+
+@functools.lru_cache(maxsize=4096, typed=True)
+def sympy_min(*args):
+    return sympy.Min(*args)
+
+
+@functools.lru_cache(maxsize=4096, typed=True)
+def sympy_max(*args):
+    return sympy.Max(*args)
+
+
+@functools.lru_cache(maxsize=4096, typed=True)
+def sympy_str(expr):
+    return str(expr)
+
+
+# ops whose output has the shape of input 0, and the element type of input 0 unless it is a Cast
+NATIVE_UNARY_OPS = [
+    "Abs",
+    "Ceil",
+    "Cos",
+    "Elu",
+    "Erf",
+    "Exp",
+    "Floor",
+    "HardSigmoid",
+    "Identity",
+    "LeakyRelu",
+    "Log",
+    "LogSoftmax",
+    "Neg",
+    "Not",
+    "Reciprocal",
+    "Relu",
+    "Round",
+    "Sigmoid",
+    "Sign",
+    "Sin",
+    "Softmax",
+    "Softplus",
+    "Sqrt",
+    "Tanh",
+]
+
+# ops with multidirectional broadcasting of all inputs, mapped to the index of the input with the element type of
+# the output, or None for bool outputs
+NATIVE_BROADCAST_OPS = {
+    "Add": 0,
+    "Sub": 0,
+    "Mul": 0,
+    "Div": 0,
+    "Max": 0,
+    "Min": 0,
+    "Sum": 0,
+    "Mean": 0,
+    "Where": 1,
+    "Equal": None,
+    "Less": None,
+    "Greater": None,
+    "LessOrEqual": None,
+    "GreaterOrEqual": None,
+    "And": None,
+    "Or": None,
+    "Xor": None,
+}
+
+# initializers with up to this number of elements are hashed with their values for the cache of inference results,
+# larger ones only by their name, type and shape unless they are integers which could hold shapes
+CACHE_HASH_VALUE_SIZE_LIMIT = 1024
+
+# version of the format of the cached results, to be incremented when it changes
+CACHE_FORMAT_VERSION = 1
+
+
+def hash_graph_structure(mp):
+    """
+    Hashes the parts of a model which could change the result of shape inference. The values of large float
+    initializers are not hashed, so that hashing a large model is fast, and external data is never loaded.
+    """
+    digest = hashlib.sha256()
+    digest.update(str(mp.ir_version).encode())
+    graph = mp.graph
+    for field in (mp.opset_import, mp.functions, graph.input, graph.output, graph.node, graph.sparse_initializer):
+        digest.update(str(len(field)).encode())
+        for proto in field:
+            digest.update(proto.SerializeToString(deterministic=True))
+    digest.update(str(len(graph.initializer)).encode())
+    for tensor in graph.initializer:
+        if tensor.data_location != onnx.TensorProto.EXTERNAL and (
+            tensor.data_type in [onnx.TensorProto.INT32, onnx.TensorProto.INT64]
+            or np.prod(tensor.dims) <= CACHE_HASH_VALUE_SIZE_LIMIT
+        ):
+            digest.update(tensor.SerializeToString(deterministic=True))
+        else:
+            metadata = onnx.TensorProto(
+                name=tensor.name,
+                data_type=tensor.data_type,
+                dims=tensor.dims,
+                data_location=tensor.data_location,
+                external_data=tensor.external_data,
+            )
+            digest.update(metadata.SerializeToString(deterministic=True))
+    return digest.hexdigest()
+
+
+class SymbolicShapeInferenceCache:
+    """
+    Cache of the results of symbolic shape inference, so that tools which run SymbolicShapeInference.infer_shapes
+    one after the other on the same model with the same settings, like quant_pre_process and
+    convert_float_to_float16, only run it once. The results of the last max_entries models are kept in memory, and
+    they are also saved in cache_dir when it is set, to be reused by other processes.
+
+    The cache is used when use_cache=True is given to the inference, or when use_cache is not given and cache_dir
+    is set, for example by ORT_SYMBOLIC_SHAPE_INFER_CACHE_DIR. A key covers the graph, the settings, the versions
+    of onnx and sympy, the source of the inference and the format of the results, so that results of another
+    version are never reused.
+
+    A result is a serialized model without initializers, holding the inferred graph inputs, outputs and value_info,
+    and the nodes with subgraphs since the inference updates the value_info of the subgraphs.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=8):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.entries_ = OrderedDict()
+
+    def is_enabled(self, use_cache=None):
+        """Returns use_cache, or whether cache_dir is set when use_cache is None."""
+        return bool(self.cache_dir) if use_cache is None else use_cache
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def source_digest(path):
+        """Returns the hash of a source file, which identifies the version of the code inferring the shapes."""
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    @staticmethod
+    def make_key(mp, *settings):
+        versions = [
+            CACHE_FORMAT_VERSION,
+            SymbolicShapeInferenceCache.source_digest(__file__),
+            onnx.__version__,
+            sympy.__version__,
+        ]
+        content = json.dumps([hash_graph_structure(mp), versions, *settings], sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.onnx")
+
+    def _add(self, key, result):
+        self.entries_[key] = result
+        self.entries_.move_to_end(key)
+        while len(self.entries_) > self.max_entries:
+            self.entries_.popitem(last=False)
+
+    def load(self, key):
+        if key in self.entries_:
+            self.entries_.move_to_end(key)
+            return self.entries_[key]
+        if self.cache_dir and os.path.exists(self._path(key)):
+            with open(self._path(key), "rb") as f:
+                result = f.read()
+            self._add(key, result)
+            return result
+        return None
+
+    def save(self, key, result):
+        self._add(key, result)
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # write to a temporary file first so that other processes never read a partially written result
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".onnx.tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(result)
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+    def clear(self):
+        self.entries_.clear()
+
+
+# the cache is enabled by setting ORT_SYMBOLIC_SHAPE_INFER_CACHE_DIR or the cache_dir of this cache
+shape_inference_cache = SymbolicShapeInferenceCache(os.environ.get("ORT_SYMBOLIC_SHAPE_INFER_CACHE_DIR"))
+
+
 class SymbolicShapeInference:
     def __init__(self, int_max, auto_merge, guess_output_rank, verbose, prefix=""):
         self.dispatcher_ = {
@@ -244,6 +448,18 @@ class SymbolicShapeInference:
             "upsample_nearest3d": self._infer_aten_upsample,
             "upsample_bicubic2d": self._infer_aten_upsample,
         }
+        # output types of standard ops computed from the input types following onnx shape inference, instead of
+        # running onnx shape inference on a single node model. None is returned to fall back to onnx shape inference.
+        self.native_dispatcher_ = {
+            **{op_type: self._native_infer_unary for op_type in NATIVE_UNARY_OPS},
+            **{op_type: self._native_infer_broadcast for op_type in NATIVE_BROADCAST_OPS},
+            **{op_type: self._native_infer_by_dispatcher for op_type in ["Concat", "Gather", "MatMul", "Squeeze"]},
+            "Cast": self._native_infer_unary,
+            "Reshape": self._native_infer_Reshape,
+            "Shape": self._native_infer_Shape,
+            "Transpose": self._native_infer_Transpose,
+            "Unsqueeze": self._native_infer_by_dispatcher,
+        }
         self.run_ = True
         self.suggested_merge_ = {}
         self.symbolic_dims_ = {}
@@ -254,6 +470,18 @@ class SymbolicShapeInference:
         self.int_max_ = int_max
         self.subgraph_id_ = 0
         self.prefix_ = prefix
+        # prerequisites of the nodes of out_mp_, see _get_prereq
+        self.node_prereqs_ = None
+        # indices of the nodes of out_mp_ in the order of inference
+        self.sorted_node_indices_ = None
+        # output value infos and sympy data of the nodes inferred in the last run, by node index in out_mp_
+        self.node_results_ = {}
+        # suggested merges when the last run started
+        self.merged_symbols_ = set()
+        # prerequisites of the nodes of the subgraphs of the nodes, passed to the inference of the subgraphs
+        self.subgraph_prereqs_ = {}
+        # process pool to infer the independent subgraphs of a node concurrently, see _onnx_infer_subgraphs
+        self.executor_ = None
 
     def _add_suggested_merge(self, symbols, apply=False):
         assert all([(type(s) == str and s in self.symbolic_dims_) or is_literal(s) for s in symbols])  # noqa: E721
@@ -316,7 +544,10 @@ class SymbolicShapeInference:
         self.out_mp_ = onnx.ModelProto()
         self.out_mp_.CopyFrom(in_mp)
         self.graph_inputs_ = {i.name: i for i in list(self.out_mp_.graph.input)}
-        self.initializers_ = {i.name: i for i in self.out_mp_.graph.initializer}
+        # initializers whose external data is not loaded are only known by their types and shapes
+        self.initializers_ = {
+            i.name: i for i in self.out_mp_.graph.initializer if i.data_location != onnx.TensorProto.EXTERNAL
+        }
         self.known_vi_ = {i.name: i for i in list(self.out_mp_.graph.input)}
         self.known_vi_.update(
             {
@@ -433,15 +664,125 @@ class SymbolicShapeInference:
     def _update_computed_dims(self, new_sympy_shape):
         for i, new_dim in enumerate(new_sympy_shape):
             if not is_literal(new_dim) and type(new_dim) != str:  # noqa: E721
-                str_dim = str(new_dim)
+                str_dim = sympy_str(new_dim)
                 if str_dim in self.suggested_merge_:
                     if is_literal(self.suggested_merge_[str_dim]):
                         continue  # no need to create dim for literals
                     new_sympy_shape[i] = self.symbolic_dims_[self.suggested_merge_[str_dim]]
                 else:
                     # add new_dim if it's a computational expression
-                    if str(new_dim) not in self.symbolic_dims_:
-                        self.symbolic_dims_[str(new_dim)] = new_dim
+                    if str_dim not in self.symbolic_dims_:
+                        self.symbolic_dims_[str_dim] = new_dim
+
+    def _get_native_input_type(self, node, idx):
+        """
+        Returns the tensor type of a node input for native inference, or None when onnx shape inference is needed
+        because the input is not a tensor, or has an unknown element type, rank or dimension.
+        """
+        vi = self.known_vi_.get(node.input[idx])
+        if vi is None or vi.type.WhichOneof("value") != "tensor_type":
+            return None
+        tensor_type = vi.type.tensor_type
+        if tensor_type.elem_type == onnx.TensorProto.UNDEFINED or not tensor_type.HasField("shape"):
+            return None
+        if not all(d.HasField("dim_value") or d.dim_param for d in tensor_type.shape.dim):
+            return None
+        return tensor_type
+
+    def _make_native_output(self, node, elem_type, dims=None):
+        vi = make_named_value_info(node.output[0])
+        vi.type.tensor_type.elem_type = elem_type
+        if dims is not None:
+            shape = vi.type.tensor_type.shape
+            shape.SetInParent()
+            for d in dims:
+                if isinstance(d, int):
+                    shape.dim.add().dim_value = d
+                else:
+                    shape.dim.add().CopyFrom(d)
+        return [vi]
+
+    def _native_infer_unary(self, node):
+        input_type = self._get_native_input_type(node, 0)
+        if input_type is None or len(node.output) != 1:
+            return None
+        dims = input_type.shape.dim
+        if node.op_type in ["Softmax", "LogSoftmax"]:
+            axis = get_attribute(node, "axis", -1 if get_opset(self.out_mp_) >= 13 else 1)
+            if axis < -len(dims) or axis >= len(dims):
+                return None
+        elem_type = get_attribute(node, "to") if node.op_type == "Cast" else input_type.elem_type
+        return self._make_native_output(node, elem_type, dims)
+
+    def _native_infer_broadcast(self, node):
+        if node.op_type in ["Max", "Min", "Sum", "Mean"] and get_opset(self.out_mp_) < 8:
+            return None  # no broadcasting
+        input_types = [self._get_native_input_type(node, i) for i in range(len(node.input))]
+        if not input_types or any(t is None for t in input_types):
+            return None
+
+        # same as multidirectionalBroadcastShapeInference in onnx
+        shapes = [t.shape.dim for t in input_types]
+        rank = max(len(s) for s in shapes)
+        dims = []
+        for i in range(rank):
+            dim_value = 1
+            symbolic_dims = []
+            for s in shapes:
+                if i < rank - len(s):
+                    continue
+                dim = s[i - rank + len(s)]
+                if dim.HasField("dim_value"):
+                    if dim.dim_value != 1:
+                        if dim_value not in (1, dim.dim_value):
+                            return None  # incompatible dimensions
+                        dim_value = dim.dim_value
+                elif not symbolic_dims or dim.dim_param != symbolic_dims[0].dim_param:
+                    symbolic_dims.append(dim)
+            if dim_value != 1 or not symbolic_dims:
+                dims.append(dim_value)
+            elif len(symbolic_dims) == 1:
+                dims.append(symbolic_dims[0])
+            else:
+                return None  # onnx creates a new symbolic dimension
+
+        type_input = NATIVE_BROADCAST_OPS[node.op_type]
+        elem_type = onnx.TensorProto.BOOL if type_input is None else input_types[type_input].elem_type
+        return self._make_native_output(node, elem_type, dims)
+
+    def _native_infer_by_dispatcher(self, node):
+        # the output is computed from the inputs in the dispatcher
+        return [make_named_value_info(o) for o in node.output]
+
+    def _native_infer_Reshape(self, node):  # noqa: N802
+        # the output shape is computed in the dispatcher from the output element type
+        vi = self.known_vi_.get(node.input[0])
+        if vi is None or vi.type.WhichOneof("value") != "tensor_type":
+            return None
+        if vi.type.tensor_type.elem_type == onnx.TensorProto.UNDEFINED:
+            return None
+        return self._make_native_output(node, vi.type.tensor_type.elem_type)
+
+    def _native_infer_Shape(self, node):  # noqa: N802
+        input_type = self._get_native_input_type(node, 0)
+        if input_type is None:
+            return None
+        rank = len(input_type.shape.dim)
+        start = get_attribute(node, "start", 0)
+        end = get_attribute(node, "end", rank)
+        start = min(max(start + rank if start < 0 else start, 0), rank)
+        end = min(max(end + rank if end < 0 else end, 0), rank)
+        return self._make_native_output(node, onnx.TensorProto.INT64, [max(end - start, 0)])
+
+    def _native_infer_Transpose(self, node):  # noqa: N802
+        input_type = self._get_native_input_type(node, 0)
+        if input_type is None:
+            return None
+        dims = input_type.shape.dim
+        perm = get_attribute(node, "perm", list(reversed(range(len(dims)))))
+        if sorted(perm) != list(range(len(dims))):
+            return None
+        return self._make_native_output(node, input_type.elem_type, [dims[p] for p in perm])
 
     def _onnx_infer_single_node(self, node):
         # skip onnx shape inference for some ops, as they are handled in _infer_*
@@ -481,6 +822,11 @@ class SymbolicShapeInference:
             "RotaryEmbedding",
         ]
 
+        native_output_vis = None
+        if not skip_infer and node.domain in ["", "ai.onnx"] and node.op_type in self.native_dispatcher_:
+            native_output_vis = self.native_dispatcher_[node.op_type](node)
+            skip_infer = native_output_vis is not None
+
         if not skip_infer:
             # Only pass initializers that satisfy the following condition:
             # (1) Operator need value of some input for shape inference.
@@ -512,7 +858,9 @@ class SymbolicShapeInference:
             o = node.output[i_o]
             if o:  # skip optional output
                 vi = self.out_mp_.graph.value_info.add()
-                if not skip_infer:
+                if native_output_vis is not None:
+                    vi.CopyFrom(native_output_vis[i_o])
+                elif not skip_infer:
                     vi.CopyFrom(self.tmp_mp_.graph.output[i_o])
                 else:
                     vi.name = o
@@ -521,6 +869,43 @@ class SymbolicShapeInference:
     def _onnx_infer_subgraph(self, node, subgraph, use_node_input=True, inc_subgraph_id=True):
         if self.verbose_ > 2:
             logger.debug(f"Inferencing subgraph of node {node.name} with output({node.output[0]}...): {node.op_type}")
+        symbolic_shape_inference = SymbolicShapeInference._infer_subgraph(
+            *self._prepare_subgraph_inference(node, subgraph, inc_subgraph_id), executor=self.executor_
+        )
+        self._update_subgraph(node, subgraph, symbolic_shape_inference, use_node_input)
+        return symbolic_shape_inference
+
+    def _onnx_infer_subgraphs(self, node, subgraphs, use_node_input=True):
+        """
+        Infers the subgraphs of a node, like the branches of If. The subgraphs are independent, and the symbolic dims
+        created in a subgraph are named from the id assigned to the subgraph here in order. So with an executor, they
+        are inferred concurrently in the worker processes, and the results are merged in order, the same as inferring
+        them one after the other.
+        """
+        if self.executor_ is None or len(subgraphs) < 2:
+            return [self._onnx_infer_subgraph(node, subgraph, use_node_input) for subgraph in subgraphs]
+
+        if self.verbose_ > 2:
+            logger.debug(f"Inferencing subgraphs of node {node.name} with output({node.output[0]}...): {node.op_type}")
+        futures = [
+            self.executor_.submit(_infer_subgraph_in_worker, *self._prepare_subgraph_inference(node, subgraph))
+            for subgraph in subgraphs
+        ]
+        results = []
+        for subgraph, future in zip(subgraphs, futures):
+            graph, symbolic_dims, sympy_data = future.result()
+            symbolic_shape_inference = SymbolicShapeInference(
+                self.int_max_, self.auto_merge_, self.guess_output_rank_, self.verbose_
+            )
+            symbolic_shape_inference.out_mp_ = onnx.ModelProto(graph=graph)
+            symbolic_shape_inference.symbolic_dims_ = symbolic_dims
+            symbolic_shape_inference.sympy_data_ = sympy_data
+            self._update_subgraph(node, subgraph, symbolic_shape_inference, use_node_input)
+            results.append(symbolic_shape_inference)
+        return results
+
+    def _prepare_subgraph_inference(self, node, subgraph, inc_subgraph_id=True):
+        """Returns the arguments of _infer_subgraph to infer a subgraph of the node, in this or another process."""
         # node inputs are not passed directly to the subgraph
         # it's up to the node dispatcher to prepare subgraph input
         # for example, with Scan/Loop, subgraph input shape would be trimmed from node input shape
@@ -535,23 +920,34 @@ class SymbolicShapeInference:
         )
         tmp_graph.initializer.extend([i for i in self.out_mp_.graph.initializer if i.name in subgraph_implicit_input])
         tmp_graph.initializer.extend(subgraph.initializer)
-        self.tmp_mp_.graph.CopyFrom(tmp_graph)
-
-        symbolic_shape_inference = SymbolicShapeInference(
-            self.int_max_,
-            self.auto_merge_,
-            self.guess_output_rank_,
-            self.verbose_,
-            prefix=self.prefix_ + "_" + str(self.subgraph_id_),
-        )
+        tmp_mp = onnx.ModelProto(ir_version=self.out_mp_.ir_version, graph=tmp_graph)
+        tmp_mp.opset_import.extend(self.out_mp_.opset_import)
+        tmp_mp.functions.extend(self.out_mp_.functions)
+
+        settings = (self.int_max_, self.auto_merge_, self.guess_output_rank_, self.verbose_)
+        prefix = self.prefix_ + "_" + str(self.subgraph_id_)
         if inc_subgraph_id:
             self.subgraph_id_ += 1
+        node_prereqs = None
+        if id(subgraph) in self.subgraph_prereqs_:
+            cached_subgraph, subgraph_node_prereqs = self.subgraph_prereqs_[id(subgraph)]
+            if cached_subgraph is subgraph:
+                node_prereqs = subgraph_node_prereqs
+        return tmp_mp, settings, prefix, node_prereqs, self.suggested_merge_.copy(), self.sympy_data_.copy()
 
-        symbolic_shape_inference._preprocess(self.tmp_mp_)
-        symbolic_shape_inference.suggested_merge_ = self.suggested_merge_.copy()
+    @staticmethod
+    def _infer_subgraph(tmp_mp, settings, prefix, node_prereqs, suggested_merge, sympy_data, executor=None):
+        symbolic_shape_inference = SymbolicShapeInference(*settings, prefix=prefix)
+        symbolic_shape_inference.node_prereqs_ = node_prereqs
+        symbolic_shape_inference.executor_ = executor
+        symbolic_shape_inference._preprocess(tmp_mp)
+        symbolic_shape_inference.suggested_merge_ = suggested_merge
         while symbolic_shape_inference.run_:
-            symbolic_shape_inference._infer_impl(self.sympy_data_.copy())
+            symbolic_shape_inference._infer_impl(sympy_data.copy())
         symbolic_shape_inference._update_output_from_vi()
+        return symbolic_shape_inference
+
+    def _update_subgraph(self, node, subgraph, symbolic_shape_inference, use_node_input):
         if use_node_input:
             # if subgraph uses node input, it needs to update to merged dims
             subgraph.ClearField("input")
@@ -572,7 +968,6 @@ class SymbolicShapeInference:
             assert d in symbolic_shape_inference.symbolic_dims_
             new_dims[d] = symbolic_shape_inference.symbolic_dims_[d]
         self.symbolic_dims_.update(new_dims)
-        return symbolic_shape_inference
 
     def _get_int_or_float_values(self, node, broadcast=False, allow_float_values=False):
         def int_or_float(value, allow_float_values):
@@ -824,12 +1219,12 @@ class SymbolicShapeInference:
             "Max": lambda l: (  # noqa: E741
                 l[1]
                 if is_literal(l[0]) and int(l[0]) < -self.int_max_
-                else (l[0] if is_literal(l[1]) and int(l[1]) < -self.int_max_ else sympy.Max(l[0], l[1]))
+                else (l[0] if is_literal(l[1]) and int(l[1]) < -self.int_max_ else sympy_max(l[0], l[1]))
             ),
             "Min": lambda l: (  # noqa: E741
                 l[1]
                 if is_literal(l[0]) and int(l[0]) > self.int_max_
-                else (l[0] if is_literal(l[1]) and int(l[1]) > self.int_max_ else sympy.Min(l[0], l[1]))
+                else (l[0] if is_literal(l[1]) and int(l[1]) > self.int_max_ else sympy_min(l[0], l[1]))
             ),
             "Mul": lambda l: int(l[0] * l[1]) if isinstance(l[0] * l[1], float) else l[0] * l[1],  # noqa: E741
             "Sub": lambda l: l[0] - l[1],  # noqa: E741
@@ -1151,9 +1546,12 @@ class SymbolicShapeInference:
                 subgraphs[1].CopyFrom(subgraphs[0])
             else:
                 subgraphs[0].CopyFrom(subgraphs[1])
+            # the prerequisites cached for the overwritten branch are the ones of its previous nodes
+            for subgraph in subgraphs:
+                self.subgraph_prereqs_.pop(id(subgraph), None)
 
-        for i_sub, subgraph in enumerate(subgraphs):
-            subgraph_infer = self._onnx_infer_subgraph(node, subgraph, use_node_input=False)
+        subgraph_infers = self._onnx_infer_subgraphs(node, subgraphs, use_node_input=False)
+        for i_sub, (subgraph, subgraph_infer) in enumerate(zip(subgraphs, subgraph_infers)):
             for i_out in range(len(node.output)):
                 vi = self.known_vi_[node.output[i_out]]
                 if i_sub == 0:
@@ -1330,9 +1728,9 @@ class SymbolicShapeInference:
         shape1 = sympy_shape[dim1]
         shape2 = sympy_shape[dim2]
         if offset >= 0:
-            diag_shape = sympy.Max(0, sympy.Min(shape1, shape2 - offset))
+            diag_shape = sympy_max(0, sympy_min(shape1, shape2 - offset))
         else:
-            diag_shape = sympy.Max(0, sympy.Min(shape1 + offset, shape2))
+            diag_shape = sympy_max(0, sympy_min(shape1 + offset, shape2))
         new_shape.append(diag_shape)
 
         if node.output[0]:
@@ -1511,7 +1909,7 @@ class SymbolicShapeInference:
             start = as_scalar(input_data[0])
             limit = as_scalar(input_data[1])
             delta = as_scalar(input_data[2])
-            new_sympy_shape = [sympy.Max(sympy.ceiling((limit - start) / delta), 0)]
+            new_sympy_shape = [sympy_max(sympy.ceiling((limit - start) / delta), 0)]
         else:
             new_sympy_shape = [self._new_symbolic_dim_from_output(node)]
         self._update_computed_dims(new_sympy_shape)
@@ -1635,7 +2033,7 @@ class SymbolicShapeInference:
         if get_opset(self.out_mp_) <= 10:
             scales = self._try_get_value(node, 1)
             if scales is not None:
-                new_sympy_shape = [sympy.simplify(sympy.floor(d * s)) for d, s in zip(input_sympy_shape, scales)]
+                new_sympy_shape = [sympy_simplify(sympy.floor(d * s)) for d, s in zip(input_sympy_shape, scales)]
                 self._update_computed_dims(new_sympy_shape)
                 vi.CopyFrom(
                     helper.make_tensor_value_info(
@@ -1649,7 +2047,7 @@ class SymbolicShapeInference:
             scales = self._try_get_value(node, 2)
             sizes = self._try_get_value(node, 3)
             if sizes is not None:
-                new_sympy_shape = [sympy.simplify(sympy.floor(s)) for s in sizes]
+                new_sympy_shape = [sympy_simplify(sympy.floor(s)) for s in sizes]
                 self._update_computed_dims(new_sympy_shape)
             elif scales is not None:
                 rank = len(scales)
@@ -1662,7 +2060,7 @@ class SymbolicShapeInference:
                     roi_end = [1] * rank
                 scales = list(scales)
                 new_sympy_shape = [
-                    sympy.simplify(sympy.floor(d * (end - start) * scale))
+                    sympy_simplify(sympy.floor(d * (end - start) * scale))
                     for d, start, end, scale in zip(input_sympy_shape, roi_start, roi_end, scales)
                 ]
                 self._update_computed_dims(new_sympy_shape)
@@ -1863,11 +2261,11 @@ class SymbolicShapeInference:
                     else:
                         if e > 0:
                             e = (  # noqa: PLW2901
-                                sympy.Min(e, new_sympy_shape[i]) if e > 1 else e
+                                sympy_min(e, new_sympy_shape[i]) if e > 1 else e
                             )  # special case for slicing first to make computation easier
                 else:
                     if is_literal(new_sympy_shape[i]):
-                        e = sympy.Min(e, new_sympy_shape[i])  # noqa: PLW2901
+                        e = sympy_min(e, new_sympy_shape[i])  # noqa: PLW2901
                     else:
                         try:
                             if not less_equal(e, new_sympy_shape[i]):
@@ -1880,7 +2278,7 @@ class SymbolicShapeInference:
                 if is_literal(new_sympy_shape[i]) and is_literal(s):
                     s = max(0, min(s, new_sympy_shape[i]))  # noqa: PLW2901
 
-                new_sympy_shape[i] = sympy.simplify((e - s + t + (-1 if t > 0 else 1)) // t)
+                new_sympy_shape[i] = sympy_simplify((e - s + t + (-1 if t > 0 else 1)) // t)
 
             self._update_computed_dims(new_sympy_shape)
 
@@ -2547,9 +2945,178 @@ class SymbolicShapeInference:
                 return out
         return None
 
+    @staticmethod
+    def _get_subgraphs(node):
+        if node.op_type == "If":
+            return [get_attribute(node, "then_branch"), get_attribute(node, "else_branch")]
+        if node.op_type in ["Loop", "Scan"]:
+            return [get_attribute(node, "body")]
+        return []
+
+    @staticmethod
+    def _copy_inferred_graph(src, dst):
+        # copies the inferred graph inputs, outputs and value_info of a graph and its subgraphs, but not initializers
+        for field in ["input", "output", "value_info"]:
+            dst.ClearField(field)
+            getattr(dst, field).extend(getattr(src, field))
+        for src_node, dst_node in zip(src.node, dst.node):
+            src_subgraphs = SymbolicShapeInference._get_subgraphs(src_node)
+            for src_subgraph, dst_subgraph in zip(src_subgraphs, SymbolicShapeInference._get_subgraphs(dst_node)):
+                SymbolicShapeInference._copy_inferred_graph(src_subgraph, dst_subgraph)
+
+    def _get_prereq(self, node):
+        """
+        Returns the inputs of a node, including the implicit inputs of its subgraphs, which affect topological sort.
+        The prerequisites of the nodes of each subgraph are returned as well, so that the inference of the subgraphs
+        does not need to compute them again.
+        """
+        names = {i for i in node.input if i}
+        subgraph_prereqs = []
+        for g in self._get_subgraphs(node):
+            g_outputs_and_initializers = {i.name for i in g.initializer}
+            for n in g.node:
+                g_outputs_and_initializers.update(n.output)
+            g_node_prereqs = [self._get_prereq(n) for n in g.node]
+            for n_names, _ in g_node_prereqs:
+                names.update([i for i in n_names if i not in g_outputs_and_initializers])
+            # remove subgraph inputs from g_prereq since those are local-only
+            for i in g.input:
+                names.discard(i.name)
+            subgraph_prereqs.append(g_node_prereqs)
+        return names, subgraph_prereqs
+
+    def _topological_sort(self, known):
+        """
+        Returns the indices of the nodes of out_mp_ in the order of inference, given the names of known inputs.
+
+        The order is the one of repeated sweeps over the nodes, each sweep taking the nodes whose prerequisites are
+        known, until a sweep reaches all graph outputs. It is computed in linear time with Kahn's algorithm: a node is
+        ready when its count of unknown prerequisites drops to zero, and the ready nodes are taken by (sweep, index).
+        """
+        graph = self.out_mp_.graph
+        if self.node_prereqs_ is None:
+            self.node_prereqs_ = [self._get_prereq(node) for node in graph.node]
+        for node, (_, subgraph_prereqs) in zip(graph.node, self.node_prereqs_):
+            for g, g_node_prereqs in zip(self._get_subgraphs(node), subgraph_prereqs):
+                self.subgraph_prereqs_[id(g)] = (g, g_node_prereqs)
+
+        # nodes sharing the same first output share the prerequisites of the last one
+        prereq_for_node = {node.output[0]: names for node, (names, _) in zip(graph.node, self.node_prereqs_)}
+        known = set(known)
+        unknown_outputs = {o.name for o in graph.output if o.name not in known}
+        if not unknown_outputs:
+            return []
+
+        num_unknown_prereqs = []
+        consumers = defaultdict(list)
+        ready = []
+        for index, node in enumerate(graph.node):
+            unknown_prereqs = [i for i in prereq_for_node[node.output[0]] if i not in known]
+            for name in unknown_prereqs:
+                consumers[name].append(index)
+            num_unknown_prereqs.append(len(unknown_prereqs))
+            if not unknown_prereqs:
+                ready.append((0, index))
+
+        sorted_indices = []
+        last_sweep = None
+        while ready:
+            sweep, index = heapq.heappop(ready)
+            if last_sweep is not None and sweep > last_sweep:
+                break
+            node = graph.node[index]
+            if node.output[0] in known:
+                continue
+            sorted_indices.append(index)
+            for name in node.output:
+                if name in known:
+                    continue
+                known.add(name)
+                unknown_outputs.discard(name)
+                for consumer in consumers.pop(name, []):
+                    num_unknown_prereqs[consumer] -= 1
+                    if num_unknown_prereqs[consumer] == 0:
+                        # a node before the current one is only reached by the next sweep
+                        heapq.heappush(ready, (sweep if consumer > index else sweep + 1, consumer))
+            if not unknown_outputs and last_sweep is None:
+                # the sweep reaching all graph outputs is completed
+                last_sweep = sweep
+
+        if unknown_outputs:
+            raise Exception("Invalid model with cyclic graph")
+        return sorted_indices
+
+    @staticmethod
+    def _is_same_sympy_data(data, other):
+        if type(data) != type(other):  # noqa: E721
+            return False
+        if isinstance(data, np.ndarray):
+            return data.shape == other.shape and np.array_equal(data, other)
+        if isinstance(data, list):
+            return len(data) == len(other) and all(
+                SymbolicShapeInference._is_same_sympy_data(d, o) for d, o in zip(data, other)
+            )
+        try:
+            return bool(data == other)
+        except (TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def _references_symbols(node_result, symbols):
+        # a substring match may find symbols that are not referenced, which only causes an extra inference
+        output_vis, output_sympy_data = node_result
+        for vi in output_vis:
+            if vi.type.WhichOneof("value") == "tensor_type":
+                for d in vi.type.tensor_type.shape.dim:
+                    if d.dim_param and any(s in d.dim_param for s in symbols):
+                        return True
+            elif any(s in str(vi.type) for s in symbols):
+                return True
+        return any(any(s in str(data) for s in symbols) for data in output_sympy_data.values())
+
+    def _reuse_node_result(self, index, node, last_node_result, changed_names, merged_symbols):
+        """
+        Reuses the results of a node from the last run when its inputs did not change and its outputs do not
+        reference symbols merged since the last run. Nodes with subgraphs are always inferred again.
+        """
+        if last_node_result is None or self._get_subgraphs(node):
+            return False
+        if any(i in changed_names for i in node.input):
+            return False
+        if merged_symbols and self._references_symbols(last_node_result, merged_symbols):
+            return False
+
+        output_vis, output_sympy_data = last_node_result
+        for output_vi in output_vis:
+            vi = self.out_mp_.graph.value_info.add()
+            vi.CopyFrom(output_vi)
+            self.known_vi_[vi.name] = vi
+        self.sympy_data_.update(output_sympy_data)
+        self.node_results_[index] = last_node_result
+        return True
+
+    def _record_node_result(self, index, node, last_node_result, changed_names):
+        output_vis = []
+        for o in node.output:
+            if o and o in self.known_vi_:
+                vi = onnx.ValueInfoProto()
+                vi.CopyFrom(self.known_vi_[o])
+                output_vis.append(vi)
+        output_sympy_data = {o: self.sympy_data_[o] for o in node.output if o in self.sympy_data_}
+        node_result = (output_vis, output_sympy_data)
+        if (
+            last_node_result is None
+            or last_node_result[0] != output_vis
+            or last_node_result[1].keys() != output_sympy_data.keys()
+            or not all(self._is_same_sympy_data(v, last_node_result[1][k]) for k, v in output_sympy_data.items())
+        ):
+            changed_names.update(o for o in node.output if o)
+        self.node_results_[index] = node_result
+
     def _infer_impl(self, start_sympy_data=None):
         self.sympy_data_ = start_sympy_data or {}
         self.out_mp_.graph.ClearField("value_info")
+        input_types = [i.type.SerializeToString() for i in self.out_mp_.graph.input]
         self._apply_suggested_merge(graph_input_only=True)
         self.input_symbols_ = set()
         for i in self.out_mp_.graph.input:
@@ -2578,64 +3145,38 @@ class SymbolicShapeInference:
                 # Since inputs are not produced by other ops, we can assume positivity
                 self.symbolic_dims_[s] = sympy.Symbol(s, integer=True, positive=True)
         # create a temporary ModelProto for single node inference
-        # note that we remove initializer to have faster inference
+        # note that we do not copy the graph, and its initializers, to have faster inference
         # for tensor ops like Reshape/Tile/Expand that read initializer, we need to do sympy computation based inference anyways
-        self.tmp_mp_ = onnx.ModelProto()
-        self.tmp_mp_.CopyFrom(self.out_mp_)
-        self.tmp_mp_.graph.ClearField("initializer")
-
-        # compute prerequesite for node for topological sort
-        # node with subgraphs may have dependency on implicit inputs, which will affect topological sort
-        prereq_for_node = {}  # map from node to all its inputs, including implicit ones in subgraph
-
-        def get_prereq(node):
-            names = {i for i in node.input if i}
-            subgraphs = []
-            if node.op_type == "If":
-                subgraphs = [
-                    get_attribute(node, "then_branch"),
-                    get_attribute(node, "else_branch"),
-                ]
-            elif node.op_type in ["Loop", "Scan"]:
-                subgraphs = [get_attribute(node, "body")]
-            for g in subgraphs:
-                g_outputs_and_initializers = {i.name for i in g.initializer}
-                g_prereq = set()
-                for n in g.node:
-                    g_outputs_and_initializers.update(n.output)
-                for n in g.node:
-                    g_prereq.update([i for i in get_prereq(n) if i not in g_outputs_and_initializers])
-                names.update(g_prereq)
-                # remove subgraph inputs from g_prereq since those are local-only
-                for i in g.input:
-                    if i.name in names:
-                        names.remove(i.name)
-            return names
-
-        for n in self.tmp_mp_.graph.node:
-            prereq_for_node[n.output[0]] = get_prereq(n)
+        self.tmp_mp_ = onnx.ModelProto(ir_version=self.out_mp_.ir_version)
+        self.tmp_mp_.opset_import.extend(self.out_mp_.opset_import)
+        self.tmp_mp_.functions.extend(self.out_mp_.functions)
 
         # topological sort nodes, note there might be dead nodes so we check if all graph outputs are reached to terminate
-        sorted_nodes = []
-        sorted_known_vi = {i.name for i in list(self.out_mp_.graph.input) + list(self.out_mp_.graph.initializer)}
-        if any([o.name in sorted_known_vi for o in self.out_mp_.graph.output]):
-            # Loop/Scan will have some graph output in graph inputs, so don't do topological sort
-            sorted_nodes = self.out_mp_.graph.node
-        else:
-            while not all([o.name in sorted_known_vi for o in self.out_mp_.graph.output]):
-                old_sorted_nodes_len = len(sorted_nodes)
-                for node in self.out_mp_.graph.node:
-                    if (node.output[0] not in sorted_known_vi) and all(
-                        [i in sorted_known_vi for i in prereq_for_node[node.output[0]] if i]
-                    ):
-                        sorted_known_vi.update(node.output)
-                        sorted_nodes.append(node)
-                if old_sorted_nodes_len == len(sorted_nodes) and not all(
-                    [o.name in sorted_known_vi for o in self.out_mp_.graph.output]
-                ):
-                    raise Exception("Invalid model with cyclic graph")
-
-        for node in sorted_nodes:
+        # the order only depends on the names of the inputs and outputs, so it is the same in every run
+        if self.sorted_node_indices_ is None:
+            sorted_known_vi = {i.name for i in list(self.out_mp_.graph.input) + list(self.out_mp_.graph.initializer)}
+            if any([o.name in sorted_known_vi for o in self.out_mp_.graph.output]):
+                # Loop/Scan will have some graph output in graph inputs, so don't do topological sort
+                self.sorted_node_indices_ = range(len(self.out_mp_.graph.node))
+            else:
+                self.sorted_node_indices_ = self._topological_sort(sorted_known_vi)
+
+        # when inference is run again after merging symbols, the nodes whose inputs did not change and whose outputs
+        # do not reference the newly merged symbols keep the results of the last run
+        last_node_results, self.node_results_ = self.node_results_, {}
+        merged_symbols = [s for s in self.suggested_merge_ if s not in self.merged_symbols_]
+        self.merged_symbols_ = set(self.suggested_merge_)
+        changed_names = {
+            i.name
+            for i, input_type in zip(self.out_mp_.graph.input, input_types)
+            if i.type.SerializeToString() != input_type
+        }
+
+        for index in self.sorted_node_indices_:
+            node = self.out_mp_.graph.node[index]
+            if self._reuse_node_result(index, node, last_node_results.get(index), changed_names, merged_symbols):
+                continue
+
             assert all([i in self.known_vi_ for i in node.input if i])
             self._onnx_infer_single_node(node)
             known_aten_op = False
@@ -2858,6 +3399,8 @@ class SymbolicShapeInference:
                             logger.debug("Merging: " + str(self.suggested_merge_))  # noqa: G003
                     return False
 
+            self._record_node_result(index, node, last_node_results.get(index), changed_names)
+
         self.run_ = False
         return True
 
@@ -2866,23 +3409,153 @@ class SymbolicShapeInference:
             if output.name in self.known_vi_:
                 output.CopyFrom(self.known_vi_[output.name])
 
+    def _save_to_cache(self, key, all_shapes_inferred):
+        graph = self.out_mp_.graph
+        result = onnx.ModelProto()
+        result.graph.input.extend(graph.input)
+        result.graph.output.extend(graph.output)
+        result.graph.value_info.extend(graph.value_info)
+        node_indices = [i for i, node in enumerate(graph.node) if self._get_subgraphs(node)]
+        result.graph.node.extend([graph.node[i] for i in node_indices])
+        helper.set_model_props(
+            result, {"node_indices": json.dumps(node_indices), "all_shapes_inferred": str(all_shapes_inferred)}
+        )
+        shape_inference_cache.save(key, result.SerializeToString())
+
+    def _load_from_cache(self, key, in_mp):
+        # returns whether all shapes were inferred, or None when the cache has no result for the model
+        serialized = shape_inference_cache.load(key)
+        if serialized is None:
+            return None
+        result = onnx.ModelProto.FromString(serialized)
+        props = {prop.key: prop.value for prop in result.metadata_props}
+        self._preprocess(in_mp)
+        graph = self.out_mp_.graph
+        for field in ["input", "output", "value_info"]:
+            graph.ClearField(field)
+            getattr(graph, field).extend(getattr(result.graph, field))
+        for index, node in zip(json.loads(props["node_indices"]), result.graph.node):
+            graph.node[index].CopyFrom(node)
+        self.graph_inputs_ = {i.name: i for i in graph.input}
+        self.known_vi_.update(self.graph_inputs_)
+        self.known_vi_.update({vi.name: vi for vi in graph.value_info})
+        self.run_ = False
+        return props["all_shapes_inferred"] == "True"
+
     @staticmethod
-    def infer_shapes(in_mp, int_max=2**31 - 1, auto_merge=False, guess_output_rank=False, verbose=0):
+    def infer_shapes(
+        in_mp,
+        int_max=2**31 - 1,
+        auto_merge=False,
+        guess_output_rank=False,
+        verbose=0,
+        use_cache=None,
+        num_workers=1,
+    ):
+        """
+        Infers the shapes of a model. With num_workers > 1, the independent subgraphs of a node, like the then and
+        else branches of If, are inferred concurrently in a pool of num_workers processes. The result is the same.
+        The result is taken from and saved to shape_inference_cache with use_cache=True, or when use_cache is None
+        and the cache_dir of the cache is set, see SymbolicShapeInferenceCache.
+        """
         onnx_opset = get_opset(in_mp)
         if (not onnx_opset) or onnx_opset < 7:
             logger.warning("Only support models of onnx opset 7 and above.")
             return None
         symbolic_shape_inference = SymbolicShapeInference(int_max, auto_merge, guess_output_rank, verbose)
-        all_shapes_inferred = False
-        symbolic_shape_inference._preprocess(in_mp)
-        while symbolic_shape_inference.run_:
-            all_shapes_inferred = symbolic_shape_inference._infer_impl()
-        symbolic_shape_inference._update_output_from_vi()
+        all_shapes_inferred = None
+        use_cache = shape_inference_cache.is_enabled(use_cache)
+        if use_cache:
+            key = shape_inference_cache.make_key(in_mp, "infer_shapes", int_max, auto_merge, guess_output_rank)
+            all_shapes_inferred = symbolic_shape_inference._load_from_cache(key, in_mp)
+        if all_shapes_inferred is None:
+            all_shapes_inferred = False
+            symbolic_shape_inference._preprocess(in_mp)
+            if num_workers > 1:
+                # the worker processes are started on the first subgraphs to infer
+                symbolic_shape_inference.executor_ = ProcessPoolExecutor(num_workers)
+            try:
+                while symbolic_shape_inference.run_:
+                    all_shapes_inferred = symbolic_shape_inference._infer_impl()
+            finally:
+                if symbolic_shape_inference.executor_ is not None:
+                    symbolic_shape_inference.executor_.shutdown()
+                    symbolic_shape_inference.executor_ = None
+            symbolic_shape_inference._update_output_from_vi()
+            if use_cache:
+                symbolic_shape_inference._save_to_cache(key, all_shapes_inferred)
         if not all_shapes_inferred:
             onnx.save_model(symbolic_shape_inference.out_mp_, "sym_shape_infer_temp.onnx", save_as_external_data=True)
             raise Exception("Incomplete symbolic shape inference")
         return symbolic_shape_inference.out_mp_
 
+    @staticmethod
+    def infer_shapes_path(
+        model_path,
+        output_path=None,
+        int_max=2**31 - 1,
+        auto_merge=False,
+        guess_output_rank=False,
+        verbose=0,
+        size_threshold=1024,
+        use_cache=None,
+        num_workers=1,
+    ):
+        """
+        Infers the shapes of a model with external data without loading its weights. Only the graph and the
+        initializers with at most size_threshold bytes of external data, like shapes, axes or small constants which
+        could be needed to compute shapes, are loaded. The model with the inferred value_info is returned without the
+        loaded external data, and saved to output_path when it is given. The output path shall be in the directory of
+        the model, so that the saved model refers to the same external data files, which are not written.
+        """
+        model = onnx.load(model_path, load_external_data=False)
+        base_dir = os.path.dirname(model_path)
+        has_external_data = False
+
+        loaded_model = onnx.ModelProto()
+        loaded_model.CopyFrom(model)
+        for tensor in external_data_helper._get_all_tensors(loaded_model):
+            if not external_data_helper.uses_external_data(tensor):
+                continue
+            has_external_data = True
+            info = external_data_helper.ExternalDataInfo(tensor)
+            size = info.length or int(np.prod(tensor.dims)) * helper.tensor_dtype_to_np_dtype(tensor.data_type).itemsize
+            if size <= size_threshold:
+                external_data_helper.load_external_data_for_tensor(tensor, base_dir)
+                tensor.data_location = onnx.TensorProto.DEFAULT
+                del tensor.external_data[:]
+
+        if (
+            output_path
+            and has_external_data
+            and os.path.abspath(os.path.dirname(output_path)) != os.path.abspath(base_dir)
+        ):
+            raise ValueError("The output model shall be in the directory of the input model with external data.")
+
+        out_mp = SymbolicShapeInference.infer_shapes(
+            loaded_model, int_max, auto_merge, guess_output_rank, verbose, use_cache, num_workers
+        )
+        if out_mp is None:
+            return None
+        SymbolicShapeInference._copy_inferred_graph(out_mp.graph, model.graph)
+        if output_path:
+            onnx.save(model, output_path)
+        return model
+
+
+def _infer_subgraph_in_worker(*args):
+    """Infers a subgraph in a worker process, and returns what is needed to update the subgraph in the main process."""
+    symbolic_shape_inference = SymbolicShapeInference._infer_subgraph(*args)
+    graph = symbolic_shape_inference.out_mp_.graph
+    output_dims = {d for o in graph.output for d in get_shape_from_value_info(o) or [] if type(d) == str}  # noqa: E721
+    symbolic_dims = {d: v for d, v in symbolic_shape_inference.symbolic_dims_.items() if d in output_dims}
+    sympy_data = {
+        o.name: symbolic_shape_inference.sympy_data_[o.name]
+        for o in graph.output
+        if o.name in symbolic_shape_inference.sympy_data_
+    }
+    return graph, symbolic_dims, sympy_data
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser()
@@ -2935,6 +3608,24 @@ def parse_arguments():
         type=int,
         default=1024,
     )
+    parser.add_argument(
+        "--skip_external_data",
+        help="Do not load the external data of initializers larger than --external_data_size_threshold, and save "
+        "the output model next to the external data of the input model",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="The directory to cache the results of inference, to skip it when the same model is inferred again",
+        default=None,
+    )
+    parser.add_argument(
+        "--num_workers",
+        help="The number of processes to infer the branches of If nodes concurrently",
+        type=int,
+        default=1,
+    )
     return parser.parse_args()
 
 
@@ -2943,25 +3634,41 @@ if __name__ == "__main__":
     logger.info("input model: " + args.input)  # noqa: G003
     if args.output:
         logger.info("output model " + args.output)  # noqa: G003
+    if args.cache_dir:
+        shape_inference_cache.cache_dir = args.cache_dir
     logger.info("Doing symbolic shape inference...")
-    out_mp = SymbolicShapeInference.infer_shapes(
-        onnx.load(args.input),
-        args.int_max,
-        args.auto_merge,
-        args.guess_output_rank,
-        args.verbose,
-    )
-    if args.output and out_mp:
-        if args.save_as_external_data:
-            onnx.save_model(
-                out_mp,
-                args.output,
-                save_as_external_data=True,
-                all_tensors_to_one_file=args.all_tensors_to_one_file,
-                location=args.external_data_location,
-                size_threshold=args.external_data_size_threshold,
-                convert_attribute=False,
-            )
-        else:
-            onnx.save(out_mp, args.output)
+    if args.skip_external_data:
+        SymbolicShapeInference.infer_shapes_path(
+            args.input,
+            args.output,
+            args.int_max,
+            args.auto_merge,
+            args.guess_output_rank,
+            args.verbose,
+            args.external_data_size_threshold,
+            num_workers=args.num_workers,
+        )
         logger.info("Done!")
+    else:
+        out_mp = SymbolicShapeInference.infer_shapes(
+            onnx.load(args.input),
+            args.int_max,
+            args.auto_merge,
+            args.guess_output_rank,
+            args.verbose,
+            num_workers=args.num_workers,
+        )
+        if args.output and out_mp:
+            if args.save_as_external_data:
+                onnx.save_model(
+                    out_mp,
+                    args.output,
+                    save_as_external_data=True,
+                    all_tensors_to_one_file=args.all_tensors_to_one_file,
+                    location=args.external_data_location,
+                    size_threshold=args.external_data_size_threshold,
+                    convert_attribute=False,
+                )
+            else:
+                onnx.save(out_mp, args.output)
+            logger.info("Done!")
@@ -301,6 +301,7 @@ class PackingMultiHeadAttention(PackingAttentionBase):
                     and len(rel_pos_bias_node.input) == 6
                 ):
                     rel_pos_bias_node.input.append(token_offset)
+                    self.model.update_node_index(rel_pos_bias_node)
                     gated_relative_pos_bias_count += 1
 
         logger.info("Converted %d MultiHeadAttention nodes to PackedMultiHeadAttention.", len(self.attention_nodes))
@@ -11,16 +11,19 @@
 # (4) add force_fp16_initializers option
 # (5) handle Resize and GroupNorm with mixed float inputs
 # (6) allow convert_float_to_float16 to accept model path
+# (7) add convert_float_to_float16_path to convert models with external data without loading the weights
 
 import itertools
 import logging
 import os
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
 
 import numpy as np
 import onnx
-from onnx import AttributeProto, GraphProto, ModelProto, NodeProto, TensorProto, helper, numpy_helper
+from onnx import AttributeProto, GraphProto, ModelProto, NodeProto, TensorProto, external_data_helper, helper
 from onnx.shape_inference import infer_shapes, infer_shapes_path
 from packaging import version
 
@@ -34,7 +37,11 @@ def _npfloat16_to_int(np_list):
     :param np_list: numpy float16 list
     :return int_list: python int list
     """
-    return [int(bin(_.view("H"))[2:].zfill(16), 2) for _ in np_list]
+    return np.asarray(np_list, dtype=np.float16).view(np.uint16).tolist()
+
+
+# Number of elements converted at a time by convert_np_to_float16, so that the temporary buffer stays in cache.
+CONVERT_CHUNK_SIZE = 1 << 16
 
 
 def convert_np_to_float16(np_array, min_positive_val=5.96e-08, max_finite_val=65504.0):
@@ -44,32 +51,52 @@ def convert_np_to_float16(np_array, min_positive_val=5.96e-08, max_finite_val=65
     Positive finite values greater than max_finite_val are mapped to max_finite_val.
     Similar for negative values. NaN, 0, inf, and -inf are unchanged.
     """
-
-    def between(a, b, c):
-        return np.logical_and(a < b, b < c)
-
-    if np_array[np.where(np_array > 0)].shape[0] > 0:
-        positive_max = np_array[np.where(np_array > 0)].max()
-        positive_min = np_array[np.where(np_array > 0)].min()
+    np_array = np.asarray(np_array)
+    if logger.isEnabledFor(logging.DEBUG):
+        _log_float16_truncation(np_array, min_positive_val, max_finite_val)
+
+    # The values are clamped in the type of the input, like comparing them with min_positive_val and max_finite_val,
+    # one chunk at a time in a small buffer, and the chunk is written to the float16 output.
+    dtype = np_array.dtype if np.issubdtype(np_array.dtype, np.floating) else np.dtype(np.float64)
+    values = np_array.reshape(-1)
+    float16_values = np.empty(values.shape, dtype=np.float16)
+    buffer = np.empty(min(values.size, CONVERT_CHUNK_SIZE), dtype=dtype)
+    unchanged = np.empty(buffer.shape, dtype=bool)
+    for start in range(0, values.size, CONVERT_CHUNK_SIZE):
+        chunk = values[start : start + CONVERT_CHUNK_SIZE]
+        clamped = buffer[: chunk.size]
+        np.abs(chunk, out=clamped)
+        np.clip(clamped, min_positive_val, max_finite_val, out=clamped)
+        np.copysign(clamped, chunk, out=clamped)
+        # NaN, 0, inf and -inf are unchanged.
+        mask = unchanged[: chunk.size]
+        np.isfinite(chunk, out=mask)
+        np.logical_and(mask, chunk, out=mask)
+        np.logical_not(mask, out=mask)
+        np.copyto(clamped, chunk, where=mask)
+        float16_values[start : start + chunk.size] = clamped
+    return float16_values.reshape(np_array.shape)
+
+
+def _log_float16_truncation(np_array, min_positive_val, max_finite_val):
+    positive_values = np_array[np_array > 0]
+    if positive_values.size > 0:
+        positive_max = positive_values.max()
+        positive_min = positive_values.min()
         if positive_max >= max_finite_val:
             logger.debug(f"the float32 number {positive_max} will be truncated to {max_finite_val}")
         if positive_min <= min_positive_val:
             logger.debug(f"the float32 number {positive_min} will be truncated to {min_positive_val}")
 
-    if np_array[np.where(np_array < 0)].shape[0] > 0:
-        negative_max = np_array[np.where(np_array < 0)].max()
-        negative_min = np_array[np.where(np_array < 0)].min()
+    negative_values = np_array[np_array < 0]
+    if negative_values.size > 0:
+        negative_max = negative_values.max()
+        negative_min = negative_values.min()
         if negative_min <= -max_finite_val:
             logger.debug(f"the float32 number {negative_min} will be truncated to {-max_finite_val}")
         if negative_max >= -min_positive_val:
             logger.debug(f"the float32 number {negative_max} will be truncated to {-min_positive_val}")
 
-    np_array = np.where(between(0, np_array, min_positive_val), min_positive_val, np_array)
-    np_array = np.where(between(-min_positive_val, np_array, 0), -min_positive_val, np_array)
-    np_array = np.where(between(max_finite_val, np_array, float("inf")), max_finite_val, np_array)
-    np_array = np.where(between(float("-inf"), np_array, -max_finite_val), -max_finite_val, np_array)
-    return np.float16(np_array)
-
 
 def convert_tensor_float_to_float16(tensor, min_positive_val=5.96e-08, max_finite_val=65504.0):
     """Convert tensor float to float16.
@@ -90,27 +117,44 @@ def convert_tensor_float_to_float16(tensor, min_positive_val=5.96e-08, max_finit
         raise ValueError(f"Expected input type is an ONNX TensorProto but got {type(tensor)}")
 
     if tensor.data_type == TensorProto.FLOAT:
-        tensor.data_type = TensorProto.FLOAT16
-        # convert float_data (float type) to float16 and write to int32_data
-        if tensor.float_data:
-            float16_data = convert_np_to_float16(np.array(tensor.float_data), min_positive_val, max_finite_val)
-            int_list = _npfloat16_to_int(float16_data)
-            tensor.int32_data[:] = int_list
-            tensor.float_data[:] = []
-        # convert raw_data (bytes type)
-        if tensor.raw_data:
-            # convert n.raw_data to float
-            float32_list = np.frombuffer(tensor.raw_data, dtype="float32")
-            # convert float to float16
-            float16_list = convert_np_to_float16(float32_list, min_positive_val, max_finite_val)
-            # convert float16 to bytes and write back to raw_data
-            tensor.raw_data = float16_list.tobytes()
+        float16_data = _convert_float_data(_read_float_data(tensor), min_positive_val, max_finite_val)
+        _write_float16_data(tensor, float16_data)
     return tensor
 
 
+def _read_float_data(tensor):
+    """Returns the float32 values of a float tensor in float_data and in raw_data, None for an empty field."""
+    float_data = np.array(tensor.float_data) if tensor.float_data else None
+    raw_data = np.frombuffer(tensor.raw_data, dtype="float32") if tensor.raw_data else None
+    return float_data, raw_data
+
+
+def _convert_float_data(values, min_positive_val, max_finite_val):
+    """
+    Converts the values returned by _read_float_data to the int32_data and the raw_data of a float16 tensor. It does
+    not access the tensor, so it can run in another thread while the model is modified.
+    """
+    float_data, raw_data = values
+    if float_data is not None:
+        # float16 values in float_data are written to int32_data
+        float_data = _npfloat16_to_int(convert_np_to_float16(float_data, min_positive_val, max_finite_val))
+    if raw_data is not None:
+        raw_data = convert_np_to_float16(raw_data, min_positive_val, max_finite_val).tobytes()
+    return float_data, raw_data
+
+
+def _write_float16_data(tensor, float16_data):
+    int32_data, raw_data = float16_data
+    tensor.data_type = TensorProto.FLOAT16
+    if int32_data is not None:
+        tensor.int32_data[:] = int32_data
+        tensor.float_data[:] = []
+    if raw_data is not None:
+        tensor.raw_data = raw_data
+
+
 def make_value_info_from_tensor(tensor):
-    shape = numpy_helper.to_array(tensor).shape
-    return helper.make_tensor_value_info(tensor.name, tensor.data_type, shape)
+    return helper.make_tensor_value_info(tensor.name, tensor.data_type, list(tensor.dims))
 
 
 DEFAULT_OP_BLOCK_LIST = [
@@ -175,6 +219,7 @@ def convert_float_to_float16(
     force_fp16_initializers=False,
     force_fp16_inputs=None,
     use_bfloat16_as_blocked_nodes_dtype=False,
+    num_workers=1,
 ):
     """Convert tensor float type in the input ONNX model to tensor float16.
 
@@ -194,6 +239,9 @@ def convert_float_to_float16(
                                        Default to false, which will convert only the one needed to avoid precision loss.
         force_fp16_inputs(Dict[str, List[int]]): Force the conversion of the inputs of some operators to float16, even if
                                                  this script's preference it to keep them in float32.
+        num_workers (int, optional): Number of threads converting the float initializers to float16. With more than
+                                     one, an initializer is converted as soon as the walk of the graph finds that it
+                                     will be converted, while the walk goes on. Defaults to 1.
     Raises:
         ValueError: input type is not ModelProto.
 
@@ -207,6 +255,9 @@ def convert_float_to_float16(
 
     force_fp16_inputs_dict = {} if force_fp16_inputs is None else force_fp16_inputs
 
+    # time in seconds of every phase of the conversion, logged at the end
+    timings = {}
+    start_time = time.perf_counter()
     if isinstance(model, str):
         model_path = model
         if version.parse(onnx.__version__) >= version.parse("1.8.0") and not disable_shape_infer:
@@ -255,6 +306,8 @@ def convert_float_to_float16(
     # type inference on input model
     if func_infer_shape is not None:
         model = func_infer_shape(model)
+    timings["load and shape inference"] = time.perf_counter() - start_time
+    start_time = time.perf_counter()
     queue.append(model)
     name_mapping = {}
     graph_io_to_skip = set()
@@ -304,115 +357,152 @@ def convert_float_to_float16(
             io_casts.add(node_name)
 
     fp32_initializers: Dict[str, InitializerTracker] = {}
-    while queue:
-        next_level = []
-        for q in queue:
-            # if q is model, push q.graph (GraphProto)
-            if isinstance(q, ModelProto):
-                next_level.append(q.graph)
-            # if q is model.graph, push q.node.attribute (AttributeProto)
-            if isinstance(q, GraphProto):
-                for n in q.initializer:  # TensorProto type
-                    if n.data_type == TensorProto.FLOAT:
-                        assert n.name not in fp32_initializers
-                        fp32_initializers[n.name] = InitializerTracker(n)
-
-                for n in q.node:
-                    # if n is in the block list (doesn't support float16), no conversion for the node,
-                    # and save the node for further processing
-                    if n.name in io_casts:
-                        continue
-                    for i in range(len(n.input)):
-                        if n.input[i] in name_mapping:
-                            n.input[i] = name_mapping[n.input[i]]
-                    for i in range(len(n.output)):
-                        if n.output[i] in name_mapping:
-                            n.output[i] = name_mapping[n.output[i]]
-
-                    is_node_blocked = n.op_type in op_block_list or n.name in node_block_list
-                    for i, input_name in enumerate(n.input):
-                        if input_name in fp32_initializers:
-                            # For Resize/GroupNorm, only the first input can be float16
-                            use_fp32_weight = is_node_blocked or (
-                                i in ALWAYS_FLOAT_INPUTS.get(n.op_type, [])
-                                and i not in force_fp16_inputs_dict.get(n.op_type, [])
-                            )
-                            fp32_initializers[input_name].add_node(n, use_fp32_weight)
-
-                    if is_node_blocked:
-                        node_list.append(n)
-                    else:
-                        if n.op_type == "Cast":
-                            for attr in n.attribute:
-                                if attr.name == "to" and attr.i == TensorProto.FLOAT:
-                                    attr.i = TensorProto.FLOAT16
-                                    break
-
-                        if n.op_type in [
-                            "EyeLike",
-                            "Multinomial",
-                            "RandomNormal",
-                            "RandomNormalLike",
-                            "RandomUniform",
-                            "RandomUniformLike",
-                            "SequenceEmpty",
-                            "Bernoulli",
-                        ]:
-                            has_dtype = False
-                            for attr in n.attribute:
-                                if attr.name == "dtype":
-                                    has_dtype = True
-                                    if attr.i == TensorProto.FLOAT:
-                                        attr.i = TensorProto.FLOAT16
-
-                            # The dtype attribute is optional and default is FLOAT in the following operators
-                            # so we need add dtype attribute to specify the data type float16
-                            if (n.op_type in ["RandomNormal", "RandomUniform", "SequenceEmpty"]) and not has_dtype:
-                                n.attribute.extend([helper.make_attribute("dtype", TensorProto.FLOAT16)])
-
-                        # For Resize/GroupNorm, attribute data type cannot be changed
-                        if n.op_type not in ALWAYS_FLOAT_INPUTS or n.op_type in force_fp16_inputs_dict:
-                            for attr in n.attribute:
-                                next_level.append(attr)  # noqa: PERF402
+    # An initializer is converted by the executor from a copy of its data, and the float16 data is written to the
+    # initializer by this thread, since the model is not modified concurrently.
+    executor = ThreadPoolExecutor(num_workers) if num_workers > 1 else None
+    pending_conversions = {}
+    converted_initializers = set()
+
+    def finish_conversion(name):
+        _write_float16_data(fp32_initializers[name].initializer, pending_conversions.pop(name).result())
+        converted_initializers.add(name)
+
+    def start_conversion(value: InitializerTracker):
+        name = value.initializer.name
+        if executor is None or name in pending_conversions or name in converted_initializers:
+            return
+        pending_conversions[name] = executor.submit(
+            _convert_float_data, _read_float_data(value.initializer), min_positive_val, max_finite_val
+        )
+        # At most 2 * num_workers initializers are in flight, which bounds the memory of their copies.
+        if len(pending_conversions) > 2 * num_workers:
+            finish_conversion(next(iter(pending_conversions)))
+
+    try:
+        while queue:
+            next_level = []
+            for q in queue:
+                # if q is model, push q.graph (GraphProto)
+                if isinstance(q, ModelProto):
+                    next_level.append(q.graph)
+                # if q is model.graph, push q.node.attribute (AttributeProto)
+                if isinstance(q, GraphProto):
+                    for n in q.initializer:  # TensorProto type
+                        if n.data_type == TensorProto.FLOAT:
+                            assert n.name not in fp32_initializers
+                            fp32_initializers[n.name] = InitializerTracker(n)
+                            if force_fp16_initializers:
+                                start_conversion(fp32_initializers[n.name])
+
+                    for n in q.node:
+                        # if n is in the block list (doesn't support float16), no conversion for the node,
+                        # and save the node for further processing
+                        if n.name in io_casts:
+                            continue
+                        for i in range(len(n.input)):
+                            if n.input[i] in name_mapping:
+                                n.input[i] = name_mapping[n.input[i]]
+                        for i in range(len(n.output)):
+                            if n.output[i] in name_mapping:
+                                n.output[i] = name_mapping[n.output[i]]
+
+                        is_node_blocked = n.op_type in op_block_list or n.name in node_block_list
+                        for i, input_name in enumerate(n.input):
+                            if input_name in fp32_initializers:
+                                # For Resize/GroupNorm, only the first input can be float16
+                                use_fp32_weight = is_node_blocked or (
+                                    i in ALWAYS_FLOAT_INPUTS.get(n.op_type, [])
+                                    and i not in force_fp16_inputs_dict.get(n.op_type, [])
+                                )
+                                fp32_initializers[input_name].add_node(n, use_fp32_weight)
+                                if not use_fp32_weight:
+                                    start_conversion(fp32_initializers[input_name])
+
+                        if is_node_blocked:
+                            node_list.append(n)
                         else:
-                            mixed_float_type_node_list.append(n)
-
-            # if q is model.graph.node.attribute, push q.g and q.graphs (GraphProto)
-            # and process node.attribute.t and node.attribute.tensors (TensorProto)
-            if isinstance(q, AttributeProto):
-                next_level.append(q.g)
-                for n in q.graphs:
-                    next_level.append(n)  # noqa: PERF402
-                q.t.CopyFrom(convert_tensor_float_to_float16(q.t, min_positive_val, max_finite_val))
-                for n in q.tensors:
-                    n = convert_tensor_float_to_float16(n, min_positive_val, max_finite_val)  # noqa: PLW2901
-            # if q is graph, process input, output and value_info (ValueInfoProto)
-            if isinstance(q, GraphProto):
-                # Note that float initializers tracked by fp32_initializers will be processed later.
-                # for all ValueInfoProto with tensor(float) type in input, output and value_info, convert them to
-                # tensor(float16) except map and seq(map). And save them in value_info_list for further processing
-                for n in itertools.chain(q.input, q.output, q.value_info):
-                    if n.type.tensor_type.elem_type == TensorProto.FLOAT:
-                        if n.name not in graph_io_to_skip:
-                            n.type.tensor_type.elem_type = TensorProto.FLOAT16
-                            value_info_list.append(n)
-                    if n.type.HasField("sequence_type"):
-                        if n.type.sequence_type.elem_type.tensor_type.elem_type == TensorProto.FLOAT:
+                            if n.op_type == "Cast":
+                                for attr in n.attribute:
+                                    if attr.name == "to" and attr.i == TensorProto.FLOAT:
+                                        attr.i = TensorProto.FLOAT16
+                                        break
+
+                            if n.op_type in [
+                                "EyeLike",
+                                "Multinomial",
+                                "RandomNormal",
+                                "RandomNormalLike",
+                                "RandomUniform",
+                                "RandomUniformLike",
+                                "SequenceEmpty",
+                                "Bernoulli",
+                            ]:
+                                has_dtype = False
+                                for attr in n.attribute:
+                                    if attr.name == "dtype":
+                                        has_dtype = True
+                                        if attr.i == TensorProto.FLOAT:
+                                            attr.i = TensorProto.FLOAT16
+
+                                # The dtype attribute is optional and default is FLOAT in the following operators
+                                # so we need add dtype attribute to specify the data type float16
+                                if (n.op_type in ["RandomNormal", "RandomUniform", "SequenceEmpty"]) and not has_dtype:
+                                    n.attribute.extend([helper.make_attribute("dtype", TensorProto.FLOAT16)])
+
+                            # For Resize/GroupNorm, attribute data type cannot be changed
+                            if n.op_type not in ALWAYS_FLOAT_INPUTS or n.op_type in force_fp16_inputs_dict:
+                                for attr in n.attribute:
+                                    next_level.append(attr)  # noqa: PERF402
+                            else:
+                                mixed_float_type_node_list.append(n)
+
+                # if q is model.graph.node.attribute, push q.g and q.graphs (GraphProto)
+                # and process node.attribute.t and node.attribute.tensors (TensorProto)
+                if isinstance(q, AttributeProto):
+                    next_level.append(q.g)
+                    for n in q.graphs:
+                        next_level.append(n)  # noqa: PERF402
+                    q.t.CopyFrom(convert_tensor_float_to_float16(q.t, min_positive_val, max_finite_val))
+                    for n in q.tensors:
+                        n = convert_tensor_float_to_float16(n, min_positive_val, max_finite_val)  # noqa: PLW2901
+                # if q is graph, process input, output and value_info (ValueInfoProto)
+                if isinstance(q, GraphProto):
+                    # Note that float initializers tracked by fp32_initializers will be processed later.
+                    # for all ValueInfoProto with tensor(float) type in input, output and value_info, convert them to
+                    # tensor(float16) except map and seq(map). And save them in value_info_list for further processing
+                    for n in itertools.chain(q.input, q.output, q.value_info):
+                        if n.type.tensor_type.elem_type == TensorProto.FLOAT:
                             if n.name not in graph_io_to_skip:
-                                n.type.sequence_type.elem_type.tensor_type.elem_type = TensorProto.FLOAT16
+                                n.type.tensor_type.elem_type = TensorProto.FLOAT16
                                 value_info_list.append(n)
-
-        queue = next_level
-
-    for value in fp32_initializers.values():
-        # By default, to avoid precision loss, do not convert an initializer to fp16 when it is used only by fp32 nodes.
-        if force_fp16_initializers or value.fp16_nodes:
-            value.initializer = convert_tensor_float_to_float16(value.initializer, min_positive_val, max_finite_val)
-            value_info_list.append(make_value_info_from_tensor(value.initializer))
-            if value.fp32_nodes and not force_fp16_initializers:
-                logger.info(
-                    f"initializer is used by both fp32 and fp16 nodes. Consider add these nodes to block list:{value.fp16_nodes}"
-                )
+                        if n.type.HasField("sequence_type"):
+                            if n.type.sequence_type.elem_type.tensor_type.elem_type == TensorProto.FLOAT:
+                                if n.name not in graph_io_to_skip:
+                                    n.type.sequence_type.elem_type.tensor_type.elem_type = TensorProto.FLOAT16
+                                    value_info_list.append(n)
+
+            queue = next_level
+        timings["graph walk"] = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+
+        for value in fp32_initializers.values():
+            # By default, to avoid precision loss, do not convert an initializer to fp16 when it is used only by fp32 nodes.
+            if force_fp16_initializers or value.fp16_nodes:
+                if value.initializer.name in pending_conversions:
+                    finish_conversion(value.initializer.name)
+                elif value.initializer.name not in converted_initializers:
+                    convert_tensor_float_to_float16(value.initializer, min_positive_val, max_finite_val)
+                value_info_list.append(make_value_info_from_tensor(value.initializer))
+                if value.fp32_nodes and not force_fp16_initializers:
+                    logger.info(
+                        f"initializer is used by both fp32 and fp16 nodes. Consider add these nodes to block list:{value.fp16_nodes}"
+                    )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    # with an executor, the initializers are mostly converted during the walk of the graph
+    timings["initializers"] = time.perf_counter() - start_time
+    start_time = time.perf_counter()
 
     # Some operators have data type fixed as float for some input. Add a float16 to float cast for those inputs.
     for node in mixed_float_type_node_list:
@@ -477,6 +567,111 @@ def convert_float_to_float16(
                     # change current node's input name
                     node.output[i] = input_name
                     break
+    timings["casts"] = time.perf_counter() - start_time
+    phases = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in timings.items())
+    logger.info(f"float16 conversion time: {phases}")
+    return model
+
+
+def _external_data_key(tensor):
+    return tuple((entry.key, entry.value) for entry in tensor.external_data)
+
+
+def _read_external_data(tensor, base_dir, dtype, count, chunk_size):
+    """
+    Yields the count elements of the external data of a tensor in chunks of at most chunk_size elements. Every chunk
+    is mapped from the file only until the next one is read, so that the whole tensor is never resident in memory.
+    """
+    info = external_data_helper.ExternalDataInfo(tensor)
+    path = os.path.join(base_dir, info.location)
+    itemsize = np.dtype(dtype).itemsize
+    for start in range(0, count, chunk_size):
+        offset = (info.offset or 0) + start * itemsize
+        yield np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(min(chunk_size, count - start),))
+
+
+def convert_float_to_float16_path(
+    model_path,
+    output_path,
+    external_data_location=None,
+    chunk_size=1 << 22,
+    min_positive_val=5.96e-08,
+    max_finite_val=65504.0,
+    disable_shape_infer=False,
+    **kwargs,
+):
+    """Convert a model with external data to float16 without loading its weights.
+
+    Only the graph is loaded and converted like convert_float_to_float16. Then the float32 external data of the
+    converted tensors is read through memory maps, converted chunk by chunk, and written to a new external data file,
+    with the external data of the other tensors copied as is. So the memory used does not depend on the size of the
+    weights.
+
+    Args:
+        model_path (str): The path of the ONNX model to convert.
+        output_path (str): The path of the converted model.
+        external_data_location (str, optional): The external data file of the converted model, relative to the
+                                                directory of output_path. Defaults to the name of output_path + ".data".
+        chunk_size (int, optional): The number of elements converted at a time. Defaults to 4M.
+        min_positive_val, max_finite_val, disable_shape_infer: see convert_float_to_float16.
+        kwargs: other arguments of convert_float_to_float16.
+
+    Raises:
+        ValueError: the external data file of the converted model is a file of the input model.
+
+    Returns:
+        ModelProto: converted model, with the external data not loaded.
+    """
+    base_dir = os.path.dirname(model_path)
+    output_dir = os.path.dirname(output_path)
+    if external_data_location is None:
+        external_data_location = os.path.basename(output_path) + ".data"
+    external_data_path = os.path.abspath(os.path.join(output_dir, external_data_location))
+
+    # The shapes are inferred on the graph alone, which is small since the weights are not loaded.
+    model = onnx.load(model_path, load_external_data=False)
+    if not disable_shape_infer:
+        model = infer_shapes(model)
+
+    external_tensors = [
+        tensor
+        for tensor in external_data_helper._get_all_tensors(model)
+        if external_data_helper.uses_external_data(tensor)
+    ]
+    for tensor in external_tensors:
+        location = external_data_helper.ExternalDataInfo(tensor).location
+        if os.path.abspath(os.path.join(base_dir, location)) == external_data_path:
+            raise ValueError(f"The external data file {external_data_path} is used by the input model.")
+    float_data_keys = {_external_data_key(t) for t in external_tensors if t.data_type == TensorProto.FLOAT}
+
+    # The external tensors converted to float16 only have their data type changed.
+    model = convert_float_to_float16(model, min_positive_val, max_finite_val, disable_shape_infer=True, **kwargs)
+
+    with open(external_data_path, "wb") as external_data_file:
+        for tensor in external_data_helper._get_all_tensors(model):
+            if not external_data_helper.uses_external_data(tensor):
+                continue
+            offset = external_data_file.tell()
+            if tensor.data_type == TensorProto.FLOAT16 and _external_data_key(tensor) in float_data_keys:
+                count = int(np.prod(tensor.dims))
+                chunks = _read_external_data(tensor, base_dir, np.float32, count, chunk_size)
+                external_data_file.writelines(
+                    convert_np_to_float16(chunk, min_positive_val, max_finite_val).tobytes() for chunk in chunks
+                )
+            else:
+                count = external_data_helper.ExternalDataInfo(tensor).length
+                if not count:
+                    count = int(np.prod(tensor.dims)) * helper.tensor_dtype_to_np_dtype(tensor.data_type).itemsize
+                chunks = _read_external_data(tensor, base_dir, np.uint8, count, chunk_size)
+                external_data_file.writelines(chunk.tobytes() for chunk in chunks)
+            length = external_data_file.tell() - offset
+            del tensor.external_data[:]
+            for key, value in [("location", external_data_location), ("offset", offset), ("length", length)]:
+                entry = tensor.external_data.add()
+                entry.key = key
+                entry.value = str(value)
+
+    onnx.save(model, output_path)
     return model
 
 
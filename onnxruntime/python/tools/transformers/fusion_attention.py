@@ -589,6 +589,7 @@ class FusionAttention(Fusion):
                 initializer_input = 1 if self.model.get_initializer(q_add.input[1]) else 0
                 if np.any(NumpyHelper.to_array(self.model.get_initializer(q_add.input[initializer_input]))):
                     q_add.input[1 - initializer_input] = q_slice_output
+                    self.model.update_node_index(q_add)
                     q_output = q_add
                     qkv_nodes.append(q_add)
                     self.node_name_to_graph_name[q_add.name] = self.this_graph_name
@@ -596,6 +597,7 @@ class FusionAttention(Fusion):
                 initializer_input = 1 if self.model.get_initializer(k_add.input[1]) else 0
                 if np.any(NumpyHelper.to_array(self.model.get_initializer(k_add.input[initializer_input]))):
                     k_add.input[1 - initializer_input] = k_slice_output
+                    self.model.update_node_index(k_add)
                     k_output = k_add
                     qkv_nodes.append(k_add)
                     self.node_name_to_graph_name[k_add.name] = self.this_graph_name
@@ -603,6 +605,7 @@ class FusionAttention(Fusion):
                 initializer_input = 1 if self.model.get_initializer(v_add.input[1]) else 0
                 if np.any(NumpyHelper.to_array(self.model.get_initializer(v_add.input[initializer_input]))):
                     v_add.input[1 - initializer_input] = v_slice_output
+                    self.model.update_node_index(v_add)
                     v_output = v_add
                     qkv_nodes.append(v_add)
                     self.node_name_to_graph_name[v_add.name] = self.this_graph_name
@@ -1219,6 +1222,7 @@ class FusionAttention(Fusion):
                     self.this_graph_name,
                 )
                 einsum_node.input[0] = new_edge
+                self.model.update_node_index(einsum_node)
 
             self.nodes_to_remove.extend([attention_last_node, transpose_qkv, matmul_qkv])
             self.nodes_to_remove.extend(qk_nodes)
@@ -285,7 +285,9 @@ class FusionBartAttention(FusionAttention):
             present_v = v_nodes[-1].output[0]
             if present_v not in graph_output_names:
                 identity_node_v = list(
-                    filter(lambda node: node.op_type == "Identity", self.model.input_name_to_nodes()[past_v])
+                    filter(
+                        lambda node: node.op_type == "Identity", self.model.graph_index().input_name_to_nodes[past_v]
+                    )
                 )
                 present_v = identity_node_v[0].output[0] if len(identity_node_v) == 1 else ""
         elif (
@@ -297,7 +299,9 @@ class FusionBartAttention(FusionAttention):
             present_v = v_nodes[-1].output[0]
             if present_v not in graph_output_names:
                 identity_node_v = list(
-                    filter(lambda node: node.op_type == "Identity", self.model.input_name_to_nodes()[past_v])
+                    filter(
+                        lambda node: node.op_type == "Identity", self.model.graph_index().input_name_to_nodes[past_v]
+                    )
                 )
                 present_v = identity_node_v[0].output[0] if len(identity_node_v) == 1 else ""
         else:
@@ -435,7 +439,9 @@ class FusionBartAttention(FusionAttention):
             present_k = k_nodes[-1].output[0]
             if present_k not in graph_output_names:
                 identity_node_k = list(
-                    filter(lambda node: node.op_type == "Identity", self.model.input_name_to_nodes()[past_k])
+                    filter(
+                        lambda node: node.op_type == "Identity", self.model.graph_index().input_name_to_nodes[past_k]
+                    )
                 )
                 present_k = identity_node_k[0].output[0] if len(identity_node_k) == 1 else ""
         elif (
@@ -447,7 +453,9 @@ class FusionBartAttention(FusionAttention):
             present_k = k_nodes[-1].output[0]
             if present_k not in graph_output_names:
                 identity_node_k = list(
-                    filter(lambda node: node.op_type == "Identity", self.model.input_name_to_nodes()[past_k])
+                    filter(
+                        lambda node: node.op_type == "Identity", self.model.graph_index().input_name_to_nodes[past_k]
+                    )
                 )
                 present_k = identity_node_k[0].output[0] if len(identity_node_k) == 1 else ""
         else:
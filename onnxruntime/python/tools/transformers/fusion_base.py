@@ -2,6 +2,7 @@
 # Copyright (c) Microsoft Corporation.  All rights reserved.
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
+import time
 from collections import defaultdict
 from logging import getLogger
 from typing import Any, Dict, List, Optional, Sequence, Union
@@ -58,6 +59,9 @@ class Fusion:
         It searched nodes of given operators, and start fusion on each of those nodes.
         """
         logger.debug(f"start {self.description} fusion...")
+        start_time = time.perf_counter()
+        # Previous fusions might have edited nodes in place, which is not tracked by the index of nodes.
+        self.model.reset_graph_index()
         input_name_to_nodes = self.model.input_name_to_nodes()
         output_name_to_node = self.model.output_name_to_node()
 
@@ -83,10 +87,8 @@ class Fusion:
         self.model.remove_nodes(self.nodes_to_remove)
         self.model.add_nodes(self.nodes_to_add, self.node_name_to_graph_name)
 
-        if self.prune_graph:
-            self.model.prune_graph()
-        elif self.nodes_to_remove or self.nodes_to_add:
-            self.model.update_graph()
+        # Prune or update the graph, unless it is deferred to the end of a stage of the pass manager.
+        self.model.fusion_pass_manager.end_pass(self, start_time)
 
     def add_initializer(self, name: str, data_type: int, dims: Sequence[int], vals: Any, raw: bool = True):
         if raw:
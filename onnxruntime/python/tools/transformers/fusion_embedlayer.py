@@ -603,6 +603,7 @@ class FusionEmbedLayerNoMask(Fusion):
 
         if need_embedding_sum_output:
             node_with_sum_output.output[sum_output_index] = "_no_use__to_be_removed_"
+            self.model.update_node_index(node_with_sum_output)
             if not is_sum_graph_output:
                 self.model.replace_input_of_all_nodes(sum_output, embed_node.output[2])
 
@@ -755,6 +756,7 @@ class FusionEmbedLayerNormalization(FusionEmbedLayerNoMask):
         else:
             logger.debug("skip mask in %s", embed_node.name)
             return
+        self.model.update_node_index(embed_node)
 
         for attention_node in attention_nodes:
             logger.debug("update mask_index in %s", attention_node.name)
@@ -762,6 +764,7 @@ class FusionEmbedLayerNormalization(FusionEmbedLayerNoMask):
                 attention_node.input[3] = embed_node.output[1]
             elif attention_node.op_type == "MultiHeadAttention":
                 attention_node.input[4] = embed_node.output[1]
+            self.model.update_node_index(attention_node)
 
     def fuse(self, node, input_name_to_nodes, output_name_to_node):
         # Reset attention and embed_node so that we know fusion is successful when they are not None.
@@ -270,11 +270,12 @@ class FusionLayerNormalizationTF(Fusion):
                 return
             subgraph_nodes.extend([node_before_reduce, cast_node_2, cast_node_3])
 
+        graph_index = self.model.graph_index()
         if not self.model.is_safe_to_fuse_nodes(
             subgraph_nodes,
             node.output,
-            self.model.input_name_to_nodes(),
-            self.model.output_name_to_node(),
+            graph_index.input_name_to_nodes,
+            graph_index.output_name_to_node,
         ):
             logger.debug("not safe to fuse layer normalization")
             return
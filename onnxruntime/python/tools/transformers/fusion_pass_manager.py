@@ -0,0 +1,110 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class FusionStatistics:
+    """Statistics of one fusion pass, or of the clean up of the graph after some passes."""
+
+    name: str
+    stage: Optional[str]
+    fused_count: int
+    nodes_removed: int
+    nodes_added: int
+    seconds: float
+
+
+class FusionPassManager:
+    """
+    Schedules the fusion passes of a model and collects the time and the number of fused subgraphs of every pass.
+
+    Every pass ends with a clean up of the graph: prune_graph() removes the nodes which do not contribute to any graph
+    output, and update_graph() removes the unused initializers and constants. Both walk the whole graph. Passes run
+    inside a stage only record the clean up they need, and it is done once at the end of the stage. So the passes
+    of a stage shall not depend on the clean up after the previous passes of the same stage. Passes run outside of
+    a stage clean up the graph immediately.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.statistics: List[FusionStatistics] = []
+        self.current_stage: Optional[str] = None
+        self._prune_graph = False
+        self._update_graph = False
+
+    @contextmanager
+    def stage(self, name: str):
+        """Defers the clean up of the graph after the passes run in this context to the end of the context."""
+        if self.current_stage is not None:
+            # A nested stage is part of the outer stage.
+            yield
+            return
+
+        self.current_stage = name
+        try:
+            yield
+        finally:
+            self.current_stage = None
+        self.clean_up(name)
+
+    def end_pass(self, fusion, start_time: float):
+        """Records the statistics of a pass. It is called by Fusion.apply after the fused nodes are added."""
+        if fusion.fused_count:
+            fused_count = sum(fusion.fused_count.values())
+        else:
+            fused_count = sum(1 for node in fusion.nodes_to_add if node.op_type == fusion.fused_op_type)
+        self.statistics.append(
+            FusionStatistics(
+                fusion.description,
+                self.current_stage,
+                fused_count,
+                len(fusion.nodes_to_remove),
+                len(fusion.nodes_to_add),
+                time.perf_counter() - start_time,
+            )
+        )
+
+        self._prune_graph = self._prune_graph or fusion.prune_graph
+        self._update_graph = self._update_graph or bool(fusion.nodes_to_remove or fusion.nodes_to_add)
+        if self.current_stage is None:
+            self.clean_up()
+
+    def clean_up(self, stage: Optional[str] = None):
+        """Prunes or updates the graph if a pass since the last clean up requires it."""
+        if not (self._prune_graph or self._update_graph):
+            return
+
+        start_time = time.perf_counter()
+        num_nodes = len(self.model.nodes())
+        if self._prune_graph:
+            name = "prune_graph"
+            self.model.prune_graph()
+        else:
+            name = "update_graph"
+            self.model.update_graph()
+        self._prune_graph = False
+        self._update_graph = False
+        self.statistics.append(
+            FusionStatistics(name, stage, 0, num_nodes - len(self.model.nodes()), 0, time.perf_counter() - start_time)
+        )
+
+    def get_statistics_table(self) -> str:
+        """Returns a table of the statistics of all passes, with the passes sorted by time."""
+        header = f"{'pass':<48} {'stage':<24} {'fused':>6} {'removed':>8} {'added':>6} {'seconds':>8}"
+        lines = [header, "-" * len(header)]
+        for item in sorted(self.statistics, key=lambda item: item.seconds, reverse=True):
+            lines.append(
+                f"{item.name:<48} {item.stage or '':<24} {item.fused_count:>6} {item.nodes_removed:>8} "
+                f"{item.nodes_added:>6} {item.seconds:>8.3f}"
+            )
+        lines.append(f"{'total':<48} {'':<24} {'':>6} {'':>8} {'':>6} {self.total_seconds():>8.3f}")
+        return "\n".join(lines)
+
+    def total_seconds(self) -> float:
+        return sum(item.seconds for item in self.statistics)
@@ -34,6 +34,7 @@ class FusionReshape(Fusion):
             ),
         )
         reshape_node.input[1] = constant_shape_name
+        self.model.update_node_index(reshape_node)
         reshape_node.name = self.model.create_node_name("Reshape", "Reshape_Fuse")
         self.nodes_to_remove.extend([concat_node])
         self.nodes_to_add.append(new_node)
@@ -890,6 +890,8 @@ class FusionRotaryAttention(FusionAttention):
 
             # Rename current output of rotary_k (present_key) so it doesn't match output of MHA (present_key)
             rotary_k.output[0] = rotary_k.name + "_output_0"
+            self.model.update_node_index(rotary_q)
+            self.model.update_node_index(rotary_k)
 
             if qkv_nodes == qkv_nodes_3:
                 qkv_nodes = qkv_nodes[1:]
@@ -141,6 +141,7 @@ class FusionSkipGroupNorm(Fusion):
             return None
 
         reshape.input[0] = matmul.output[0]
+        self.model.update_node_index(reshape)
         self.remove_if_safe(add_bias, input_name_to_nodes)
 
         return bias
@@ -9,7 +9,7 @@ import numpy
 from numpy import array_equal, ndarray
 from onnx import NodeProto, TensorProto, helper, numpy_helper
 from onnx import onnx_pb as onnx_proto
-from onnx_model import OnnxModel
+from onnx_model import GraphIndex, OnnxModel
 
 logger = getLogger(__name__)
 
@@ -97,6 +97,7 @@ class FusionUtils:
             old_input_reference = len(input_name_to_nodes[node.input[i]])
 
         node.input[i] = new_input_name
+        GraphIndex.notify_edit(node)
 
         if new_input_name in input_name_to_nodes:
             input_name_to_nodes[new_input_name].append(node)
@@ -281,7 +282,8 @@ class FusionUtils:
                 if bool(set(node.output) & graph_output_names):
                     if (
                         not bool(set(node.input) & graph_input_names)
-                        and len(self.model.input_name_to_nodes()[node.input[0]]) == 1  # parent has only one child
+                        # parent has only one child
+                        and len(self.model.graph_index().input_name_to_nodes[node.input[0]]) == 1
                     ):
                         self.model.replace_output_of_all_nodes(node.input[0], node.output[0])
                     else:
@@ -7,11 +7,13 @@ import itertools
 import logging
 import os
 import sys
+import weakref
 from collections import deque
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 from float16 import convert_float_to_float16
+from fusion_pass_manager import FusionPassManager
 from onnx import (
     AttributeProto,
     GraphProto,
@@ -29,6 +31,129 @@ from shape_infer_helper import SymbolicShapeInferenceHelper
 logger = logging.getLogger(__name__)
 
 
+class GraphIndex:
+    """
+    Index of the nodes of a model and of its subgraphs: the graph of every node, and the nodes producing and consuming
+    every tensor. Nodes are listed in the order of OnnxModel.nodes() like in the dictionaries returned by
+    OnnxModel.input_name_to_nodes() and OnnxModel.output_name_to_node().
+
+    OnnxModel keeps the index in sync when nodes are added, removed or rewired through its methods. Nodes added to
+    or removed from a graph directly are detected by comparing the number of nodes and the first and last nodes of
+    every graph, and the index is rebuilt. The static helpers editing inputs or outputs in place, like
+    OnnxModel.replace_node_input(), update the indexes holding the edited node, see notify_edit(). Other edits in
+    place (like node.input[0] = name) are not detected: call OnnxModel.update_node_index() after such edits.
+    """
+
+    # The live indexes, so that the edits of a node by the static helpers update the index of its model.
+    _indexes = weakref.WeakSet()
+
+    def __init__(self, graphs: List[GraphProto]):
+        self.graphs = graphs
+        self._graph_order = {id(graph): i for i, graph in enumerate(graphs)}
+        # id(node) -> (node, graph, sort key, indexed inputs, indexed outputs). The index holds a reference to
+        # the node so that its id cannot be reused by another node.
+        self._nodes: Dict[int, Tuple[NodeProto, GraphProto, Tuple[int, int], Tuple[str, ...], Tuple[str, ...]]] = {}
+        self._next_key = 0
+        self._signatures: Dict[int, Tuple[int, Optional[NodeProto], Optional[NodeProto]]] = {}
+        self.input_name_to_nodes: Dict[str, List[NodeProto]] = {}
+        self.output_name_to_nodes: Dict[str, List[NodeProto]] = {}
+        self.output_name_to_node: Dict[str, NodeProto] = {}
+        for graph in graphs:
+            for node in graph.node:
+                self._add(node, graph)
+            self.update_signature(graph)
+        GraphIndex._indexes.add(self)
+
+    def update_signature(self, graph: GraphProto):
+        nodes = graph.node
+        self._signatures[id(graph)] = (len(nodes), nodes[0], nodes[-1]) if nodes else (0, None, None)
+
+    @staticmethod
+    def notify_edit(node: NodeProto):
+        """Updates the indexes holding a node after its inputs or outputs were edited in place."""
+        for index in list(GraphIndex._indexes):
+            index.update_node(node)
+
+    def is_valid(self, graphs: List[GraphProto]) -> bool:
+        """Checks that nodes were not added to or removed from the graphs without updating the index."""
+        if graphs is not self.graphs:
+            return False
+        for graph in graphs:
+            count, first, last = self._signatures[id(graph)]
+            nodes = graph.node
+            if len(nodes) != count or (count > 0 and (nodes[0] is not first or nodes[-1] is not last)):
+                return False
+        return True
+
+    def _insert(self, nodes: List[NodeProto], node: NodeProto, key: Tuple[int, int]):
+        position = len(nodes)
+        while position > 0 and self._nodes[id(nodes[position - 1])][2] > key:
+            position -= 1
+        nodes.insert(position, node)
+
+    def _add(self, node: NodeProto, graph: GraphProto, key: Optional[Tuple[int, int]] = None):
+        if key is None:
+            key = (self._graph_order[id(graph)], self._next_key)
+            self._next_key += 1
+        inputs = tuple(name for name in node.input if name)
+        outputs = tuple(name for name in node.output if name)
+        self._nodes[id(node)] = (node, graph, key, inputs, outputs)
+        for name in inputs:
+            if name in self.input_name_to_nodes:
+                self._insert(self.input_name_to_nodes[name], node, key)
+            else:
+                self.input_name_to_nodes[name] = [node]
+        for name in outputs:
+            if name in self.output_name_to_nodes:
+                producers = self.output_name_to_nodes[name]
+                self._insert(producers, node, key)
+                self.output_name_to_node[name] = producers[-1]
+            else:
+                self.output_name_to_nodes[name] = [node]
+                self.output_name_to_node[name] = node
+
+    def _remove(self, node: NodeProto):
+        _, graph, key, inputs, outputs = self._nodes.pop(id(node))
+        for name in set(inputs):
+            consumers = [consumer for consumer in self.input_name_to_nodes[name] if consumer is not node]
+            if consumers:
+                self.input_name_to_nodes[name] = consumers
+            else:
+                del self.input_name_to_nodes[name]
+        for name in set(outputs):
+            producers = [producer for producer in self.output_name_to_nodes[name] if producer is not node]
+            if producers:
+                self.output_name_to_nodes[name] = producers
+                self.output_name_to_node[name] = producers[-1]
+            else:
+                del self.output_name_to_nodes[name]
+                del self.output_name_to_node[name]
+        return graph, key
+
+    def get_graph(self, node: NodeProto) -> Optional[GraphProto]:
+        entry = self._nodes.get(id(node))
+        return entry[1] if entry is not None else None
+
+    def add_node(self, node: NodeProto, graph: GraphProto):
+        """Indexes a node appended to a graph."""
+        self._add(node, graph)
+        self.update_signature(graph)
+
+    def remove_node(self, node: NodeProto) -> Optional[GraphProto]:
+        """Removes a node from the index and returns its graph, or None if the node is not indexed."""
+        if id(node) not in self._nodes:
+            return None
+        graph, _ = self._remove(node)
+        return graph
+
+    def update_node(self, node: NodeProto):
+        """Updates the index after the inputs or outputs of a node were edited in place."""
+        # The index holds a reference to its nodes, so another node cannot have the id of an indexed node.
+        if id(node) in self._nodes:
+            graph, key = self._remove(node)
+            self._add(node, graph, key)
+
+
 class OnnxModel:
     def __init__(self, model):
         self.initialize(model)
@@ -46,6 +171,13 @@ class OnnxModel:
         self._dtype_dict: Optional[Dict[str, int]] = None
         self._shape_dict: Optional[Dict[str, List]] = None
 
+        # Index of nodes, producers and consumers of all graphs. It is built on demand and updated by the methods
+        # adding, removing or rewiring nodes so that fusions do not scan the whole graph for every matched node.
+        self._graph_index: Optional[GraphIndex] = None
+
+        # Time and number of fused subgraphs of the fusion passes applied to this model.
+        self.fusion_pass_manager = FusionPassManager(self)
+
     def disable_shape_inference(self):
         self.enable_shape_infer = False
 
@@ -63,6 +195,21 @@ class OnnxModel:
 
         return None
 
+    def graph_index(self) -> GraphIndex:
+        """Returns the index of the nodes of all graphs. The index shall not be modified by the caller."""
+        if self._graph_index is None or not self._graph_index.is_valid(self.graphs()):
+            self._graph_index = GraphIndex(self.graphs())
+        return self._graph_index
+
+    def reset_graph_index(self):
+        """Rebuilds the index of nodes on its next use."""
+        self._graph_index = None
+
+    def update_node_index(self, node):
+        """Updates the index of nodes after the inputs or outputs of a node were edited in place."""
+        if self._graph_index is not None:
+            self._graph_index.update_node(node)
+
     def input_name_to_nodes(self):
         input_name_to_nodes = {}
         for node in self.nodes():
@@ -130,6 +277,9 @@ class OnnxModel:
         return output_names
 
     def get_graph_by_node(self, node):
+        graph = self.graph_index().get_graph(node)
+        if graph is not None:
+            return graph
         for graph in self.graphs():
             if node in graph.node:
                 return graph
@@ -149,27 +299,50 @@ class OnnxModel:
         return len(graph.node)
 
     def remove_node(self, node):
-        for graph in self.graphs():
-            if node in graph.node:
-                graph.node.remove(node)
-                return
-        logger.warning("Failed to remove node %s", node)  # It might be a bug to hit this line.
+        self.remove_nodes([node])
 
     def remove_nodes(self, nodes_to_remove):
+        index = self.graph_index()
+        # Indexed nodes are removed from their graph in one pass, other nodes are searched by value.
+        removed = {}
         for node in nodes_to_remove:
-            self.remove_node(node)
+            graph = index.remove_node(node)
+            if graph is not None:
+                removed.setdefault(id(graph), (graph, set()))[1].add(id(node))
+            elif any(id(node) in node_ids for _, node_ids in removed.values()) or not self._remove_node_by_value(node):
+                logger.warning("Failed to remove node %s", node)  # It might be a bug to hit this line.
+
+        for graph, node_ids in removed.values():
+            for i in reversed([i for i, node in enumerate(graph.node) if id(node) in node_ids]):
+                del graph.node[i]
+            index.update_signature(graph)
+
+    def _remove_node_by_value(self, node) -> bool:
+        for graph in self.graphs():
+            if node in graph.node:
+                graph.node.remove(node)
+                self.reset_graph_index()
+                return True
+        return False
 
     def add_node(self, node, graph_name=None):
         if graph_name is None or graph_name == self.model.graph.name:
-            self.model.graph.node.extend([node])
+            self.add_nodes([node])
         else:
             graph = self.get_graph_by_name(graph_name)
             insert_idx = self.get_topological_insert_id(graph, node.output)
             graph.node.insert(insert_idx, node)
+            # The order of nodes in the index is only kept for nodes appended to a graph.
+            self.reset_graph_index()
 
     def add_nodes(self, nodes_to_add, node_name_to_graph_name=None):
         if node_name_to_graph_name is None:
-            self.model.graph.node.extend(nodes_to_add)
+            index = self.graph_index()
+            graph = self.model.graph
+            graph.node.extend(nodes_to_add)
+            # The graph holds copies of the added nodes.
+            for i in range(len(graph.node) - len(nodes_to_add), len(graph.node)):
+                index.add_node(graph.node[i], graph)
         else:
             for node in nodes_to_add:
                 graph_name = node_name_to_graph_name[node.name]
@@ -189,23 +362,32 @@ class OnnxModel:
             graph = self.get_graph_by_name(graph_name)
             graph.input.extend([input])
 
+    @staticmethod
+    def _replace_name(names, old_name, new_name) -> bool:
+        assert isinstance(old_name, str) and isinstance(new_name, str)
+        replaced = False
+        for j in range(len(names)):
+            if names[j] == old_name:
+                names[j] = new_name
+                replaced = True
+        return replaced
+
     @staticmethod
     def replace_node_input(node, old_input_name, new_input_name):
-        assert isinstance(old_input_name, str) and isinstance(new_input_name, str)
-        for j in range(len(node.input)):
-            if node.input[j] == old_input_name:
-                node.input[j] = new_input_name
+        if OnnxModel._replace_name(node.input, old_input_name, new_input_name):
+            GraphIndex.notify_edit(node)
 
     def replace_input_of_all_nodes(self, old_input_name, new_input_name):
+        index = self.graph_index()
         for node in self.model.graph.node:
-            OnnxModel.replace_node_input(node, old_input_name, new_input_name)
+            if old_input_name in node.input:
+                OnnxModel._replace_name(node.input, old_input_name, new_input_name)
+                index.update_node(node)
 
     @staticmethod
     def replace_node_output(node, old_output_name, new_output_name):
-        assert isinstance(old_output_name, str) and isinstance(new_output_name, str)
-        for j in range(len(node.output)):
-            if node.output[j] == old_output_name:
-                node.output[j] = new_output_name
+        if OnnxModel._replace_name(node.output, old_output_name, new_output_name):
+            GraphIndex.notify_edit(node)
 
     def replace_output_of_all_nodes(self, old_output_name, new_output_name):
         # This function shall be used carefully. For example:
@@ -214,8 +396,11 @@ class OnnxModel:
         #        +----[old_name]--> Transpose -->
         # If we want to remove the Cast node: replace output of Add to new_name is not enough;
         # The input of Transpose shall also be updated to new_name.
+        index = self.graph_index()
         for node in self.model.graph.node:
-            OnnxModel.replace_node_output(node, old_output_name, new_output_name)
+            if old_output_name in node.output:
+                OnnxModel._replace_name(node.output, old_output_name, new_output_name)
+                index.update_node(node)
 
     def get_initializer(self, name):
         for graph in self.graphs():
@@ -233,7 +418,7 @@ class OnnxModel:
 
     def get_children(self, node, input_name_to_nodes=None):
         if input_name_to_nodes is None:
-            input_name_to_nodes = self.input_name_to_nodes()
+            input_name_to_nodes = self.graph_index().input_name_to_nodes
 
         children = []
         for output in node.output:
@@ -244,7 +429,7 @@ class OnnxModel:
 
     def get_parents(self, node, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self.graph_index().output_name_to_node
 
         parents = []
         for input in node.input:
@@ -254,7 +439,7 @@ class OnnxModel:
 
     def get_parent(self, node, i, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self.graph_index().output_name_to_node
 
         if len(node.input) <= i:
             return None
@@ -317,7 +502,7 @@ class OnnxModel:
         assert input_index is None or input_index >= 0
 
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self.graph_index().output_name_to_node
 
         if input_index is None:
             parent, index = self.match_first_parent(node, parent_op_type, output_name_to_node, exclude)
@@ -387,7 +572,7 @@ class OnnxModel:
             assert len(parent_input_index) == len(parent_op_types)
 
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self.graph_index().output_name_to_node
 
         current_node = node
         matched_parents = []
@@ -480,7 +665,7 @@ class OnnxModel:
 
     def find_first_parent_by_type(self, node, parent_type, output_name_to_node=None, recursive=True):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self.graph_index().output_name_to_node
 
         parents = self.get_parents(node, output_name_to_node)
         dq = deque(parents)
@@ -497,8 +682,8 @@ class OnnxModel:
         return None
 
     def get_constant_value(self, output_name):
-        for node in self.get_nodes_by_op_type("Constant"):
-            if node.output[0] == output_name:
+        for node in self.graph_index().output_name_to_nodes.get(output_name, []):
+            if node.op_type == "Constant" and node.output[0] == output_name:
                 for att in node.attribute:
                     if att.name == "value":
                         return numpy_helper.to_array(att.t)
@@ -542,7 +727,7 @@ class OnnxModel:
 
     def get_children_subgraph_nodes(self, root_node, stop_nodes, input_name_to_nodes=None):
         if input_name_to_nodes is None:
-            input_name_to_nodes = self.input_name_to_nodes()
+            input_name_to_nodes = self.graph_index().input_name_to_nodes
 
         children = input_name_to_nodes[root_node.output[0]]
 
@@ -658,6 +843,7 @@ class OnnxModel:
                     removed_count += 1
 
         if removed_count > 0:
+            self.reset_graph_index()
             logger.info("Removed %d cascaded Cast nodes", removed_count)
             self.prune_graph()
 
@@ -681,7 +867,7 @@ class OnnxModel:
             for node in nodes_to_remove:
                 if bool(set(node.output) & graph_output_names):
                     if (not bool(set(node.input) & graph_input_names)) and len(
-                        self.input_name_to_nodes()[node.input[0]]
+                        self.graph_index().input_name_to_nodes[node.input[0]]
                     ) == 1:
                         self.replace_output_of_all_nodes(node.input[0], node.output[0])
                     else:
@@ -734,6 +920,7 @@ class OnnxModel:
             max_finite_val (float, optional): maximal finite value. Defaults to 1e4.
             force_fp16_inputs(Dict[str, List[int]]): Force the conversion of the inputs of some operators to float16, even if
                                                      this script's preference it to keep them in float32.
+            num_workers (int, optional): number of threads converting the float initializers. Defaults to 1.
         """
         if "keep_io_types" not in kwargs:
             kwargs["keep_io_types"] = True
@@ -786,6 +973,7 @@ class OnnxModel:
                     "force_fp16_initializers",
                     "force_fp16_inputs",
                     "use_bfloat16_as_blocked_nodes_dtype",
+                    "num_workers",
                 ]
                 if key in kwargs
             }
@@ -847,7 +1035,7 @@ class OnnxModel:
 
     def get_parent_subgraph_nodes(self, node, stop_nodes, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self.graph_index().output_name_to_node
 
         unique_nodes = []
 
@@ -892,7 +1080,7 @@ class OnnxModel:
         return -1
 
     def remove_unused_constant(self):
-        input_name_to_nodes = self.input_name_to_nodes()
+        input_name_to_nodes = self.graph_index().input_name_to_nodes
 
         # remove unused constant
         unused_nodes = []
@@ -997,18 +1185,17 @@ class OnnxModel:
     def update_graph(self, verbose=False, allow_remove_graph_inputs=False):
         graph = self.model.graph
 
-        remaining_input_names = []
+        # Use a dictionary as an ordered set since a list is too slow to search in large graphs.
+        remaining_input_names = {}
         for node in graph.node:
             if node.op_type in ["Loop", "Scan", "If"]:
                 # TODO: handle inner graph
                 logger.debug(f"Skip update_graph since graph has operator: {node.op_type}")
                 return
             if node.op_type != "Constant":
-                for input_name in node.input:
-                    if input_name not in remaining_input_names:
-                        remaining_input_names.append(input_name)
+                remaining_input_names.update(dict.fromkeys(node.input))
         if verbose:
-            logger.debug(f"remaining input names: {remaining_input_names}")
+            logger.debug(f"remaining input names: {list(remaining_input_names)}")
 
         # remove graph input that is not used
         inputs_to_remove = []
@@ -1023,18 +1210,20 @@ class OnnxModel:
         logger.debug(f"remove {len(inputs_to_remove)} unused inputs: {names_to_remove}")
 
         # remove weights that are not used
-        weights_to_remove = []
+        indices_to_remove = []
+        names_to_remove = []
         weights_to_keep = []
-        for initializer in graph.initializer:
+        for i, initializer in enumerate(graph.initializer):
             if initializer.name not in remaining_input_names and not self.find_graph_output(initializer.name):
-                weights_to_remove.append(initializer)
+                indices_to_remove.append(i)
+                names_to_remove.append(initializer.name)
             else:
                 weights_to_keep.append(initializer.name)
-        for initializer in weights_to_remove:
-            graph.initializer.remove(initializer)
+        # Delete by position since remove() compares the content of tensors.
+        for i in reversed(indices_to_remove):
+            del graph.initializer[i]
 
-        names_to_remove = [initializer.name for initializer in weights_to_remove]
-        logger.debug(f"remove {len(weights_to_remove)} unused initializers: {names_to_remove}")
+        logger.debug(f"remove {len(names_to_remove)} unused initializers: {names_to_remove}")
         if verbose:
             logger.debug(f"remaining initializers:{weights_to_keep}")
 
@@ -1354,6 +1543,7 @@ class OnnxModel:
                 if node.output[j] not in excluded:
                     if prefix + node.output[j] not in excluded:
                         node.output[j] = prefix + node.output[j]
+        self.reset_graph_index()
 
         for value_info in self.model.graph.value_info:
             if value_info.name not in excluded:
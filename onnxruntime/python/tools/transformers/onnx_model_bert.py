@@ -227,7 +227,7 @@ class BertOnnxModel(OnnxModel):
                     node,
                     ["Expand", "Expand", "Reshape", "Slice"],
                     [0, 0, 0, 0],
-                    self.output_name_to_node(),
+                    self.graph_index().output_name_to_node,
                 )
                 if reshape_path is not None:
                     expand_node = reshape_path[-3]
@@ -245,6 +245,7 @@ class BertOnnxModel(OnnxModel):
                         and expand_shape_value[1] == shape_value[0]
                     ):
                         node.input[0] = slice_node.output[0]
+                        self.update_node_index(node)
 
         if nodes_to_remove:
             self.remove_nodes(nodes_to_remove)
@@ -289,6 +290,7 @@ class BertOnnxModel(OnnxModel):
                     ) = parent_nodes
                     if shape.input[0] == self.graph().input[0].name:
                         constantOfShape.input[0] = shape.output[0]
+                        self.update_node_index(constantOfShape)
                         output_name_to_node = self.output_name_to_node()
 
             if node.op_type == "Attention":
@@ -329,23 +331,26 @@ class BertOnnxModel(OnnxModel):
         # Remove cast nodes that having same data type of input and output based on symbolic shape inference.
         self.utils.remove_useless_cast_nodes()
 
-        if (options is None) or options.enable_layer_norm:
-            self.fuse_layer_norm()
-            self.fuse_simplified_layer_norm()
+        # Fusions of a stage do not depend on each other, so the graph is only updated at the end of the stage.
+        with self.fusion_pass_manager.stage("layer_norm_and_gelu"):
+            if (options is None) or options.enable_layer_norm:
+                self.fuse_layer_norm()
+                self.fuse_simplified_layer_norm()
 
-        if (options is None) or options.enable_gelu:
-            self.fuse_gelu()
+            if (options is None) or options.enable_gelu:
+                self.fuse_gelu()
 
         self.preprocess()
 
         self.fuse_reshape()
 
-        if (options is None) or options.enable_skip_layer_norm:
-            self.fuse_skip_layer_norm()
-            self.fuse_skip_simplified_layer_norm()
+        with self.fusion_pass_manager.stage("skip_layer_norm"):
+            if (options is None) or options.enable_skip_layer_norm:
+                self.fuse_skip_layer_norm()
+                self.fuse_skip_simplified_layer_norm()
 
-        if (options is None) or options.enable_rotary_embeddings:
-            self.fuse_rotary_embeddings()
+            if (options is None) or options.enable_rotary_embeddings:
+                self.fuse_rotary_embeddings()
 
         if options is not None:
             self.attention_mask.set_mask_format(options.attention_mask_format)
@@ -378,20 +383,21 @@ class BertOnnxModel(OnnxModel):
         self.postprocess()
 
         # Bias fusion is done after postprocess to avoid extra Reshape between bias and Gelu/FastGelu/SkipLayerNormalization
-        if (options is None) or options.enable_bias_gelu:
-            # Fuse Gelu and Add Bias before it.
-            self.fuse_bias_gelu(is_fastgelu=True)
-            self.fuse_bias_gelu(is_fastgelu=False)
+        with self.fusion_pass_manager.stage("bias"):
+            if (options is None) or options.enable_bias_gelu:
+                # Fuse Gelu and Add Bias before it.
+                self.fuse_bias_gelu(is_fastgelu=True)
+                self.fuse_bias_gelu(is_fastgelu=False)
 
-        if (options is None) or options.enable_bias_skip_layer_norm:
-            # Fuse SkipLayerNormalization and Add Bias before it.
-            self.fuse_add_bias_skip_layer_norm()
+            if (options is None) or options.enable_bias_skip_layer_norm:
+                # Fuse SkipLayerNormalization and Add Bias before it.
+                self.fuse_add_bias_skip_layer_norm()
 
-        if options is not None and options.enable_gelu_approximation:
-            self.gelu_approximation()
+            if options is not None and options.enable_gelu_approximation:
+                self.gelu_approximation()
 
-        if options is not None and options.enable_gemm_fast_gelu:
-            self.fuse_gemm_fast_gelu()
+            if options is not None and options.enable_gemm_fast_gelu:
+                self.fuse_gemm_fast_gelu()
 
         self.remove_unused_constant()
 
@@ -228,6 +228,7 @@ class BertOnnxModelKeras(BertOnnxModelTF):
             parent = self.get_parent(reshape_node, 0)
             if parent is not None and parent.op_type == "Reshape":
                 reshape_node.input[0] = parent.input[0]
+                self.update_node_index(reshape_node)
                 count += 1
 
         if count > 0:
@@ -407,10 +408,13 @@ class BertOnnxModelKeras(BertOnnxModelTF):
                 skiplayernorm,
             ) = path
             add_2.input[0] = matmul_2.output[0]
+            self.update_node_index(add_2)
             self.remove_node(reshape_3)
             matmul_1.input[0] = gelu.output[0]
+            self.update_node_index(matmul_1)
             self.remove_node(reshape_2)
             add_1.input[0] = matmul_1.output[0]
+            self.update_node_index(add_1)
             self.remove_node(reshape_1)
             reshape_removed += 3
 
@@ -453,15 +457,19 @@ class BertOnnxModelKeras(BertOnnxModelTF):
             ) = path
 
             matmul_2.input[0] = skiplayernorm.output[0]
+            self.update_node_index(matmul_2)
             self.remove_node(reshape_4)
 
             add_2.input[0] = matmul_2.output[0]
+            self.update_node_index(add_2)
             self.remove_node(reshape_3)
 
             matmul_1.input[0] = gelu.output[0]
+            self.update_node_index(matmul_1)
             self.remove_node(reshape_2)
 
             add_1.input[0] = matmul_1.output[0]
+            self.update_node_index(add_1)
             self.remove_node(reshape_1)
 
             reshape_removed += 4
@@ -472,6 +472,7 @@ class BertOnnxModelTF(BertOnnxModel):
                     graph_name,
                 )
                 mask_nodes[-1].input[0] = squeeze_output_name
+                self.update_node_index(mask_nodes[-1])
 
             is_same_root = self.check_attention_input(matmul_q, matmul_k, matmul_v, parent, output_name_to_node)
             if is_same_root:
@@ -525,6 +526,7 @@ class BertOnnxModelTF(BertOnnxModel):
                         name=qkv_nodes[1].name + "_reshape",
                     )
                     qkv_nodes[1].input[0] = qkv_nodes[1].name + "_reshape_output"
+                    self.update_node_index(qkv_nodes[1])
                     self.add_node(reshape_, graph_name)
                 if parent.op_type == "Reshape":
                     # Temporary work around: we require the skiplayernorm and attention op be fed with 3-d input
@@ -538,6 +540,7 @@ class BertOnnxModelTF(BertOnnxModel):
                     )
                     self.add_initializer(tensor, graph_name)
                     parent.input[1] = parent.name + "_modified"
+                    self.update_node_index(parent)
 
                 self.add_node(attention_node, graph_name)
                 attention_count += 1
@@ -567,6 +570,7 @@ class BertOnnxModelTF(BertOnnxModel):
             parent = self.get_parent(reshape_node, 0)
             if parent is not None and parent.op_type == "Reshape":
                 reshape_node.input[0] = parent.input[0]
+                self.update_node_index(reshape_node)
                 count += 1
 
         if count > 0:
@@ -738,6 +738,7 @@ class T5OnnxModel(BertOnnxModel):
 
                 rpb_node = rpb_nodes[0]
                 rpb_node.output[0] = node.output[0]
+                self.update_node_index(rpb_node)
 
                 nodes_to_remove.extend(extended_mask_nodes)
                 nodes_to_remove.append(node)
@@ -774,6 +775,7 @@ class T5OnnxModel(BertOnnxModel):
 
                 rpb_node = rpb_nodes[0]
                 rpb_node.output[0] = node.output[0]
+                self.update_node_index(rpb_node)
 
                 nodes_to_remove.extend(extended_mask_nodes)
                 nodes_to_remove.append(node)
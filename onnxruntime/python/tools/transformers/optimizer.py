@@ -254,6 +254,9 @@ def optimize_by_fusion(
 
     optimizer.topological_sort()
 
+    if optimizer.fusion_pass_manager.statistics:
+        logger.info("Fusion passes:\n%s", optimizer.fusion_pass_manager.get_statistics_table())
+
     optimizer.model.producer_name = "onnxruntime.transformers"
     from onnxruntime import __version__ as onnxruntime_version
 
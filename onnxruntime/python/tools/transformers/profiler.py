@@ -1,11 +1,20 @@
 import argparse
-import json
 import os
+import sys
 
 import numpy
 import psutil
 from onnx import TensorProto
 
+# In ORT Package the profile_trace.py is in ../tools
+file_path = os.path.dirname(__file__)
+if os.path.exists(os.path.join(file_path, "../tools/profile_trace.py")):
+    sys.path.append(os.path.join(file_path, "../tools"))
+else:
+    sys.path.append(os.path.join(file_path, ".."))
+
+from profile_trace import iter_trace_events  # noqa: E402
+
 """
 This profiler tool could run a transformer model and print out the kernel time spent on each Node of the model.
 Example of profiling of longformer model:
@@ -179,110 +188,100 @@ def run_profile(onnx_model_path, use_gpu, provider, basic_optimization, thread_n
 def load_profile_json(profile_file):
     print(f"loading profile output {profile_file} ...")
 
-    with open(profile_file) as opened_file:
-        sess_time = json.load(opened_file)
-
-    assert isinstance(sess_time, list)
-    return sess_time
+    # The events are decoded one by one from chunks of the file while they are iterated, so that the trace is never
+    # held in memory. The returned iterator can only be consumed once.
+    return iter_trace_events(profile_file)
 
 
-def parse_kernel_results(sess_time, threshold=0):
-    """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
+class KernelResults:
+    """Kernel time of the profile data, aggregated one item at a time. See parse_kernel_results."""
 
-    Args:
-        sess_time (List[Dict]): profile data
-        kernel_time_only (bool, optional): Only include items for kernel time. Defaults to False.
-        threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
+    def __init__(self):
+        self.kernel_name_to_op_name = {}
+        self.kernel_time = {}
+        self.kernel_freq = {}
+        self.total = 0
+        self.session_init = False
 
-    Returns:
-        List[str]: lines of string for output.
-    """
-    kernel_name_to_op_name = {}
-    kernel_time = {}
-    kernel_freq = {}
-    total = 0
-    session_init = False
-    for item in sess_time:
+    def add(self, item):
         # Skip all MemcpyHostToDevice before session_initialization
         if item["cat"] == "Session" and item["name"] == "session_initialization":
-            session_init = True
-        if not session_init:
-            continue
+            self.session_init = True
+        if not self.session_init:
+            return
 
         if item["cat"] == "Kernel" and "dur" in item and "args" in item and "op_name" in item["args"]:
             kernel_name = item["name"]
 
             op_name = item["args"]["op_name"]
             if op_name in NODES_TYPE_CONTAINING_SUBGRAPH:
-                continue
+                return
 
             # Handle MemcpyHostToDevice and MemcpyDeviceToHost here
             if not op_name:
                 op_name = f"({kernel_name})"
 
-            if kernel_name in kernel_time:
-                kernel_time[kernel_name] += item["dur"]
-                kernel_freq[kernel_name] += 1
+            if kernel_name in self.kernel_time:
+                self.kernel_time[kernel_name] += item["dur"]
+                self.kernel_freq[kernel_name] += 1
             else:
-                kernel_time[kernel_name] = item["dur"]
-                kernel_freq[kernel_name] = 1
-                kernel_name_to_op_name[kernel_name] = op_name
-
-            total += item["dur"]
-
-    if not kernel_time:
-        return ["No kernel record found!"]
-
-    # Output items with run time ratio > thresholds, and sorted by duration in the descending order.
-    lines = []
-    lines.append(f"\nTop expensive kernels with Time% >= {threshold*100:.2f}:")
-    lines.append("-" * 64)
-    lines.append("Total(μs)\tTime%\tCalls\tAvg(μs)\tKernel")
-    for kernel_name, duration in sorted(kernel_time.items(), key=lambda x: x[1], reverse=True):
-        ratio = duration / total
-        if ratio < threshold:
-            continue
-
-        calls = kernel_freq[kernel_name]
-        avg_time = duration / float(calls)
-        lines.append(f"{duration:10d}\t{ratio * 100.0:5.2f}\t{calls:5d}\t{avg_time:8.1f}\t{kernel_name}")
-
-    # Group by operator
-    op_time = {}
-    for kernel_name, op_name in kernel_name_to_op_name.items():
-        duration = kernel_time[kernel_name]
-        if op_name in op_time:
-            op_time[op_name] += duration
-        else:
-            op_time[op_name] = duration
+                self.kernel_time[kernel_name] = item["dur"]
+                self.kernel_freq[kernel_name] = 1
+                self.kernel_name_to_op_name[kernel_name] = op_name
+
+            self.total += item["dur"]
+
+    def get_lines(self, threshold=0):
+        kernel_time = self.kernel_time
+        total = self.total
+        if not kernel_time:
+            return ["No kernel record found!"]
+
+        # Output items with run time ratio > thresholds, and sorted by duration in the descending order.
+        lines = []
+        lines.append(f"\nTop expensive kernels with Time% >= {threshold*100:.2f}:")
+        lines.append("-" * 64)
+        lines.append("Total(μs)\tTime%\tCalls\tAvg(μs)\tKernel")
+        for kernel_name, duration in sorted(kernel_time.items(), key=lambda x: x[1], reverse=True):
+            ratio = duration / total
+            if ratio < threshold:
+                continue
 
-    lines.append("\nGroup kernel time by operator:")
-    lines.append("-" * 64)
-    lines.append("Total(μs)\tTime%\tOperator")
-    for op_name, duration in sorted(op_time.items(), key=lambda x: x[1], reverse=True):
-        ratio = duration / total
-        lines.append(f"{duration:10d}\t{ratio * 100.0:5.2f}\t{op_name}")
+            calls = self.kernel_freq[kernel_name]
+            avg_time = duration / float(calls)
+            lines.append(f"{duration:10d}\t{ratio * 100.0:5.2f}\t{calls:5d}\t{avg_time:8.1f}\t{kernel_name}")
 
-    return lines
+        # Group by operator
+        op_time = {}
+        for kernel_name, op_name in self.kernel_name_to_op_name.items():
+            duration = kernel_time[kernel_name]
+            if op_name in op_time:
+                op_time[op_name] += duration
+            else:
+                op_time[op_name] = duration
 
+        lines.append("\nGroup kernel time by operator:")
+        lines.append("-" * 64)
+        lines.append("Total(μs)\tTime%\tOperator")
+        for op_name, duration in sorted(op_time.items(), key=lambda x: x[1], reverse=True):
+            ratio = duration / total
+            lines.append(f"{duration:10d}\t{ratio * 100.0:5.2f}\t{op_name}")
 
-def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
-    """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
+        return lines
 
-    Args:
-        sess_time (List[Dict]): profile data
-        kernel_time_only (bool, optional): Only include items for kernel time. Defaults to False.
-        threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
 
-    Returns:
-        List[str]: lines of string for output.
-    """
-    node_name_list = []
-    node_time = {}
-    node_freq = {}
-    node_provider = {}
-    total = 0
-    for item in sess_time:
+class NodeResults:
+    """Node time of the profile data, aggregated one item at a time. See parse_node_results."""
+
+    def __init__(self, kernel_time_only=False):
+        self.kernel_time_only = kernel_time_only
+        self.node_name_list = []
+        self.node_time = {}
+        self.node_freq = {}
+        self.node_provider = {}
+        self.total = 0
+
+    def add(self, item):
         if item["cat"] == "Node" and "dur" in item and "args" in item and "op_name" in item["args"]:
             node_name = (
                 item["name"].replace("_kernel_time", "").replace("_fence_before", "").replace("_fence_after", "")
@@ -296,161 +295,214 @@ def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
                 elif item["args"]["provider"] == "DmlExecutionProvider":
                     device = "DML"
 
-                if node_name not in node_provider:
-                    node_provider[node_name] = device
+                if node_name not in self.node_provider:
+                    self.node_provider[node_name] = device
                 else:
-                    assert node_provider[node_name] == device
-            elif kernel_time_only:
-                continue
+                    assert self.node_provider[node_name] == device
+            elif self.kernel_time_only:
+                return
 
             op_name = item["args"]["op_name"]
             if op_name in NODES_TYPE_CONTAINING_SUBGRAPH:
-                continue
+                return
 
-            if node_name in node_time:
-                node_time[node_name] += item["dur"]
-                node_freq[node_name] += 1
+            if node_name in self.node_time:
+                self.node_time[node_name] += item["dur"]
+                self.node_freq[node_name] += 1
             else:
-                node_time[node_name] = item["dur"]
-                node_freq[node_name] = 1
-                node_name_list.append(node_name)
-
-            total += item["dur"]
-
-    # Output items in the original order.
-    lines = [
-        "\nNodes in the original order:",
-        "-" * 64,
-        "Total(μs)\tTime%\tAcc %\tAvg(μs)\tCalls\tProvider\tNode",
-    ]
-    before_percentage = 0.0
-    for node_name in node_name_list:
-        duration = node_time[node_name]
-        calls = node_freq[node_name]
-        avg_time = duration / float(calls)
-        percentage = (duration / total) * 100.0
-        provider = node_provider.get(node_name, "")
-        before_percentage += percentage
-        lines.append(
-            f"{duration:10d}\t{percentage:5.2f}\t{before_percentage:5.2f}\t{avg_time:8.1f}\t{calls:5d}\t{provider:8s}\t{node_name}"
-        )
+                self.node_time[node_name] = item["dur"]
+                self.node_freq[node_name] = 1
+                self.node_name_list.append(node_name)
+
+            self.total += item["dur"]
+
+    def get_lines(self, threshold=0):
+        node_time = self.node_time
+        node_freq = self.node_freq
+        node_provider = self.node_provider
+        total = self.total
+
+        # Output items in the original order.
+        lines = [
+            "\nNodes in the original order:",
+            "-" * 64,
+            "Total(μs)\tTime%\tAcc %\tAvg(μs)\tCalls\tProvider\tNode",
+        ]
+        before_percentage = 0.0
+        for node_name in self.node_name_list:
+            duration = node_time[node_name]
+            calls = node_freq[node_name]
+            avg_time = duration / float(calls)
+            percentage = (duration / total) * 100.0
+            provider = node_provider.get(node_name, "")
+            before_percentage += percentage
+            lines.append(
+                f"{duration:10d}\t{percentage:5.2f}\t{before_percentage:5.2f}\t{avg_time:8.1f}\t{calls:5d}\t{provider:8s}\t{node_name}"
+            )
 
-    # Output items with run time ratio > thresholds, and sorted by duration in the descending order.
-    lines.append(f"\nTop expensive nodes with Time% >= {threshold*100:.2f}:")
-    lines.append("-" * 64)
-    lines.append("Total(μs)\tTime%\tAvg(μs)\tCalls\tProvider\tNode")
-    for node_name, duration in sorted(node_time.items(), key=lambda x: x[1], reverse=True):
-        ratio = duration / total
-        if ratio < threshold:
-            continue
-
-        calls = node_freq[node_name]
-        avg_time = duration / float(calls)
-        percentage = (duration / total) * 100.0
-        provider = node_provider.get(node_name, "")
-        lines.append(f"{duration:10d}\t{percentage:5.2f}\t{avg_time:8.1f}\t{calls:5d}\t{provider:8s}\t{node_name}")
+        # Output items with run time ratio > thresholds, and sorted by duration in the descending order.
+        lines.append(f"\nTop expensive nodes with Time% >= {threshold*100:.2f}:")
+        lines.append("-" * 64)
+        lines.append("Total(μs)\tTime%\tAvg(μs)\tCalls\tProvider\tNode")
+        for node_name, duration in sorted(node_time.items(), key=lambda x: x[1], reverse=True):
+            ratio = duration / total
+            if ratio < threshold:
+                continue
 
-    return lines
+            calls = node_freq[node_name]
+            avg_time = duration / float(calls)
+            percentage = (duration / total) * 100.0
+            provider = node_provider.get(node_name, "")
+            lines.append(f"{duration:10d}\t{percentage:5.2f}\t{avg_time:8.1f}\t{calls:5d}\t{provider:8s}\t{node_name}")
 
+        return lines
 
-def group_node_results(sess_time, kernel_time_only, use_gpu):
-    """Group results by operator name.
 
-    Args:
-        sess_time (List[Dict]): profile data
-        kernel_time_only (bool): Only include items for kernel time.
-        use_gpu (bool): GPU is used in profiling or not.
+class GroupedNodeResults:
+    """Node time of the profile data grouped by operator, aggregated one item at a time. See group_node_results."""
 
-    Returns:
-        List[str]: lines of string for output.
-    """
-    op_kernel_time = {}
-    op_kernel_records = {}
-    total_kernel_time = 0
+    def __init__(self):
+        self.op_kernel_time = {}
+        self.op_kernel_records = {}
+        self.total_kernel_time = 0
 
-    provider_op_kernel_time = {}
-    provider_op_kernel_records = {}
-    provider_kernel_time = {}
+        self.provider_op_kernel_time = {}
+        self.provider_op_kernel_records = {}
+        self.provider_kernel_time = {}
 
-    op_fence_time = {}
-    total_fence_time = 0
+        self.op_fence_time = {}
+        self.total_fence_time = 0
 
-    provider_counter = {}
-    for item in sess_time:
+        self.provider_counter = {}
+
+    def add(self, item):
         if item["cat"] == "Node" and "dur" in item and "args" in item and "op_name" in item["args"]:
             op_name = item["args"]["op_name"]
 
             # TODO: shall we have a separated group for nodes with subgraph?
             if op_name in NODES_TYPE_CONTAINING_SUBGRAPH:
-                continue
+                return
 
             if "provider" not in item["args"]:
                 if "fence" in item["name"]:
-                    if op_name in op_fence_time:
-                        op_fence_time[op_name] += item["dur"]
+                    if op_name in self.op_fence_time:
+                        self.op_fence_time[op_name] += item["dur"]
                     else:
-                        op_fence_time[op_name] = item["dur"]
-                    total_fence_time += item["dur"]
-                continue
+                        self.op_fence_time[op_name] = item["dur"]
+                    self.total_fence_time += item["dur"]
+                return
 
             provider = item["args"].get("provider", "")
-            if provider in provider_counter:
-                provider_counter[provider] += 1
+            if provider in self.provider_counter:
+                self.provider_counter[provider] += 1
             else:
-                provider_counter[provider] = 1
+                self.provider_counter[provider] = 1
 
             key = f"{provider}:{op_name}"
-            if key in provider_op_kernel_time:
-                provider_op_kernel_time[key] += item["dur"]
-                provider_op_kernel_records[key] += 1
+            if key in self.provider_op_kernel_time:
+                self.provider_op_kernel_time[key] += item["dur"]
+                self.provider_op_kernel_records[key] += 1
             else:
-                provider_op_kernel_time[key] = item["dur"]
-                provider_op_kernel_records[key] = 1
+                self.provider_op_kernel_time[key] = item["dur"]
+                self.provider_op_kernel_records[key] = 1
 
-            if provider in provider_kernel_time:
-                provider_kernel_time[provider] += item["dur"]
+            if provider in self.provider_kernel_time:
+                self.provider_kernel_time[provider] += item["dur"]
             else:
-                provider_kernel_time[provider] = item["dur"]
+                self.provider_kernel_time[provider] = item["dur"]
 
-            if op_name in op_kernel_time:
-                op_kernel_time[op_name] += item["dur"]
-                op_kernel_records[op_name] += 1
+            if op_name in self.op_kernel_time:
+                self.op_kernel_time[op_name] += item["dur"]
+                self.op_kernel_records[op_name] += 1
             else:
-                op_kernel_time[op_name] = item["dur"]
-                op_kernel_records[op_name] = 1
-
-            total_kernel_time += item["dur"]
-
-    lines = ["", "Grouped by operator"]
-    lines.append("-" * 64)
-    lines.append("Total(μs)\tTime%\tKernel(μs)\tKernel%\tCalls\tAvgKernel(μs)\tFence(μs)\tOperator")
-    for op_name, kernel_time in sorted(op_kernel_time.items(), key=lambda x: x[1], reverse=True):
-        fence_time = op_fence_time.get(op_name, 0)
-        kernel_time_ratio = kernel_time / total_kernel_time
-        total_time = kernel_time + fence_time
-        time_ratio = total_time / (total_kernel_time + total_fence_time)
-        kernel_calls = op_kernel_records[op_name]
-        avg_kernel_time = kernel_time / kernel_calls
-        lines.append(
-            f"{total_time:10d}\t{time_ratio * 100.0:5.2f}\t{kernel_time:11d}\t{kernel_time_ratio * 100.0:5.2f}\t{kernel_calls:5d}\t{avg_kernel_time:14.1f}\t{fence_time:10d}\t{op_name}"
-        )
+                self.op_kernel_time[op_name] = item["dur"]
+                self.op_kernel_records[op_name] = 1
+
+            self.total_kernel_time += item["dur"]
+
+    def get_lines(self):
+        total_kernel_time = self.total_kernel_time
+        lines = ["", "Grouped by operator"]
+        lines.append("-" * 64)
+        lines.append("Total(μs)\tTime%\tKernel(μs)\tKernel%\tCalls\tAvgKernel(μs)\tFence(μs)\tOperator")
+        for op_name, kernel_time in sorted(self.op_kernel_time.items(), key=lambda x: x[1], reverse=True):
+            fence_time = self.op_fence_time.get(op_name, 0)
+            kernel_time_ratio = kernel_time / total_kernel_time
+            total_time = kernel_time + fence_time
+            time_ratio = total_time / (total_kernel_time + self.total_fence_time)
+            kernel_calls = self.op_kernel_records[op_name]
+            avg_kernel_time = kernel_time / kernel_calls
+            lines.append(
+                f"{total_time:10d}\t{time_ratio * 100.0:5.2f}\t{kernel_time:11d}\t{kernel_time_ratio * 100.0:5.2f}\t{kernel_calls:5d}\t{avg_kernel_time:14.1f}\t{fence_time:10d}\t{op_name}"
+            )
 
-    lines += ["", "Grouped by provider + operator"]
-    lines.append("-" * 64)
-    lines.append("Kernel(μs)\tProvider%\tCalls\tAvgKernel(μs)\tProvider\tOperator")
-    for key, kernel_time in sorted(provider_op_kernel_time.items(), key=lambda x: x[1], reverse=True):
-        parts = key.split(":")
-        provider = parts[0]
-        op_name = parts[1]
-        short_ep = provider.replace("ExecutionProvider", "")
-        calls = provider_op_kernel_records[key]
-        avg_kernel_time = kernel_time / calls
-        provider_time_ratio = kernel_time / provider_kernel_time[provider]
-        lines.append(
-            f"{kernel_time:10d}\t{provider_time_ratio * 100.0:9.2f}\t{calls:5d}\t{avg_kernel_time:14.1f}\t{short_ep:8s}\t{op_name}"
-        )
+        lines += ["", "Grouped by provider + operator"]
+        lines.append("-" * 64)
+        lines.append("Kernel(μs)\tProvider%\tCalls\tAvgKernel(μs)\tProvider\tOperator")
+        for key, kernel_time in sorted(self.provider_op_kernel_time.items(), key=lambda x: x[1], reverse=True):
+            parts = key.split(":")
+            provider = parts[0]
+            op_name = parts[1]
+            short_ep = provider.replace("ExecutionProvider", "")
+            calls = self.provider_op_kernel_records[key]
+            avg_kernel_time = kernel_time / calls
+            provider_time_ratio = kernel_time / self.provider_kernel_time[provider]
+            lines.append(
+                f"{kernel_time:10d}\t{provider_time_ratio * 100.0:9.2f}\t{calls:5d}\t{avg_kernel_time:14.1f}\t{short_ep:8s}\t{op_name}"
+            )
+
+        return lines
 
-    return lines
+
+def parse_kernel_results(sess_time, threshold=0):
+    """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
+
+    Args:
+        sess_time (Iterable[Dict]): profile data
+        kernel_time_only (bool, optional): Only include items for kernel time. Defaults to False.
+        threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
+
+    Returns:
+        List[str]: lines of string for output.
+    """
+    results = KernelResults()
+    for item in sess_time:
+        results.add(item)
+    return results.get_lines(threshold)
+
+
+def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
+    """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
+
+    Args:
+        sess_time (Iterable[Dict]): profile data
+        kernel_time_only (bool, optional): Only include items for kernel time. Defaults to False.
+        threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
+
+    Returns:
+        List[str]: lines of string for output.
+    """
+    results = NodeResults(kernel_time_only)
+    for item in sess_time:
+        results.add(item)
+    return results.get_lines(threshold)
+
+
+def group_node_results(sess_time, kernel_time_only, use_gpu):
+    """Group results by operator name.
+
+    Args:
+        sess_time (Iterable[Dict]): profile data
+        kernel_time_only (bool): Only include items for kernel time.
+        use_gpu (bool): GPU is used in profiling or not.
+
+    Returns:
+        List[str]: lines of string for output.
+    """
+    results = GroupedNodeResults()
+    for item in sess_time:
+        results.add(item)
+    return results.get_lines()
 
 
 def get_dim_from_type_proto(dim):
@@ -640,13 +692,21 @@ def create_longformer_inputs(onnx_model, batch_size, sequence_length, global_len
 
 
 def process_results(profile_file, args):
-    profile_records = load_profile_json(profile_file)
+    kernel_results = KernelResults()
+    node_results = NodeResults(args.kernel_time_only)
+    grouped_node_results = GroupedNodeResults()
+
+    # All the results are aggregated in a single pass over the events of the trace.
+    for item in load_profile_json(profile_file):
+        kernel_results.add(item)
+        node_results.add(item)
+        grouped_node_results.add(item)
 
-    lines = parse_kernel_results(profile_records, args.threshold)
+    lines = kernel_results.get_lines(args.threshold)
 
-    lines += parse_node_results(profile_records, args.kernel_time_only, args.threshold)
+    lines += node_results.get_lines(args.threshold)
 
-    lines += group_node_results(profile_records, args.kernel_time_only, args.use_gpu)
+    lines += grouped_node_results.get_lines()
 
     return lines
 
@@ -15,15 +15,22 @@ if os.path.exists(os.path.join(file_path, "../tools/symbolic_shape_infer.py")):
 else:
     sys.path.append(os.path.join(file_path, ".."))
 
-from symbolic_shape_infer import SymbolicShapeInference, get_shape_from_type_proto, sympy  # noqa: E402
+from symbolic_shape_infer import (  # noqa: E402
+    SymbolicShapeInference,
+    get_shape_from_type_proto,
+    shape_inference_cache,
+    sympy,
+)
 
 logger = logging.getLogger(__name__)
 
 
 class SymbolicShapeInferenceHelper(SymbolicShapeInference):
-    def __init__(self, model, verbose=0, int_max=2**31 - 1, auto_merge=True, guess_output_rank=False):
+    def __init__(self, model, verbose=0, int_max=2**31 - 1, auto_merge=True, guess_output_rank=False, use_cache=None):
         super().__init__(int_max, auto_merge, guess_output_rank, verbose)
         self.model_ = model
+        # see SymbolicShapeInferenceCache.is_enabled
+        self.use_cache_ = shape_inference_cache.is_enabled(use_cache)
         self.all_shapes_inferred_: bool = False
         self.is_inferred_: bool = False
         self.dynamic_axis_mapping_: Dict[str, int] = {}
@@ -45,6 +52,26 @@ class SymbolicShapeInferenceHelper(SymbolicShapeInference):
 
         self.dynamic_axis_mapping_ = dynamic_axis_mapping
 
+        if self.use_cache_:
+            # The result of a previous helper on the same graph with the same settings is reused. The results of
+            # SymbolicShapeInference.infer_shapes are not, since the helper substitutes the dynamic axes and does
+            # not update the graph outputs.
+            key = shape_inference_cache.make_key(
+                self.model_,
+                "SymbolicShapeInferenceHelper",
+                shape_inference_cache.source_digest(__file__),
+                self.int_max_,
+                self.auto_merge_,
+                self.guess_output_rank_,
+                dynamic_axis_mapping,
+                max_runs,
+            )
+            all_shapes_inferred = self._load_from_cache(key, self.model_)
+            if all_shapes_inferred is not None:
+                self.all_shapes_inferred_ = all_shapes_inferred
+                self.is_inferred_ = True
+                return self.all_shapes_inferred_
+
         self._preprocess(self.model_)
 
         count = 0
@@ -55,6 +82,8 @@ class SymbolicShapeInferenceHelper(SymbolicShapeInference):
             if max_runs > 0 and count >= max_runs:
                 break
 
+        if self.use_cache_:
+            self._save_to_cache(key, self.all_shapes_inferred_)
         self.is_inferred_ = True
         return self.all_shapes_inferred_
 
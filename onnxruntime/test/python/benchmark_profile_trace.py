@@ -0,0 +1,143 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Benchmark the reading of a synthetic profile trace of a GPU model in events per second and the increase of the peak
+resident memory, with json.load of the whole file and with the streaming reader into the columns of profile_explorer,
+and the demangling of the kernel names with a demangler process per name and with a single batched process:
+python benchmark_profile_trace.py --num_events 1000000
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+if os.path.exists(os.path.join(os.path.dirname(__file__), "..", "..", "python", "tools", "profile_trace.py")):
+    # Allow running this script without installing onnxruntime package.
+    sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "python", "tools"))
+    import profile_trace
+else:
+    from onnxruntime.tools import profile_trace
+
+OP_TYPES = ["MatMul", "Add", "LayerNormalization", "Softmax", "Gelu", "Transpose"]
+
+
+def create_trace(trace_path, num_events, num_nodes=120):
+    """
+    Writes a trace like the ones of the profiler of onnxruntime for a model run with the CUDA execution provider:
+    a model_run event per run, and per node the fence and kernel_time events of the node on the CPU followed by a GPU
+    kernel event with a mangled name. Returns the number of distinct kernel names.
+    """
+
+    def iter_events():
+        ts = 0
+        while True:
+            for i in range(num_nodes):
+                op_type = OP_TYPES[i % len(OP_TYPES)]
+                name = f"{op_type}_{i}"
+                shape = [{"float": [1, 128, 768 + i % 3]}]
+                node_args = {"op_name": op_type}
+                kernel_args = {
+                    "op_name": op_type,
+                    "provider": "CUDAExecutionProvider",
+                    "input_type_shape": shape,
+                    "output_type_shape": shape,
+                    "thread_scheduling_stats": {"main_thread": {"thread_pool_name": "session-1", "thread_id": 1}},
+                }
+                gpu_args = {"op_name": op_type, "block_x": 256, "block_y": 1, "block_z": 1, "grid_x": 96 + i % 4}
+                gpu_args.update({"grid_y": 1, "grid_z": 1})
+                kernel = f"_ZN11onnxruntime4cuda{len(op_type) + 8}_{op_type}_kernelILi{i % 8}EEEvPKfPf"
+                for event_name, cat, args in [
+                    (f"{name}_fence_before", "Node", node_args),
+                    (f"{name}_kernel_time", "Node", kernel_args),
+                    (f"{name}_fence_after", "Node", node_args),
+                    (kernel, "Kernel", gpu_args),
+                ]:
+                    yield {
+                        "cat": cat,
+                        "pid": 1,
+                        "tid": 2,
+                        "dur": 5 + i % 7,
+                        "ts": ts,
+                        "ph": "X",
+                        "name": event_name,
+                        "args": args,
+                    }
+                    ts += 10
+            yield {"cat": "Session", "pid": 1, "tid": 1, "dur": ts, "ts": 0, "ph": "X", "name": "model_run", "args": {}}
+
+    # The events are written as they are created, so that the trace is not held in memory by the benchmark.
+    kernels = set()
+    events = iter_events()
+    with open(trace_path, "w", encoding="utf-8") as trace_file:
+        trace_file.write("[\n")
+        for i in range(num_events):
+            event = next(events)
+            if event["cat"] == "Kernel":
+                kernels.add(event["name"])
+            trace_file.write(json.dumps(event) + (",\n" if i < num_events - 1 else "\n]\n"))
+    return len(kernels)
+
+
+def read_columns(trace_path):
+    columns = profile_trace.TraceColumns(["name", "op_name"], ["duration"])
+    for event in profile_trace.iter_trace_events(trace_path):
+        if event.get("cat") == "Kernel":
+            columns.append(name=event["name"], op_name=event["args"].get("op_name"), duration=event["dur"])
+    return columns
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(num_events):
+    with tempfile.TemporaryDirectory() as trace_dir:
+        trace_path = os.path.join(trace_dir, "profile.json")
+        num_kernels = create_trace(trace_path, num_events)
+        size_mb = os.path.getsize(trace_path) / 1024**2
+        print(f"events={num_events} trace={size_mb:.0f}MB kernel names={num_kernels}")
+
+        # The peak memory only increases, so the streaming reader is measured first.
+        rss = peak_rss_mb()
+        start = time.perf_counter()
+        columns = read_columns(trace_path)
+        elapsed = time.perf_counter() - start
+        print(
+            f"iter_trace_events into columns: {elapsed:.2f}s, {num_events / elapsed:.0f} events/s, "
+            f"peak memory +{peak_rss_mb() - rss:.0f}MB"
+        )
+
+        start = time.perf_counter()
+        with open(trace_path, encoding="utf-8") as trace_file:
+            events = json.load(trace_file)
+        elapsed = time.perf_counter() - start
+        print(
+            f"json.load: {elapsed:.2f}s, {num_events / elapsed:.0f} events/s, "
+            f"peak memory +{peak_rss_mb() - rss:.0f}MB"
+        )
+        assert len(events) == num_events
+
+    names = columns.strings("name")
+    start = time.perf_counter()
+    for name in names:
+        subprocess.run(["c++filt", name], capture_output=True, check=True)
+    elapsed = time.perf_counter() - start
+    print(f"demangle {len(names)} names, a process per name: {elapsed:.2f}s")
+
+    start = time.perf_counter()
+    profile_trace.demangle_names(names)
+    elapsed = time.perf_counter() - start
+    print(f"demangle {len(names)} names, batched: {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_events", type=int, default=1000000)
+    args = parser.parse_args()
+    run(args.num_events)
@@ -0,0 +1,175 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Benchmark the throughput of symbolic shape inference in nodes per second on a transformer-like model with symbolic
+batch and sequence dimensions, with the native shape inference of standard ops and with onnx shape inference only:
+python benchmark_symbolic_shape_infer.py --num_layers 24
+
+With --past, the model has the key and value cache and the causal mask of GPT-2, and the inference is also run
+without the memoization of sympy expressions:
+python benchmark_symbolic_shape_infer.py --num_layers 24 --past
+"""
+
+import argparse
+import os
+import sys
+import time
+from unittest.mock import patch
+
+import numpy as np
+from onnx import TensorProto, helper, numpy_helper
+
+if os.path.exists(os.path.join(os.path.dirname(__file__), "..", "..", "python", "tools", "symbolic_shape_infer.py")):
+    # Allow running this script without installing onnxruntime package.
+    sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "python", "tools"))
+    import symbolic_shape_infer
+else:
+    from onnxruntime.tools import symbolic_shape_infer
+
+SymbolicShapeInference = symbolic_shape_infer.SymbolicShapeInference
+MEMOIZED_FUNCTIONS = ["sympy_simplify", "sympy_min", "sympy_max", "sympy_str"]
+
+
+def create_transformer_model(num_layers, hidden_size=64, num_heads=4, past=False):
+    """
+    Creates a transformer with symbolic batch and sequence dims. With past, like GPT-2 exported from PyTorch, every
+    layer concatenates its key and value to past states with a symbolic past_sequence dim, and slices a causal mask
+    with bounds computed from the shapes, so that the dims are symbolic expressions like past_sequence + sequence.
+    """
+    head_size = hidden_size // num_heads
+    rng = np.random.default_rng(0)
+    nodes = []
+    initializers = [
+        numpy_helper.from_array(np.array([0, 0, num_heads, head_size], dtype=np.int64), "qkv_shape"),
+        numpy_helper.from_array(np.array(np.sqrt(head_size), dtype=np.float32), "scale"),
+        numpy_helper.from_array(np.array([0], dtype=np.int64), "zero"),
+        numpy_helper.from_array(np.array([1], dtype=np.int64), "one"),
+        numpy_helper.from_array(np.array([hidden_size], dtype=np.int64), "hidden"),
+    ]
+    inputs = [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", "sequence", hidden_size])]
+    outputs = []
+    if past:
+        initializers.extend(
+            [
+                numpy_helper.from_array(np.array(2, dtype=np.int64), "two"),
+                numpy_helper.from_array(np.array(3, dtype=np.int64), "three"),
+                numpy_helper.from_array(np.array([2], dtype=np.int64), "axis_2"),
+                numpy_helper.from_array(np.array([3], dtype=np.int64), "axis_3"),
+                numpy_helper.from_array(np.tril(np.ones((1, 1, 1024, 1024), dtype=bool)), "causal_mask"),
+                numpy_helper.from_array(np.array(-10000.0, dtype=np.float32), "masked_value"),
+            ]
+        )
+    else:
+        inputs.append(helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", 1, 1, "sequence"]))
+
+    def add_weight(name, shape):
+        initializers.append(numpy_helper.from_array(rng.standard_normal(shape).astype(np.float32), name))
+        return name
+
+    def add_node(op_type, inputs, **kwargs):
+        output = f"{op_type}_{len(nodes)}"
+        nodes.append(helper.make_node(op_type, inputs, [output], name=output, **kwargs))
+        return output
+
+    def linear(x, name, in_size, out_size):
+        y = add_node("MatMul", [x, add_weight(f"{name}_weight", [in_size, out_size])])
+        return add_node("Add", [y, add_weight(f"{name}_bias", [out_size])])
+
+    def add_past(i, name, state, axis, shape):
+        inputs.append(helper.make_tensor_value_info(f"past_{name}_{i}", TensorProto.FLOAT, shape))
+        present = add_node("Concat", [f"past_{name}_{i}", state], axis=axis)
+        outputs.append(helper.make_tensor_value_info(present, TensorProto.FLOAT, None))
+        return present
+
+    if not past:
+        mask = add_node("Cast", [add_node("Unsqueeze", ["attention_mask", "one"])], to=TensorProto.FLOAT)
+    x = "input"
+    for i in range(num_layers):
+        heads = []
+        for name, perm in [("q", [0, 2, 1, 3]), ("k", [0, 2, 3, 1]), ("v", [0, 2, 1, 3])]:
+            projected = linear(x, f"layer_{i}_{name}", hidden_size, hidden_size)
+            heads.append(add_node("Transpose", [add_node("Reshape", [projected, "qkv_shape"])], perm=perm))
+        if past:
+            heads[1] = add_past(i, "key", heads[1], 3, ["batch", num_heads, head_size, "past_sequence"])
+            heads[2] = add_past(i, "value", heads[2], 2, ["batch", num_heads, "past_sequence", head_size])
+        scores = add_node("Div", [add_node("MatMul", heads[:2]), "scale"])
+        if past:
+            query_length = add_node("Gather", [add_node("Shape", [heads[0]]), "two"], axis=0)
+            key_length = add_node("Gather", [add_node("Shape", [heads[1]]), "three"], axis=0)
+            start = add_node("Unsqueeze", [add_node("Sub", [key_length, query_length]), "zero"])
+            end = add_node("Unsqueeze", [key_length, "zero"])
+            mask = add_node("Slice", ["causal_mask", start, end, "axis_2"])
+            mask = add_node("Slice", [mask, "zero", end, "axis_3"])
+            scores = add_node("Where", [mask, scores, "masked_value"])
+        else:
+            scores = add_node("Add", [scores, mask])
+        context = add_node(
+            "Transpose", [add_node("MatMul", [add_node("Softmax", [scores]), heads[2]])], perm=[0, 2, 1, 3]
+        )
+
+        # the output shape is computed from the input shape
+        input_shape = add_node("Shape", [x])
+        batch = add_node("Gather", [input_shape, "zero"], axis=0)
+        sequence = add_node("Gather", [input_shape, "one"], axis=0)
+        output_shape = add_node("Concat", [batch, sequence, "hidden"], axis=0)
+        attention = linear(add_node("Reshape", [context, output_shape]), f"layer_{i}_o", hidden_size, hidden_size)
+        x = add_node("Add", [x, attention])
+
+        hidden = linear(x, f"layer_{i}_fc1", hidden_size, 4 * hidden_size)
+        hidden = add_node("Mul", [hidden, add_node("Sigmoid", [hidden])])
+        x = add_node("Add", [x, linear(hidden, f"layer_{i}_fc2", 4 * hidden_size, hidden_size)])
+
+    outputs.insert(0, helper.make_tensor_value_info(x, TensorProto.FLOAT, None))
+    graph = helper.make_graph(nodes, "transformer", inputs, outputs, initializers)
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+
+def infer_shapes(model, native, auto_merge=False):
+    symbolic_shape_inference = SymbolicShapeInference(
+        int_max=2**31 - 1, auto_merge=auto_merge, guess_output_rank=False, verbose=0
+    )
+    if not native:
+        symbolic_shape_inference.native_dispatcher_.clear()
+    symbolic_shape_inference._preprocess(model)
+    while symbolic_shape_inference.run_:
+        symbolic_shape_inference._infer_impl()
+    symbolic_shape_inference._update_output_from_vi()
+    return symbolic_shape_inference.out_mp_
+
+
+def run(num_layers, past):
+    model = create_transformer_model(num_layers, past=past)
+    num_nodes = len(model.graph.node)
+    modes = {"onnx only": {"native": False}, "native": {"native": True}}
+    if past:
+        modes["no memoization"] = {"native": True, "memoize": False}
+
+    results = {}
+    for mode, settings in modes.items():
+        for name in MEMOIZED_FUNCTIONS:
+            getattr(symbolic_shape_infer, name).cache_clear()
+        functions = {name: getattr(symbolic_shape_infer, name) for name in MEMOIZED_FUNCTIONS}
+        if not settings.get("memoize", True):
+            functions = {name: function.__wrapped__ for name, function in functions.items()}
+
+        with patch.multiple(symbolic_shape_infer, **functions):
+            start = time.perf_counter()
+            results[mode] = infer_shapes(model, settings["native"], auto_merge=past)
+            elapsed = time.perf_counter() - start
+        print(f"{mode:<15} {num_nodes} nodes: {elapsed:.2f}s, {num_nodes / elapsed:.0f} nodes/s")
+        if settings.get("memoize", True):
+            hits = sum(getattr(symbolic_shape_infer, name).cache_info().hits for name in MEMOIZED_FUNCTIONS)
+            misses = sum(getattr(symbolic_shape_infer, name).cache_info().misses for name in MEMOIZED_FUNCTIONS)
+            print(f"{'':<15} memoized sympy expressions: {hits} hits, {misses} misses")
+
+    for result in results.values():
+        assert result.graph.value_info == results["native"].graph.value_info
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_layers", type=int, default=24)
+    parser.add_argument("--past", action="store_true", help="Add the key and value cache and the causal mask")
+    args = parser.parse_args()
+    run(args.num_layers, args.past)
@@ -1071,6 +1071,42 @@ class TestInferenceSession(unittest.TestCase):
         # Chronological profiling's start time
         self.assertTrue(start_time_1 <= start_time_2 <= start_time_3)
 
+    def test_profiling_aggregator(self):
+        sess = onnxrt.InferenceSession(get_name("mul_1.onnx"), providers=["CPUExecutionProvider"])
+        aggregator = onnxrt.ProfilingAggregator()
+        sess.start_profiling(aggregator)
+        x = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], dtype=np.float32)
+        for _ in range(10):
+            sess.run([], {"X": x})
+
+        snapshot = aggregator.snapshot(reset=True)
+        self.assertEqual(list(snapshot.op_types), ["Mul"])
+        self.assertEqual(len(snapshot.nodes), 1)
+        self.assertEqual(snapshot.runs.count, 10)
+        histogram = snapshot.op_types["Mul"]
+        self.assertEqual(histogram.count, 10)
+        self.assertEqual(sum(count for _, count in histogram.buckets), 10)
+        self.assertTrue(histogram.min_us <= histogram.percentile(50) <= histogram.percentile(99) <= histogram.max_us)
+        self.assertEqual(snapshot.top(1, "op_types")[0][0], "Mul")
+
+        # the snapshot with reset started a new interval
+        sess.run([], {"X": x})
+        self.assertEqual(aggregator.snapshot().runs.count, 1)
+        aggregator.reset()
+        self.assertEqual(aggregator.snapshot().runs.count, 0)
+
+        # no durations are aggregated after the end of profiling, and no profile file is written
+        self.assertEqual(sess.end_profiling(), "")
+        sess.run([], {"X": x})
+        self.assertEqual(aggregator.snapshot().nodes, {})
+
+        so = onnxrt.SessionOptions()
+        so.enable_profiling = True
+        sess = onnxrt.InferenceSession(get_name("mul_1.onnx"), sess_options=so, providers=["CPUExecutionProvider"])
+        with self.assertRaises(RuntimeError):
+            sess.start_profiling(aggregator)
+        os.remove(sess.end_profiling())
+
     def test_graph_optimization_level(self):
         opt = onnxrt.SessionOptions()
         # default should be all optimizations optimization
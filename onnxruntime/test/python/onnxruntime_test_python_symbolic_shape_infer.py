@@ -7,7 +7,7 @@ import numpy
 
 # -*- coding: UTF-8 -*-
 import onnx
-from onnx import AttributeProto, GraphProto, TensorProto, helper, numpy_helper  # noqa: F401
+from onnx import AttributeProto, GraphProto, TensorProto, external_data_helper, helper, numpy_helper  # noqa: F401
 
 if os.path.exists(
     os.path.join(
@@ -23,12 +23,16 @@ if os.path.exists(
     import sys
 
     sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "python", "tools"))
-    from symbolic_shape_infer import SymbolicShapeInference
+    from symbolic_shape_infer import SymbolicShapeInference, shape_inference_cache, sympy_simplify
 else:
-    from onnxruntime.tools.symbolic_shape_infer import SymbolicShapeInference
+    from onnxruntime.tools.symbolic_shape_infer import SymbolicShapeInference, shape_inference_cache, sympy_simplify
 
+import sys
+import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from unittest.mock import patch
 
 
 def unique_element(lst):
@@ -36,6 +40,113 @@ def unique_element(lst):
     return lst[0]
 
 
+def create_transformer_model(num_layers, hidden_size=64, num_heads=4, past=False):
+    """
+    Creates a transformer with symbolic batch and sequence dims. With past, like GPT-2 exported from PyTorch, every
+    layer concatenates its key and value to past states with a symbolic past_sequence dim, and slices a causal mask
+    with bounds computed from the shapes, so that the dims are symbolic expressions like past_sequence + sequence.
+    """
+    head_size = hidden_size // num_heads
+    rng = numpy.random.default_rng(0)
+    nodes = []
+    initializers = [
+        numpy_helper.from_array(numpy.array([0, 0, num_heads, head_size], dtype=numpy.int64), "qkv_shape"),
+        numpy_helper.from_array(numpy.array(numpy.sqrt(head_size), dtype=numpy.float32), "scale"),
+        numpy_helper.from_array(numpy.array([0], dtype=numpy.int64), "zero"),
+        numpy_helper.from_array(numpy.array([1], dtype=numpy.int64), "one"),
+        numpy_helper.from_array(numpy.array([hidden_size], dtype=numpy.int64), "hidden"),
+    ]
+    inputs = [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", "sequence", hidden_size])]
+    outputs = []
+    if past:
+        initializers.extend(
+            [
+                numpy_helper.from_array(numpy.array(2, dtype=numpy.int64), "two"),
+                numpy_helper.from_array(numpy.array(3, dtype=numpy.int64), "three"),
+                numpy_helper.from_array(numpy.array([2], dtype=numpy.int64), "axis_2"),
+                numpy_helper.from_array(numpy.array([3], dtype=numpy.int64), "axis_3"),
+                numpy_helper.from_array(numpy.tril(numpy.ones((1, 1, 1024, 1024), dtype=bool)), "causal_mask"),
+                numpy_helper.from_array(numpy.array(-10000.0, dtype=numpy.float32), "masked_value"),
+            ]
+        )
+    else:
+        inputs.append(helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", 1, 1, "sequence"]))
+
+    def add_weight(name, shape):
+        initializers.append(numpy_helper.from_array(rng.standard_normal(shape).astype(numpy.float32), name))
+        return name
+
+    def add_node(op_type, inputs, **kwargs):
+        output = f"{op_type}_{len(nodes)}"
+        nodes.append(helper.make_node(op_type, inputs, [output], name=output, **kwargs))
+        return output
+
+    def linear(x, name, in_size, out_size):
+        y = add_node("MatMul", [x, add_weight(f"{name}_weight", [in_size, out_size])])
+        return add_node("Add", [y, add_weight(f"{name}_bias", [out_size])])
+
+    def add_past(i, name, state, axis, shape):
+        inputs.append(helper.make_tensor_value_info(f"past_{name}_{i}", TensorProto.FLOAT, shape))
+        present = add_node("Concat", [f"past_{name}_{i}", state], axis=axis)
+        outputs.append(helper.make_tensor_value_info(present, TensorProto.FLOAT, None))
+        return present
+
+    if not past:
+        mask = add_node("Cast", [add_node("Unsqueeze", ["attention_mask", "one"])], to=TensorProto.FLOAT)
+    x = "input"
+    for i in range(num_layers):
+        heads = []
+        for name, perm in [("q", [0, 2, 1, 3]), ("k", [0, 2, 3, 1]), ("v", [0, 2, 1, 3])]:
+            projected = linear(x, f"layer_{i}_{name}", hidden_size, hidden_size)
+            heads.append(add_node("Transpose", [add_node("Reshape", [projected, "qkv_shape"])], perm=perm))
+        if past:
+            heads[1] = add_past(i, "key", heads[1], 3, ["batch", num_heads, head_size, "past_sequence"])
+            heads[2] = add_past(i, "value", heads[2], 2, ["batch", num_heads, "past_sequence", head_size])
+        scores = add_node("Div", [add_node("MatMul", heads[:2]), "scale"])
+        if past:
+            query_length = add_node("Gather", [add_node("Shape", [heads[0]]), "two"], axis=0)
+            key_length = add_node("Gather", [add_node("Shape", [heads[1]]), "three"], axis=0)
+            start = add_node("Unsqueeze", [add_node("Sub", [key_length, query_length]), "zero"])
+            end = add_node("Unsqueeze", [key_length, "zero"])
+            mask = add_node("Slice", ["causal_mask", start, end, "axis_2"])
+            mask = add_node("Slice", [mask, "zero", end, "axis_3"])
+            scores = add_node("Where", [mask, scores, "masked_value"])
+        else:
+            scores = add_node("Add", [scores, mask])
+        context = add_node(
+            "Transpose", [add_node("MatMul", [add_node("Softmax", [scores]), heads[2]])], perm=[0, 2, 1, 3]
+        )
+
+        # the output shape is computed from the input shape
+        input_shape = add_node("Shape", [x])
+        batch = add_node("Gather", [input_shape, "zero"], axis=0)
+        sequence = add_node("Gather", [input_shape, "one"], axis=0)
+        output_shape = add_node("Concat", [batch, sequence, "hidden"], axis=0)
+        attention = linear(add_node("Reshape", [context, output_shape]), f"layer_{i}_o", hidden_size, hidden_size)
+        x = add_node("Add", [x, attention])
+
+        hidden = linear(x, f"layer_{i}_fc1", hidden_size, 4 * hidden_size)
+        hidden = add_node("Mul", [hidden, add_node("Sigmoid", [hidden])])
+        x = add_node("Add", [x, linear(hidden, f"layer_{i}_fc2", 4 * hidden_size, hidden_size)])
+
+    outputs.insert(0, helper.make_tensor_value_info(x, TensorProto.FLOAT, None))
+    graph = helper.make_graph(nodes, "transformer", inputs, outputs, initializers)
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+
+def infer_shapes(model, native, auto_merge=False):
+    symbolic_shape_inference = SymbolicShapeInference(
+        int_max=2**31 - 1, auto_merge=auto_merge, guess_output_rank=False, verbose=0
+    )
+    if not native:
+        symbolic_shape_inference.native_dispatcher_.clear()
+    symbolic_shape_inference._preprocess(model)
+    while symbolic_shape_inference.run_:
+        symbolic_shape_inference._infer_impl()
+    symbolic_shape_inference._update_output_from_vi()
+    return symbolic_shape_inference.out_mp_
+
+
 skipped_models = ["SSD-MobilenetV1", "SSD-int8", "Inception-1-int8"]
 
 
@@ -105,6 +216,260 @@ class TestSymbolicShapeInference(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, r"if_node.*FLOAT.*DOUBLE"):
             SymbolicShapeInference.infer_shapes(model, auto_merge=True)
 
+    def _get_model_with_implicit_input(self, reverse_nodes):
+        # The If node is listed before the node producing "relu", which is only used in its subgraphs.
+        def make_branch(name, op_type):
+            return helper.make_graph(
+                [helper.make_node(op_type, ["relu"], [name + "_out"])],
+                name,
+                [],
+                [helper.make_tensor_value_info(name + "_out", TensorProto.FLOAT, None)],
+            )
+
+        nodes = [
+            helper.make_node("Neg", ["x"], ["neg"]),
+            helper.make_node("Relu", ["neg"], ["relu"]),
+            helper.make_node("ReduceMin", ["cond_in"], ["cond"], keepdims=0),
+            helper.make_node(
+                "If",
+                ["cond"],
+                ["if_out"],
+                then_branch=make_branch("then", "Sigmoid"),
+                else_branch=make_branch("else", "Tanh"),
+            ),
+            helper.make_node("Add", ["if_out", "x"], ["out"]),
+        ]
+        if reverse_nodes:
+            nodes.reverse()
+        graph = helper.make_graph(
+            nodes,
+            "graph",
+            [
+                helper.make_tensor_value_info("x", TensorProto.FLOAT, ["batch", 8]),
+                helper.make_tensor_value_info("cond_in", TensorProto.BOOL, [1]),
+            ],
+            [helper.make_tensor_value_info("out", TensorProto.FLOAT, None)],
+        )
+        return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+    def test_topological_sort(self):
+        expected = SymbolicShapeInference.infer_shapes(self._get_model_with_implicit_input(False))
+        inferred = SymbolicShapeInference.infer_shapes(self._get_model_with_implicit_input(True))
+        output_dims = unique_element(inferred.graph.output).type.tensor_type.shape.dim
+        self.assertEqual([d.dim_param or d.dim_value for d in output_dims], ["batch", 8])
+        self.assertEqual(
+            sorted(vi.SerializeToString() for vi in inferred.graph.value_info),
+            sorted(vi.SerializeToString() for vi in expected.graph.value_info),
+        )
+
+    def test_if_with_constant_condition(self):
+        # The branch which is not executed is replaced by the other one, which has different nodes.
+        then_branch = helper.make_graph(
+            [helper.make_node("Relu", ["x"], ["t1"])],
+            "then",
+            [],
+            [helper.make_tensor_value_info("t1", TensorProto.FLOAT, None)],
+        )
+        else_branch = helper.make_graph(
+            [helper.make_node("Neg", ["x"], ["e1"]), helper.make_node("Abs", ["e1"], ["e2"])],
+            "else",
+            [],
+            [helper.make_tensor_value_info("e2", TensorProto.FLOAT, None)],
+        )
+        graph = helper.make_graph(
+            [helper.make_node("If", ["cond"], ["out"], then_branch=then_branch, else_branch=else_branch)],
+            "graph",
+            [helper.make_tensor_value_info("x", TensorProto.FLOAT, ["batch", 8])],
+            [helper.make_tensor_value_info("out", TensorProto.FLOAT, None)],
+            [helper.make_tensor("cond", TensorProto.BOOL, [], [False])],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+        inferred = SymbolicShapeInference.infer_shapes(model)
+        output_dims = unique_element(inferred.graph.output).type.tensor_type.shape.dim
+        self.assertEqual([d.dim_param or d.dim_value for d in output_dims], ["batch", 8])
+
+    def test_native_shape_inference(self):
+        model = create_transformer_model(num_layers=2)
+        native = infer_shapes(model, native=True)
+        self.assertEqual(native.graph.value_info, infer_shapes(model, native=False).graph.value_info)
+        output_dims = unique_element(native.graph.output).type.tensor_type.shape.dim
+        self.assertEqual([d.dim_param or d.dim_value for d in output_dims], ["batch", "sequence", 64])
+
+    def test_memoized_sympy_expressions(self):
+        model = create_transformer_model(num_layers=4, past=True)
+        sympy_simplify.cache_clear()
+        inferred = SymbolicShapeInference.infer_shapes(model, auto_merge=True, use_cache=False)
+
+        # the two dims of the causal mask sliced in every layer are only simplified in the first layer
+        self.assertEqual(sympy_simplify.cache_info().misses, 2)
+        self.assertGreaterEqual(sympy_simplify.cache_info().hits, 6)
+        for vi in inferred.graph.value_info:
+            if vi.name.startswith("Where"):
+                dims = [d.dim_param or d.dim_value for d in vi.type.tensor_type.shape.dim]
+                self.assertEqual(dims, ["batch", 4, "sequence", "past_sequence + sequence"])
+
+    def test_incremental_inference_after_merge(self):
+        # a chain of nodes, and two nodes adding tensors of different symbolic dims, each needing a merge of symbols
+        nodes = [helper.make_node("Relu", ["x" if i == 0 else f"relu_{i - 1}"], [f"relu_{i}"]) for i in range(10)]
+        inputs = [helper.make_tensor_value_info("x", TensorProto.FLOAT, ["batch", 8])]
+        outputs = [helper.make_tensor_value_info("relu_9", TensorProto.FLOAT, None)]
+        for i in range(2):
+            nodes.append(helper.make_node("Add", [f"a_{i}", f"b_{i}"], [f"add_{i}"]))
+            inputs.append(helper.make_tensor_value_info(f"a_{i}", TensorProto.FLOAT, [f"a_len_{i}", 8]))
+            inputs.append(helper.make_tensor_value_info(f"b_{i}", TensorProto.FLOAT, [f"b_len_{i}", 8]))
+            outputs.append(helper.make_tensor_value_info(f"add_{i}", TensorProto.FLOAT, None))
+        model = helper.make_model(
+            helper.make_graph(nodes, "graph", inputs, outputs), opset_imports=[helper.make_opsetid("", 17)]
+        )
+
+        with patch.object(
+            SymbolicShapeInference,
+            "_onnx_infer_single_node",
+            autospec=True,
+            side_effect=SymbolicShapeInference._onnx_infer_single_node,
+        ) as infer_single_node:
+            inferred = SymbolicShapeInference.infer_shapes(model, auto_merge=True)
+
+        # the nodes of the chain are inferred once, each Add node is inferred again only after its own merge
+        inferred_nodes = [call.args[1].output[0] for call in infer_single_node.call_args_list]
+        self.assertEqual(inferred_nodes[10:], ["add_0", "add_0", "add_1", "add_1"])
+        for output in inferred.graph.output[1:]:
+            self.assertNotIn("unk", str(output.type))
+        self.assertEqual(len(inferred.graph.value_info), 12)
+
+    def test_inference_cache(self):
+        model = create_transformer_model(num_layers=1)
+        shape_inference_cache.clear()
+        inferred = SymbolicShapeInference.infer_shapes(model, use_cache=True)
+
+        with tempfile.TemporaryDirectory() as cache_dir, patch.object(
+            SymbolicShapeInference, "_infer_impl", autospec=True, side_effect=SymbolicShapeInference._infer_impl
+        ) as infer_impl:
+            # the cache is not used by default
+            self.assertEqual(SymbolicShapeInference.infer_shapes(model), inferred)
+            self.assertEqual(infer_impl.call_count, 1)
+
+            # the result is reused from memory, or from the disk when the memory is cleared
+            self.assertEqual(SymbolicShapeInference.infer_shapes(model, use_cache=True), inferred)
+            self.assertEqual(infer_impl.call_count, 1)
+            shape_inference_cache.cache_dir = cache_dir
+            try:
+                # the cache is used by default when its directory is set
+                SymbolicShapeInference.infer_shapes(model, auto_merge=True)
+                shape_inference_cache.clear()
+                self.assertEqual(infer_impl.call_count, 2)
+                SymbolicShapeInference.infer_shapes(model, auto_merge=True)
+                self.assertEqual(infer_impl.call_count, 2)
+
+                # the results saved with another version of the format are not reused
+                shape_inference_cache.clear()
+                with patch.object(sys.modules[SymbolicShapeInference.__module__], "CACHE_FORMAT_VERSION", 0):
+                    SymbolicShapeInference.infer_shapes(model, auto_merge=True)
+                self.assertEqual(infer_impl.call_count, 3)
+            finally:
+                shape_inference_cache.cache_dir = None
+
+            # a different shape of a graph input or of a small initializer is inferred again
+            model.graph.input[0].type.tensor_type.shape.dim[0].dim_value = 2
+            SymbolicShapeInference.infer_shapes(model, use_cache=True)
+            self.assertEqual(infer_impl.call_count, 4)
+            model.graph.initializer[0].CopyFrom(
+                numpy_helper.from_array(numpy.array([0, 0, 2, 32], dtype=numpy.int64), "qkv_shape")
+            )
+            inferred = SymbolicShapeInference.infer_shapes(model, use_cache=True)
+            self.assertEqual(infer_impl.call_count, 5)
+
+        self.assertEqual(inferred.graph.output[0].type.tensor_type.shape.dim[0].dim_value, 2)
+
+    def test_infer_shapes_path_without_weights(self):
+        model = create_transformer_model(num_layers=2)
+        expected = SymbolicShapeInference.infer_shapes(model, use_cache=False)
+        with tempfile.TemporaryDirectory() as model_dir:
+            model_path = os.path.join(model_dir, "model.onnx")
+            output_path = os.path.join(model_dir, "model_with_shapes.onnx")
+            onnx.save(model, model_path, save_as_external_data=True, location="model.data", size_threshold=0)
+            data = Path(model_dir, "model.data").read_bytes()
+
+            with patch.object(
+                external_data_helper,
+                "load_external_data_for_tensor",
+                side_effect=external_data_helper.load_external_data_for_tensor,
+            ) as load_tensor:
+                inferred = SymbolicShapeInference.infer_shapes_path(
+                    model_path, output_path, size_threshold=64, use_cache=False
+                )
+
+            # only the shapes and scalars are loaded, and the external data is not written
+            loaded = {call.args[0].name for call in load_tensor.call_args_list}
+            self.assertEqual(loaded, {"qkv_shape", "scale", "zero", "one", "hidden"})
+            self.assertEqual(inferred.graph.value_info, expected.graph.value_info)
+            self.assertEqual(Path(model_dir, "model.data").read_bytes(), data)
+            saved = onnx.load(output_path)
+            self.assertEqual(saved.graph.value_info, expected.graph.value_info)
+            for saved_tensor, tensor in zip(saved.graph.initializer, expected.graph.initializer):
+                numpy.testing.assert_array_equal(numpy_helper.to_array(saved_tensor), numpy_helper.to_array(tensor))
+
+            with self.assertRaises(ValueError):
+                SymbolicShapeInference.infer_shapes_path(model_path, os.path.join(model_dir, "out", "model.onnx"))
+
+    def test_parallel_subgraph_inference(self):
+        # every branch creates a new symbolic dim, named from the id of the branch
+        def make_branch(name):
+            return helper.make_graph(
+                [
+                    helper.make_node("NonZero", ["x"], [name + "_nonzero"]),
+                    helper.make_node("Transpose", [name + "_nonzero"], [name + "_out"]),
+                ],
+                name,
+                [],
+                [helper.make_tensor_value_info(name + "_out", TensorProto.INT64, None)],
+            )
+
+        graph = helper.make_graph(
+            [
+                helper.make_node(
+                    "If", ["cond"], ["out"], then_branch=make_branch("then"), else_branch=make_branch("else")
+                )
+            ],
+            "graph",
+            [
+                helper.make_tensor_value_info("x", TensorProto.FLOAT, ["batch", 8]),
+                helper.make_tensor_value_info("cond", TensorProto.BOOL, []),
+            ],
+            [helper.make_tensor_value_info("out", TensorProto.INT64, None)],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+        expected = SymbolicShapeInference.infer_shapes(model, use_cache=False)
+        with patch.object(
+            ProcessPoolExecutor, "submit", autospec=True, side_effect=ProcessPoolExecutor.submit
+        ) as submit:
+            inferred = SymbolicShapeInference.infer_shapes(model, use_cache=False, num_workers=2)
+
+        self.assertEqual(submit.call_count, 2)
+        self.assertEqual(inferred, expected)
+        branches = {attr.name: attr.g for attr in inferred.graph.node[0].attribute}
+        self.assertEqual(
+            branches["then_branch"].output[0].type.tensor_type.shape.dim[0].dim_param, "NonZero_0_0_o0__d1"
+        )
+        self.assertEqual(
+            branches["else_branch"].output[0].type.tensor_type.shape.dim[0].dim_param, "NonZero_1_0_o0__d1"
+        )
+
+    def test_cyclic_graph(self):
+        graph = helper.make_graph(
+            [
+                helper.make_node("Add", ["x", "b"], ["a"]),
+                helper.make_node("Relu", ["a"], ["b"]),
+            ],
+            "graph",
+            [helper.make_tensor_value_info("x", TensorProto.FLOAT, [2])],
+            [helper.make_tensor_value_info("b", TensorProto.FLOAT, None)],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+        with self.assertRaisesRegex(Exception, "cyclic"):
+            SymbolicShapeInference.infer_shapes(model)
+
 
 class TestSymbolicShapeInferenceForOperators(unittest.TestCase):
     def _check_shapes(self, graph, inferred_graph, vis):  # type: (GraphProto, GraphProto, List[ValueInfoProto]) -> None
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark the threshold search of HistogramCollector against the original per-bin Python loop:
+python benchmark_calibration.py --num_tensors 8 --num_bins 2048
+
+Benchmark the per-sample overhead of MinMaxCalibrater on a BERT-sized augmented graph against the original
+implementation which kept every output in memory until compute_data:
+python benchmark_calibration.py --minmax --num_layers 12 --num_samples 500
+"""
+
+import argparse
+import copy
+import os
+import tempfile
+import time
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper
+
+from onnxruntime.quantization.calibrate import HistogramCollector, MinMaxCalibrater, entropy
+from onnxruntime.quantization.quant_utils import smooth_distribution
+
+
+def get_entropy_threshold_loop(histogram, num_quantized_bins):
+    """Original implementation of HistogramCollector.get_entropy_threshold, kept as a reference."""
+    hist = histogram[0]
+    hist_edges = histogram[1]
+    num_bins = hist.size
+    zero_bin_index = num_bins // 2
+    num_half_quantized_bin = num_quantized_bins // 2
+
+    dtype = histogram[1].dtype
+    kl_divergence = np.zeros(zero_bin_index - num_half_quantized_bin + 1)
+    thresholds = [(np.array(0, dtype=dtype), np.array(0, dtype=dtype)) for i in range(kl_divergence.size)]
+
+    for i in range(num_half_quantized_bin, zero_bin_index + 1, 1):
+        start_index = zero_bin_index - i
+        end_index = zero_bin_index + i + 1 if (zero_bin_index + i + 1) <= num_bins else num_bins
+
+        thresholds[i - num_half_quantized_bin] = (hist_edges[start_index], hist_edges[end_index])
+
+        sliced_distribution = copy.deepcopy(hist[start_index:end_index])
+
+        p = sliced_distribution.copy()
+        left_outliers_count = sum(hist[:start_index])
+        right_outliers_count = sum(hist[end_index:])
+        p[0] += left_outliers_count
+        p[-1] += right_outliers_count
+
+        nonzeros = (p != 0).astype(np.int64)
+
+        quantized_bins = np.zeros(num_quantized_bins, dtype=np.int64)
+        num_merged_bins = sliced_distribution.size // num_quantized_bins
+
+        for index in range(num_quantized_bins):
+            start = index * num_merged_bins
+            end = start + num_merged_bins
+            quantized_bins[index] = sum(sliced_distribution[start:end])
+        quantized_bins[-1] += sum(sliced_distribution[num_quantized_bins * num_merged_bins :])
+
+        q = np.zeros(p.size, dtype=np.int64)
+        for index in range(num_quantized_bins):
+            start = index * num_merged_bins
+            end = start + num_merged_bins
+
+            norm = sum(nonzeros[start:end])
+            if norm != 0:
+                q[start:end] = quantized_bins[index] / norm
+
+        p = smooth_distribution(p)
+        q = smooth_distribution(q)
+        if p is None or q is None:
+            div = np.array(np.inf, dtype=dtype)
+        else:
+            div = np.array(entropy(p, q), dtype=dtype)
+        kl_divergence[i - num_half_quantized_bin] = div
+
+    min_kl_divergence_idx = np.argmin(kl_divergence)
+    optimal_threshold = thresholds[min_kl_divergence_idx]
+    min_value = histogram[2]
+    max_value = histogram[3]
+    if optimal_threshold[0] < min_value:
+        optimal_threshold = (min_value, optimal_threshold[1])
+    if optimal_threshold[1] > max_value:
+        optimal_threshold = (optimal_threshold[0], max_value)
+    return optimal_threshold
+
+
+def compute_data_lists(calibrater, intermediate_outputs, output_names):
+    """Original implementation of MinMaxCalibrater.compute_data (without moving average), kept as a reference."""
+    output_dicts_list = [dict(zip(output_names, intermediate_output)) for intermediate_output in intermediate_outputs]
+
+    merged_output_dict = {}
+    for d in output_dicts_list:
+        for k, v in d.items():
+            merged_output_dict.setdefault(k, []).append(v)
+    added_output_names = output_names[calibrater.num_model_outputs :]
+    calibrate_tensor_names = [added_output_names[i].rpartition("_")[0] for i in range(0, len(added_output_names), 2)]
+
+    merged_added_output_dict = {
+        i: merged_output_dict[i] for i in merged_output_dict if i not in calibrater.model_original_outputs
+    }
+
+    pairs = []
+    for i in range(0, len(added_output_names), 2):
+        min_value_array = np.min(merged_added_output_dict[added_output_names[i]], axis=0)
+        max_value_array = np.max(merged_added_output_dict[added_output_names[i + 1]], axis=0)
+        pairs.append((min_value_array, max_value_array))
+    return dict(zip(calibrate_tensor_names, pairs))
+
+
+def create_layered_model(model_path, num_layers, nodes_per_layer=64):
+    """
+    Creates a model with the number of float tensors of a BERT-base encoder (about 64 per layer).
+    The tensors are small, the benchmark measures the overhead of the calibrater, not the inference.
+    """
+    nodes = []
+    previous = "input"
+    for layer in range(num_layers):
+        for i in range(nodes_per_layer):
+            output = f"layer{layer}_node{i}"
+            op_type = "Relu" if i % 2 == 0 else "Neg"
+            nodes.append(helper.make_node(op_type, [previous], [output], name=output))
+            previous = output
+    graph = helper.make_graph(
+        nodes,
+        "layered",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 16])],
+        [helper.make_tensor_value_info(previous, TensorProto.FLOAT, [1, 16])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    onnx.save(model, model_path)
+
+
+def run_minmax(num_layers, num_samples):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, "model.onnx")
+        create_layered_model(model_path, num_layers)
+        calibrater = MinMaxCalibrater(model_path, augmented_model_path=os.path.join(tmp_dir, "augmented.onnx"))
+        calibrater.augment_graph()
+        output_names = [output.name for output in calibrater.model.graph.output]
+
+    rng = np.random.default_rng(0)
+    samples = [
+        [rng.standard_normal(1).astype(np.float32) for _ in range(len(output_names))] for _ in range(num_samples)
+    ]
+    num_tensors = (len(output_names) - calibrater.num_model_outputs) // 2
+
+    start = time.perf_counter()
+    intermediate_outputs = list(samples)
+    expected = compute_data_lists(calibrater, intermediate_outputs, output_names)
+    lists_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for outputs in samples:
+        calibrater.accumulate_outputs(outputs)
+    actual = calibrater.compute_data()
+    accumulators_time = time.perf_counter() - start
+
+    for name, (min_value, max_value) in expected.items():
+        assert actual[name].range_value == (min_value, max_value), name
+
+    print(f"tensors={num_tensors} samples={num_samples}")
+    print(
+        f"lists: {lists_time / num_samples * 1e6:.1f}us/sample, "
+        f"accumulators: {accumulators_time / num_samples * 1e6:.1f}us/sample, "
+        f"speedup: {lists_time / accumulators_time:.1f}x"
+    )
+
+
+def create_histograms(num_tensors, num_bins, seed=0):
+    rng = np.random.default_rng(seed)
+    collector = HistogramCollector(
+        method="entropy",
+        symmetric=False,
+        num_bins=num_bins,
+        num_quantized_bins=128,
+        percentile=99.999,
+        scenario="same",
+    )
+    name_to_arr = {}
+    for i in range(num_tensors):
+        data = rng.standard_t(df=3 + i % 5, size=(4, 4096)).astype(np.float32)
+        name_to_arr[f"tensor_{i}"] = data
+    collector.collect_value(name_to_arr)
+    return collector.histogram_dict
+
+
+def run(num_tensors, num_bins, num_quantized_bins):
+    histograms = create_histograms(num_tensors, num_bins)
+    collector = HistogramCollector("entropy", False, num_bins, num_quantized_bins, 99.999, "same")
+
+    start = time.perf_counter()
+    expected = {name: get_entropy_threshold_loop(h, num_quantized_bins) for name, h in histograms.items()}
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = {name: collector.get_entropy_threshold(h, num_quantized_bins) for name, h in histograms.items()}
+    vectorized_time = time.perf_counter() - start
+
+    for name in histograms:
+        assert expected[name][0] == actual[name][0] and expected[name][1] == actual[name][1], name
+
+    print(f"tensors={num_tensors} bins={num_bins} quantized_bins={num_quantized_bins}")
+    print(f"loop: {loop_time:.3f}s, vectorized: {vectorized_time:.3f}s, speedup: {loop_time / vectorized_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_tensors", type=int, default=8)
+    parser.add_argument("--num_bins", type=int, default=2048)
+    parser.add_argument("--num_quantized_bins", type=int, default=128)
+    parser.add_argument("--minmax", action="store_true", help="benchmark MinMaxCalibrater instead")
+    parser.add_argument("--num_layers", type=int, default=12)
+    parser.add_argument("--num_samples", type=int, default=500)
+    args = parser.parse_args()
+    if args.minmax:
+        run_minmax(args.num_layers, args.num_samples)
+    else:
+        run(args.num_tensors, args.num_bins, args.num_quantized_bins)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark the numpy implementation of HQQ against the torch implementation, when torch is installed:
+python benchmark_hqq.py --rows 4096 --cols 4096 --block_size 128
+"""
+
+import argparse
+import time
+from importlib.util import find_spec
+
+import numpy as np
+
+from onnxruntime.quantization.matmul_4bits_quantizer import HQQWeightOnlyQuantConfig, HQQWeightOnlyQuantizer
+
+
+def dequantize(packed, scales, zero_points, bits, rows):
+    """Returns the [K, N] weight represented by the outputs of HQQWeightOnlyQuantizer.quantize_weight."""
+    cols, k_blocks, _ = packed.shape
+    packed = packed.reshape(cols, -1)
+    values = np.stack([(packed >> shift) & (2**bits - 1) for shift in range(0, 8, bits)], axis=-1)
+    values = values.reshape(cols, k_blocks, -1).astype(np.float32)
+    scales = scales.reshape(cols, k_blocks, 1)
+    zero_points = zero_points.reshape(cols, k_blocks, 1)
+    return ((values - zero_points) * scales).reshape(cols, -1)[:, :rows].T
+
+
+def run(rows, cols, block_size, bits, repeat):
+    weight = np.random.default_rng(0).standard_normal((rows, cols)).astype(np.float32)
+    backends = ["numpy", "torch"] if find_spec("torch") else ["numpy"]
+
+    results = {}
+    for backend in backends:
+        quantizer = HQQWeightOnlyQuantizer(HQQWeightOnlyQuantConfig(block_size=block_size, bits=bits, backend=backend))
+        quantizer.quantize_weight(weight)  # warm up
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results[backend] = quantizer.quantize_weight(weight)
+        elapsed = (time.perf_counter() - start) / repeat
+        error = np.abs(dequantize(*results[backend], bits, rows) - weight).mean()
+        print(f"{backend}: {elapsed * 1000:.1f}ms, mean absolute error: {error:.6f}")
+
+    if "torch" in results:
+        mismatches = np.mean(results["torch"][0] != results["numpy"][0])
+        scale_diff = np.abs(results["torch"][1] - results["numpy"][1]).max()
+        print(f"packed bytes differing from torch: {mismatches:.2e}, max scale difference: {scale_diff:.2e}")
+    else:
+        print("torch is not installed, only the numpy implementation is measured")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=4096)
+    parser.add_argument("--cols", type=int, default=4096)
+    parser.add_argument("--block_size", type=int, default=128)
+    parser.add_argument("--bits", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.cols, args.block_size, args.bits, args.repeat)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark quantize_static on a wide model with many small weights, where the time is dominated by the lookups of
+initializers and graph inputs and outputs by name rather than by the quantization of the weights:
+python benchmark_quantize_static.py --num_branches 5000 --quant_format QDQ
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+
+def create_wide_model(model_path, num_branches, size=4):
+    """
+    Creates a model with num_branches parallel MatMul + Add branches summed two by two, each with its own weight
+    and bias, so that the model has 2 * num_branches initializers.
+    """
+    rng = np.random.default_rng(0)
+    nodes = []
+    initializers = []
+    outputs = []
+    for i in range(num_branches):
+        weight = numpy_helper.from_array(rng.standard_normal((size, size)).astype(np.float32), f"weight_{i}")
+        bias = numpy_helper.from_array(rng.standard_normal(size).astype(np.float32), f"bias_{i}")
+        initializers.extend([weight, bias])
+        nodes.append(helper.make_node("MatMul", ["input", weight.name], [f"matmul_{i}"], name=f"MatMul_{i}"))
+        nodes.append(helper.make_node("Add", [f"matmul_{i}", bias.name], [f"add_{i}"], name=f"Add_{i}"))
+        outputs.append(f"add_{i}")
+
+    # Reduce the outputs of the branches to a single output.
+    while len(outputs) > 1:
+        reduced = []
+        for i in range(0, len(outputs) - 1, 2):
+            name = f"sum_{len(nodes)}"
+            nodes.append(helper.make_node("Add", [outputs[i], outputs[i + 1]], [name], name=name))
+            reduced.append(name)
+        if len(outputs) % 2:
+            reduced.append(outputs[-1])
+        outputs = reduced
+
+    graph = helper.make_graph(
+        nodes,
+        "wide",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, size])],
+        [helper.make_tensor_value_info(outputs[0], TensorProto.FLOAT, [1, size])],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    onnx.save(model, model_path)
+
+
+class DataReader(CalibrationDataReader):
+    def __init__(self, num_samples, size=4):
+        rng = np.random.default_rng(1)
+        self.samples = iter([{"input": rng.standard_normal((1, size)).astype(np.float32)} for _ in range(num_samples)])
+
+    def get_next(self):
+        return next(self.samples, None)
+
+
+def run(num_branches, quant_format, num_samples):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, "model.onnx")
+        quant_model_path = os.path.join(tmp_dir, "model.quant.onnx")
+        create_wide_model(model_path, num_branches)
+
+        start = time.perf_counter()
+        quantize_static(
+            model_path,
+            quant_model_path,
+            DataReader(num_samples),
+            quant_format=QuantFormat.from_string(quant_format),
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+        elapsed = time.perf_counter() - start
+
+        model = onnx.load(quant_model_path)
+        print(f"branches={num_branches} format={quant_format} initializers={2 * num_branches}")
+        print(f"quantize_static: {elapsed:.2f}s, quantized model: {len(model.graph.node)} nodes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_branches", type=int, default=5000)
+    parser.add_argument("--quant_format", choices=["QDQ", "QOperator"], default="QDQ")
+    parser.add_argument("--num_samples", type=int, default=2)
+    args = parser.parse_args()
+    run(args.num_branches, args.quant_format, args.num_samples)
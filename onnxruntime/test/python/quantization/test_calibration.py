@@ -5,6 +5,7 @@
 # license information.
 # --------------------------------------------------------------------------
 
+import copy
 import tempfile
 import unittest
 from pathlib import Path
@@ -14,7 +15,14 @@ import onnx
 from onnx import TensorProto, helper, numpy_helper
 
 import onnxruntime
-from onnxruntime.quantization.calibrate import CalibrationDataReader, create_calibrator
+from onnxruntime.quantization.calibrate import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    HistogramCollector,
+    create_calibrator,
+    entropy,
+)
+from onnxruntime.quantization.quant_utils import smooth_distribution
 
 
 def generate_input_initializer(tensor_shape, tensor_dtype, input_name):
@@ -26,6 +34,85 @@ def generate_input_initializer(tensor_shape, tensor_dtype, input_name):
     return init
 
 
+def get_entropy_threshold_loop(histogram, num_quantized_bins):
+    """
+    Per-bin implementation of HistogramCollector.get_entropy_threshold, the reference of the vectorized one
+    """
+    hist = histogram[0]
+    hist_edges = histogram[1]
+    num_bins = hist.size
+    zero_bin_index = num_bins // 2
+    num_half_quantized_bin = num_quantized_bins // 2
+
+    dtype = histogram[1].dtype
+    kl_divergence = np.zeros(zero_bin_index - num_half_quantized_bin + 1)
+    thresholds = [(np.array(0, dtype=dtype), np.array(0, dtype=dtype)) for i in range(kl_divergence.size)]
+
+    for i in range(num_half_quantized_bin, zero_bin_index + 1, 1):
+        start_index = zero_bin_index - i
+        end_index = min(zero_bin_index + i + 1, num_bins)
+
+        thresholds[i - num_half_quantized_bin] = (hist_edges[start_index], hist_edges[end_index])
+
+        sliced_distribution = copy.deepcopy(hist[start_index:end_index])
+
+        p = sliced_distribution.copy()
+        left_outliers_count = sum(hist[:start_index])
+        right_outliers_count = sum(hist[end_index:])
+        p[0] += left_outliers_count
+        p[-1] += right_outliers_count
+
+        nonzeros = (p != 0).astype(np.int64)
+
+        quantized_bins = np.zeros(num_quantized_bins, dtype=np.int64)
+        num_merged_bins = sliced_distribution.size // num_quantized_bins
+
+        for index in range(num_quantized_bins):
+            start = index * num_merged_bins
+            end = start + num_merged_bins
+            quantized_bins[index] = sum(sliced_distribution[start:end])
+        quantized_bins[-1] += sum(sliced_distribution[num_quantized_bins * num_merged_bins :])
+
+        q = np.zeros(p.size, dtype=np.int64)
+        for index in range(num_quantized_bins):
+            start = index * num_merged_bins
+            end = start + num_merged_bins
+
+            norm = sum(nonzeros[start:end])
+            if norm != 0:
+                q[start:end] = quantized_bins[index] / norm
+
+        p = smooth_distribution(p)
+        q = smooth_distribution(q)
+        if p is None or q is None:
+            div = np.array(np.inf, dtype=dtype)
+        else:
+            div = np.array(entropy(p, q), dtype=dtype)
+        kl_divergence[i - num_half_quantized_bin] = div
+
+    min_kl_divergence_idx = np.argmin(kl_divergence)
+    optimal_threshold = thresholds[min_kl_divergence_idx]
+    min_value = histogram[2]
+    max_value = histogram[3]
+    if optimal_threshold[0] < min_value:
+        optimal_threshold = (min_value, optimal_threshold[1])
+    if optimal_threshold[1] > max_value:
+        optimal_threshold = (optimal_threshold[0], max_value)
+    return optimal_threshold
+
+
+def create_histograms(num_tensors, num_bins, seed=0):
+    """
+    Helper function to collect the histograms of tensors with heavy tailed distributions
+    """
+    rng = np.random.default_rng(seed)
+    collector = HistogramCollector("entropy", False, num_bins, 128, 99.999, "same")
+    collector.collect_value(
+        {f"tensor_{i}": rng.standard_t(df=3 + i % 5, size=(4, 4096)).astype(np.float32) for i in range(num_tensors)}
+    )
+    return collector.histogram_dict
+
+
 class TestDataReader(CalibrationDataReader):
     """for test purpose"""
 
@@ -357,6 +444,293 @@ class TestCalibrateMinMaxCalibrator(unittest.TestCase):
         for output_name in output_min_max_dict:
             self.assertEqual(output_min_max_dict[output_name], tensors_range[output_name].range_value)
 
+    def test_compute_data_moving_average(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_moving_average.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+        data_reader = TestDataReader()
+
+        infer_session = onnxruntime.InferenceSession(test_model_path.as_posix(), providers=["CPUExecutionProvider"])
+        output_names = [output.name for output in infer_session.get_outputs()]
+        sample_ranges = []
+        while True:
+            input = data_reader.get_next()
+            if not input:
+                break
+            output = np.asarray(infer_session.run(None, input)).reshape(len(output_names), -1)
+            sample_ranges.append(np.stack([np.amin(output, axis=1), np.amax(output, axis=1)], axis=1))
+
+        averaging_constant = 0.1
+        for max_intermediate_outputs in [None, 2]:
+            for symmetric in [False, True]:
+                step = max_intermediate_outputs or len(sample_ranges)
+                expected = None
+                for i in range(0, len(sample_ranges), step):
+                    ranges = np.mean(sample_ranges[i : i + step], axis=0)
+                    if symmetric:
+                        max_abs = np.abs(ranges).max(axis=1)
+                        ranges = np.stack([-max_abs, max_abs], axis=1)
+                    expected = ranges if expected is None else expected + averaging_constant * (ranges - expected)
+
+                augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                    f"./augmented_test_model_moving_average_{max_intermediate_outputs}_{symmetric}.onnx"
+                )
+                calibrater = create_calibrator(
+                    test_model_path,
+                    augmented_model_path=augmented_model_path.as_posix(),
+                    extra_options={
+                        "moving_average": True,
+                        "averaging_constant": averaging_constant,
+                        "symmetric": symmetric,
+                        "max_intermediate_outputs": max_intermediate_outputs,
+                    },
+                )
+                data_reader.rewind()
+                calibrater.collect_data(data_reader)
+                tensors_range = calibrater.compute_data()
+
+                with self.subTest(max_intermediate_outputs=max_intermediate_outputs, symmetric=symmetric):
+                    for i, output_name in enumerate(output_names):
+                        rmin, rmax = tensors_range[output_name].range_value
+                        self.assertEqual(rmin.dtype, np.float32)
+                        np.testing.assert_allclose(rmin, expected[i, :1], rtol=1e-5)
+                        np.testing.assert_allclose(rmax, expected[i, 1:], rtol=1e-5)
+
+    def test_compute_data_per_channel(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_per_channel.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+        data_reader = TestDataReader()
+
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+        infer_session = onnxruntime.InferenceSession(
+            test_model_path.as_posix(), sess_options=sess_options, providers=["CPUExecutionProvider"]
+        )
+        output_names = [output.name for output in infer_session.get_outputs()]
+        outputs = []
+        while True:
+            input = data_reader.get_next()
+            if not input:
+                break
+            outputs.append(infer_session.run(None, input))
+
+        for channel_axis in [1, -1]:
+            for max_intermediate_outputs in [None, 2]:
+                augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                    f"./augmented_test_model_per_channel_{channel_axis}_{max_intermediate_outputs}.onnx"
+                )
+                calibrater = create_calibrator(
+                    test_model_path,
+                    augmented_model_path=augmented_model_path.as_posix(),
+                    extra_options={
+                        "per_channel": True,
+                        "channel_axis": channel_axis,
+                        "max_intermediate_outputs": max_intermediate_outputs,
+                    },
+                )
+                data_reader.rewind()
+                calibrater.collect_data(data_reader)
+                tensors_range = calibrater.compute_data()
+
+                with self.subTest(channel_axis=channel_axis, max_intermediate_outputs=max_intermediate_outputs):
+                    for i, output_name in enumerate(output_names):
+                        values = np.stack([np.moveaxis(output[i], channel_axis, 0) for output in outputs], axis=1)
+                        values = values.reshape(values.shape[0], -1)
+                        rmin, rmax = tensors_range[output_name].range_value
+                        np.testing.assert_array_equal(rmin, values.min(axis=1))
+                        np.testing.assert_array_equal(rmax, values.max(axis=1))
+
+    def test_compute_data_per_channel_unknown_rank(self):
+        # a scalar has a single channel and a single range is computed for the tensors of unknown rank
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_per_channel_unknown_rank.onnx")
+        graph = helper.make_graph(
+            [
+                helper.make_node("Mul", ["input", "scale"], ["X1"], name="Mul"),
+                helper.make_node("Reshape", ["X1", "shape"], ["X2"], name="Reshape"),
+                helper.make_node("Relu", ["X2"], ["X3"], name="Relu"),
+            ],
+            "test_graph_per_channel_unknown_rank",
+            [
+                helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 3, 1, 3]),
+                helper.make_tensor_value_info("scale", TensorProto.FLOAT, []),
+                helper.make_tensor_value_info("shape", TensorProto.INT64, [None]),
+            ],
+            [
+                helper.make_tensor_value_info("X1", TensorProto.FLOAT, [1, 3, 1, 3]),
+                helper.make_tensor_value_info("X3", TensorProto.FLOAT, None),
+            ],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        onnx.save(model, test_model_path)
+
+        data_reader = TestDataReader()
+        inputs = [
+            {"input": input_data, "scale": np.array(i + 1, dtype=np.float32), "shape": np.array([3, 3], dtype=np.int64)}
+            for i, input_data in enumerate(data_reader.input_data_list)
+        ]
+        augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+            "./augmented_test_model_per_channel_unknown_rank.onnx"
+        )
+        calibrater = create_calibrator(
+            test_model_path,
+            ["Mul", "Relu"],
+            augmented_model_path=augmented_model_path.as_posix(),
+            extra_options={"per_channel": True, "channel_axis": 1},
+        )
+        data_reader.enum_data_dicts = iter(inputs)
+        data_reader.preprocess_flag = False
+        calibrater.collect_data(data_reader)
+        tensors_range = calibrater.compute_data()
+
+        rmin, rmax = tensors_range["scale"].range_value
+        np.testing.assert_array_equal(rmin, [1.0])
+        np.testing.assert_array_equal(rmax, [4.0])
+        values = np.stack([(feeds["input"] * feeds["scale"]).reshape(3, 3) for feeds in inputs])
+        rmin, rmax = tensors_range["X1"].range_value
+        np.testing.assert_array_equal(rmin, values.min(axis=(0, 2)))
+        np.testing.assert_array_equal(rmax, values.max(axis=(0, 2)))
+        rmin, rmax = tensors_range["X2"].range_value
+        np.testing.assert_array_equal(rmin, [values.min()])
+        np.testing.assert_array_equal(rmax, [values.max()])
+
+    def test_compute_data_parallel_sessions(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_parallel.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+        data_reader = TestDataReader()
+
+        for calibrate_method in [CalibrationMethod.MinMax, CalibrationMethod.Percentile]:
+            tensors_ranges = []
+            for num_sessions in [1, 2]:
+                augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                    f"./augmented_test_model_parallel_{calibrate_method.name}_{num_sessions}.onnx"
+                )
+                calibrater = create_calibrator(
+                    test_model_path,
+                    augmented_model_path=augmented_model_path.as_posix(),
+                    calibrate_method=calibrate_method,
+                    extra_options={"num_sessions": num_sessions},
+                )
+                data_reader.rewind()
+                calibrater.collect_data(data_reader)
+                tensors_ranges.append(calibrater.compute_data())
+
+            with self.subTest(calibrate_method=calibrate_method):
+                self.assertEqual(set(tensors_ranges[0]), set(tensors_ranges[1]))
+                for tensor in tensors_ranges[0]:
+                    self.assertEqual(tensors_ranges[0][tensor].range_value, tensors_ranges[1][tensor].range_value)
+
+    def test_calibration_cache(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_cache.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+        cache_dir = Path(self._tmp_model_dir.name).joinpath("calibration_cache")
+        data_reader = TestDataReader()
+
+        class InterruptedDataReader(CalibrationDataReader):
+            def __init__(self, data_reader, num_samples):
+                self.data_reader = data_reader
+                self.num_samples = num_samples
+
+            def get_next(self):
+                if self.num_samples == 0:
+                    raise KeyboardInterrupt()
+                self.num_samples -= 1
+                return self.data_reader.get_next()
+
+        for calibrate_method in [CalibrationMethod.MinMax, CalibrationMethod.Entropy]:
+            augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                f"./augmented_test_model_cache_{calibrate_method.name}.onnx"
+            )
+
+            def create(cache_dir, augmented_model_path=augmented_model_path, calibrate_method=calibrate_method):
+                extra_options = {"max_intermediate_outputs": 2}
+                if cache_dir is not None:
+                    extra_options["cache_dir"] = cache_dir
+                return create_calibrator(
+                    test_model_path,
+                    augmented_model_path=augmented_model_path.as_posix(),
+                    calibrate_method=calibrate_method,
+                    extra_options=extra_options,
+                )
+
+            data_reader.rewind()
+            calibrater = create(None)
+            calibrater.collect_data(data_reader)
+            expected = calibrater.compute_data()
+
+            # The calibration is interrupted after 3 samples, the first 2 ones are saved in the cache.
+            data_reader.rewind()
+            calibrater = create(cache_dir)
+            with self.assertRaises(KeyboardInterrupt):
+                calibrater.collect_data(InterruptedDataReader(data_reader, 3))
+
+            # The calibration resumes from the third sample.
+            data_reader.rewind()
+            calibrater = create(cache_dir)
+            calibrater.collect_data(data_reader)
+            self.assertEqual(calibrater.num_collected_samples, 4)
+            tensors_range = calibrater.compute_data()
+
+            # Every sample is in the cache, the model is not run anymore.
+            data_reader.rewind()
+            calibrater = create(cache_dir)
+            calibrater.infer_session = None
+            calibrater.collect_data(data_reader)
+            cached_tensors_range = calibrater.compute_data()
+
+            with self.subTest(calibrate_method=calibrate_method):
+                self.assertEqual(set(expected), set(tensors_range))
+                self.assertEqual(set(expected), set(cached_tensors_range))
+                for tensor in expected:
+                    self.assertEqual(expected[tensor].range_value, tensors_range[tensor].range_value)
+                    self.assertEqual(expected[tensor].range_value, cached_tensors_range[tensor].range_value)
+
+            # Other calibration data with the same first sample has the same default fingerprint, the cached
+            # statistics are rejected since its other samples are not the cached ones.
+            other_data_reader = TestDataReader()
+            other_data_reader.input_data_list[0] = data_reader.input_data_list[0]
+            calibrater = create(cache_dir)
+            with self.subTest(calibrate_method=calibrate_method), self.assertRaises(ValueError):
+                calibrater.collect_data(other_data_reader)
+
+            other_data_reader.rewind()
+            calibrater = create_calibrator(
+                test_model_path,
+                augmented_model_path=augmented_model_path.as_posix(),
+                calibrate_method=calibrate_method,
+                extra_options={"cache_dir": cache_dir, "reader_fingerprint": "other_data_reader"},
+            )
+            calibrater.collect_data(other_data_reader)
+            self.assertEqual(calibrater.num_collected_samples, 4)
+
+    def test_histogram_max_intermediate_outputs(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_histogram.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+        data_reader = TestDataReader()
+
+        histograms = {}
+        for max_intermediate_outputs in [None, 1, 3]:
+            augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                f"./augmented_test_model_histogram_{max_intermediate_outputs}.onnx"
+            )
+            calibrater = create_calibrator(
+                test_model_path,
+                augmented_model_path=augmented_model_path.as_posix(),
+                calibrate_method=CalibrationMethod.Entropy,
+                extra_options={"max_intermediate_outputs": max_intermediate_outputs},
+            )
+            data_reader.rewind()
+            calibrater.collect_data(data_reader)
+            self.assertEqual(len(calibrater.intermediate_outputs), 0)
+            histograms[max_intermediate_outputs] = calibrater.collector.get_histogram_dict()
+            tensors_range = calibrater.compute_data()
+            self.assertEqual(set(tensors_range), set(histograms[max_intermediate_outputs]))
+
+        # Folding the outputs in several steps may widen the histogram but must not lose any value.
+        for tensor, expected in histograms[None].items():
+            for streamed in (histograms[1][tensor], histograms[3][tensor]):
+                self.assertEqual(streamed[0].sum(), expected[0].sum())
+                self.assertEqual(streamed[2], expected[2])
+                self.assertEqual(streamed[3], expected[3])
+
     def test_augment_graph_with_zero_value_dimension(self):
         """TEST_CONFIG_5"""
         #   Conv
@@ -457,5 +831,72 @@ class TestCalibrateMinMaxCalibrator(unittest.TestCase):
             self.assertTrue(output in augmented_model_outputs)
 
 
+class TestHistogramCollector(unittest.TestCase):
+    def test_entropy_threshold_matches_loop(self):
+        for num_bins, num_quantized_bins in [(128, 128), (512, 128), (513, 127), (1000, 64)]:
+            for seed in range(3):
+                histograms = create_histograms(num_tensors=2, num_bins=num_bins, seed=seed)
+                collector = HistogramCollector("entropy", False, num_bins, num_quantized_bins, 99.999, "same")
+                for name, histogram in histograms.items():
+                    with self.subTest(num_bins=num_bins, num_quantized_bins=num_quantized_bins, tensor=name):
+                        expected = get_entropy_threshold_loop(histogram, num_quantized_bins)
+                        actual = collector.get_entropy_threshold(histogram, num_quantized_bins)
+                        self.assertEqual(expected[0], actual[0])
+                        self.assertEqual(expected[1], actual[1])
+
+    def test_compute_collection_result_num_workers(self):
+        histograms = create_histograms(num_tensors=6, num_bins=512, seed=1)
+        for method in ["entropy", "percentile", "distribution"]:
+            results = []
+            for num_workers in [None, 3]:
+                collector = HistogramCollector(method, False, 512, 128, 99.99, "same", num_workers=num_workers)
+                collector.histogram_dict = histograms
+                results.append(collector.compute_collection_result())
+            with self.subTest(method=method):
+                self.assertEqual(list(results[0]), list(results[1]))
+                for tensor, expected in results[0].items():
+                    if method == "distribution":
+                        self.assertEqual(expected.range_value, results[1][tensor].range_value)
+                        self.assertEqual(expected.avg_std, results[1][tensor].avg_std)
+                    else:
+                        self.assertEqual(expected[:2], results[1][tensor][:2])
+
+    def test_streamed_thresholds_match_collected_at_once(self):
+        # the range grows with the batches, the histograms collected so far are spread over the new bins
+        rng = np.random.default_rng(0)
+        batches = [rng.standard_normal(4096).astype(np.float32) * (1 + i / 8) for i in range(16)]
+        for method, symmetric, num_bins in [
+            ("entropy", False, 128),
+            ("percentile", False, 2048),
+            ("percentile", True, 2048),
+            ("distribution", False, 2048),
+        ]:
+            collectors = [HistogramCollector(method, symmetric, num_bins, 128, 99.99, "same") for _ in range(2)]
+            collectors[0].collect({"tensor": np.concatenate(batches)})
+            for batch in batches:
+                collectors[1].collect({"tensor": batch})
+            expected, streamed = (collector.compute_collection_result()["tensor"] for collector in collectors)
+
+            with self.subTest(method=method, symmetric=symmetric):
+                expected_hist, streamed_hist = (collector.histogram_dict["tensor"][0] for collector in collectors)
+                self.assertEqual(streamed_hist.sum(), expected_hist.sum())
+                if method == "distribution":
+                    np.testing.assert_allclose(streamed.range_value, expected.range_value, rtol=1e-3)
+                    np.testing.assert_allclose(streamed.avg_std, expected.avg_std, rtol=1e-2)
+                else:
+                    np.testing.assert_allclose(streamed[:2], expected[:2], rtol=1e-3)
+
+    def test_entropy_threshold_sparse_histogram(self):
+        hist = np.zeros(256, dtype=np.int64)
+        hist[[10, 120, 128, 129, 200]] = [1, 7, 30, 12, 2]
+        hist_edges = np.linspace(-1, 1, 257, dtype=np.float32)
+        histogram = (hist, hist_edges, np.float32(-0.9), np.float32(0.6), np.float32(1))
+        collector = HistogramCollector("entropy", False, 256, 32, 99.999, "same")
+        expected = get_entropy_threshold_loop(histogram, 32)
+        actual = collector.get_entropy_threshold(histogram, 32)
+        self.assertEqual(expected[0], actual[0])
+        self.assertEqual(expected[1], actual[1])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -168,6 +168,40 @@ class TestONNXModel(unittest.TestCase):
         onnx_model.topological_sort()
         check_op_type_order(self, onnx_model.model, ["Op1", "Op1", "Op2", "Op3"])
 
+    def test_name_index(self):
+        test_model_path = str(Path(self._tmp_model_dir.name) / "onnx_model_name_index.onnx")
+        construct_model_for_topo_sort(test_model_path)
+        onnx_model = ONNXModel(onnx.load(test_model_path))
+        graph = onnx_model.graph()
+        self.assertIs(onnx_model.get_initializer("W_GRU"), graph.initializer[0])
+        self.assertIs(onnx_model.find_graph_input("input"), graph.input[0])
+        self.assertIsNone(onnx_model.get_initializer("missing"))
+
+        # Initializers added by the model or directly to the graph are found.
+        onnx_model.add_initializer(numpy_helper.from_array(np.zeros(1, dtype=np.float32), "added"))
+        graph.initializer.append(numpy_helper.from_array(np.ones(1, dtype=np.float32), "appended"))
+        self.assertEqual(onnx_model.get_initializer("added").name, "added")
+        self.assertEqual(onnx_model.get_initializer("appended").name, "appended")
+
+        # An initializer renamed in place is no longer found by its previous name.
+        graph.initializer[0].name = "W_GRU_renamed"
+        self.assertIsNone(onnx_model.get_initializer("W_GRU"))
+        self.assertIs(onnx_model.get_initializer("W_GRU_renamed"), graph.initializer[0])
+
+        onnx_model.remove_initializers(
+            [onnx_model.get_initializer("added"), onnx_model.get_initializer("W_GRU_renamed")]
+        )
+        self.assertIsNone(onnx_model.get_initializer("added"))
+        self.assertIsNone(onnx_model.get_initializer("W_GRU_renamed"))
+        self.assertEqual(onnx_model.get_initializer("appended").name, "appended")
+
+        # Elements renamed or replaced in place are found by their new name after notify_edit().
+        graph.input[0].name = "input_renamed"
+        graph.initializer[1].CopyFrom(numpy_helper.from_array(np.ones(1, dtype=np.float32), "replaced"))
+        onnx_model.notify_edit()
+        self.assertIs(onnx_model.find_graph_input("input_renamed"), graph.input[0])
+        self.assertIs(onnx_model.get_initializer("replaced"), graph.initializer[1])
+
 
 if __name__ == "__main__":
     unittest.main()
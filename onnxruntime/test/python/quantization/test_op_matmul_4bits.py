@@ -10,12 +10,15 @@ import unittest
 from importlib.util import find_spec
 from pathlib import Path
 from typing import Dict, Tuple, Union
+from unittest.mock import patch
 
 import numpy as np
 import onnx
 from onnx import TensorProto, helper
+from onnx.external_data_helper import uses_external_data
 from op_test_utils import TestDataFeeds, check_model_correctness, check_op_type_count
 
+import onnxruntime
 from onnxruntime.quantization import quant_utils
 
 
@@ -110,6 +113,99 @@ class TestOpMatMul4Bits(unittest.TestCase):
 
         onnx.save(model, output_model_path)
 
+    def construct_model_matmul_chain(
+        self, output_model_path: str, num_matmuls: int, features=(52, 64, 100, 32, 64), save_as_external_data=False
+    ) -> None:
+        #      (input)
+        #         |
+        #      MatMul_0
+        #         |
+        #        ...
+        #         |
+        #      MatMul_{num_matmuls - 1}
+        #         |
+        #      (output)
+        rng = np.random.default_rng(0)
+        nodes = []
+        initializers = []
+        for i in range(num_matmuls):
+            in_features = features[i % len(features)]
+            out_features = features[(i + 1) % len(features)]
+            weight = rng.standard_normal((in_features, out_features)).astype(np.float32)
+            initializers.append(onnx.numpy_helper.from_array(weight, name=f"linear{i}.weight"))
+            input_name = "input" if i == 0 else f"hidden{i - 1}"
+            output_name = "output" if i == num_matmuls - 1 else f"hidden{i}"
+            nodes.append(helper.make_node("MatMul", [input_name, f"linear{i}.weight"], [output_name], f"MatMul_{i}"))
+
+        input_tensor = helper.make_tensor_value_info("input", TensorProto.FLOAT, [-1, features[0]])
+        output_tensor = helper.make_tensor_value_info(
+            "output", TensorProto.FLOAT, [-1, features[num_matmuls % len(features)]]
+        )
+        graph = helper.make_graph(
+            nodes, "matmul_4bits_chain", [input_tensor], [output_tensor], initializer=initializers
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 7  # use stable onnx ir version
+
+        onnx.save(
+            model,
+            output_model_path,
+            save_as_external_data=save_as_external_data,
+            location=Path(output_model_path).name + ".data",
+            size_threshold=0,
+        )
+
+    def construct_model_matmul_if(self, output_model_path: str) -> None:
+        #              (input)
+        #                 |
+        #              MatMul_0
+        #                 |
+        #                If  (then: MatMul_then_0 -> MatMul_then_1, else: MatMul_else)
+        #                 |
+        #              MatMul_1
+        #                 |
+        #              (output)
+        # the weights of MatMul_then_0 and MatMul_else are initializers of the main graph
+        rng = np.random.default_rng(0)
+        features = 64
+
+        def make_weight(name):
+            weight = rng.standard_normal((features, features)).astype(np.float32)
+            return onnx.numpy_helper.from_array(weight, name=name)
+
+        def make_branch(name, matmuls, initializers):
+            nodes = []
+            for i, weight_name in enumerate(matmuls):
+                input_name = "hidden0" if i == 0 else f"{name}_hidden{i - 1}"
+                output_name = f"{name}_output" if i == len(matmuls) - 1 else f"{name}_hidden{i}"
+                nodes.append(helper.make_node("MatMul", [input_name, weight_name], [output_name], f"MatMul_{name}_{i}"))
+            output_tensor = helper.make_tensor_value_info(f"{name}_output", TensorProto.FLOAT, [-1, features])
+            return helper.make_graph(nodes, name, [], [output_tensor], initializer=initializers)
+
+        then_branch = make_branch("then", ["then0.weight", "then1.weight"], [make_weight("then1.weight")])
+        else_branch = make_branch("else", ["else0.weight"], [])
+        nodes = [
+            helper.make_node("MatMul", ["input", "linear0.weight"], ["hidden0"], "MatMul_0"),
+            helper.make_node("If", ["cond"], ["hidden1"], "If", then_branch=then_branch, else_branch=else_branch),
+            helper.make_node("MatMul", ["hidden1", "linear1.weight"], ["output"], "MatMul_1"),
+        ]
+        initializers = [
+            make_weight(name) for name in ["linear0.weight", "then0.weight", "else0.weight", "linear1.weight"]
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "matmul_4bits_if",
+            [
+                helper.make_tensor_value_info("input", TensorProto.FLOAT, [-1, features]),
+                helper.make_tensor_value_info("cond", TensorProto.BOOL, []),
+            ],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [-1, features])],
+            initializer=initializers,
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 7  # use stable onnx ir version
+        onnx.save(model, output_model_path)
+
     def quant_test(
         self,
         model_fp32_path: str,
@@ -170,7 +266,10 @@ class TestOpMatMul4Bits(unittest.TestCase):
             algo_config = matmul_4bits_quantizer.GPTQWeightOnlyQuantConfig(calibration_data_reader=data_reader)
         elif algorithm == "HQQ":
             # test HQQ algorithm
-            algo_config = matmul_4bits_quantizer.HQQWeightOnlyQuantConfig(block_size=block_size)
+            algo_config = matmul_4bits_quantizer.HQQWeightOnlyQuantConfig(block_size=block_size, backend="torch")
+        elif algorithm == "HQQ_NUMPY":
+            # test HQQ algorithm without torch
+            algo_config = matmul_4bits_quantizer.HQQWeightOnlyQuantConfig(block_size=block_size, backend="numpy")
 
         model = quant_utils.load_model_with_shape_infer(Path(model_fp32_path))
         quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model, block_size, is_symmetric, algo_config=algo_config)
@@ -211,6 +310,145 @@ class TestOpMatMul4Bits(unittest.TestCase):
         data_reader = self.input_feeds(1, {"input": [100, 52]})
         self.quant_test(model_fp32_path, data_reader, 32, False)
 
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_num_workers(self):
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        model_fp32_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_fp32_chain.onnx").absolute())
+        self.construct_model_matmul_chain(model_fp32_path, num_matmuls=7)
+
+        for is_symmetric in [True, False]:
+            quantized_models = []
+            for num_workers in [1, 3]:
+                quant_config = matmul_4bits_quantizer.DefaultWeightOnlyQuantConfig(
+                    block_size=32, is_symmetric=is_symmetric, accuracy_level=4
+                )
+                quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+                    onnx.load(model_fp32_path), algo_config=quant_config, num_workers=num_workers
+                )
+                quant.process()
+                quantized_models.append(quant.model.model)
+
+            with self.subTest(is_symmetric=is_symmetric):
+                self.assertEqual([node.op_type for node in quantized_models[1].graph.node], ["MatMulNBits"] * 7)
+                self.assertEqual(quantized_models[0].SerializeToString(), quantized_models[1].SerializeToString())
+
+        # the weights of the subgraphs are quantized concurrently with the ones of the main graph
+        model_fp32_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_fp32_if.onnx").absolute())
+        self.construct_model_matmul_if(model_fp32_path)
+        quantized_models = []
+        for num_workers in [1, 3]:
+            quant_config = matmul_4bits_quantizer.DefaultWeightOnlyQuantConfig(block_size=32, is_symmetric=False)
+            quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+                onnx.load(model_fp32_path), algo_config=quant_config, num_workers=num_workers
+            )
+            quant.process()
+            quantized_models.append(quant.model.model)
+
+        graph = quantized_models[1].graph
+        self.assertEqual([node.op_type for node in graph.node], ["MatMulNBits", "If", "MatMulNBits"])
+        for branch in graph.node[1].attribute:
+            self.assertEqual({node.op_type for node in branch.g.node}, {"MatMulNBits"})
+        self.assertEqual(quantized_models[0].SerializeToString(), quantized_models[1].SerializeToString())
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_external_data(self):
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        model_dir = Path(self._tmp_model_dir.name).joinpath("external_data")
+        model_dir.mkdir()
+        model_fp32_path = str(model_dir.joinpath("matmul_fp32_chain.onnx"))
+        self.construct_model_matmul_chain(model_fp32_path, num_matmuls=7, save_as_external_data=True)
+
+        quant_config = matmul_4bits_quantizer.DefaultWeightOnlyQuantConfig(block_size=32, is_symmetric=False)
+        quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+            model_fp32_path, algo_config=quant_config, nodes_to_exclude=["MatMul_2"]
+        )
+        quant.process()
+        expected = quant.model.model
+
+        # the output model is written next to the input model to check the input external data is not overwritten
+        for output_dir, num_workers in [(model_dir, 1), (Path(self._tmp_model_dir.name), 2)]:
+            model_int4_path = str(output_dir.joinpath(f"matmul_int4_chain_{num_workers}.onnx"))
+            quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+                model_fp32_path,
+                algo_config=quant_config,
+                nodes_to_exclude=["MatMul_2"],
+                num_workers=num_workers,
+                load_external_data=False,
+            )
+            quant.process_external_data(model_int4_path)
+
+            with self.subTest(num_workers=num_workers):
+                actual = onnx.load(model_int4_path, load_external_data=False)
+                for initializer in actual.graph.initializer:
+                    self.assertLess(len(initializer.raw_data), 1024)
+                onnx.load_external_data_for_model(actual, str(output_dir))
+                self.assertEqual(expected.graph.node, actual.graph.node)
+                self.assertEqual(
+                    {i.name: onnx.numpy_helper.to_array(i).tobytes() for i in expected.graph.initializer},
+                    {i.name: onnx.numpy_helper.to_array(i).tobytes() for i in actual.graph.initializer},
+                )
+
+        with self.assertRaises(ValueError):
+            quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+                model_fp32_path, algo_config=quant_config, load_external_data=False
+            )
+            quant.process_external_data(str(model_dir.joinpath("matmul_fp32_chain.onnx")))
+
+        # the weights of the model are already loaded
+        with self.assertRaises(ValueError):
+            quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, algo_config=quant_config)
+            quant.process_external_data(str(output_dir.joinpath("matmul_int4_chain.onnx")))
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_external_data_memory(self):
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        model_dir = Path(self._tmp_model_dir.name).joinpath("external_data_memory")
+        model_dir.mkdir()
+        model_fp32_path = str(model_dir.joinpath("matmul_fp32_chain.onnx"))
+        num_matmuls = 16
+        self.construct_model_matmul_chain(
+            model_fp32_path, num_matmuls=num_matmuls, features=(128,), save_as_external_data=True
+        )
+
+        # by default, the external data is loaded with the model as with onnx.load
+        quant_config = matmul_4bits_quantizer.DefaultWeightOnlyQuantConfig(block_size=32, is_symmetric=False)
+        quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, algo_config=quant_config)
+        self.assertFalse(any(uses_external_data(tensor) for tensor in quant.model.model.graph.initializer))
+
+        quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+            model_fp32_path, algo_config=quant_config, load_external_data=False
+        )
+        self.assertTrue(all(uses_external_data(tensor) for tensor in quant.model.model.graph.initializer))
+        weights = []
+
+        def load_external_tensor(tensor, base_dir):
+            weights.append(quant_utils.load_external_tensor(tensor, base_dir))
+            return weights[-1]
+
+        # the weights are memory mapped, the external data is never loaded in the tensors of the model
+        with patch.object(matmul_4bits_quantizer, "load_external_tensor", side_effect=load_external_tensor), patch(
+            "onnx.numpy_helper.load_external_data_for_tensor", side_effect=AssertionError("external data loaded")
+        ), patch(
+            "onnx.external_data_helper.load_external_data_for_model",
+            side_effect=AssertionError("external data loaded"),
+        ):
+            quant.process_external_data(str(model_dir.joinpath("matmul_int4_chain.onnx")))
+        self.assertEqual(len(weights), num_matmuls)
+        self.assertTrue(all(isinstance(weight, np.memmap) for weight in weights))
+        # the quantized weights are moved to the external data file as soon as they are computed
+        for tensor in quant.model.model.graph.initializer:
+            self.assertTrue(uses_external_data(tensor) or len(tensor.raw_data) < 1024)
+        check_op_type_count(self, str(model_dir.joinpath("matmul_int4_chain.onnx")), MatMulNBits=num_matmuls)
+
     @unittest.skipIf(
         find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
     )
@@ -244,6 +482,249 @@ class TestOpMatMul4Bits(unittest.TestCase):
         data_reader = self.input_feeds(1, {"input": [100, 52]})
         self.quant_test_with_algo("HQQ", model_fp32_path, data_reader, 32, False)
 
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_using_hqq_numpy(self):
+        model_fp32_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_fp32_offset.onnx").absolute())
+        self.construct_model_matmul(model_fp32_path, symmetric=False)
+        data_reader = self.input_feeds(1, {"input": [100, 52]})
+        self.quant_test_with_algo("HQQ_NUMPY", model_fp32_path, data_reader, 32, False)
+
+    def test_hqq_pack_on_row_248bit_numpy(self):
+        from onnxruntime.quantization.matmul_4bits_quantizer import HQQWeightOnlyQuantizer
+
+        rng = np.random.default_rng(0)
+        for bits in [2, 4, 8]:
+            values = rng.integers(0, 2**bits, size=(6, 32), dtype=np.int32)
+            packed = HQQWeightOnlyQuantizer.pack_on_row_248bit_numpy(values, bits)
+            compress_ratio = 8 // bits
+            self.assertEqual(packed.dtype, np.uint8)
+            self.assertEqual(packed.shape, (6, 32 // compress_ratio))
+            for j in range(compress_ratio):
+                np.testing.assert_array_equal((packed >> (bits * j)) & (2**bits - 1), values[:, j::compress_ratio])
+
+    def test_hqq_numpy_matches_torch(self):
+        if not find_spec("torch"):
+            self.skipTest("skip test_hqq_numpy_matches_torch since torch is not installed")
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        weight = np.random.default_rng(0).standard_normal((100, 64)).astype(np.float32)
+        results = {}
+        for backend in ["torch", "numpy"]:
+            quantizer = matmul_4bits_quantizer.HQQWeightOnlyQuantizer(
+                matmul_4bits_quantizer.HQQWeightOnlyQuantConfig(block_size=32, backend=backend)
+            )
+            results[backend] = quantizer.quantize_weight(weight)
+
+        for expected, actual in zip(results["torch"], results["numpy"]):
+            self.assertEqual(expected.shape, actual.shape)
+            self.assertEqual(expected.dtype, actual.dtype)
+        np.testing.assert_allclose(results["torch"][1], results["numpy"][1], rtol=1e-5)
+        np.testing.assert_allclose(results["torch"][2], results["numpy"][2], atol=1e-4)
+        # rounding of values on the boundary of two levels may differ
+        self.assertLess(np.mean(results["torch"][0] != results["numpy"][0]), 1e-3)
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_int4_block_dequant(self):
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        rows, cols, block_size = 100, 64, 32
+        weight = np.random.default_rng(0).standard_normal((rows, cols)).astype(np.float32)
+        for is_symmetric in [True, False]:
+            quantizer = matmul_4bits_quantizer.DefaultWeightOnlyQuantizer(
+                matmul_4bits_quantizer.DefaultWeightOnlyQuantConfig(block_size=block_size, is_symmetric=is_symmetric)
+            )
+            packed, scales, zero_points = quantizer.int4_block_quant(weight)
+            dequantized = quantizer.int4_block_dequant(packed, scales, zero_points, rows)
+
+            # MatMulNBits applied to the identity matrix returns the dequantized weight
+            inputs = ["input", "packed", "scales"] + ([] if is_symmetric else ["zero_points"])
+            graph = helper.make_graph(
+                [
+                    helper.make_node(
+                        "MatMulNBits",
+                        inputs,
+                        ["output"],
+                        domain="com.microsoft",
+                        K=rows,
+                        N=cols,
+                        bits=4,
+                        block_size=block_size,
+                    )
+                ],
+                "dequant",
+                [helper.make_tensor_value_info("input", TensorProto.FLOAT, [rows, rows])],
+                [helper.make_tensor_value_info("output", TensorProto.FLOAT, [rows, cols])],
+                initializer=[
+                    onnx.numpy_helper.from_array(packed, name="packed"),
+                    onnx.numpy_helper.from_array(scales, name="scales"),
+                    onnx.numpy_helper.from_array(zero_points, name="zero_points"),
+                ][: len(inputs) - 1],
+            )
+            model = helper.make_model(
+                graph, opset_imports=[helper.make_opsetid("", 13), helper.make_opsetid("com.microsoft", 1)]
+            )
+            model.ir_version = 7  # use stable onnx ir version
+
+            session = onnxruntime.InferenceSession(model.SerializeToString(), providers=["CPUExecutionProvider"])
+            expected = session.run(None, {"input": np.eye(rows, dtype=np.float32)})[0]
+            np.testing.assert_allclose(dequantized, expected, rtol=1e-5, atol=1e-6)
+            self.assertLess(np.abs(dequantized - weight).max(), np.abs(scales).max())
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_using_awq_algo(self):
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        model_fp32_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_fp32_awq.onnx").absolute())
+        self.construct_model_matmul_chain(model_fp32_path, num_matmuls=2, features=(128, 64))
+
+        # a few input channels are much larger than the others
+        rng = np.random.default_rng(1)
+        channel_scales = np.ones(128, dtype=np.float32)
+        channel_scales[rng.choice(128, 4, replace=False)] = 20.0
+        inputs = [{"input": rng.standard_normal((8, 128)).astype(np.float32) * channel_scales} for _ in range(4)]
+
+        outputs = {}
+        for algorithm in ["DEFAULT", "AWQ"]:
+            if algorithm == "AWQ":
+                algo_config = matmul_4bits_quantizer.AWQWeightOnlyQuantConfig(
+                    calibration_data_reader=TestDataFeeds(inputs), block_size=32
+                )
+            else:
+                algo_config = matmul_4bits_quantizer.DefaultWeightOnlyQuantConfig(block_size=32)
+            model_int4_path = str(Path(self._tmp_model_dir.name).joinpath(f"matmul_int4_{algorithm}.onnx").absolute())
+            quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, algo_config=algo_config)
+            quant.process()
+            quant.model.save_model_to_file(model_int4_path, False)
+            if algorithm == "AWQ":
+                check_op_type_count(self, model_int4_path, MatMulNBits=2, Mul=2, MatMul=0)
+            session = onnxruntime.InferenceSession(model_int4_path, providers=["CPUExecutionProvider"])
+            outputs[algorithm] = np.concatenate([session.run(None, feeds)[0] for feeds in inputs])
+
+        session = onnxruntime.InferenceSession(model_fp32_path, providers=["CPUExecutionProvider"])
+        expected = np.concatenate([session.run(None, feeds)[0] for feeds in inputs])
+        default_error = np.square(outputs["DEFAULT"] - expected).mean()
+        awq_error = np.square(outputs["AWQ"] - expected).mean()
+        self.assertLess(awq_error, default_error)
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_using_awq_algo_shared_input(self):
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        #          (input)
+        #        /    |    \
+        #  MatMul_0 MatMul_1 MatMul_2
+        #        \    |    /
+        #      Sum  -> (output)
+        rng = np.random.default_rng(2)
+        initializers = [
+            onnx.numpy_helper.from_array(rng.standard_normal((128, 64)).astype(np.float32), name=f"linear{i}.weight")
+            for i in range(3)
+        ]
+        nodes = [
+            helper.make_node("MatMul", ["input", f"linear{i}.weight"], [f"hidden{i}"], f"MatMul_{i}") for i in range(3)
+        ]
+        nodes.append(helper.make_node("Sum", [f"hidden{i}" for i in range(3)], ["output"], "Sum"))
+        graph = helper.make_graph(
+            nodes,
+            "matmul_4bits_shared_input",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, [-1, 128])],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [-1, 64])],
+            initializer=initializers,
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 7  # use stable onnx ir version
+        model_fp32_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_fp32_awq_shared.onnx").absolute())
+        onnx.save(model, model_fp32_path)
+
+        channel_scales = np.ones(128, dtype=np.float32)
+        channel_scales[rng.choice(128, 4, replace=False)] = 20.0
+        inputs = [{"input": rng.standard_normal((8, 128)).astype(np.float32) * channel_scales} for _ in range(4)]
+        algo_config = matmul_4bits_quantizer.AWQWeightOnlyQuantConfig(
+            calibration_data_reader=TestDataFeeds(inputs), block_size=32
+        )
+        quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, algo_config=algo_config)
+        quant.process()
+        # only the input of the MatMul nodes is calibrated, not their outputs
+        self.assertEqual(set(quant.node_quantizer.input_magnitudes), {"input"})
+        model_int4_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_int4_awq_shared.onnx").absolute())
+        quant.model.save_model_to_file(model_int4_path, False)
+        # the MatMul nodes share the scales of their input and the Mul node applying them
+        check_op_type_count(self, model_int4_path, MatMulNBits=3, Mul=1, MatMul=0)
+
+        session = onnxruntime.InferenceSession(model_int4_path, providers=["CPUExecutionProvider"])
+        actual = np.concatenate([session.run(None, feeds)[0] for feeds in inputs])
+        session = onnxruntime.InferenceSession(model_fp32_path, providers=["CPUExecutionProvider"])
+        expected = np.concatenate([session.run(None, feeds)[0] for feeds in inputs])
+        self.assertLess(np.square(actual - expected).mean(), 0.1 * np.square(expected).mean())
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_using_awq_algo_unknown_rank(self):
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        #  (input) -> MatMul_0 -> Reshape -> MatMul_1 -> (output)
+        #                            |
+        #                         (shape)
+        # the rank of the output of Reshape cannot be inferred, its channels cannot be calibrated
+        rng = np.random.default_rng(3)
+        initializers = [
+            onnx.numpy_helper.from_array(rng.standard_normal((128, 64)).astype(np.float32), name="linear0.weight"),
+            onnx.numpy_helper.from_array(rng.standard_normal((64, 64)).astype(np.float32), name="linear1.weight"),
+        ]
+        nodes = [
+            helper.make_node("MatMul", ["input", "linear0.weight"], ["hidden0"], "MatMul_0"),
+            helper.make_node("Reshape", ["hidden0", "shape"], ["reshaped"], "Reshape"),
+            helper.make_node("MatMul", ["reshaped", "linear1.weight"], ["output"], "MatMul_1"),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "matmul_4bits_unknown_rank",
+            [
+                helper.make_tensor_value_info("input", TensorProto.FLOAT, [-1, 128]),
+                helper.make_tensor_value_info("shape", TensorProto.INT64, [None]),
+            ],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, None)],
+            initializer=initializers,
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 7  # use stable onnx ir version
+        model_fp32_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_fp32_awq_unknown_rank.onnx").absolute())
+        onnx.save(model, model_fp32_path)
+
+        channel_scales = np.ones(128, dtype=np.float32)
+        channel_scales[rng.choice(128, 4, replace=False)] = 20.0
+        shape = np.array([-1, 64], dtype=np.int64)
+        inputs = [
+            {"input": rng.standard_normal((8, 128)).astype(np.float32) * channel_scales, "shape": shape}
+            for _ in range(4)
+        ]
+        algo_config = matmul_4bits_quantizer.AWQWeightOnlyQuantConfig(
+            calibration_data_reader=TestDataFeeds(inputs), block_size=32
+        )
+        quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, algo_config=algo_config)
+        quant.process()
+        # a single magnitude is computed for the input of unknown rank, the MatMul it feeds is not scaled
+        self.assertEqual(quant.node_quantizer.input_magnitudes["reshaped"].shape, (1,))
+        self.assertEqual(set(quant.node_quantizer.input_scales), {"input"})
+        model_int4_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_int4_awq_unknown_rank.onnx").absolute())
+        quant.model.save_model_to_file(model_int4_path, False)
+        check_op_type_count(self, model_int4_path, MatMulNBits=2, Mul=1, MatMul=0)
+
+        session = onnxruntime.InferenceSession(model_int4_path, providers=["CPUExecutionProvider"])
+        actual = np.concatenate([session.run(None, feeds)[0] for feeds in inputs])
+        session = onnxruntime.InferenceSession(model_fp32_path, providers=["CPUExecutionProvider"])
+        expected = np.concatenate([session.run(None, feeds)[0] for feeds in inputs])
+        self.assertLess(np.square(actual - expected).mean(), 0.1 * np.square(expected).mean())
+
 
 if __name__ == "__main__":
     unittest.main()
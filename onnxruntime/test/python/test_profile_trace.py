@@ -0,0 +1,257 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Test the streaming reader of profile traces shared by the profiling tools."""
+
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+TOOLS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "python", "tools")
+PROFILE_EXPLORER_DIR = os.path.join(TOOLS_DIR, "profile_explorer")
+
+if os.path.exists(os.path.join(TOOLS_DIR, "profile_trace.py")):
+    # Allow running this test script without installing onnxruntime package.
+    sys.path.append(TOOLS_DIR)
+    import profile_trace
+else:
+    from onnxruntime.tools import profile_trace
+
+OP_TYPES = ["MatMul", "Add", "LayerNormalization", "Softmax", "Gelu", "Transpose"]
+
+
+def create_trace(trace_path, num_events, num_nodes=120):
+    """
+    Writes a trace like the ones of the profiler of onnxruntime for a model run with the CUDA execution provider:
+    a model_run event per run, and per node the fence and kernel_time events of the node on the CPU followed by a GPU
+    kernel event with a mangled name. Returns the number of distinct kernel names.
+    """
+
+    def iter_events():
+        ts = 0
+        while True:
+            for i in range(num_nodes):
+                op_type = OP_TYPES[i % len(OP_TYPES)]
+                name = f"{op_type}_{i}"
+                shape = [{"float": [1, 128, 768 + i % 3]}]
+                node_args = {"op_name": op_type}
+                kernel_args = {
+                    "op_name": op_type,
+                    "provider": "CUDAExecutionProvider",
+                    "input_type_shape": shape,
+                    "output_type_shape": shape,
+                    "thread_scheduling_stats": {"main_thread": {"thread_pool_name": "session-1", "thread_id": 1}},
+                }
+                gpu_args = {"op_name": op_type, "block_x": 256, "block_y": 1, "block_z": 1, "grid_x": 96 + i % 4}
+                gpu_args.update({"grid_y": 1, "grid_z": 1})
+                kernel = f"_ZN11onnxruntime4cuda{len(op_type) + 8}_{op_type}_kernelILi{i % 8}EEEvPKfPf"
+                for event_name, cat, args in [
+                    (f"{name}_fence_before", "Node", node_args),
+                    (f"{name}_kernel_time", "Node", kernel_args),
+                    (f"{name}_fence_after", "Node", node_args),
+                    (kernel, "Kernel", gpu_args),
+                ]:
+                    yield {
+                        "cat": cat,
+                        "pid": 1,
+                        "tid": 2,
+                        "dur": 5 + i % 7,
+                        "ts": ts,
+                        "ph": "X",
+                        "name": event_name,
+                        "args": args,
+                    }
+                    ts += 10
+            yield {"cat": "Session", "pid": 1, "tid": 1, "dur": ts, "ts": 0, "ph": "X", "name": "model_run", "args": {}}
+
+    kernels = set()
+    events = iter_events()
+    with open(trace_path, "w", encoding="utf-8") as trace_file:
+        trace_file.write("[\n")
+        for i in range(num_events):
+            event = next(events)
+            if event["cat"] == "Kernel":
+                kernels.add(event["name"])
+            trace_file.write(json.dumps(event) + (",\n" if i < num_events - 1 else "\n]\n"))
+    return len(kernels)
+
+
+# Outputs of the profile explorer before it streamed the trace, for the trace of create_trace(path, 87, num_nodes=7),
+# with the durations rounded to 2 decimals.
+EXPECTED_CPU_KERNEL_TIMES = """name,duration,pct,count,cumulative_pct,cumulative_dur
+MatMul,32,28.57,4,28.57,32
+Transpose,20,17.86,2,46.43,52
+Gelu,18,16.07,2,62.5,70
+Softmax,16,14.29,2,76.79,86
+LayerNormalization,14,12.5,2,89.29,100
+Add,12,10.71,2,100.0,112
+"""
+
+EXPECTED_GPU_KERNEL_TIMES = """name,duration,pct,count,cumulative_pct,cumulative_dur
+_ZN11onnxruntime4cuda14_MatMul_kernelILi6EEEvPKfPf,22,19.64,2,19.64,22
+_ZN11onnxruntime4cuda17_Transpose_kernelILi5EEEvPKfPf,20,17.86,2,37.5,42
+_ZN11onnxruntime4cuda12_Gelu_kernelILi4EEEvPKfPf,18,16.07,2,53.57,60
+_ZN11onnxruntime4cuda15_Softmax_kernelILi3EEEvPKfPf,16,14.29,2,67.86,76
+_ZN11onnxruntime4cuda26_LayerNormalization_kernelILi2EEEvPKfPf,14,12.5,2,80.36,90
+_ZN11onnxruntime4cuda11_Add_kernelILi1EEEvPKfPf,12,10.71,2,91.07,102
+_ZN11onnxruntime4cuda14_MatMul_kernelILi0EEEvPKfPf,10,8.93,2,100.0,112
+"""
+
+EXPECTED_OP_KERNEL_MAPPING = """op_name,input_type_shape,op_count,kernel_dimensions,kernel_count,kernel_avg_dur (us),\
+kernel_total_dur (us),op_dur (us),op_avg_dur (us),kernel_pct (%),op_pct (%),kernel_name
+MatMul,float(1x128x768),2.0,"b256x1x1,g98x1x1",1.0,11.0,11.0,16.0,8.0,68.75,28.57,\
+_ZN11onnxruntime4cuda14_MatMul_kernelILi6EEEvPKfPf
+MatMul,float(1x128x768),2.0,"b256x1x1,g96x1x1",1.0,5.0,5.0,16.0,8.0,31.25,28.57,\
+_ZN11onnxruntime4cuda14_MatMul_kernelILi0EEEvPKfPf
+Transpose,float(1x128x770),1.0,"b256x1x1,g97x1x1",1.0,10.0,10.0,10.0,10.0,100.0,17.86,\
+_ZN11onnxruntime4cuda17_Transpose_kernelILi5EEEvPKfPf
+Gelu,float(1x128x769),1.0,"b256x1x1,g96x1x1",1.0,9.0,9.0,9.0,9.0,100.0,16.07,_ZN11onnxruntime4cuda12_Gelu_kernelILi4EEEvPKfPf
+Softmax,float(1x128x768),1.0,"b256x1x1,g99x1x1",1.0,8.0,8.0,8.0,8.0,100.0,14.29,\
+_ZN11onnxruntime4cuda15_Softmax_kernelILi3EEEvPKfPf
+LayerNormalization,float(1x128x770),1.0,"b256x1x1,g98x1x1",1.0,7.0,7.0,7.0,7.0,100.0,12.5,\
+_ZN11onnxruntime4cuda26_LayerNormalization_kernelILi2EEEvPKfPf
+Add,float(1x128x769),1.0,"b256x1x1,g97x1x1",1.0,6.0,6.0,6.0,6.0,100.0,10.71,_ZN11onnxruntime4cuda11_Add_kernelILi1EEEvPKfPf
+"""
+
+
+class TestProfileTrace(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory(prefix="test_profile_trace.")
+        self.trace_path = os.path.join(self._tmp_dir.name, "profile.json")
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def write_trace(self, text):
+        with open(self.trace_path, "w", encoding="utf-8") as trace_file:
+            trace_file.write(text)
+
+    def test_iter_trace_events(self):
+        create_trace(self.trace_path, 1000, num_nodes=10)
+        with open(self.trace_path, encoding="utf-8") as trace_file:
+            events = json.load(trace_file)
+        self.assertEqual(len(events), 1000)
+
+        # the events and the numbers at the end of the events span several chunks
+        for chunk_size in [7, 1000, profile_trace.TRACE_CHUNK_SIZE]:
+            self.assertEqual(list(profile_trace.iter_trace_events(self.trace_path, chunk_size)), events)
+
+        # the events in traceEvents of an object, after other values
+        self.write_trace(json.dumps({"displayTimeUnit": "ns", "otherData": {"a": [1, 2]}, "traceEvents": events[:5]}))
+        self.assertEqual(list(profile_trace.iter_trace_events(self.trace_path, 16)), events[:5])
+
+        # the closing bracket is optional
+        self.write_trace(' [{"name": "a", "dur": 1},\n{"name": "b", "dur": 23},\n')
+        events = list(profile_trace.iter_trace_events(self.trace_path, 33))
+        self.assertEqual(events, [{"name": "a", "dur": 1}, {"name": "b", "dur": 23}])
+
+        for text in ['{"otherData": {}}', '"trace"', '[{"name": "a", "dur": 1}, {"name": "b"']:
+            self.write_trace(text)
+            with self.assertRaises(ValueError):
+                list(profile_trace.iter_trace_events(self.trace_path, 4))
+
+    @unittest.skipIf(shutil.which("c++filt") is None, "c++filt is not installed")
+    def test_demangle_names(self):
+        names = ["_Z6kernelILi5EEvPf", "MemcpyHostToDevice", "_Z6kernelILi5EEvPf", "_Z6kernelILi6EEvPf"]
+        with patch.object(profile_trace, "_demangled_names", {}), patch.object(
+            profile_trace.subprocess, "run", wraps=subprocess.run
+        ) as run:
+            demangled = profile_trace.demangle_names(names)
+            self.assertEqual(
+                demangled,
+                {
+                    "_Z6kernelILi5EEvPf": "void kernel<5>(float*)",
+                    "MemcpyHostToDevice": "MemcpyHostToDevice",
+                    "_Z6kernelILi6EEvPf": "void kernel<6>(float*)",
+                },
+            )
+            self.assertEqual(run.call_count, 1)
+
+            # the demangled names are cached
+            self.assertEqual(profile_trace.demangle_names(names[:2]), {name: demangled[name] for name in names[:2]})
+            self.assertEqual(run.call_count, 1)
+
+            # the names are not changed when the demangler cannot be run
+            self.assertEqual(profile_trace.demangle_names(names, "missing-demangler"), {name: name for name in names})
+
+    def test_trace_columns(self):
+        columns = profile_trace.TraceColumns(["name", "op_name"], ["duration"])
+        for name, op_name, duration in [("k1", "MatMul", 5), ("k2", None, 3), ("k1", "MatMul", 7), ("k1", "Add", 2)]:
+            columns.append(name=name, op_name=op_name, duration=duration)
+
+        self.assertEqual(len(columns), 4)
+        self.assertEqual(columns.strings("op_name"), ["MatMul", "Add"])
+        np.testing.assert_array_equal(columns.column("op_name"), [0, -1, 0, 1])
+        np.testing.assert_array_equal(columns.column("duration"), [5, 3, 7, 2])
+
+        self.assertEqual(columns.sum_by(["name"], "duration"), {("k1",): (14, 3), ("k2",): (3, 1)})
+        # the rows with a None key are skipped
+        self.assertEqual(
+            columns.sum_by(["op_name", "name"], "duration"), {("MatMul", "k1"): (12, 2), ("Add", "k1"): (2, 1)}
+        )
+        self.assertEqual(columns.slice(1, 3).sum_by(["name"], "duration"), {("k1",): (7, 1), ("k2",): (3, 1)})
+
+
+@unittest.skipIf(importlib.util.find_spec("pandas") is None, "pandas is not installed")
+@unittest.skipIf(not os.path.exists(PROFILE_EXPLORER_DIR), "profile_explorer is only in the source tree")
+class TestProfileExplorer(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory(prefix="test_profile_explorer.")
+        self.trace_path = os.path.join(self._tmp_dir.name, "profile.json")
+        self.csv_prefix = os.path.join(self._tmp_dir.name, "profile")
+        sys.path.append(PROFILE_EXPLORER_DIR)
+
+    def tearDown(self):
+        sys.path.remove(PROFILE_EXPLORER_DIR)
+        self._tmp_dir.cleanup()
+
+    def run_explorer(self, *args):
+        import profile_explorer
+
+        argv = ["profile_explorer.py", self.trace_path, "--demangler", "missing-demangler", "--csv", self.csv_prefix]
+        output = io.StringIO()
+        with patch.object(sys, "argv", argv + list(args)), contextlib.redirect_stdout(output):
+            profile_explorer.main()
+        return output.getvalue()
+
+    def assert_csv_equal(self, target, expected):
+        import pandas as pd
+
+        actual = pd.read_csv(f"{self.csv_prefix}_{target}.csv").round(2)
+        pd.testing.assert_frame_equal(actual, pd.read_csv(io.StringIO(expected)))
+
+    def test_same_output_as_before_streaming(self):
+        # 3 runs of 7 nodes, and the first run is skipped by default
+        create_trace(self.trace_path, 3 * (4 * 7 + 1), num_nodes=7)
+        output = self.run_explorer("--mapping")
+        self.assertIn("Found 3 model_run events in trace.", output)
+        self.assertIn("Analyzing 2 model run(s): 1-2.", output)
+
+        self.assert_csv_equal("cpu_kernel_times", EXPECTED_CPU_KERNEL_TIMES)
+        self.assert_csv_equal("gpu_kernel_times", EXPECTED_GPU_KERNEL_TIMES)
+        self.assert_csv_equal("op_kernel_mapping", EXPECTED_OP_KERNEL_MAPPING)
+
+    def test_trace_without_model_run(self):
+        import pandas as pd
+
+        # a single run without its model_run event is analyzed as a whole
+        create_trace(self.trace_path, 4 * 7, num_nodes=7)
+        output = self.run_explorer()
+        self.assertIn('Could not find "model_run" event in trace', output)
+        cpu_kernel_times = pd.read_csv(f"{self.csv_prefix}_cpu_kernel_times.csv")
+        self.assertEqual(cpu_kernel_times["count"].sum(), 7)
+        self.assertEqual(cpu_kernel_times["duration"].sum(), 56)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark the conversion of the float initializers of a model to float16 in MB of float32 weights per second, on a
+model with large weights in raw_data and small weights in float_data:
+python benchmark_float16.py --num_layers 8 --hidden_size 1024
+
+The time of every phase of the conversion is printed. With --num_workers, the initializers are converted by a pool
+of threads during the walk of the graph:
+python benchmark_float16.py --num_layers 8 --hidden_size 1024 --num_workers 4
+"""
+
+import argparse
+import logging
+import time
+
+import numpy as np
+from onnx import TensorProto, helper, numpy_helper
+
+from onnxruntime.transformers.float16 import convert_float_to_float16
+
+
+def create_mlp_model(num_layers=8, hidden_size=1024):
+    """
+    Creates a stack of MatMul + Add + Relu layers. The weights are stored in raw_data, and the biases in float_data
+    like the tensors created by helper.make_tensor. Some weights are out of the range of float16.
+    """
+    rng = np.random.default_rng(0)
+    nodes = []
+    initializers = []
+    x = "input"
+    for i in range(num_layers):
+        weight = rng.standard_normal((hidden_size, hidden_size)).astype(np.float32)
+        weight[0, :4] = [1e-9, -1e-9, 1e6, -1e6]
+        initializers.append(numpy_helper.from_array(weight, f"weight_{i}"))
+        bias = rng.standard_normal(hidden_size).astype(np.float32)
+        initializers.append(helper.make_tensor(f"bias_{i}", TensorProto.FLOAT, [hidden_size], bias.tolist()))
+        nodes.append(helper.make_node("MatMul", [x, f"weight_{i}"], [f"matmul_{i}"], name=f"MatMul_{i}"))
+        nodes.append(helper.make_node("Add", [f"matmul_{i}", f"bias_{i}"], [f"add_{i}"], name=f"Add_{i}"))
+        nodes.append(helper.make_node("Relu", [f"add_{i}"], [f"relu_{i}"], name=f"Relu_{i}"))
+        x = f"relu_{i}"
+
+    graph = helper.make_graph(
+        nodes,
+        "mlp",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", hidden_size])],
+        [helper.make_tensor_value_info(x, TensorProto.FLOAT, ["batch", hidden_size])],
+        initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+
+def run(num_layers, hidden_size, num_workers):
+    model = create_mlp_model(num_layers, hidden_size)
+    size_mb = num_layers * (hidden_size + 1) * hidden_size * 4 / 1024**2
+
+    start = time.perf_counter()
+    converted = convert_float_to_float16(model, keep_io_types=True, disable_shape_infer=True, num_workers=num_workers)
+    elapsed = time.perf_counter() - start
+
+    assert all(tensor.data_type == TensorProto.FLOAT16 for tensor in converted.graph.initializer)
+    print(f"layers={num_layers} hidden_size={hidden_size} float32 weights={size_mb:.0f}MB workers={num_workers}")
+    print(f"convert_float_to_float16: {elapsed:.2f}s, {size_mb / elapsed:.0f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_layers", type=int, default=8)
+    parser.add_argument("--hidden_size", type=int, default=1024)
+    parser.add_argument("--num_workers", type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(format="%(message)s", level=logging.WARNING)
+    logging.getLogger("onnxruntime.transformers.float16").setLevel(logging.INFO)
+    run(args.num_layers, args.hidden_size, args.num_workers)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark the graph fusions of the transformers optimizer on a synthetic decoder without fused operators:
+python benchmark_fusion.py --num_layers 50
+"""
+
+import argparse
+import logging
+import time
+
+import numpy as np
+from onnx import TensorProto, helper, numpy_helper
+
+from onnxruntime.transformers.optimizer import optimize_model
+
+
+def create_decoder_model(num_layers=50, hidden_size=64, num_heads=4, vocab_size=128):
+    """
+    Creates a GPT-2 like decoder exported from PyTorch without fusion: LayerNormalization and Gelu are decomposed
+    and the reshapes of the attention compute their shapes with Shape, Gather, Unsqueeze and Concat nodes.
+    """
+    rng = np.random.default_rng(0)
+    nodes = []
+    initializers = []
+
+    def weight(name, shape):
+        initializers.append(numpy_helper.from_array(rng.standard_normal(shape).astype(np.float32) * 0.02, name))
+        return name
+
+    def scalar(name, value, dtype=np.float32):
+        initializers.append(numpy_helper.from_array(np.array(value, dtype=dtype), name))
+        return name
+
+    def node(op_type, inputs, prefix, num_outputs=1, **kwargs):
+        name = f"{prefix}_{len(nodes)}"
+        outputs = [f"{name}_out{i}" for i in range(num_outputs)]
+        nodes.append(helper.make_node(op_type, inputs, outputs, name, **kwargs))
+        return outputs[0] if num_outputs == 1 else outputs
+
+    eps = scalar("eps", 1e-5)
+    two = scalar("two", 2.0)
+    one = scalar("one", 1.0)
+    half = scalar("half", 0.5)
+    sqrt2 = scalar("sqrt2", 1.4142135381698608)
+    unsqueeze_axes = scalar("unsqueeze_axes", [0], np.int64)
+    heads = scalar("num_heads", [num_heads], np.int64)
+    head_size = scalar("head_size", [hidden_size // num_heads], np.int64)
+    hidden = scalar("hidden", [hidden_size], np.int64)
+    scale = scalar("scale", 1.0 / np.sqrt(hidden_size // num_heads))
+
+    def layer_norm(x, prefix):
+        mean = node("ReduceMean", [x], prefix, axes=[-1])
+        sub = node("Sub", [x, mean], prefix)
+        pow_ = node("Pow", [sub, two], prefix)
+        var = node("ReduceMean", [pow_], prefix, axes=[-1])
+        add = node("Add", [var, eps], prefix)
+        std = node("Sqrt", [add], prefix)
+        div = node("Div", [sub, std], prefix)
+        mul = node("Mul", [div, weight(f"{prefix}_gamma", [hidden_size])], prefix)
+        return node("Add", [mul, weight(f"{prefix}_beta", [hidden_size])], prefix)
+
+    def linear(x, in_features, out_features, prefix):
+        matmul = node("MatMul", [x, weight(f"{prefix}_weight", [in_features, out_features])], prefix)
+        return node("Add", [weight(f"{prefix}_bias", [out_features]), matmul], prefix)
+
+    def dim(x, index, prefix):
+        shape = node("Shape", [x], prefix)
+        gather = node("Gather", [shape, scalar(f"{prefix}_index{len(nodes)}", index, np.int64)], prefix, axis=0)
+        return node("Unsqueeze", [gather, unsqueeze_axes], prefix)
+
+    def split_heads(x, prefix, perm):
+        shape = node("Concat", [dim(x, 0, prefix), dim(x, 1, prefix), heads, head_size], prefix, axis=0)
+        reshape = node("Reshape", [x, shape], prefix)
+        return node("Transpose", [reshape], prefix, perm=perm)
+
+    embedding = weight("wte", [vocab_size, hidden_size])
+    x = node("Gather", [embedding, "input_ids"], "embed")
+    for layer in range(num_layers):
+        prefix = f"layer{layer}"
+        ln = layer_norm(x, f"{prefix}_ln1")
+        qkv = linear(ln, hidden_size, 3 * hidden_size, f"{prefix}_qkv")
+        q, k, v = node("Split", [qkv], f"{prefix}_split", num_outputs=3, axis=2)
+        q = split_heads(q, f"{prefix}_q", [0, 2, 1, 3])
+        k = split_heads(k, f"{prefix}_k", [0, 2, 3, 1])
+        v = split_heads(v, f"{prefix}_v", [0, 2, 1, 3])
+        scores = node("Mul", [node("MatMul", [q, k], prefix), scale], prefix)
+        probs = node("Softmax", [scores], prefix, axis=-1)
+        context = node("Transpose", [node("MatMul", [probs, v], prefix)], prefix, perm=[0, 2, 1, 3])
+        merged_shape = node("Concat", [dim(context, 0, prefix), dim(context, 1, prefix), hidden], prefix, axis=0)
+        context = node("Reshape", [context, merged_shape], prefix)
+        x = node("Add", [x, linear(context, hidden_size, hidden_size, f"{prefix}_proj")], prefix)
+
+        ln = layer_norm(x, f"{prefix}_ln2")
+        fc = linear(ln, hidden_size, 4 * hidden_size, f"{prefix}_fc")
+        erf = node("Erf", [node("Div", [fc, sqrt2], prefix)], prefix)
+        gelu = node("Mul", [node("Mul", [fc, node("Add", [erf, one], prefix)], prefix), half], prefix)
+        x = node("Add", [x, linear(gelu, 4 * hidden_size, hidden_size, f"{prefix}_fc2")], prefix)
+
+    x = layer_norm(x, "final_ln")
+    node("MatMul", [x, weight("lm_head", [hidden_size, vocab_size])], "lm_head")
+    nodes[-1].output[0] = "logits"
+    graph = helper.make_graph(
+        nodes,
+        "decoder",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch_size", "sequence_length"])],
+        [helper.make_tensor_value_info("logits", TensorProto.FLOAT, ["batch_size", "sequence_length", vocab_size])],
+        initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+
+def run(num_layers, hidden_size, num_heads):
+    model = create_decoder_model(num_layers, hidden_size, num_heads)
+    num_nodes = len(model.graph.node)
+
+    start = time.perf_counter()
+    optimized = optimize_model(
+        model, model_type="gpt2", num_heads=num_heads, hidden_size=hidden_size, opt_level=0, use_gpu=False
+    )
+    elapsed = time.perf_counter() - start
+
+    print(f"layers={num_layers} nodes={num_nodes} -> {len(optimized.model.graph.node)}")
+    print(f"optimize_model: {elapsed:.2f}s, {num_nodes / elapsed:.0f} nodes/s")
+    print(optimized.get_fused_operator_statistics())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_layers", type=int, default=50)
+    parser.add_argument("--hidden_size", type=int, default=64)
+    parser.add_argument("--num_heads", type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    run(args.num_layers, args.hidden_size, args.num_heads)
@@ -0,0 +1,186 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+from onnxruntime.transformers import float16
+from onnxruntime.transformers.float16 import (
+    convert_float_to_float16,
+    convert_float_to_float16_path,
+    convert_np_to_float16,
+)
+
+# Converts a model in a new process, and prints the increase of the peak resident memory of the process in MB.
+PEAK_RSS_SCRIPT = """
+import sys
+from onnxruntime.transformers.float16 import convert_float_to_float16_path
+
+def peak_rss():
+    with open("/proc/self/status") as status:
+        return int(status.read().split("VmHWM:")[1].split()[0]) / 1024
+
+rss = peak_rss()
+convert_float_to_float16_path(sys.argv[1], sys.argv[2], chunk_size=1 << 18, keep_io_types=True)
+print(peak_rss() - rss)
+"""
+
+
+def create_mlp_model(num_layers=8, hidden_size=1024):
+    """
+    Creates a stack of MatMul + Add + Relu layers. The weights are stored in raw_data, and the biases in float_data
+    like the tensors created by helper.make_tensor. Some weights are out of the range of float16.
+    """
+    rng = np.random.default_rng(0)
+    nodes = []
+    initializers = []
+    x = "input"
+    for i in range(num_layers):
+        weight = rng.standard_normal((hidden_size, hidden_size)).astype(np.float32)
+        weight[0, :4] = [1e-9, -1e-9, 1e6, -1e6]
+        initializers.append(numpy_helper.from_array(weight, f"weight_{i}"))
+        bias = rng.standard_normal(hidden_size).astype(np.float32)
+        initializers.append(helper.make_tensor(f"bias_{i}", TensorProto.FLOAT, [hidden_size], bias.tolist()))
+        nodes.append(helper.make_node("MatMul", [x, f"weight_{i}"], [f"matmul_{i}"], name=f"MatMul_{i}"))
+        nodes.append(helper.make_node("Add", [f"matmul_{i}", f"bias_{i}"], [f"add_{i}"], name=f"Add_{i}"))
+        nodes.append(helper.make_node("Relu", [f"add_{i}"], [f"relu_{i}"], name=f"Relu_{i}"))
+        x = f"relu_{i}"
+
+    graph = helper.make_graph(
+        nodes,
+        "mlp",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", hidden_size])],
+        [helper.make_tensor_value_info(x, TensorProto.FLOAT, ["batch", hidden_size])],
+        initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+
+class TestFloat16Conversion(unittest.TestCase):
+    def test_convert_np_to_float16(self):
+        values = np.array(
+            [0.0, -0.0, np.nan, np.inf, -np.inf, 1e-9, -1e-9, 5.96e-08, 1e-4, -2.5, 65504, 65519, 1e6, -1e6],
+            dtype=np.float32,
+        )
+        expected = np.array(
+            [
+                0.0,
+                -0.0,
+                np.nan,
+                np.inf,
+                -np.inf,
+                5.96e-08,
+                -5.96e-08,
+                5.96e-08,
+                1e-4,
+                -2.5,
+                65504,
+                65504,
+                65504,
+                -65504,
+            ],
+            dtype=np.float16,
+        )
+        converted = convert_np_to_float16(values)
+        self.assertEqual(converted.dtype, np.float16)
+        self.assertEqual(converted.tobytes(), expected.tobytes())
+
+        # the values are converted in chunks, and the shape is kept
+        with patch.object(float16, "CONVERT_CHUNK_SIZE", 5):
+            chunked = convert_np_to_float16(np.tile(values, (3, 1)), min_positive_val=1e-7, max_finite_val=1e4)
+        self.assertEqual(chunked.shape, (3, len(values)))
+        for row in chunked:
+            np.testing.assert_array_equal(row[[5, 6, 12, 13]], np.float16([1e-7, -1e-7, 1e4, -1e4]))
+            np.testing.assert_array_equal(row[:5], expected[:5])
+
+    def test_convert_float_data(self):
+        model = create_mlp_model(num_layers=2, hidden_size=8)
+        biases = {
+            tensor.name: np.array(tensor.float_data, dtype=np.float32)
+            for tensor in model.graph.initializer
+            if tensor.float_data
+        }
+        self.assertEqual(len(biases), 2)
+
+        converted = convert_float_to_float16(model, keep_io_types=True, disable_shape_infer=True)
+        for tensor in converted.graph.initializer:
+            self.assertEqual(tensor.data_type, TensorProto.FLOAT16)
+            if tensor.name in biases:
+                self.assertFalse(tensor.float_data)
+                np.testing.assert_array_equal(numpy_helper.to_array(tensor), biases[tensor.name].astype(np.float16))
+
+        # the value of a float16 tensor in int32_data is the bit pattern of float16
+        tensor = helper.make_tensor("scale", TensorProto.FLOAT, [3], [1.0, -2.0, 1e-9])
+        float16.convert_tensor_float_to_float16(tensor)
+        self.assertEqual(list(tensor.int32_data), [0x3C00, 0xC000, 0x0001])
+
+    def test_convert_initializers_in_threads(self):
+        for force_fp16_initializers in [False, True]:
+            models = []
+            for num_workers in [1, 3]:
+                model = create_mlp_model(num_layers=8, hidden_size=16)
+                with self.assertLogs("onnxruntime.transformers.float16", "INFO") as logs:
+                    models.append(
+                        convert_float_to_float16(
+                            model,
+                            keep_io_types=True,
+                            disable_shape_infer=True,
+                            # the biases are only used by blocked nodes, and only converted when forced
+                            op_block_list=["Add"],
+                            force_fp16_initializers=force_fp16_initializers,
+                            num_workers=num_workers,
+                        )
+                    )
+                self.assertRegex(logs.output[-1], "graph walk .*s, initializers .*s, casts .*s")
+            self.assertEqual(models[0], models[1])
+            data_types = {tensor.name: tensor.data_type for tensor in models[1].graph.initializer}
+            self.assertEqual(data_types["weight_0"], TensorProto.FLOAT16)
+            self.assertEqual(
+                data_types["bias_0"], TensorProto.FLOAT16 if force_fp16_initializers else TensorProto.FLOAT
+            )
+
+    @unittest.skipIf(not sys.platform.startswith("linux"), "peak resident memory is read from /proc")
+    def test_convert_external_data(self):
+        # 4 layers of 2048 x 2048 weights: 64MB of float32 external data
+        model = create_mlp_model(num_layers=4, hidden_size=2048)
+        expected = convert_float_to_float16(model, keep_io_types=True, disable_shape_infer=True)
+        with tempfile.TemporaryDirectory() as model_dir:
+            model_path = os.path.join(model_dir, "model.onnx")
+            onnx.save(create_mlp_model(4, 2048), model_path, save_as_external_data=True, location="model.onnx.data")
+            output_path = os.path.join(model_dir, "fp16", "model.onnx")
+            os.makedirs(os.path.dirname(output_path))
+
+            result = subprocess.run(
+                [sys.executable, "-c", PEAK_RSS_SCRIPT, model_path, output_path],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            # The weights are converted in chunks of 1MB, without loading any of the 16MB weights.
+            self.assertLess(float(result.stdout.split()[-1]), 16)
+
+            converted = onnx.load(output_path)
+            self.assertEqual(os.path.getsize(output_path + ".data"), 4 * 2048 * 2048 * 2)
+            self.assertEqual(
+                [(node.op_type, list(node.input)) for node in converted.graph.node],
+                [(node.op_type, list(node.input)) for node in expected.graph.node],
+            )
+            for tensor, expected_tensor in zip(converted.graph.initializer, expected.graph.initializer):
+                self.assertEqual(tensor.data_type, TensorProto.FLOAT16)
+                np.testing.assert_array_equal(numpy_helper.to_array(tensor), numpy_helper.to_array(expected_tensor))
+
+            with self.assertRaises(ValueError):
+                convert_float_to_float16_path(model_path, os.path.join(model_dir, "converted.onnx"), "model.onnx.data")
+
+
+if __name__ == "__main__":
+    unittest.main()
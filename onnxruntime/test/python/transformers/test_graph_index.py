@@ -0,0 +1,121 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import unittest
+
+from onnx import TensorProto, helper
+
+from onnxruntime.transformers.onnx_model import GraphIndex, OnnxModel
+
+
+class TestGraphIndex(unittest.TestCase):
+    def _get_model(self) -> OnnxModel:
+        nodes = [
+            helper.make_node("Relu", ["input"], ["relu"], name="relu"),
+            helper.make_node("Neg", ["relu"], ["neg"], name="neg"),
+            helper.make_node("Add", ["relu", "neg"], ["add"], name="add"),
+            helper.make_node("Identity", ["add"], ["output"], name="identity"),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "graph",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, [2])],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [2])],
+        )
+        return OnnxModel(helper.make_model(graph))
+
+    def _assert_index_in_sync(self, model: OnnxModel):
+        index = model.graph_index()
+        fresh = GraphIndex(model.graphs())
+        self.assertEqual(
+            {name: [node.name for node in nodes] for name, nodes in index.input_name_to_nodes.items()},
+            {name: [node.name for node in nodes] for name, nodes in fresh.input_name_to_nodes.items()},
+        )
+        self.assertEqual(
+            {name: node.name for name, node in index.output_name_to_node.items()},
+            {name: node.name for name, node in fresh.output_name_to_node.items()},
+        )
+        self.assertEqual(index.input_name_to_nodes.keys(), model.input_name_to_nodes().keys())
+        self.assertEqual(index.output_name_to_node.keys(), model.output_name_to_node().keys())
+
+    def test_index_is_updated_by_model_methods(self):
+        model = self._get_model()
+        index = model.graph_index()
+        neg = model.get_nodes_by_op_type("Neg")[0]
+        self.assertEqual([node.name for node in index.input_name_to_nodes["relu"]], ["neg", "add"])
+        self.assertIs(model.get_graph_by_node(neg), model.graph())
+
+        model.remove_node(neg)
+        model.add_node(helper.make_node("Sigmoid", ["relu"], ["neg"], name="sigmoid"))
+        model.replace_input_of_all_nodes("add", "neg")
+        self.assertIs(model.graph_index(), index)
+        self._assert_index_in_sync(model)
+        self.assertEqual(index.output_name_to_node["neg"].name, "sigmoid")
+        self.assertEqual([node.name for node in index.input_name_to_nodes["neg"]], ["add", "identity"])
+
+    def test_index_is_rebuilt_after_direct_edits(self):
+        model = self._get_model()
+        index = model.graph_index()
+        model.graph().node.append(helper.make_node("Relu", ["output"], ["relu2"], name="relu2"))
+        self.assertIsNot(model.graph_index(), index)
+        self._assert_index_in_sync(model)
+
+        model.graph().node[0].input[0] = "output"
+        model.reset_graph_index()
+        self.assertEqual([node.name for node in model.graph_index().input_name_to_nodes["output"]], ["relu", "relu2"])
+
+    def test_index_is_updated_after_edits_in_place(self):
+        graph = helper.make_graph(
+            [
+                helper.make_node("Relu", ["x"], ["r"], name="relu"),
+                helper.make_node("Add", ["r", "x"], ["y"], name="add"),
+            ],
+            "graph",
+            [helper.make_tensor_value_info("x", TensorProto.FLOAT, [2])],
+            [helper.make_tensor_value_info("y", TensorProto.FLOAT, [2])],
+        )
+        model = OnnxModel(helper.make_model(graph))
+        relu, add = model.nodes()
+        self.assertEqual(model.get_children(relu), [add])
+
+        model.graph().node[1].input[0] = "x"
+        model.update_node_index(model.graph().node[1])
+        self.assertEqual(model.get_children(relu), [])
+        self.assertIsNone(model.get_parent(add, 0))
+        self._assert_index_in_sync(model)
+
+    def test_index_is_updated_after_edits_by_static_helpers(self):
+        model = self._get_model()
+        index = model.graph_index()
+        identity = model.get_nodes_by_op_type("Identity")[0]
+        neg = model.get_nodes_by_op_type("Neg")[0]
+
+        OnnxModel.replace_node_input(identity, "add", "neg")
+        self.assertIs(model.graph_index(), index)
+        self._assert_index_in_sync(model)
+        self.assertEqual(model.get_children(neg), [model.get_nodes_by_op_type("Add")[0], identity])
+
+        OnnxModel.replace_node_output(identity, "output", "identity_output")
+        self.assertIs(model.graph_index(), index)
+        self._assert_index_in_sync(model)
+        self.assertIs(index.output_name_to_node["identity_output"], identity)
+
+    def test_edits_do_not_change_the_index_of_other_models(self):
+        model = self._get_model()
+        other_model = self._get_model()
+        other_index = other_model.graph_index()
+        other_inputs = {name: list(nodes) for name, nodes in other_index.input_name_to_nodes.items()}
+
+        identity = model.get_nodes_by_op_type("Identity")[0]
+        model.graph_index()
+        OnnxModel.replace_node_input(identity, "add", "neg")
+        self._assert_index_in_sync(model)
+
+        self.assertIs(other_model.graph_index(), other_index)
+        self.assertEqual(other_index.input_name_to_nodes, other_inputs)
+        self._assert_index_in_sync(other_model)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,13 +7,128 @@
 
 # For live logging, use the command: pytest -o log_cli=true --log-cli-level=DEBUG
 
+import argparse
+import json
 import os
+import tempfile
 import unittest
+from unittest.mock import patch
 
 import pytest
 from test_optimizer import _get_test_model_path
 
 
+def create_profile_events():
+    """Returns the events of a profile of 2 runs of a model with nodes on CUDA and CPU and a Loop node."""
+    events = [
+        {"cat": "Kernel", "name": "MemcpyHostToDevice", "dur": 100, "args": {"op_name": ""}},
+        {"cat": "Session", "name": "session_initialization", "dur": 1000, "args": {}},
+    ]
+    nodes = [
+        ("MatMul_0", "MatMul", "CUDAExecutionProvider"),
+        ("Add_1", "Add", "CUDAExecutionProvider"),
+        ("Loop_2", "Loop", "CPUExecutionProvider"),
+        ("Shape_3", "Shape", "CPUExecutionProvider"),
+        ("MatMul_4", "MatMul", "CUDAExecutionProvider"),
+    ]
+    for run in range(2):
+        for i, (name, op_type, provider) in enumerate(nodes):
+            dur = 10 * (i + 1) + run
+            node_args = {"op_name": op_type}
+            kernel_args = {"op_name": op_type, "provider": provider}
+            events.append({"cat": "Node", "name": f"{name}_fence_before", "dur": 1, "args": node_args})
+            events.append({"cat": "Node", "name": f"{name}_kernel_time", "dur": dur, "args": kernel_args})
+            events.append({"cat": "Node", "name": f"{name}_fence_after", "dur": 2, "args": node_args})
+            if provider == "CUDAExecutionProvider":
+                events.append({"cat": "Kernel", "name": f"{op_type}_kernel", "dur": dur - 3, "args": node_args})
+        events.append({"cat": "Kernel", "name": "MemcpyDeviceToHost", "dur": 4, "args": {"op_name": ""}})
+        events.append({"cat": "Session", "name": "model_run", "dur": 200, "args": {}})
+    return events
+
+
+# Results of the profiler before it streamed the trace, for the events of create_profile_events and a threshold of 0.1
+EXPECTED_RESULTS = [
+    "\nTop expensive kernels with Time% >= 10.00:",
+    "-" * 64,
+    "Total(μs)\tTime%\tCalls\tAvg(μs)\tKernel",
+    "       110\t71.90\t    4\t    27.5\tMatMul_kernel",
+    "        35\t22.88\t    2\t    17.5\tAdd_kernel",
+    "\nGroup kernel time by operator:",
+    "-" * 64,
+    "Total(μs)\tTime%\tOperator",
+    "       110\t71.90\tMatMul",
+    "        35\t22.88\tAdd",
+    "         8\t 5.23\t(MemcpyDeviceToHost)",
+    "\nNodes in the original order:",
+    "-" * 64,
+    "Total(μs)\tTime%\tAcc %\tAvg(μs)\tCalls\tProvider\tNode",
+    "        27\t10.07\t10.07\t     4.5\t    6\tCUDA    \tMatMul_0",
+    "        47\t17.54\t27.61\t     7.8\t    6\tCUDA    \tAdd_1",
+    "        87\t32.46\t60.07\t    14.5\t    6\tCPU     \tShape_3",
+    "       107\t39.93\t100.00\t    17.8\t    6\tCUDA    \tMatMul_4",
+    "\nTop expensive nodes with Time% >= 10.00:",
+    "-" * 64,
+    "Total(μs)\tTime%\tAvg(μs)\tCalls\tProvider\tNode",
+    "       107\t39.93\t    17.8\t    6\tCUDA    \tMatMul_4",
+    "        87\t32.46\t    14.5\t    6\tCPU     \tShape_3",
+    "        47\t17.54\t     7.8\t    6\tCUDA    \tAdd_1",
+    "        27\t10.07\t     4.5\t    6\tCUDA    \tMatMul_0",
+    "",
+    "Grouped by operator",
+    "-" * 64,
+    "Total(μs)\tTime%\tKernel(μs)\tKernel%\tCalls\tAvgKernel(μs)\tFence(μs)\tOperator",
+    "       134\t50.00\t        122\t50.00\t    4\t          30.5\t        12\tMatMul",
+    "        87\t32.46\t         81\t33.20\t    2\t          40.5\t         6\tShape",
+    "        47\t17.54\t         41\t16.80\t    2\t          20.5\t         6\tAdd",
+    "",
+    "Grouped by provider + operator",
+    "-" * 64,
+    "Kernel(μs)\tProvider%\tCalls\tAvgKernel(μs)\tProvider\tOperator",
+    "       122\t    74.85\t    4\t          30.5\tCUDA    \tMatMul",
+    "        81\t   100.00\t    2\t          40.5\tCPU     \tShape",
+    "        41\t    25.15\t    2\t          20.5\tCUDA    \tAdd",
+]
+
+
+class TestProfileResults(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory(prefix="test_profiler.")
+        self.profile_file = os.path.join(self._tmp_dir.name, "profile.json")
+        self.events = create_profile_events()
+        with open(self.profile_file, "w", encoding="utf-8") as opened_file:
+            json.dump(self.events, opened_file)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_process_results(self):
+        from onnxruntime.transformers import profiler
+
+        args = argparse.Namespace(threshold=0.1, kernel_time_only=False, use_gpu=True)
+        with patch.object(profiler, "iter_trace_events", wraps=profiler.iter_trace_events) as iter_trace_events:
+            lines = profiler.process_results(self.profile_file, args)
+        self.assertEqual(lines, EXPECTED_RESULTS)
+        # the trace is read in a single pass
+        self.assertEqual(iter_trace_events.call_count, 1)
+
+        # the events are not loaded in memory
+        self.assertNotIsInstance(profiler.load_profile_json(self.profile_file), list)
+
+        # the results of every function from a list of events are the same
+        lines = profiler.parse_kernel_results(self.events, 0.1)
+        lines += profiler.parse_node_results(self.events, False, 0.1)
+        lines += profiler.group_node_results(self.events, False, True)
+        self.assertEqual(lines, EXPECTED_RESULTS)
+
+    def test_kernel_time_only(self):
+        from onnxruntime.transformers import profiler
+
+        # the fence events without a provider are skipped in the nodes
+        lines = profiler.parse_node_results(profiler.load_profile_json(self.profile_file), kernel_time_only=True)
+        self.assertIn("        41\t16.80\t25.41\t    20.5\t    2\tCUDA    \tAdd_1", lines)
+        self.assertEqual(profiler.parse_kernel_results([]), ["No kernel record found!"])
+
+
 class TestBertProfiler(unittest.TestCase):
     def setUp(self):
         from onnxruntime import get_available_providers